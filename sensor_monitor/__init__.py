@@ -1,6 +1,10 @@
-import _gpio
-import dht22
-import sensors
-import utility
-import who8myrpi
-import multiplex
+
+# Submodules are imported on first attribute access, see lazy.py.  Importing the package
+# itself stays cheap, e.g. for the who8myrpi entry point.
+import sys
+
+import lazy
+
+sys.modules[__name__] = lazy.Lazy_Package(sys.modules[__name__],
+                                          ['_gpio', 'dht22', 'sensors', 'utility', 'who8myrpi',
+                                           'multiplex'])
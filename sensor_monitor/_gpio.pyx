@@ -11,23 +11,35 @@ np.import_array()
 ############################
 
 cdef extern from 'wiringPi/wiringPi.h':
-    cdef int wiringPiSetup()
-    cdef int wiringPiSetupSys()
-    cdef int wiringPiSetupGpio()
-    cdef int wiringPiSetupPiFace()
+    cdef int wiringPiSetup() nogil
+    cdef int wiringPiSetupSys() nogil
+    cdef int wiringPiSetupGpio() nogil
+    cdef int wiringPiSetupPiFace() nogil
 
-    cdef void pinMode(int pin, int mode)
-    cdef int  digitalRead(int pin)
-    cdef void digitalWrite(int pin, int value)
-    cdef void pullUpDnControl(int pin, int pud)
-    cdef void setPadDrive(int group, int value)
+    cdef void pinMode(int pin, int mode) nogil
+    cdef int  digitalRead(int pin) nogil
+    cdef void digitalWrite(int pin, int value) nogil
+    cdef void pullUpDnControl(int pin, int pud) nogil
+    cdef void setPadDrive(int group, int value) nogil
 
-    cdef void pwmSetMode(int mode)
-    cdef void pwmWrite(int pin, int value)
-    cdef void pwmSetRange(unsigned int range)
+    cdef void pwmSetMode(int mode) nogil
+    cdef void pwmWrite(int pin, int value) nogil
+    cdef void pwmSetRange(unsigned int range) nogil
 
-    cdef void delayMicroseconds(unsigned int howLong)
-    cdef unsigned int millis()
+    cdef void delayMicroseconds(unsigned int howLong) nogil
+    cdef unsigned int millis() nogil
+
+    cdef int piHiPri(int pri) nogil
+
+from libc.stdint cimport uint32_t
+
+cdef extern from 'gpio_mmap.h':
+    cdef long gpio_map_address() nogil
+    cdef int gpio_map_open(const char *path, long offset) nogil
+    cdef void gpio_map_close() nogil
+    cdef int gpio_map_is_open() nogil
+    cdef uint32_t gpio_map_levels() nogil
+    cdef void gpio_map_write_mask(uint32_t mask_set, uint32_t mask_clear) nogil
 
 
 # Constants.
@@ -97,3 +109,101 @@ cpdef _delayMicroseconds(unsigned int howLong):
 
 cpdef _millis():
     return millis()
+
+cpdef _piHiPri(int pri):
+    return piHiPri(pri)
+
+
+#######################################
+# Batched multi-pin access.  One call from Python does the work for many pins.  With the
+# register block mapped (_gpio_map_open) reads and writes on pins 0 - 31 become single
+# register operations, otherwise they loop over wiringPi calls without holding the GIL.
+
+cpdef _gpio_map_open(path, long offset=0):
+    path = path.encode('utf-8') if isinstance(path, unicode) else path
+    return gpio_map_open(path, offset)
+
+cpdef _gpio_map_address():
+    return gpio_map_address()
+
+cpdef _gpio_map_close():
+    gpio_map_close()
+
+cpdef _gpio_map_is_open():
+    return bool(gpio_map_is_open())
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef int all_below_32(int [:] pins) nogil:
+    cdef int k
+    for k in range(pins.shape[0]):
+        if pins[k] < 0 or pins[k] >= 32:
+            return 0
+    return 1
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _write_many(int [:] pins, int [:] values):
+    """Write values[k] to pins[k] for all k.
+    """
+    if pins.shape[0] != values.shape[0]:
+        raise ValueError('Number of pins and values must match: %d, %d' %
+                         (pins.shape[0], values.shape[0]))
+
+    cdef int k
+    cdef uint32_t mask_set = 0
+    cdef uint32_t mask_clear = 0
+
+    with nogil:
+        if gpio_map_is_open() and all_below_32(pins):
+            for k in range(pins.shape[0]):
+                if values[k]:
+                    mask_set |= (<uint32_t>1) << pins[k]
+                else:
+                    mask_clear |= (<uint32_t>1) << pins[k]
+
+            gpio_map_write_mask(mask_set, mask_clear)
+        else:
+            for k in range(pins.shape[0]):
+                digitalWrite(pins[k], values[k])
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _read_many(int [:] pins):
+    """Read levels of all pins.  Return Numpy int array.
+    """
+    result = np.zeros(pins.shape[0], dtype=np.intc)
+    cdef int [:] result_view = result
+
+    cdef int k
+    cdef uint32_t word
+
+    with nogil:
+        if gpio_map_is_open() and all_below_32(pins):
+            word = gpio_map_levels()
+            for k in range(pins.shape[0]):
+                result_view[k] = (word >> pins[k]) & 1
+        else:
+            for k in range(pins.shape[0]):
+                result_view[k] = digitalRead(pins[k])
+
+    return result
+
+
+def _read_mask():
+    """Levels of pins 0 - 31 packed into one integer, bit N for pin N.
+    """
+    cdef int k
+    cdef uint32_t word = 0
+
+    with nogil:
+        if gpio_map_is_open():
+            word = gpio_map_levels()
+        else:
+            for k in range(32):
+                word |= (<uint32_t>(digitalRead(k) & 1)) << k
+
+    return word
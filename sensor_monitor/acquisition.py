@@ -0,0 +1,371 @@
+
+from __future__ import division, print_function, unicode_literals
+
+"""
+Sensor acquisition in a separate process.
+
+DHT22 reads are timing critical.  Running them in the same interpreter as uploads, JSON
+parsing and garbage collection means any of those can stall a read half way through.  This
+module runs the sensor channels in their own process at elevated scheduling priority.  Data
+crosses to the parent through shared-memory ring buffers; nothing is pickled on the hot path.
+
+Two rings are used:
+  - samples: one row per good reading (seconds, pin, RH, Tf, kind code).
+  - reads: one row per read attempt (seconds, pin, ok, duration, reason code), feeding the
+    parent's Health_Monitor and metrics.
+
+Acquisition.samples behaves like the Queue returned by sensors.start_channels and
+Acquisition.channels like the channel list, so the rest of the application is unchanged.
+"""
+
+import os
+import time
+import threading
+import multiprocessing
+import Queue
+
+import numpy as np
+
+import metrics
+
+# Failure reasons, index is the reason code stored in the reads ring.
+_REASONS = [''] + metrics.REASONS
+
+# Sample kinds, index is the kind code stored in the samples ring.  See
+# sensors.Channel_Filter_Outlier.
+_KINDS = ['sample', 'outlier']
+
+#################################################
+
+
+class Ring_Buffer(object):
+    def __init__(self, capacity=4096, width=4):
+        """
+        Fixed-size ring of float64 rows in shared memory.  One producer, one consumer.
+
+        When full, new rows are dropped and counted in count_dropped rather than overwriting
+        rows the consumer has not seen.
+
+        Parameters
+        ----------
+        capacity : number of rows.
+
+        width : number of values per row.
+
+        """
+        self.capacity = capacity
+        self.width = width
+
+        self._data = multiprocessing.RawArray('d', capacity*width)
+        self._head = multiprocessing.Value('L', 0)   # rows written, ever.
+        self._tail = multiprocessing.Value('L', 0)   # rows read, ever.
+        self._dropped = multiprocessing.Value('L', 0)
+
+        self._view = None
+
+    @property
+    def view(self):
+        # Numpy view created lazily so it is built in whichever process uses it.
+        if self._view is None:
+            self._view = np.frombuffer(self._data, dtype=np.float64).reshape(self.capacity,
+                                                                              self.width)
+        return self._view
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_view'] = None
+        return state
+
+    def put(self, row):
+        """
+        Append one row.  Return False if the ring was full and the row was dropped.
+        """
+        with self._tail.get_lock():
+            tail = self._tail.value
+
+        head = self._head.value
+        if head - tail >= self.capacity:
+            with self._dropped.get_lock():
+                self._dropped.value += 1
+            return False
+
+        self.view[head % self.capacity] = row
+
+        # Publish only after the row is in place.
+        with self._head.get_lock():
+            self._head.value = head + 1
+
+        return True
+
+    def get_rows(self, num_max=None):
+        """
+        Remove and return up to num_max waiting rows as a 2D Numpy array.
+        """
+        with self._head.get_lock():
+            head = self._head.value
+
+        tail = self._tail.value
+        num = head - tail
+        if num_max is not None:
+            num = min(num, num_max)
+
+        index = (tail + np.arange(num)) % self.capacity
+        rows = self.view[index].copy()
+
+        with self._tail.get_lock():
+            self._tail.value = tail + num
+
+        return rows
+
+    def qsize(self):
+        return self._head.value - self._tail.value
+
+    def empty(self):
+        return self.qsize() == 0
+
+    @property
+    def count_dropped(self):
+        return self._dropped.value
+
+
+class Sample_Ring(Ring_Buffer):
+    def __init__(self, capacity=4096):
+        """
+        Ring of data samples with the get/empty/qsize interface of Queue.Queue, yielding the
+        same info dicts as sensors.Channel_Runner.
+        """
+        super(Sample_Ring, self).__init__(capacity, width=5)
+
+    def put_sample(self, info):
+        return self.put([info['seconds'], info['pin'], info['RH'], info['Tf'],
+                         _kind_code(info['kind'])])
+
+    def get(self, block=False):
+        """
+        Return next sample as an info dict.  Never blocks; raises Queue.Empty if empty.
+        """
+        rows = self.get_rows(1)
+        if not len(rows):
+            raise Queue.Empty()
+
+        seconds, pin, RH, Tf, kind = rows[0]
+        info = {'kind': _KINDS[int(kind)],
+                'pin': int(pin),
+                'RH': float(RH),
+                'Tf': float(Tf),
+                'seconds': float(seconds)}
+
+        return info
+
+#################################################
+
+
+class Remote_Channel(object):
+    def __init__(self, pin, index, acquisition):
+        """
+        Parent-side stand-in for a channel running in the acquisition process.  Provides the
+        pin, pause, unpause and stop used by power.Power_Supervisor and sensors.stop_channels.
+        """
+        self.pin = pin
+        self.index = index
+        self.acquisition = acquisition
+        self.monitor = acquisition.monitor
+        self.data_latest = None
+
+    def pause(self):
+        self.acquisition.flags_pause[self.index] = 1
+
+    def unpause(self):
+        self.acquisition.flags_pause[self.index] = 0
+
+    @property
+    def is_paused(self):
+        return bool(self.acquisition.flags_pause[self.index])
+
+    def stop(self):
+        self.acquisition.stop()
+
+    def join(self, timeout=None):
+        pass
+
+
+def _kind_code(kind):
+    if kind not in _KINDS:
+        raise ValueError('Unknown sample kind: {:s}'.format(kind))
+
+    return _KINDS.index(kind)
+
+
+def _reason_code(msg):
+    reason = metrics.failure_reason(msg)
+    if reason in _REASONS:
+        return _REASONS.index(reason)
+
+    return _REASONS.index('other')
+
+
+def set_priority(priority):
+    """
+    Raise scheduling priority of the calling process.  Try real-time scheduling through
+    wiringPi, then a negative nice value.  Return description of what worked.
+    """
+    try:
+        import gpio
+        if gpio.piHiPri(priority) == 0:
+            return 'realtime %d' % priority
+    except Exception:
+        pass
+
+    try:
+        os.nice(-10)
+        return 'nice -10'
+    except OSError:
+        return 'default'
+
+
+def run_acquisition(pins_data, ring_samples, ring_reads, flags_pause, event_stop,
+                    time_wait=5.0, priority=50, outliers=None, verbose=False):
+    """
+    Body of the acquisition process.  Start channels on pins_data and copy their output into
+    the shared rings until event_stop is set.
+    """
+    import sensors
+
+    how = set_priority(priority)
+    if verbose:
+        print('Acquisition process %d, priority: %s' % (os.getpid(), how))
+
+    def observer(pin, time_read, ok, msg=None, duration=None):
+        code = 0 if ok else _reason_code(msg)
+        ring_reads.put([time_read, pin, 1. if ok else 0., duration or 0., code])
+
+    channels, queue = sensors.start_channels(pins_data, time_wait=time_wait,
+                                             observers=[observer], outliers=outliers)
+
+    while not event_stop.is_set():
+        # Mirror pause flags set by the parent, e.g. during a power cycle.
+        for k, c in enumerate(channels):
+            paused = bool(flags_pause[k])
+            if paused != c.is_paused:
+                if paused:
+                    c.pause()
+                else:
+                    c.unpause()
+
+        try:
+            info = queue.get(timeout=0.1)
+        except Queue.Empty:
+            continue
+
+        ring_samples.put_sample(info)
+
+    sensors.stop_channels(channels)
+
+
+class Acquisition(object):
+    def __init__(self, pins_data, time_wait=5.0, priority=50, capacity=4096, monitor=None,
+                 observers=None, outliers=None, verbose=False):
+        """
+        Sensor channels running in a dedicated high-priority process.
+
+        Parameters
+        ----------
+        pins_data : list of DHT22 data pins.
+
+        time_wait : seconds between reads on each channel.
+
+        priority : real-time priority for the acquisition process, 0 - 99.
+
+        capacity : rows in each shared ring buffer.
+
+        monitor : optional Health_Monitor fed from the reads ring in this process.
+
+        observers : optional further functions(pin, time_read, ok, msg, duration) called for
+                    every read attempt, in this process.
+
+        outliers : optional outlier policy, see sensors.start_channels.
+
+        """
+        self.pins_data = list(pins_data)
+        self.monitor = monitor
+        self.observers = list(observers or [])
+
+        self.samples = Sample_Ring(capacity)
+        self.reads = Ring_Buffer(capacity, width=5)
+        self.flags_pause = multiprocessing.RawArray('b', len(self.pins_data))
+        self.event_stop = multiprocessing.Event()
+
+        self.channels = [Remote_Channel(p, k, self)
+                         for k, p in enumerate(self.pins_data)]
+
+        if monitor:
+            for p in self.pins_data:
+                monitor.add(p)
+            self.observers.insert(0, monitor.report)
+
+        self.process = multiprocessing.Process(target=run_acquisition, name='acquisition',
+                                               args=(self.pins_data, self.samples, self.reads,
+                                                     self.flags_pause, self.event_stop),
+                                               kwargs={'time_wait': time_wait,
+                                                       'priority': priority,
+                                                       'outliers': outliers,
+                                                       'verbose': verbose})
+        self.process.daemon = True
+
+        self.thread_pump = threading.Thread(target=self.pump, name='acquisition_pump')
+        self.thread_pump.daemon = True
+
+    def start(self):
+        self.process.start()
+        self.thread_pump.start()
+
+    def pump(self, time_poll=0.1):
+        """
+        Hand read attempts from the acquisition process to local observers.
+        """
+        while not self.event_stop.is_set():
+            self.pump_once()
+            time.sleep(time_poll)
+
+        self.pump_once()
+
+    def pump_once(self):
+        for seconds, pin, ok, duration, code in self.reads.get_rows():
+            msg = None if ok else _REASONS[int(code)]
+            for observer in self.observers:
+                observer(int(pin), seconds, bool(ok), msg, duration)
+
+    def stop(self):
+        """
+        Stop the acquisition process and wait for it to finish.  Safe to call more than once.
+        """
+        if not self.process.is_alive():
+            self.event_stop.set()
+            return
+
+        self.event_stop.set()
+        self.process.join(10.)
+        if self.process.is_alive():
+            self.process.terminate()
+
+        self.thread_pump.join(1.)
+
+#################################################
+
+
+if __name__ == '__main__':
+    """
+    Development and examples.
+    """
+    acq = Acquisition([4, 17], verbose=True)
+    acq.start()
+
+    try:
+        while True:
+            time.sleep(10)
+            while not acq.samples.empty():
+                print(acq.samples.get())
+    except KeyboardInterrupt:
+        pass
+
+    acq.stop()
@@ -0,0 +1,484 @@
+
+from __future__ import division, print_function, unicode_literals
+
+"""
+GPIO timing benchmark suite.
+
+Cases:
+  - read_latency: distribution of digitalRead call durations.
+  - write_latency: distribution of digitalWrite call durations.
+  - delay_accuracy: actual duration of delayMicroseconds versus requested.
+  - loop_jitter: iteration period of a paced loop, idle and with all other CPUs busy.
+  - dht22: read_dht22_single success rate, duration and failure reasons per pin.
+
+Results are plain dicts saved as JSON, along with information about the machine they were
+recorded on, so runs on different kernels, Pi models or code versions can be compared.
+
+The hardware backend uses the Cython kernels in measure_timing and the DHT22 reader in dht22.
+The simulated backend exercises the same cases against an in-memory pin state and synthetic
+sensor, and runs on any Linux box.
+
+Example:
+
+    python benchmark.py --pins 4 17 --output results_new.json --compare results_old.json
+    python benchmark.py --simulate
+"""
+
+import os
+import time
+import json
+import socket
+import random
+import argparse
+import platform
+import multiprocessing
+import contextlib
+
+import numpy as np
+
+import metrics
+
+#################################################
+
+
+def summarize(values):
+    """
+    Summary statistics of a sequence of durations.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if not values.size:
+        return {'count': 0}
+
+    info = {'count': int(values.size),
+            'mean': float(np.mean(values)),
+            'std': float(np.std(values)),
+            'min': float(np.min(values)),
+            'p50': float(np.percentile(values, 50)),
+            'p90': float(np.percentile(values, 90)),
+            'p99': float(np.percentile(values, 99)),
+            'max': float(np.max(values))}
+
+    return info
+
+
+failure_reason = metrics.failure_reason
+
+
+def _busy():
+    """Spin forever.  Target for CPU load processes.
+    """
+    while True:
+        pass
+
+
+@contextlib.contextmanager
+def cpu_load(num_processes=None):
+    """
+    Keep all other CPUs busy for the duration of the context.
+    """
+    if num_processes is None:
+        num_processes = max(1, multiprocessing.cpu_count() - 1)
+
+    workers = [multiprocessing.Process(target=_busy) for k in range(num_processes)]
+    for w in workers:
+        w.daemon = True
+        w.start()
+
+    try:
+        yield
+    finally:
+        for w in workers:
+            w.terminate()
+            w.join()
+
+
+def machine_info():
+    """
+    Describe the machine the benchmark runs on.
+    """
+    system, node, release, version, machine, processor = platform.uname()
+
+    info = {'host': socket.gethostname(),
+            'system': system,
+            'kernel': release,
+            'kernel_version': version,
+            'machine': machine,
+            'python': platform.python_version(),
+            'cpu_count': multiprocessing.cpu_count()}
+
+    # Raspberry Pi board revision.
+    try:
+        with open('/proc/cpuinfo', 'r') as fi:
+            for line in fi:
+                key, sep, value = line.partition(':')
+                key = key.strip().lower()
+                if key in ['hardware', 'revision', 'model']:
+                    info['cpu_' + key] = value.strip()
+    except IOError:
+        pass
+
+    return info
+
+#################################################
+
+
+class Hardware_Backend(object):
+    name = 'hardware'
+
+    def __init__(self):
+        """
+        Real GPIO through measure_timing and dht22.  Requires root on a Raspberry Pi.
+        """
+        import measure_timing
+        import dht22
+
+        self.measure_timing = measure_timing
+        self.dht22 = dht22
+
+    def timer_overhead(self, num_samples):
+        return self.measure_timing.timer_overhead(num_samples)
+
+    def read_latency(self, pin, num_samples):
+        return self.measure_timing.read_latency(pin, num_samples)
+
+    def write_latency(self, pin, num_samples):
+        return self.measure_timing.write_latency(pin, num_samples)
+
+    def delay_accuracy(self, delay, num_samples):
+        return self.measure_timing.delay_accuracy(delay, num_samples)
+
+    def loop_jitter(self, period, num_samples):
+        return self.measure_timing.loop_jitter(period, num_samples)
+
+    def read_dht22(self, pin):
+        return self.dht22.read_dht22_single(pin)
+
+
+class Simulated_Backend(object):
+    name = 'simulated'
+
+    def __init__(self, rate_success=0.8, seed=None):
+        """
+        In-memory pin state and synthetic DHT22 sensors.  Timings are real measurements of the
+        Python code paths involved, so results still reflect the host's scheduling behavior.
+
+        Parameters
+        ----------
+        rate_success : fraction of simulated sensor reads that succeed.
+
+        """
+        self.rate_success = rate_success
+        self.pins = {}
+        self.random = random.Random(seed)
+
+    def _now_ns(self):
+        return int(time.time() * 1.e9)
+
+    def digitalRead(self, pin):
+        return self.pins.get(pin, 0)
+
+    def digitalWrite(self, pin, value):
+        self.pins[pin] = value
+
+    def timer_overhead(self, num_samples):
+        data = np.zeros(num_samples, dtype=np.int64)
+        for k in range(num_samples):
+            t0 = self._now_ns()
+            data[k] = self._now_ns() - t0
+        return data
+
+    def read_latency(self, pin, num_samples):
+        data = np.zeros(num_samples, dtype=np.int64)
+        for k in range(num_samples):
+            t0 = self._now_ns()
+            self.digitalRead(pin)
+            data[k] = self._now_ns() - t0
+        return data
+
+    def write_latency(self, pin, num_samples):
+        data = np.zeros(num_samples, dtype=np.int64)
+        for k in range(num_samples):
+            t0 = self._now_ns()
+            self.digitalWrite(pin, k & 1)
+            data[k] = self._now_ns() - t0
+        return data
+
+    def delay_accuracy(self, delay, num_samples):
+        data = np.zeros(num_samples, dtype=np.int64)
+        for k in range(num_samples):
+            t0 = self._now_ns()
+            time.sleep(delay * 1.e-6)
+            data[k] = self._now_ns() - t0
+        return data
+
+    def loop_jitter(self, period, num_samples):
+        data = np.zeros(num_samples, dtype=np.int64)
+        period_ns = period * 1000
+        t_prior = self._now_ns()
+        t_next = t_prior + period_ns
+        for k in range(num_samples):
+            t_now = self._now_ns()
+            while t_now < t_next:
+                t_now = self._now_ns()
+
+            data[k] = t_now - t_prior
+            t_prior = t_now
+            t_next += period_ns
+        return data
+
+    def read_dht22(self, pin):
+        # A real read takes about 5 ms of signalling plus the 10 ms start pulse.
+        time.sleep(0.015)
+
+        if self.random.random() < self.rate_success:
+            RH = round(self.random.uniform(30., 60.), 1)
+            Tf = round(self.random.uniform(60., 80.), 1)
+            return RH, Tf
+
+        msg = self.random.choice(['Fail checksum',
+                                  'Fail len(bits) != 40 [%d]' % self.random.randint(0, 39),
+                                  'Problem reading data from sensor.  count: 0, pin: %d, '
+                                  'bit: -1' % pin])
+        return None, msg
+
+#################################################
+
+
+def case_read_latency(backend, pin, num_samples=10000):
+    overhead = np.median(backend.timer_overhead(num_samples))
+    data = backend.read_latency(pin, num_samples) - overhead
+
+    info = summarize(data)
+    info.update({'pin': pin, 'unit': 'ns'})
+    return info
+
+
+def case_write_latency(backend, pin, num_samples=10000):
+    overhead = np.median(backend.timer_overhead(num_samples))
+    data = backend.write_latency(pin, num_samples) - overhead
+
+    info = summarize(data)
+    info.update({'pin': pin, 'unit': 'ns'})
+    return info
+
+
+def case_delay_accuracy(backend, delays=(1, 10, 100, 1000), num_samples=1000):
+    """
+    Error of actual delay relative to requested, per requested delay.
+    """
+    results = {}
+    for delay in delays:
+        data = backend.delay_accuracy(delay, num_samples) - delay * 1000
+
+        info = summarize(data)
+        info.update({'delay_us': delay, 'unit': 'ns'})
+        results[str(delay)] = info
+
+    return results
+
+
+def case_loop_jitter(backend, period=100, num_samples=10000, with_load=True):
+    """
+    Deviation of each loop iteration from the target period, idle and under CPU load.
+    """
+    results = {}
+
+    data = backend.loop_jitter(period, num_samples) - period * 1000
+    results['idle'] = summarize(data)
+    results['idle'].update({'period_us': period, 'unit': 'ns'})
+
+    if with_load:
+        with cpu_load():
+            time.sleep(0.5)
+            data = backend.loop_jitter(period, num_samples) - period * 1000
+
+        results['load'] = summarize(data)
+        results['load'].update({'period_us': period, 'unit': 'ns'})
+
+    return results
+
+
+def case_dht22(backend, pins, num_reads=20, time_wait=2.5):
+    """
+    Success rate, duration and failure reasons of read_dht22_single, per pin.
+
+    The DHT22 needs about 2 seconds between reads.  Pins are interleaved so each one rests
+    for time_wait seconds between its own reads.
+    """
+    durations = dict((p, []) for p in pins)
+    failures = dict((p, {}) for p in pins)
+    count_good = dict((p, 0) for p in pins)
+
+    for k in range(num_reads):
+        time_zero = time.time()
+        for p in pins:
+            t0 = time.time()
+            RH, Tf = backend.read_dht22(p)
+            durations[p].append((time.time() - t0) * 1.e3)
+
+            if RH:
+                count_good[p] += 1
+            else:
+                reason = failure_reason(Tf)
+                failures[p][reason] = failures[p].get(reason, 0) + 1
+
+        time_sleep = time_wait - (time.time() - time_zero)
+        if time_sleep > 0 and k < num_reads - 1:
+            time.sleep(time_sleep)
+
+    results = {}
+    for p in pins:
+        info = {'pin': p,
+                'reads': num_reads,
+                'success_rate': count_good[p] / num_reads,
+                'duration': summarize(durations[p]),
+                'failures': failures[p]}
+        info['duration']['unit'] = 'ms'
+        results[str(p)] = info
+
+    return results
+
+#################################################
+
+
+def run(backend, pin_io=21, pins_dht22=None, num_samples=10000, num_reads=20, with_load=True,
+        verbose=False):
+    """
+    Run all benchmark cases.  Return results dict.
+    """
+    results = {'meta': machine_info(),
+               'cases': {}}
+
+    results['meta']['backend'] = backend.name
+    results['meta']['time'] = time.time()
+
+    cases = results['cases']
+
+    if verbose:
+        print('read_latency')
+    cases['read_latency'] = case_read_latency(backend, pin_io, num_samples)
+
+    if verbose:
+        print('write_latency')
+    cases['write_latency'] = case_write_latency(backend, pin_io, num_samples)
+
+    if verbose:
+        print('delay_accuracy')
+    cases['delay_accuracy'] = case_delay_accuracy(backend, num_samples=num_samples // 10)
+
+    if verbose:
+        print('loop_jitter')
+    cases['loop_jitter'] = case_loop_jitter(backend, num_samples=num_samples, with_load=with_load)
+
+    if pins_dht22:
+        if verbose:
+            print('dht22')
+        cases['dht22'] = case_dht22(backend, pins_dht22, num_reads)
+
+    return results
+
+
+def save(results, fname):
+    with open(fname, 'w') as fo:
+        json.dump(results, fo, indent=2, sort_keys=True)
+
+
+def load(fname):
+    with open(fname, 'r') as fi:
+        return json.load(fi)
+
+
+def flatten(info, prefix=''):
+    """
+    Flatten nested results into {'case.sub.key': number}.
+    """
+    values = {}
+    for key, value in info.items():
+        name = prefix + '.' + key if prefix else key
+        if isinstance(value, dict):
+            values.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+
+    return values
+
+
+def compare(results_old, results_new):
+    """
+    Relative change of every numeric result present in both runs.
+
+    Returns
+    -------
+    List of tuples (name, old, new, fraction change).
+
+    """
+    old = flatten(results_old['cases'])
+    new = flatten(results_new['cases'])
+
+    changes = []
+    for name in sorted(set(old) & set(new)):
+        a = old[name]
+        b = new[name]
+        if a:
+            delta = (b - a) / abs(a)
+        else:
+            delta = 0. if a == b else float('inf')
+
+        changes.append((name, a, b, delta))
+
+    return changes
+
+
+def pretty_compare(changes, threshold=0.05):
+    """
+    Print comparison, flagging changes larger than threshold.
+    """
+    for name, a, b, delta in changes:
+        flag = '*' if abs(delta) > threshold else ' '
+        print('{:s} {:50s} {:14.3f} {:14.3f} {:+8.1%}'.format(flag, name, a, b, delta))
+
+#################################################
+
+
+def main():
+    parser = argparse.ArgumentParser(description='GPIO timing benchmarks.')
+    parser.add_argument('--simulate', default=False, action='store_true',
+                        help='Use simulated backend instead of real GPIO.')
+    parser.add_argument('--pin', default=21, type=int,
+                        help='GPIO pin for read/write latency cases.')
+    parser.add_argument('--pins', default=[], type=int, nargs='*',
+                        help='GPIO pins with DHT22 sensors.')
+    parser.add_argument('--samples', default=10000, type=int,
+                        help='Number of samples for timing cases.')
+    parser.add_argument('--reads', default=20, type=int,
+                        help='Number of DHT22 reads per pin.')
+    parser.add_argument('--no_load', default=False, action='store_true',
+                        help='Skip loop jitter under CPU load.')
+    parser.add_argument('-o', '--output', default=None,
+                        help='Save results to JSON file.')
+    parser.add_argument('-c', '--compare', default=None,
+                        help='Compare against results from earlier JSON file.')
+
+    args = parser.parse_args()
+
+    if args.simulate:
+        backend = Simulated_Backend()
+    else:
+        backend = Hardware_Backend()
+
+    results = run(backend, args.pin, args.pins, args.samples, args.reads,
+                  with_load=not args.no_load, verbose=True)
+
+    if args.output:
+        save(results, args.output)
+        print('Saved: {:s}'.format(args.output))
+
+    if args.compare:
+        pretty_compare(compare(load(args.compare), results))
+    else:
+        for name, value in sorted(flatten(results['cases']).items()):
+            print('{:50s} {:14.3f}'.format(name, value))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,108 +1,316 @@
 
 from __future__ import division, print_function, unicode_literals
 
-import os
+"""
+Status LEDs.
+
+Every Blinker is driven by one shared Timer_Wheel thread.  The wheel keeps a heap of upcoming
+LED transitions and sleeps until the next one is due, so an idle or steady LED costs nothing and
+a blinking LED costs one wake-up per edge.  Transitions falling due together are written in a
+single gpio.write_many call.
+
+A blink pattern is a frequency, a duty cycle (fraction of each cycle the LED is on), and an
+optional burst: blink burst times then stay dark for pause seconds.  Frequency keeps its meaning
+from the original RPIO Blinker, which toggled the LED freq times per second: a full on/off
+cycle takes 2/freq seconds.
+"""
+
 import time
+import heapq
 import threading
 
-import RPIO
+import gpio
 
-class Blinker(threading.Thread):
-    def __init__(self, pin, freq=1, auto_start=True, *args, **kwargs):
-        """
-        Make an LED blink.
-        pin: GPIO pin number.
-        freq: Blinking frequency (Hz)
 
-        Set freqency to zero to temporarily disable LED.
+class Timer_Wheel(threading.Thread):
+    def __init__(self, tolerance=0.002, write_many=None, pin_mode=None, *args, **kwargs):
         """
+        Single thread driving any number of LED blink patterns.
 
+        Parameters
+        ----------
+        tolerance : transitions due within this many seconds of each other are written
+                    together.
+
+        write_many : function(pins, values) writing output levels.  Default is
+                     gpio.write_many.
+
+        pin_mode : function(pin) setting a pin as output.  Default uses gpio.pinMode.
+
+        """
         threading.Thread.__init__(self, *args, **kwargs)
+        self.daemon = True
 
-        self.lock = threading.Lock()
-        self.pin = pin
-        self.time_interval = 0
-        self.time_pause = 0.01
-        self.frequency = freq
-        self.timeout = 0
+        if write_many is None:
+            write_many = gpio.write_many
 
-        RPIO.setwarnings(False)
-        RPIO.setup(self.pin, RPIO.OUT, initial=False)
+        if pin_mode is None:
+            gpio.wiringPiSetupGpio()
+            pin_mode = lambda pin: gpio.pinMode(pin, gpio.OUTPUT)
 
-        if auto_start:
-            self.start()
+        self.tolerance = tolerance
+        self.write_many = write_many
+        self.pin_mode = pin_mode
+
+        self.condition = threading.Condition()
+        self.heap = []
+        self.keep_running = False
 
         # Done.
 
+    def start(self):
+        self.keep_running = True
+        threading.Thread.start(self)
 
+    def stop(self):
+        """
+        Tell thread to stop running.
+        """
+        with self.condition:
+            self.keep_running = False
+            self.condition.notify()
+
+    def schedule(self, blinker):
+        """
+        Restart blinker's pattern from the beginning.  Any transitions already queued for it
+        are discarded.
+        """
+        with self.condition:
+            blinker.generation += 1
+            heapq.heappush(self.heap, (time.time(), blinker.generation, blinker))
+            self.condition.notify()
+
+    def _pop_due(self):
+        """
+        Wait for the next transitions to fall due and return them as a list of
+        (time, generation, blinker).
+        """
+        with self.condition:
+            while self.keep_running:
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+
+                time_wait = self.heap[0][0] - time.time()
+                if time_wait > self.tolerance:
+                    self.condition.wait(time_wait)
+                    continue
+
+                time_limit = time.time() + self.tolerance
+                due = []
+                while self.heap and self.heap[0][0] <= time_limit:
+                    item = heapq.heappop(self.heap)
+                    if item[1] == item[2].generation:
+                        due.append(item)
+
+                if due:
+                    return due
+
+        return []
 
     def run(self):
         """
         This is where the work happens.
         """
-        time_base = time.time()
-        self.keep_running = True
-
         while self.keep_running:
-            time.sleep(self.time_pause)
+            due = self._pop_due()
+            if not due:
+                continue
+
+            pins = []
+            values = []
+            for time_due, generation, blinker in due:
+                value, duration = blinker.step()
+                pins.append(blinker.pin)
+                values.append(value)
+
+                if duration is None:
+                    # Steady state, nothing more to do until the pattern changes.
+                    continue
+
+                time_next = time_due + duration
+                time_now = time.time()
+                if time_next < time_now:
+                    # Fell behind, don't try to catch up.
+                    time_next = time_now + duration
+
+                with self.condition:
+                    if generation == blinker.generation:
+                        heapq.heappush(self.heap, (time_next, generation, blinker))
+
+            self.write_many(pins, values)
+
+        # Done.
+
+
+_wheel = None
+_wheel_lock = threading.Lock()
 
-            time_now = time.time()
 
-            if self.time_interval <= 0:
-                # Off.
-                RPIO.output(self.pin, False)
+def get_wheel():
+    """
+    Return the process-wide Timer_Wheel, creating and starting it on first call.
+    """
+    global _wheel
 
-            elif time_now - time_base > self.time_interval:
-                time_base = time_now
+    with _wheel_lock:
+        if _wheel is None:
+            _wheel = Timer_Wheel()
+            _wheel.start()
 
-                # Reverse LED state.
-                value = RPIO.input(self.pin)
-                RPIO.output(self.pin, not value)
+    return _wheel
 
-            # Repeat loop.
+#################################################
 
-        print('Blinker exit: %d' % self.pin)
-        RPIO.output(self.pin, False)
+
+def make_segments(freq, duty=0.5, burst=0, pause=0.):
+    """
+    Convert a blink pattern to a list of (level, seconds) segments repeated forever.  A
+    duration of None means hold that level indefinitely.
+    """
+    if freq <= 0 or duty <= 0:
+        return [(0, None)]
+
+    if duty >= 1:
+        return [(1, None)]
+
+    # freq counts toggles, two per cycle.
+    period = 2./freq
+    time_on = duty*period
+    time_off = period - time_on
+
+    if burst <= 0:
+        return [(1, time_on), (0, time_off)]
+
+    segments = [(1, time_on), (0, time_off)]*int(burst)
+    segments[-1] = (0, time_off + pause)
+
+    return segments
+
+
+class Blinker(object):
+    def __init__(self, pin, freq=1, auto_start=True, duty=0.5, burst=0, pause=1., wheel=None):
+        """
+        Make an LED blink.
+        pin: GPIO pin number.
+        freq: Blinking frequency (Hz), LED toggles per second.  A full cycle takes 2/freq.
+        duty: fraction of each cycle the LED is on.
+        burst: number of blinks per burst, zero to blink continuously.
+        pause: dark time between bursts (seconds).
+
+        Set freqency to zero to temporarily disable LED.  Pin None for no LED at all, e.g. when
+        replaying recorded data away from the Pi.
+        """
+        if wheel is None and pin is not None:
+            wheel = get_wheel()
+
+        self.pin = pin
+        self.wheel = wheel
+        self.generation = 0
+        self.running = False
+
+        self.pattern = (freq, duty, burst, pause)
+        self.segments = make_segments(*self.pattern)
+        self.index = 0
+
+        if self.wheel is None:
+            return
+
+        self.wheel.pin_mode(self.pin)
+
+        if auto_start:
+            self.start()
 
         # Done.
 
+    def start(self):
+        if self.wheel is None:
+            return
 
+        self.running = True
+        self.wheel.schedule(self)
+
+    def step(self):
+        """
+        Advance to the next segment of the pattern.  Called from the wheel thread only.
+        Return (level, seconds until next transition).
+        """
+        if not self.running:
+            return 0, None
+
+        segments = self.segments
+        level, duration = segments[self.index % len(segments)]
+        self.index = (self.index + 1) % len(segments)
+
+        return level, duration
 
     def stop(self):
         """
-        Tell thread to stop running.
+        Stop blinking and turn LED off.
         """
-        self.lock.acquire()
-        self.keep_running = False
-        self.lock.release()
+        if self.wheel is None:
+            return
+
+        self.running = False
+        self.wheel.schedule(self)
+
+    def set_pattern(self, freq, duty=0.5, burst=0, pause=1.):
+        """
+        Change the blink pattern.  No effect if the pattern is unchanged.
+        """
+        pattern = (freq, duty, burst, pause)
+        if pattern == self.pattern:
+            return
 
+        self.pattern = pattern
+        self.segments = make_segments(*pattern)
+        self.index = 0
 
+        if self.running:
+            self.wheel.schedule(self)
 
     @property
     def frequency(self):
         """
         Blinking frequency, Hz.
         """
-        self.lock.acquire()
-        try:
-            val = 1./self.time_interval
-        except ZeroDivisionError:
-            val = 0
+        return self.pattern[0]
+
+    @frequency.setter
+    def frequency(self, freq):
+        freq_old, duty, burst, pause = self.pattern
+        if freq < 0:
+            freq = 0
+
+        self.set_pattern(freq, duty, burst, pause)
 
-        self.lock.release()
+    @property
+    def duty(self):
+        """
+        Fraction of each blink cycle the LED is on.
+        """
+        return self.pattern[1]
 
-        return val
+    @duty.setter
+    def duty(self, duty):
+        freq, duty_old, burst, pause = self.pattern
+        self.set_pattern(freq, duty, burst, pause)
 
+#################################################
 
 
-    @frequency.setter
-    def frequency(self, freq):
+if __name__ == '__main__':
+    """
+    Development and examples.
+    """
+    leds = [Blinker(18, freq=2), Blinker(23, freq=1, duty=0.1), Blinker(24, freq=8, burst=3)]
 
-        self.lock.acquire()
+    try:
+        time.sleep(10)
+    except KeyboardInterrupt:
+        pass
 
-        if freq > 0:
-            self.time_interval = 1./freq
-        else:
-            self.time_interval = 0
+    for led in leds:
+        led.stop()
 
-        self.lock.release()
+    time.sleep(0.1)
@@ -0,0 +1,386 @@
+
+from __future__ import division, print_function, unicode_literals
+
+"""
+Compact block encoding for sensor time series.
+
+Samples (seconds, pin, RH, Tf and optionally kind) are written in blocks of a few thousand
+rows.  Within a block:
+  - Timestamps, in units of 0.01 s, are stored as delta of delta.  Regular sampling makes
+    nearly all of these zero or tiny.
+  - RH and Tf, in units of 0.01, are stored per pin as a first value plus int16 deltas.  Slowly
+    varying sensor data gives deltas of a few units.
+  - Every integer column is zigzag encoded and bit-packed at the smallest width that holds its
+    largest value.
+
+Resolution matches the text formats already in use (two decimal places), so nothing is lost
+relative to the spool or the upload rows.
+
+A file is a plain sequence of blocks, each with a small header holding its size, row count,
+time span and checksum.  Appending is just writing more blocks, a block cut short by a crash is
+detected and ignored, and Reader builds a block index from the headers alone, giving random
+access by block number or time range without decoding anything else.
+"""
+
+import os
+import zlib
+import struct
+import collections
+
+import numpy as np
+
+_MAGIC = b'TSB1'
+
+# Block header: magic, number of rows, payload bytes, first and last seconds, payload crc32.
+_HEADER = struct.Struct(str('<4sIIddI'))
+
+# Fixed point scale for timestamps and values.
+_SCALE_SECONDS = 100
+_SCALE_VALUE = 100
+
+ROWS_BLOCK = 4096
+
+Block_Info = collections.namedtuple('Block_Info', ['offset', 'size', 'num_rows',
+                                                   'seconds_first', 'seconds_last'])
+
+#################################################
+
+
+def zigzag(values):
+    """
+    Map signed integers to unsigned so small magnitudes give small numbers.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    return ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+
+def unzigzag(values):
+    values = np.asarray(values, dtype=np.uint64)
+    return ((values >> np.uint64(1)).view(np.int64) ^
+            -(values & np.uint64(1)).view(np.int64))
+
+
+def pack(values):
+    """
+    Bit-pack unsigned integers at the smallest common width.  Returns bytes starting with
+    the width.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+
+    width = int(values.max()).bit_length() if values.size else 0
+    if not width:
+        return struct.pack(str('<B'), 0)
+
+    shifts = np.arange(width - 1, -1, -1, dtype=np.uint64)
+    bits = ((values[:, np.newaxis] >> shifts) & np.uint64(1)).astype(np.uint8)
+
+    return struct.pack(str('<B'), width) + np.packbits(bits.ravel()).tobytes()
+
+
+def unpack(data, offset, count):
+    """
+    Inverse of pack.  Return values and offset just past the packed bytes.
+    """
+    width = struct.unpack_from(str('<B'), data, offset)[0]
+    offset += 1
+
+    if not width:
+        return np.zeros(count, dtype=np.uint64), offset
+
+    num_bytes = (count*width + 7) // 8
+    packed = np.frombuffer(data, dtype=np.uint8, count=num_bytes, offset=offset)
+    bits = np.unpackbits(packed)[:count*width].reshape(count, width).astype(np.uint64)
+
+    weights = np.uint64(1) << np.arange(width - 1, -1, -1, dtype=np.uint64)
+    values = (bits * weights).sum(axis=1, dtype=np.uint64)
+
+    return values, offset + num_bytes
+
+
+def _fixed(values, scale):
+    values = np.asarray(values, dtype=np.float64)
+    if not np.all(np.isfinite(values)):
+        raise ValueError('Codec can not store NaN or infinite values.')
+
+    return np.round(values*scale).astype(np.int64)
+
+#################################################
+
+
+def encode_block(columns):
+    """
+    Encode one block of samples.
+
+    columns : dict with equal length arrays 'seconds', 'pin', 'RH', 'Tf', and optionally a
+              sequence of strings 'kind'.
+
+    Returns
+    -------
+    Block bytes, header included.
+
+    """
+    seconds = _fixed(columns['seconds'], _SCALE_SECONDS)
+    pins = np.asarray(columns['pin'], dtype=np.int64)
+    num_rows = seconds.size
+
+    if not num_rows:
+        raise ValueError('Can not encode an empty block.')
+
+    parts = []
+
+    # Pins as indices into the list of pins present.
+    pins_unique, pin_index = np.unique(pins, return_inverse=True)
+    parts.append(struct.pack(str('<H'), pins_unique.size))
+    parts.append(struct.pack(str('<%di' % pins_unique.size), *pins_unique))
+    parts.append(pack(pin_index))
+
+    # Kinds as indices into the list of kinds present.
+    kinds = columns.get('kind')
+    if kinds is None:
+        parts.append(struct.pack(str('<B'), 0))
+    else:
+        kinds_unique, kind_index = np.unique(np.asarray(kinds, dtype=object).astype('U'),
+                                             return_inverse=True)
+        parts.append(struct.pack(str('<B'), kinds_unique.size))
+        for k in kinds_unique:
+            text = k.encode('utf-8')
+            parts.append(struct.pack(str('<B'), len(text)) + text)
+        parts.append(pack(kind_index))
+
+    # Timestamps, delta of delta.
+    deltas = np.diff(seconds)
+    first_delta = deltas[0] if deltas.size else 0
+    parts.append(struct.pack(str('<qq'), seconds[0], first_delta))
+    parts.append(pack(zigzag(np.diff(deltas))))
+
+    # Values, deltas within each pin.
+    order = np.argsort(pin_index, kind='mergesort')
+    starts = np.searchsorted(pin_index[order], np.arange(pins_unique.size))
+    is_first = np.zeros(num_rows, dtype=bool)
+    is_first[starts] = True
+
+    for name in ['RH', 'Tf']:
+        values = _fixed(columns[name], _SCALE_VALUE)[order]
+        deltas = np.diff(values)
+        deltas = deltas[~is_first[1:]]
+
+        if deltas.size and np.abs(deltas).max() > 32767:
+            raise ValueError('{:s} change too large for int16 delta.'.format(name))
+
+        firsts = values[starts]
+        parts.append(struct.pack(str('<%di' % firsts.size), *firsts))
+        parts.append(pack(zigzag(deltas)))
+
+    payload = b''.join(parts)
+    header = _HEADER.pack(_MAGIC, num_rows, len(payload),
+                          seconds[0] / _SCALE_SECONDS, seconds[-1] / _SCALE_SECONDS,
+                          zlib.crc32(payload) & 0xffffffff)
+
+    return header + payload
+
+
+def decode_block(data, offset=0):
+    """
+    Decode one block starting at offset.  Returns columns dict as given to encode_block,
+    with 'kind' only if it was stored.
+    """
+    magic, num_rows, size, t0, t1, crc = _HEADER.unpack_from(data, offset)
+    if magic != _MAGIC:
+        raise ValueError('Not a codec block.')
+
+    offset += _HEADER.size
+    payload = data[offset:offset + size]
+    if len(payload) != size or zlib.crc32(payload) & 0xffffffff != crc:
+        raise ValueError('Codec block is truncated or corrupt.')
+
+    offset = 0
+    columns = {}
+
+    num_pins = struct.unpack_from(str('<H'), payload, offset)[0]
+    offset += 2
+    pins_unique = np.array(struct.unpack_from(str('<%di' % num_pins), payload, offset),
+                           dtype=np.int64)
+    offset += 4*num_pins
+    pin_index, offset = unpack(payload, offset, num_rows)
+    pin_index = pin_index.astype(np.int64)
+    columns['pin'] = pins_unique[pin_index].astype(np.int32)
+
+    num_kinds = struct.unpack_from(str('<B'), payload, offset)[0]
+    offset += 1
+    if num_kinds:
+        kinds_unique = []
+        for k in range(num_kinds):
+            n = struct.unpack_from(str('<B'), payload, offset)[0]
+            kinds_unique.append(payload[offset + 1:offset + 1 + n].decode('utf-8'))
+            offset += 1 + n
+        kind_index, offset = unpack(payload, offset, num_rows)
+        columns['kind'] = [kinds_unique[k] for k in kind_index.astype(np.int64)]
+
+    seconds_first, first_delta = struct.unpack_from(str('<qq'), payload, offset)
+    offset += 16
+    dod, offset = unpack(payload, offset, max(num_rows - 2, 0))
+    deltas = np.concatenate([[first_delta], first_delta + np.cumsum(unzigzag(dod))])
+    seconds = np.concatenate([[seconds_first], seconds_first + np.cumsum(deltas)])[:num_rows]
+    columns['seconds'] = seconds / _SCALE_SECONDS
+
+    order = np.argsort(pin_index, kind='mergesort')
+    sizes = np.bincount(pin_index, minlength=num_pins)
+
+    for name in ['RH', 'Tf']:
+        firsts = np.array(struct.unpack_from(str('<%di' % num_pins), payload, offset),
+                          dtype=np.int64)
+        offset += 4*num_pins
+        deltas, offset = unpack(payload, offset, num_rows - num_pins)
+        deltas = unzigzag(deltas)
+
+        # Rebuild each pin run from its first value and deltas.
+        values_sorted = np.empty(num_rows, dtype=np.int64)
+        a = 0
+        for k, n in enumerate(sizes):
+            values_sorted[a + k:a + k + n] = firsts[k] + np.concatenate(
+                [[0], np.cumsum(deltas[a:a + n - 1])])
+            a += n - 1
+
+        values = np.empty(num_rows, dtype=np.int64)
+        values[order] = values_sorted
+
+        columns[name] = values / _SCALE_VALUE
+
+    return columns
+
+
+def concatenate(blocks):
+    """
+    Join a list of columns dicts into one.
+    """
+    columns = {}
+    for name in ['seconds', 'pin', 'RH', 'Tf']:
+        columns[name] = np.concatenate([b[name] for b in blocks]) if blocks else np.zeros(0)
+
+    if blocks and all('kind' in b for b in blocks):
+        columns['kind'] = [k for b in blocks for k in b['kind']]
+
+    return columns
+
+#################################################
+
+
+def append(fname, columns, rows_block=ROWS_BLOCK):
+    """
+    Append samples to a codec file as one or more blocks.  Returns number of bytes written.
+    """
+    num_rows = len(columns['seconds'])
+    blocks = []
+    for k in range(0, num_rows, rows_block):
+        part = dict((n, v[k:k + rows_block]) for n, v in columns.items())
+        blocks.append(encode_block(part))
+
+    content = b''.join(blocks)
+    with open(fname, 'ab') as fo:
+        fo.write(content)
+
+    return len(content)
+
+
+def write(fname, columns, rows_block=ROWS_BLOCK):
+    """
+    Write samples to a new codec file, replacing any existing file.
+    """
+    fname_temp = fname + '.tmp'
+    if os.path.isfile(fname_temp):
+        os.remove(fname_temp)
+
+    append(fname_temp, columns, rows_block)
+    os.rename(fname_temp, fname)
+
+
+class Reader(object):
+    def __init__(self, fname):
+        """
+        Random access to the blocks of a codec file.  The block index is built from block
+        headers only.  A trailing partial block, e.g. from a crash while appending, is ignored.
+        """
+        self.fname = fname
+
+        with open(fname, 'rb') as fi:
+            self.data = fi.read()
+
+        self.index = []
+        offset = 0
+        while offset + _HEADER.size <= len(self.data):
+            magic, num_rows, size, t0, t1, crc = _HEADER.unpack_from(self.data, offset)
+            if magic != _MAGIC or offset + _HEADER.size + size > len(self.data):
+                break
+
+            self.index.append(Block_Info(offset, _HEADER.size + size, num_rows, t0, t1))
+            offset += _HEADER.size + size
+
+        self.size_valid = offset
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def num_rows(self):
+        return sum(b.num_rows for b in self.index)
+
+    def read_block(self, k):
+        return decode_block(self.data, self.index[k].offset)
+
+    def blocks_between(self, seconds_start=None, seconds_end=None):
+        """
+        Numbers of blocks that may hold samples with seconds_start <= seconds < seconds_end.
+        """
+        result = []
+        for k, b in enumerate(self.index):
+            if seconds_start is not None and b.seconds_last < seconds_start:
+                continue
+            if seconds_end is not None and b.seconds_first >= seconds_end:
+                continue
+            result.append(k)
+
+        return result
+
+    def read(self, seconds_start=None, seconds_end=None):
+        """
+        Decode samples within the time range, or everything.
+        """
+        blocks = [self.read_block(k) for k in self.blocks_between(seconds_start, seconds_end)]
+        columns = concatenate(blocks)
+
+        if seconds_start is not None or seconds_end is not None:
+            mask = np.ones(columns['seconds'].size, dtype=bool)
+            if seconds_start is not None:
+                mask &= columns['seconds'] >= seconds_start
+            if seconds_end is not None:
+                mask &= columns['seconds'] < seconds_end
+
+            kinds = columns.pop('kind', None)
+            columns = dict((n, v[mask]) for n, v in columns.items())
+            if kinds is not None:
+                columns['kind'] = [k for k, m in zip(kinds, mask) if m]
+
+        return columns
+
+
+def read(fname, seconds_start=None, seconds_end=None):
+    return Reader(fname).read(seconds_start, seconds_end)
+
+#################################################
+
+
+if __name__ == '__main__':
+    """
+    Development and examples.
+    """
+    fname = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample_data.txt')
+    data = np.loadtxt(fname, delimiter=',')
+
+    columns = {'seconds': data[:, 0],
+               'pin': np.full(data.shape[0], 4, dtype=np.int32),
+               'RH': data[:, 1],
+               'Tf': data[:, 2]}
+
+    block = encode_block(columns)
+    print('rows: %d  text bytes: %d  codec bytes: %d' % (data.shape[0], os.path.getsize(fname),
+                                                         len(block)))
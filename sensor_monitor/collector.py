@@ -0,0 +1,795 @@
+
+from __future__ import division, print_function, unicode_literals
+
+"""
+Site collector: many stations stream samples to one local service.
+
+Each station (a Pi running who8myrpi) sends batches of samples over TCP instead of uploading
+straight to the cloud table.  The collector:
+  - drops samples it has already seen, keyed by (station, pin, seconds),
+  - appends new samples to a day partitioned archive, one folder per station,
+  - spools them and forwards upstream in bulk, so the site needs a single uplink.  Each
+    station goes to its own table, <table>_<station>, with the same columns a station
+    uploading directly would use,
+  - answers local queries across all stations from the archive.
+
+Protocol.  Every message is a frame: header struct '<4sBI' (magic, message type, payload
+length) followed by the payload.
+  - HELLO, station -> collector: station name, UTF-8.
+  - BATCH, station -> collector: '<Q' sequence number, then one codec block.
+  - ACK, collector -> station: '<QII' sequence number, rows new, rows duplicate.
+  - ERROR, collector -> station: '<Q' sequence number, then message text, UTF-8.
+
+A batch is acknowledged only once spooled and archived.  Stations keep samples in their own
+spool until acknowledged and resend after reconnecting, so a batch may arrive twice; dedupe
+makes that harmless.  Batches are codec blocks, sent exactly as stored in the station spool.
+
+Example:
+
+    python collector.py --port 8477 --table who8myrpi_data
+"""
+
+import os
+import struct
+import socket
+import argparse
+import threading
+import SocketServer
+
+import numpy as np
+
+import codec
+import utility
+import upload
+import session
+import blinker
+
+from coroutine import coroutine
+
+
+def path_to_module():
+    p = os.path.dirname(os.path.abspath(__file__))
+    return p
+
+
+_folder_collector = 'collector'
+
+PORT = 8477
+
+_MAGIC = b'W8MC'
+_FRAME = struct.Struct(str('<4sBI'))
+_SEQUENCE = struct.Struct(str('<Q'))
+_ACK = struct.Struct(str('<QII'))
+
+MSG_HELLO = 1
+MSG_BATCH = 2
+MSG_ACK = 3
+MSG_ERROR = 4
+
+# Largest payload accepted, bytes.
+_PAYLOAD_MAX = 16*1024*1024
+
+#################################################
+
+
+class Collector_Error(Exception):
+    """
+    Problem reported by the collector, or a broken connection.
+    """
+    pass
+
+
+def read_exact(fi, size):
+    """
+    Read exactly size bytes from file-like fi.  Returns None on clean end of stream.
+    """
+    parts = []
+    remaining = size
+    while remaining:
+        data = fi.read(remaining)
+        if not data:
+            if remaining == size:
+                return None
+            raise Collector_Error('Connection closed mid-frame.')
+
+        parts.append(data)
+        remaining -= len(data)
+
+    return b''.join(parts)
+
+
+def read_message(fi):
+    """
+    Read one frame.  Returns (message type, payload), or None at end of stream.
+    """
+    header = read_exact(fi, _FRAME.size)
+    if header is None:
+        return None
+
+    magic, kind, size = _FRAME.unpack(header)
+    if magic != _MAGIC:
+        raise Collector_Error('Bad frame magic.')
+
+    if size > _PAYLOAD_MAX:
+        raise Collector_Error('Frame too large: {:d} bytes.'.format(size))
+
+    payload = read_exact(fi, size) if size else b''
+    if payload is None:
+        raise Collector_Error('Connection closed mid-frame.')
+
+    return kind, payload
+
+
+def write_message(fo, kind, payload=b''):
+    fo.write(_FRAME.pack(_MAGIC, kind, len(payload)) + payload)
+    fo.flush()
+
+#################################################
+
+
+class Dedupe(object):
+    def __init__(self, horizon=24*60*60.):
+        """
+        Remember (station, pin, seconds) keys seen within horizon seconds of each station's
+        latest sample.
+
+        Seconds are compared at the codec resolution of 0.01 s.
+        """
+        self.horizon = horizon
+        self.seen = {}
+        self.latest = {}
+        self.pruned = {}
+
+    def check(self, station, pins, seconds):
+        """
+        Record keys and return boolean mask, True for keys not seen before.  Repeats within
+        the same batch count as seen.  Keys older than the horizon are treated as new.
+        """
+        pins = np.asarray(pins, dtype=np.int64)
+        ticks = np.round(np.asarray(seconds, dtype=np.float64)*100).astype(np.int64)
+
+        mask = np.zeros(ticks.size, dtype=bool)
+        for pin in np.unique(pins):
+            rows = np.flatnonzero(pins == pin)
+            seen = self.seen.setdefault((station, int(pin)), set())
+            for k in rows:
+                t = int(ticks[k])
+                if t not in seen:
+                    seen.add(t)
+                    mask[k] = True
+
+        if ticks.size:
+            self.latest[station] = max(self.latest.get(station, ticks.max()), ticks.max())
+            self.prune(station)
+
+        return mask
+
+    def forget(self, station, pins, seconds):
+        """
+        Remove keys again, e.g. for a batch that could not be stored, so a resend counts as
+        new.
+        """
+        pins = np.asarray(pins, dtype=np.int64)
+        ticks = np.round(np.asarray(seconds, dtype=np.float64)*100).astype(np.int64)
+
+        for pin, t in zip(pins.tolist(), ticks.tolist()):
+            self.seen.get((station, pin), set()).discard(t)
+
+    def prune(self, station):
+        """
+        Forget keys older than the horizon.  Runs once the latest sample has moved on by a tenth
+        of the horizon, so the cost is spread thin.
+        """
+        horizon = int(self.horizon*100)
+        latest = self.latest[station]
+        if latest - self.pruned.get(station, latest - horizon) < horizon // 10:
+            return
+
+        cutoff = latest - horizon
+        for key, seen in self.seen.items():
+            if key[0] == station:
+                self.seen[key] = set(t for t in seen if t >= cutoff)
+
+        self.pruned[station] = latest
+
+
+def take(columns, mask):
+    """
+    Rows of columns where mask is True.
+    """
+    kinds = columns.get('kind')
+    result = dict((n, np.asarray(v)[mask]) for n, v in columns.items() if n != 'kind')
+    if kinds is not None:
+        result['kind'] = [k for k, m in zip(kinds, mask) if m]
+
+    return result
+
+#################################################
+
+
+class Collector(object):
+    def __init__(self, path=None, service=None, table_name=None, horizon=24*60*60.,
+                 rows_bulk_min=1000, use_gzip=False):
+        """
+        Receive, dedupe, archive and forward samples from many stations.
+
+        Parameters
+        ----------
+        path : folder for the archive and the upstream spools, one per station.
+
+        service : upstream Fusion Tables service.  None to archive only.
+
+        table_name : upstream tables are named <table_name>_<station>, created when first
+                     needed.
+
+        horizon : seconds of history kept for dedupe.
+
+        rows_bulk_min : forward once the spool holds this many rows.
+
+        use_gzip : compress upstream requests.
+
+        """
+        if not path:
+            path = os.path.join(path_to_module(), _folder_collector)
+
+        self.path = path
+        self.service = service
+        self.table_name = table_name
+        self.rows_bulk_min = rows_bulk_min
+        self.use_gzip = use_gzip
+
+        self.lock = threading.Lock()
+        self.lock_forward = threading.Lock()
+        self.dedupe = Dedupe(horizon)
+
+        # Station folder name -> Spool, and -> upstream tableId.
+        self.spools = {}
+        self.table_ids = {}
+
+        path_spool = os.path.join(path, 'spool')
+        if service and os.path.isdir(path_spool):
+            for name in sorted(os.listdir(path_spool)):
+                if os.path.isdir(os.path.join(path_spool, name)):
+                    self.spool_station(name)
+
+        self.count_new = 0
+        self.count_duplicate = 0
+        self.count_forwarded = 0
+
+        self.load_recent()
+
+    def folder_station(self, station):
+        return os.path.join(self.path, 'stations', utility.valid_filename(station))
+
+    def spool_station(self, station):
+        """
+        Upstream spool of one station, None if not forwarding.
+        """
+        if not self.service:
+            return None
+
+        name = utility.valid_filename(station)
+        if name not in self.spools:
+            self.spools[name] = upload.Spool(os.path.join(self.path, 'spool', name))
+
+        return self.spools[name]
+
+    @property
+    def num_spooled(self):
+        return sum(spool.num_rows for spool in self.spools.values())
+
+    def table_station(self, name):
+        """
+        Upstream tableId for a station folder name, the table is created if needed.
+        """
+        if name not in self.table_ids:
+            table_name = '{:s}_{:s}'.format(self.table_name, name)
+            self.table_ids[name] = upload.fetch_table(self.service, table_name,
+                                                      upload.column_types)
+
+        return self.table_ids[name]
+
+    def stations(self):
+        """
+        Names of stations found in the archive.
+        """
+        path = os.path.join(self.path, 'stations')
+        if not os.path.isdir(path):
+            return []
+
+        return sorted(os.listdir(path))
+
+    def files_between(self, station, seconds_start=None, seconds_end=None):
+        """
+        Archive files of one station for days overlapping the time range.
+        """
+        path = self.folder_station(station)
+        if not os.path.isdir(path):
+            return []
+
+        files = sorted(f for f in os.listdir(path) if f.startswith('data_') and
+                       f.endswith('.tsc'))
+
+        if seconds_start is not None:
+            day = utility.datetime_seconds(seconds_start).strftime('data_%Y-%m-%d.tsc')
+            files = [f for f in files if f >= day]
+        if seconds_end is not None:
+            day = utility.datetime_seconds(seconds_end).strftime('data_%Y-%m-%d.tsc')
+            files = [f for f in files if f <= day]
+
+        return [os.path.join(path, f) for f in files]
+
+    def load_recent(self):
+        """
+        Prime dedupe from the archive, so batches archived but not acknowledged before a
+        restart are recognized when resent.
+        """
+        for station in self.stations():
+            files = self.files_between(station)
+            if not files:
+                continue
+
+            reader = codec.Reader(files[-1])
+            if not len(reader):
+                continue
+
+            seconds_end = reader.index[-1].seconds_last
+            seconds_start = seconds_end - self.dedupe.horizon
+            for f in self.files_between(station, seconds_start):
+                columns = codec.read(f, seconds_start)
+                self.dedupe.check(station, columns['pin'], columns['seconds'])
+
+    def archive(self, station, columns):
+        """
+        Append samples to the station's daily archive files.
+        """
+        path = self.folder_station(station)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        # Local time zone offsets are whole hours, so every sample in an hour has one date.
+        hours, hour_index = np.unique(np.floor(columns['seconds'] / 3600.), return_inverse=True)
+        dates = np.array([utility.datetime_seconds(h*3600.).strftime('%Y-%m-%d') for h in hours])
+        dates = dates[hour_index]
+
+        for date in np.unique(dates):
+            f = os.path.join(path, 'data_{:s}.tsc'.format(date))
+            codec.append(f, take(columns, dates == date))
+
+    def accept(self, station, columns):
+        """
+        Dedupe, spool and archive one batch.  Returns (rows new, rows duplicate).
+
+        Rows are spooled before they are archived.  Dedupe is primed from the archive after a
+        restart, so a crash in between means the resent batch is spooled twice, rather than
+        archived but never forwarded.  If storing fails the batch is forgotten by dedupe and
+        counts as new when resent.
+        """
+        num_rows = len(columns['seconds'])
+
+        with self.lock:
+            mask = self.dedupe.check(station, columns['pin'], columns['seconds'])
+            fresh = take(columns, mask)
+            num_new = int(mask.sum())
+
+            if num_new:
+                if 'kind' not in fresh:
+                    fresh['kind'] = ['sample'] * num_new
+
+                try:
+                    spool = self.spool_station(station)
+                    if spool:
+                        spool.append(fresh)
+                    self.archive(station, fresh)
+                except Exception:
+                    self.dedupe.forget(station, fresh['pin'], fresh['seconds'])
+                    raise
+
+            self.count_new += num_new
+            self.count_duplicate += num_rows - num_new
+
+        return num_new, num_rows - num_new
+
+    def forward(self, force=False):
+        """
+        Upload spooled rows in bulk, each station to its own table.  Returns number of rows
+        forwarded.  Rows stay spooled if the upload fails.
+        """
+        if not self.service:
+            return 0
+
+        num_forwarded = 0
+        with self.lock_forward:
+            if not force and self.num_spooled < self.rows_bulk_min:
+                return 0
+
+            with self.lock:
+                spools = sorted(self.spools.items())
+
+            for name, spool in spools:
+                num_forwarded += self.forward_station(name, spool)
+
+        self.count_forwarded += num_forwarded
+
+        return num_forwarded
+
+    def forward_station(self, name, spool):
+        """
+        Upload one station's spool.  Returns number of rows forwarded.
+        """
+        num_forwarded = 0
+        while spool.num_rows:
+            with self.lock:
+                content, size = spool.read()
+
+            num_rows = content.count(b'\n')
+            try:
+                tableId = self.table_station(name)
+                num_uploaded = upload.import_rows(self.service, tableId, content,
+                                                  self.use_gzip)
+            except Exception as e:
+                print('collector.forward caught error: {:s}'.format(str(e)))
+                break
+
+            if num_uploaded != num_rows:
+                print('Error: Problem forwarding data: num_uploaded != num_rows: %s, %s' %
+                      (num_uploaded, num_rows))
+
+                # Rows the service took are not sent again.
+                if 0 < num_uploaded < num_rows:
+                    with self.lock:
+                        spool.consume_rows(num_uploaded)
+                    num_forwarded += num_uploaded
+                break
+
+            with self.lock:
+                spool.consume(size)
+
+            num_forwarded += num_rows
+
+        return num_forwarded
+
+    def query(self, seconds_start=None, seconds_end=None, stations=None):
+        """
+        Archived samples with seconds_start <= seconds < seconds_end.  Returns dict of station
+        -> columns.
+        """
+        if stations is None:
+            stations = self.stations()
+
+        result = {}
+        for station in stations:
+            blocks = [codec.read(f, seconds_start, seconds_end)
+                      for f in self.files_between(station, seconds_start, seconds_end)]
+            blocks = [b for b in blocks if len(b['seconds'])]
+            if blocks:
+                result[station] = codec.concatenate(blocks)
+
+        return result
+
+#################################################
+
+
+class Handler(SocketServer.StreamRequestHandler):
+    """
+    One station connection.
+    """
+    def handle(self):
+        collector = self.server.collector
+        station = None
+
+        while True:
+            try:
+                message = read_message(self.rfile)
+            except (Collector_Error, socket.error) as e:
+                if self.server.verbose:
+                    print('Collector connection error: {:s}'.format(str(e)))
+                return
+
+            if message is None:
+                return
+
+            kind, payload = message
+
+            if kind == MSG_HELLO:
+                station = payload.decode('utf-8')
+                if self.server.verbose:
+                    print('Station connected: {:s}'.format(station))
+
+            elif kind == MSG_BATCH:
+                sequence = _SEQUENCE.unpack_from(payload)[0]
+                try:
+                    if station is None:
+                        raise Collector_Error('BATCH before HELLO.')
+
+                    columns = codec.decode_block(payload, _SEQUENCE.size)
+                    num_new, num_duplicate = collector.accept(station, columns)
+                    reply = MSG_ACK, _ACK.pack(sequence, num_new, num_duplicate)
+
+                except (Collector_Error, ValueError, struct.error, IOError, OSError) as e:
+                    reply = MSG_ERROR, _SEQUENCE.pack(sequence) + str(e).encode('utf-8')
+
+                write_message(self.wfile, *reply)
+
+            else:
+                write_message(self.wfile, MSG_ERROR, _SEQUENCE.pack(0) +
+                              'Unknown message type: {:d}'.format(kind).encode('utf-8'))
+                return
+
+
+class Server(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, collector, verbose=False):
+        SocketServer.TCPServer.__init__(self, address, Handler)
+        self.collector = collector
+        self.verbose = verbose
+
+
+class Forwarder(threading.Thread):
+    def __init__(self, collector, time_interval=60., *args, **kwargs):
+        """
+        Forward the collector spool upstream every time_interval seconds.
+        """
+        threading.Thread.__init__(self, *args, **kwargs)
+        self.daemon = True
+
+        self.collector = collector
+        self.time_interval = time_interval
+        self.event_stop = threading.Event()
+
+    def stop(self):
+        """
+        Tell thread to stop running.
+        """
+        self.event_stop.set()
+
+    def run(self):
+        """
+        This is where the work happens.
+        """
+        while not self.event_stop.wait(self.time_interval):
+            self.collector.forward()
+
+
+def serve(collector=None, port=PORT, host='', background=False, verbose=False):
+    """
+    Run a collector server.
+
+    Parameters
+    ----------
+    collector : Collector instance.  Default archives to the default folder, no forwarding.
+
+    background : if True, run in a daemon thread and return the server immediately.
+
+    """
+    if not collector:
+        collector = Collector()
+
+    server = Server((host, port), collector, verbose=verbose)
+
+    if background:
+        t = threading.Thread(target=server.serve_forever, name='collector')
+        t.daemon = True
+        t.start()
+    else:
+        server.serve_forever()
+
+    return server
+
+#################################################
+# Station side.
+
+
+class Station_Client(object):
+    def __init__(self, host, port=PORT, station=None, timeout=30.):
+        """
+        Connection from a station to a collector.  Connects on first use and again after an
+        error.
+
+        station : name of this station, default host name.
+        """
+        if not station:
+            station = socket.gethostname()
+
+        self.host = host
+        self.port = port
+        self.station = station
+        self.timeout = timeout
+
+        self.sock = None
+        self.fi = None
+        self.fo = None
+        self.sequence = 0
+
+    def connect(self):
+        self.close()
+
+        self.sock = socket.create_connection((self.host, self.port), self.timeout)
+        self.fi = self.sock.makefile('rb')
+        self.fo = self.sock.makefile('wb')
+
+        write_message(self.fo, MSG_HELLO, self.station.encode('utf-8'))
+
+    def close(self):
+        if self.sock is None:
+            return
+
+        for f in [self.fi, self.fo, self.sock]:
+            try:
+                f.close()
+            except (socket.error, IOError):
+                pass
+
+        self.sock = None
+        self.fi = None
+        self.fo = None
+
+    def send_block(self, block):
+        """
+        Send one encoded codec block and wait for its acknowledgement.  Returns (rows new,
+        rows duplicate).
+        """
+        try:
+            if self.sock is None:
+                self.connect()
+
+            self.sequence += 1
+            write_message(self.fo, MSG_BATCH, _SEQUENCE.pack(self.sequence) + block)
+
+            message = read_message(self.fi)
+
+        except (socket.error, IOError, Collector_Error) as e:
+            self.close()
+            raise Collector_Error('Collector connection failed: {:s}'.format(str(e)))
+
+        if message is None:
+            self.close()
+            raise Collector_Error('Collector closed the connection.')
+
+        kind, payload = message
+        sequence = _SEQUENCE.unpack_from(payload)[0]
+
+        if kind == MSG_ERROR:
+            raise Collector_Error(payload[_SEQUENCE.size:].decode('utf-8'))
+
+        if kind != MSG_ACK or sequence != self.sequence:
+            self.close()
+            raise Collector_Error('Unexpected reply from collector.')
+
+        sequence, num_new, num_duplicate = _ACK.unpack(payload)
+
+        return num_new, num_duplicate
+
+    def send(self, columns):
+        """
+        Send samples.  Returns (rows new, rows duplicate).
+        """
+        num_new, num_duplicate = 0, 0
+        for k in range(0, len(columns['seconds']), codec.ROWS_BLOCK):
+            part = dict((n, v[k:k + codec.ROWS_BLOCK]) for n, v in columns.items())
+            a, b = self.send_block(codec.encode_block(part))
+            num_new += a
+            num_duplicate += b
+
+        return num_new, num_duplicate
+
+
+def parse_address(text):
+    """
+    Split 'host:port' or 'host'.
+    """
+    host, sep, port = text.partition(':')
+    return host, int(port) if port else PORT
+
+
+@coroutine
+def collector_uploader(address, pin_status, station=None, rows_bulk_min=1, path_spool=None):
+    """
+    Coroutine to receive new data and send it to a site collector.
+
+    Samples wait in the local spool, as for upload.bulk_uploader, and each spool block is sent
+    as one batch.  Blocks leave the spool once acknowledged.
+    """
+    host, port = parse_address(address)
+    client = Station_Client(host, port, station)
+
+    blink_status = blinker.Blinker(pin_status)
+    spool = upload.Spool(path_spool)
+
+    if spool.num_rows:
+        print('Spooled rows waiting for collector: {:d}'.format(spool.num_rows))
+
+    keep_looping = True
+    while keep_looping:
+        try:
+            # Receive new data samples.
+            samples = (yield)
+            spool.append(upload.samples_to_columns(samples))
+
+            if spool.num_rows < rows_bulk_min:
+                continue
+
+            # Send the spool, one block per batch.
+            blink_status.frequency = 30
+            reader = codec.Reader(spool.fname)
+
+            size = 0
+            try:
+                for info in reader.index:
+                    client.send_block(reader.data[info.offset:info.offset + info.size])
+                    size += info.size
+                blink_status.frequency = 0
+
+            except Collector_Error as e:
+                print('collector.collector_uploader caught error: {:s}'.format(str(e)))
+                blink_status.frequency = 2
+
+            if size:
+                spool.consume(size)
+
+        except GeneratorExit:
+            print('Collector uploader: GeneratorExit')
+            keep_looping = False
+
+    client.close()
+    blink_status.stop()
+
+#################################################
+
+
+def main():
+    """
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description='Collect samples from many stations.')
+    parser.add_argument('--host', default='', help='Interface to listen on, default all.')
+    parser.add_argument('--port', default=PORT, type=int, help='TCP port.')
+    parser.add_argument('--path', default=None, help='Archive and spool folder.')
+    parser.add_argument('--table', default=None,
+                        help='Forward each station to the Fusion Table TABLE_<station>.  '
+                             'Archive only if not given.')
+    parser.add_argument('--service_url', default=None,
+                        help='Forward to a stand-in server instead of Google.')
+    parser.add_argument('--credentials', default=None, help='Folder holding client secrets.')
+    parser.add_argument('--rows_bulk_min', default=1000, type=int,
+                        help='Forward once this many rows are waiting.')
+    parser.add_argument('--interval', default=60., type=float,
+                        help='Seconds between forwarding attempts.')
+    parser.add_argument('--gzip', default=False, action='store_true',
+                        help='Compress upstream requests.')
+    parser.add_argument('-v', '--verbose', default=False, action='store_true')
+
+    args = parser.parse_args()
+
+    service = None
+    if args.table:
+        session.configure({'service_url': args.service_url})
+        service = upload.connect_service(args.credentials)
+
+    collector = Collector(args.path, service, args.table, rows_bulk_min=args.rows_bulk_min,
+                          use_gzip=args.gzip)
+
+    forwarder = None
+    if service:
+        forwarder = Forwarder(collector, args.interval)
+        forwarder.start()
+
+    print('Collector listening on port {:d}: {:s}'.format(args.port, collector.path))
+    try:
+        serve(collector, args.port, args.host, verbose=args.verbose)
+    except KeyboardInterrupt:
+        print()
+        print('User stop!')
+
+    if forwarder:
+        forwarder.stop()
+        collector.forward(force=True)
+
+    print('Rows new: {:d}, duplicate: {:d}, forwarded: {:d}'.format(
+        collector.count_new, collector.count_duplicate, collector.count_forwarded))
+
+
+if __name__ == '__main__':
+    main()
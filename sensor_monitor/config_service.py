@@ -0,0 +1,365 @@
+
+from __future__ import division, print_function, unicode_literals
+
+"""
+Live station configuration.
+
+who8myrpi reads config_data.yml and the master table at startup.  Config_Service keeps
+watching both while recording: the local file by modification time, the master table through
+its local cache, see master_table.Config_Cache.  When the effective station config changes,
+the difference is applied to the running station:
+
+    pins_data    : channels for new pins are started, channels for removed pins are stopped.
+    time_wait    : seconds between sensor reads, changed in place on every running channel.
+    outliers     : channels are restarted with the new outlier policy.
+    power_groups : new power pins are switched on, group membership is updated.
+
+Channels that are not affected keep reading throughout, there is no power-up or readiness wait
+for them.  All channels feed the same queue, which is never replaced, so samples read by a
+channel being stopped are still collected and uploaded.
+
+Other settings, e.g. the upload target, take effect at the next restart.  They are reported
+when they change.
+"""
+
+import os
+import time
+import threading
+
+import data_io as io
+
+import lazy
+import sensors
+import power
+
+# Pulls in the Google API client, only needed once the master table cache is stale.
+master_table = lazy.lazy_import('master_table', globals())
+
+# Default seconds between sensor reads.
+TIME_WAIT = 5.0
+
+# Options taken from the local config file, overriding the master table.
+LOCAL_KEYS = ['upload_bulk', 'rows_bulk_min', 'upload_gzip', 'power_groups', 'outliers',
+              'collector', 'station', 'time_wait', 'derived']
+
+# Options applied while running.
+LIVE_KEYS = ['pins_data', 'time_wait', 'outliers', 'power_groups', 'pin_power']
+
+#################################################
+
+
+def parse_pins(value):
+    """
+    List of data pins from the master table text "4,17,18", or a list or single number.
+    """
+    if isinstance(value, basestring):
+        value = [v for v in value.split(',') if v.strip()]
+    elif not isinstance(value, (list, tuple)):
+        value = [value]
+
+    return [int(v) for v in value]
+
+
+def station_config(info_master, info_table):
+    """
+    Effective station config from local config data and master table config data.
+    """
+    info_config = dict(info_table)
+
+    # Convert some string values to integers.
+    info_config['pins_data'] = parse_pins(info_config['pins_data'])
+
+    info_config['pin_ok'] = int(info_config['pin_ok'])
+    info_config['pin_err'] = int(info_config['pin_error'])
+    info_config['pin_power'] = int(info_config['pin_power'])
+
+    # Local options.
+    for key in LOCAL_KEYS:
+        if key in info_master:
+            info_config[key] = info_master[key]
+
+    if 'time_wait' in info_config:
+        info_config['time_wait'] = float(info_config['time_wait'])
+
+    return info_config
+
+
+def diff(info_old, info_new):
+    """
+    Compare two station configs.
+
+    Returns
+    -------
+    Dict with keys:
+        pins_added, pins_removed : sorted lists of data pins.
+        time_wait : new seconds between reads, None if unchanged.
+        outliers : True if the outlier policy changed.
+        power : True if the power groups changed.
+        restart : sorted list of other changed keys, applied at the next restart.
+
+    """
+    pins_old = set(info_old.get('pins_data', []))
+    pins_new = set(info_new.get('pins_data', []))
+
+    time_wait_old = info_old.get('time_wait', TIME_WAIT)
+    time_wait_new = info_new.get('time_wait', TIME_WAIT)
+
+    changed = lambda key: info_old.get(key) != info_new.get(key)
+
+    keys = set(info_old) | set(info_new)
+    restart = sorted(k for k in keys if k not in LIVE_KEYS and changed(k))
+
+    power_old = (info_old.get('power_groups'), info_old.get('pin_power'))
+    power_new = (info_new.get('power_groups'), info_new.get('pin_power'))
+    if not info_new.get('power_groups') and pins_old != pins_new:
+        # Single power pin shared by all data pins.
+        power_changed = True
+    else:
+        power_changed = power_old != power_new
+
+    return {'pins_added': sorted(pins_new - pins_old),
+            'pins_removed': sorted(pins_old - pins_new),
+            'time_wait': time_wait_new if time_wait_new != time_wait_old else None,
+            'outliers': changed('outliers'),
+            'power': power_changed,
+            'restart': restart}
+
+
+def has_changes(changes):
+    return bool(changes['pins_added'] or changes['pins_removed'] or
+                changes['time_wait'] is not None or changes['outliers'] or
+                changes['power'] or changes['restart'])
+
+#################################################
+
+
+class Config_Source(object):
+    def __init__(self, fname, info_master=None):
+        """
+        Station config from the local config file and the cached master table.
+
+        Parameters
+        ----------
+        fname : local config file, e.g. config_data.yml.
+
+        info_master : contents of fname if already read.
+
+        """
+        self.fname = fname
+        self.info_master = info_master
+        self.time_modified = os.path.getmtime(fname) if info_master is not None else None
+
+    def load(self):
+        """
+        Return the effective station config.  The local file is only read again after it was
+        modified.  Master table data comes from its cache, which refreshes in the background
+        when stale.
+        """
+        time_modified = os.path.getmtime(self.fname)
+        if time_modified != self.time_modified:
+            self.info_master, meta = io.read(self.fname)
+            self.time_modified = time_modified
+
+        info_table = master_table.get_cache(self.info_master).get()
+
+        return station_config(self.info_master, info_table)
+
+#################################################
+
+
+class Config_Service(threading.Thread):
+    def __init__(self, channels, queue, info_config, load, monitor=None, observers=None,
+                 supervisor=None, time_check=10., make_channel=None, verbose=False, *args,
+                 **kwargs):
+        """
+        Apply station config changes to running channels.
+
+        Parameters
+        ----------
+        channels : list of running sensors.Channel_Runner.  Updated in place, so other holders
+                   of the same list, e.g. power.Power_Supervisor, see the changes.
+
+        queue : Queue receiving data samples from all channels.
+
+        info_config : station config the channels were started with.
+
+        load : function returning the current station config, e.g. Config_Source.load.
+
+        monitor : optional health.Health_Monitor watching the channels.
+
+        observers : optional list of read observers for new channels, see
+                    sensors.Channel_Runner.
+
+        supervisor : optional power.Power_Supervisor, told about power group changes.  Its
+                     lock is held while applying changes, see power.Power_Supervisor.
+
+        time_check : seconds between checks for changes.
+
+        make_channel : function(pin, time_wait, outliers) returning a new channel, not yet
+                       started.  Default is sensors.make_channel.
+
+        """
+        threading.Thread.__init__(self, *args, **kwargs)
+        self.daemon = True
+
+        if make_channel is None:
+            make_channel = sensors.make_channel
+
+        self.channels = channels
+        self.queue = queue
+        self.info_config = info_config
+        self.load = load
+        self.monitor = monitor
+        self.observers = observers
+        self.supervisor = supervisor
+        self.time_check = time_check
+        self.make_channel = make_channel
+        self.verbose = verbose
+
+        self.count_changes = 0
+        self.lock = threading.Lock()
+        self.event_stop = threading.Event()
+
+    def find(self, pin):
+        for c in self.channels:
+            if c.pin == pin:
+                return c
+
+        return None
+
+    def start_pin(self, pin, info_config):
+        """
+        Start a channel for one pin.
+        """
+        time_wait = info_config.get('time_wait', TIME_WAIT)
+        channel = self.make_channel(pin, time_wait, info_config.get('outliers'))
+
+        c = sensors.Channel_Runner(channel, queue=self.queue, monitor=self.monitor,
+                                   observers=self.observers)
+        if self.supervisor and not self.supervisor.is_powered(pin):
+            # Group is part way through a power cycle, the supervisor unpauses it after.
+            c.pause()
+        c.start()
+        self.channels.append(c)
+
+        return c
+
+    def stop_pin(self, pin, forget=True):
+        """
+        Stop the channel for one pin and wait for it to finish.  Samples it has already read
+        are in the queue.
+        """
+        c = self.find(pin)
+        if c is None:
+            return
+
+        c.stop()
+        c.join()
+
+        self.channels.remove(c)
+
+        if forget and self.monitor:
+            self.monitor.remove(pin)
+
+    def apply(self, info_new):
+        """
+        Bring the running station in line with a new config.  Return the changes, see diff.
+        """
+        changes = diff(self.info_config, info_new)
+
+        # Share the supervisor's lock so that a power cycle and a config change don't overlap.
+        lock = self.supervisor.lock if self.supervisor else self.lock
+        with lock:
+            if changes['power'] and self.supervisor:
+                self.supervisor.update_groups(power.groups_from_config(info_new))
+
+            for pin in changes['pins_removed']:
+                self.stop_pin(pin)
+
+            if changes['outliers']:
+                pins = [c.pin for c in self.channels]
+                for pin in pins:
+                    self.stop_pin(pin, forget=False)
+                    self.start_pin(pin, info_new)
+
+            for pin in changes['pins_added']:
+                if self.monitor:
+                    # Sensor presumably just plugged in, allow for its power-up.
+                    self.monitor.power_on([pin])
+                self.start_pin(pin, info_new)
+
+            if changes['time_wait'] is not None:
+                for c in self.channels:
+                    c.time_wait = changes['time_wait']
+
+            self.info_config = info_new
+
+        if has_changes(changes):
+            self.count_changes += 1
+            if self.verbose:
+                print(pretty_changes(changes))
+
+        return changes
+
+    def check(self):
+        """
+        Load the current config and apply any changes.  Failures leave the running config in
+        place.
+        """
+        try:
+            info_new = self.load()
+        except Exception as e:
+            print('Config reload failed, keeping current config: {:s}'.format(str(e)))
+            return None
+
+        if info_new == self.info_config:
+            return None
+
+        return self.apply(info_new)
+
+    def stop(self):
+        """
+        Tell thread to stop running.
+        """
+        self.event_stop.set()
+
+    def run(self):
+        """
+        This is where the work happens.
+        """
+        while not self.event_stop.wait(self.time_check):
+            self.check()
+
+
+def pretty_changes(changes):
+    """
+    Format config changes as text.
+    """
+    lines = ['Config changed: {:s}'.format(time.strftime('%Y-%m-%d %H:%M:%S'))]
+
+    if changes['pins_added']:
+        lines.append('  pins added:   {}'.format(changes['pins_added']))
+    if changes['pins_removed']:
+        lines.append('  pins removed: {}'.format(changes['pins_removed']))
+    if changes['time_wait'] is not None:
+        lines.append('  time_wait:    {:.1f} s'.format(changes['time_wait']))
+    if changes['outliers']:
+        lines.append('  outlier policy changed, channels restarted')
+    if changes['power']:
+        lines.append('  power groups updated')
+    if changes['restart']:
+        lines.append('  applied at next restart: {:s}'.format(', '.join(changes['restart'])))
+
+    return '\n'.join(lines)
+
+#################################################
+
+
+if __name__ == '__main__':
+    """
+    Development and examples.
+    """
+    info_old = {'pins_data': [4, 17], 'pin_power': 22, 'experiment_name': 'a'}
+    info_new = {'pins_data': [4, 18], 'pin_power': 22, 'experiment_name': 'b', 'time_wait': 2.}
+
+    print(pretty_changes(diff(info_old, info_new)))
@@ -23,13 +23,19 @@ import datetime
 import glob
 
 import numpy as np
-import pandas as pd
-import arrow
 
+import lazy
+import codec
+import derived
 import download
 import master_table
+import rollup
 import utility
 
+# Loaded on first use.
+pd = lazy.lazy_import('pandas')
+arrow = lazy.lazy_import('arrow')
+
 
 def path_to_module():
     p = os.path.dirname(os.path.abspath(__file__))
@@ -38,25 +44,77 @@ def path_to_module():
 
 _folder_store = 'data_storage'
 
+# Daily files are written in the compact codec format.  Older HDF files are still read.
+_ext_store = '.tsc'
+_ext_legacy = '.h5'
+
+# Derived quantities added as columns when data is ingested or read, see derived.py.  They are
+# cheap to compute, so daily files keep only the measured values.
+_derived = derived.NAMES
+
+
+def files_in_storage():
+    """Return sorted list of daily data files found in storage.
+    """
+    files = []
+    for ext in [_ext_store, _ext_legacy]:
+        pattern = os.path.join(path_to_module(), _folder_store, 'data_????-??-??' + ext)
+        files.extend(glob.glob(pattern))
+
+    return sorted(files)
+
 
 def dates_in_storage():
     """Return list of dates found in storage.
     """
-    pattern = os.path.join(path_to_module(), _folder_store, 'data_????-??-??.h5')
-    files = glob.glob(pattern)
+    files = files_in_storage()
 
-    dates = []
+    dates = set()
     for f in files:
         b, e = os.path.splitext(os.path.basename(f))
         c = b.split('data_')[1]
 
         year, month, day = c.split('-')
         date = arrow.Arrow(int(year), int(month), int(day))
-        dates.append(date)
+        dates.add(date)
 
     return sorted(dates)
 
 
+def frame_from_columns(columns):
+    """
+    DataFrame with US/Pacific timestamp index from codec columns.
+    """
+    index = pd.DatetimeIndex(np.round(columns['seconds']*1.e9).astype(np.int64))
+    index = index.tz_localize('UTC').tz_convert('US/Pacific')
+
+    data_dict = {'Pin': columns['pin'], 'Temperature': columns['Tf'], 'Humidity': columns['RH']}
+
+    return derived.add_to_frame(pd.DataFrame(data_dict, index=index), _derived)
+
+
+def read_file(f):
+    """
+    Read one daily data file, codec or HDF.
+    """
+    if f.endswith(_ext_store):
+        return frame_from_columns(codec.read(f))
+
+    return derived.add_to_frame(pd.read_hdf(f, 'df'), _derived)
+
+
+def write_file(f, df):
+    """
+    Write one day of data in codec format.
+    """
+    columns = {'seconds': df.index.asi8 / 1.e9,
+               'pin': df.Pin.values,
+               'Tf': df.Temperature.values,
+               'RH': df.Humidity.values}
+
+    codec.write(f, columns)
+
+
 def daterange(start_date, end_date):
     """Date range generator.
     """
@@ -97,7 +155,7 @@ def update(year_start=None, month_start=None, day_start=None):
     day_end = date_tomorrow.day
 
     #
-    # Download data from Google in one big chunk.
+    # Download data from Google, one time window at a time.
     #
     seconds_start = utility.timestamp_seconds(year_start, month_start, day_start)
     seconds_end = utility.timestamp_seconds(year_end, month_end, day_end)
@@ -111,30 +169,35 @@ def update(year_start=None, month_start=None, day_start=None):
     table_id = master_table.get_current_table_id()
     print('Fetch data from Fusion Table: {:s}'.format(table_id))
 
-    data_table = download.data_between(table_id, seconds_start, seconds_end)
+    chunks = []
+    for columns in download.stream_between(table_id, seconds_start, seconds_end):
+        if columns['Seconds'].size:
+            print('Fetched {:d} rows up to {:s}'.format(
+                columns['Seconds'].size, utility.pretty_timestamp(columns['Seconds'][-1])))
+            chunks.append(columns)
+
+    if not chunks:
+        print('No new data.')
+        return
 
     #
     # Extract data, store in Pandas DataFrame.
     #
     print('Process data...')
-    ix_seconds = 1
-    ix_pin = 3
-    ix_T = 4
-    ix_RH = 5
+
+    seconds = np.concatenate([c['Seconds'] for c in chunks])
+    col_pin = np.concatenate([c['Pin'] for c in chunks])
+    col_T = np.concatenate([c['Temperature'] for c in chunks])
+    col_RH = np.concatenate([c['Humidity'] for c in chunks])
 
     # Convert data seconds to a handy timestamp (US/Pacific) index.
-    seconds = [row[ix_seconds] for row in data_table]
     timestamps = [utility.datetime_seconds(s) for s in seconds]
     timestamps_index = pd.DatetimeIndex(timestamps)
 
-    # Extract data columns.
-    col_pin = np.asarray([row[ix_pin] for row in data_table], dtype=np.uint8)
-    col_T = np.asarray([row[ix_T] for row in data_table], dtype=np.float32)
-    col_RH = np.asarray([row[ix_RH] for row in data_table], dtype=np.float32)
-
     data_dict = {'Pin': col_pin, 'Temperature': col_T, 'Humidity': col_RH}
 
     data_frame = pd.DataFrame(data_dict, index=timestamps_index)
+    derived.add_to_frame(data_frame, _derived)
 
     pins = np.unique(data_frame.Pin).values
     print('GPIO pins: {:s}'.format(str(pins)))
@@ -156,30 +219,44 @@ def update(year_start=None, month_start=None, day_start=None):
             # One day of data.
             df_k = data_frame[date_filter]
 
-            # Save to file.
-            fname = 'data_{:s}.h5'.format(date_filter)
-            f = os.path.join(path_store, fname)
+            # Save to file, replacing any older HDF file for the same day.
+            fname = 'data_{:s}'.format(date_filter)
+            f = os.path.join(path_store, fname + _ext_store)
 
             if df_k.shape[0]:
                 print(date_filter, df_k.shape)
-                df_k.to_hdf(f, 'df', table=True)
+                write_file(f, df_k)
+
+                f_legacy = os.path.join(path_store, fname + _ext_legacy)
+                if os.path.isfile(f_legacy):
+                    os.remove(f_legacy)
 
         except KeyError:
             pass
 
+    #
+    # Fold new samples into the rollup tables.
+    #
+    print('Update rollups...')
+    rollup.update(path_store, seconds, col_pin, {'Temperature': col_T, 'Humidity': col_RH},
+                  seconds_start=seconds_start)
+
+
+def folder_store():
+    return os.path.join(path_to_module(), _folder_store)
+
 
 def load():
     """Load all data from storage.
     """
-    pattern = os.path.join(path_to_module(), _folder_store, 'data_????-??-??.h5')
-    files = glob.glob(pattern)
+    files = files_in_storage()
 
     if not files:
         raise ValueError('No data found in storage.')
 
     data = []
     for f in files:
-        df_k = pd.read_hdf(f, 'df')
+        df_k = read_file(f)
         data.append(df_k)
 
     data_frame = pd.concat(data).sort()
@@ -187,6 +264,57 @@ def load():
 
     return data_frame
 
+
+def load_between(seconds_start, seconds_end):
+    """
+    Load stored samples with seconds_start <= time < seconds_end, reading only the daily files
+    that overlap the time range.
+    """
+    date_start = utility.datetime_seconds(seconds_start).date()
+    date_end = utility.datetime_seconds(seconds_end).date()
+
+    data = []
+    for date_k in daterange(date_start, date_end + datetime.timedelta(1)):
+        fname = 'data_{:s}'.format(date_k.strftime('%Y-%m-%d'))
+        for ext in [_ext_store, _ext_legacy]:
+            f = os.path.join(folder_store(), fname + ext)
+            if os.path.isfile(f):
+                data.append(read_file(f))
+                break
+
+    if not data:
+        raise ValueError('No data found in storage between {:s} and {:s}.'.format(
+            utility.pretty_timestamp(seconds_start), utility.pretty_timestamp(seconds_end)))
+
+    data_frame = pd.concat(data).sort()
+
+    seconds = data_frame.index.asi8 / 1.e9
+    mask = (seconds >= seconds_start) & (seconds < seconds_end)
+
+    return data_frame[mask]
+
+
+def build_rollups():
+    """
+    Rebuild the rollup tables from everything in storage.
+    """
+    rollup.build(folder_store(), load())
+
+
+def rollups(level='1h', pins=None, seconds_start=None, seconds_end=None):
+    """
+    Per-pin count, min, max, mean and variance for each bucket of a rollup level: '1min',
+    '15min', '1h' or '1d'.
+    """
+    return rollup.query(folder_store(), level, pins, seconds_start, seconds_end)
+
+
+def stats(seconds_start, seconds_end, pins=None):
+    """
+    Per-pin count, min, max, mean and variance over a time range, computed from rollups.
+    """
+    return rollup.stats(folder_store(), seconds_start, seconds_end, pins)
+
 #################################################
 
 
@@ -0,0 +1,287 @@
+
+from __future__ import division, print_function, unicode_literals
+
+"""
+Derived humidity and comfort quantities, computed on whole columns at once.
+
+From temperature (Tf, degrees F) and relative humidity (RH, %):
+
+    Tdf : dew point, degrees F.  Magnus form with the Alduchov and Eskridge (1996)
+          coefficients, within 0.4 C of the exact value from -40 C to 50 C.
+    AH  : absolute humidity, grams of water vapor per cubic meter.
+    VPD : vapor pressure deficit, kPa.
+    HIf : heat index, degrees F.  NWS algorithm: Steadman's simple form below about 80 F,
+          the Rothfusz regression with its low and high humidity adjustments above.
+
+Every function takes arrays (or scalars) and returns arrays, no Python loop per sample.  The
+same code serves three places:
+
+    add_columns(columns)     codec style column dicts, e.g. spool batches or collector queries.
+    add_to_frame(df)         archive DataFrames with Temperature and Humidity columns, see
+                             data_store, which adds them as files are ingested and read.
+    stage(source)            pipeline stage between sensors.data_collector and the uploader.
+"""
+
+import collections
+
+import numpy as np
+
+import lazy
+import profiling
+
+upload = lazy.lazy_import('upload', globals())
+
+# Magnus coefficients over water, Alduchov and Eskridge (1996).
+_A = 17.625
+_B = 243.04     # C
+_E0 = 6.1094    # hPa
+
+# Specific gas constant for water vapor, J / (kg K).
+_RV = 461.5
+
+# Name -> (DataFrame column, description).
+QUANTITIES = collections.OrderedDict([
+    ('Tdf', ('DewPoint', 'Dew point, F.')),
+    ('AH', ('AbsoluteHumidity', 'Absolute humidity, g/m3.')),
+    ('VPD', ('VaporPressureDeficit', 'Vapor pressure deficit, kPa.')),
+    ('HIf', ('HeatIndex', 'Heat index, F.'))])
+
+NAMES = list(QUANTITIES.keys())
+
+#################################################
+
+
+def f2c(F):
+    """
+    Convert Fahrenheit to Celcius, arrays or scalars.
+    """
+    return (np.asarray(F, dtype=np.float64) - 32.) * 5./9.
+
+
+def c2f(C):
+    """
+    Convert Celcius to Fahrenheit, arrays or scalars.
+    """
+    return np.asarray(C, dtype=np.float64) * 9./5. + 32.
+
+
+def vapor_pressure_saturation(Tc):
+    """
+    Saturation vapor pressure over water, hPa.
+    """
+    Tc = np.asarray(Tc, dtype=np.float64)
+    return _E0 * np.exp(_A * Tc / (_B + Tc))
+
+
+def vapor_pressure(Tf, RH):
+    """
+    Actual vapor pressure, hPa.
+    """
+    RH = np.asarray(RH, dtype=np.float64)
+    return RH / 100. * vapor_pressure_saturation(f2c(Tf))
+
+
+def dew_point(Tf, RH):
+    """
+    Dew point, degrees F.  NaN where RH is not positive.
+    """
+    Tc = f2c(Tf)
+    RH = np.asarray(RH, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gamma = np.log(RH / 100.) + _A * Tc / (_B + Tc)
+        Td = _B * gamma / (_A - gamma)
+
+    return np.where(RH > 0., c2f(Td), np.nan)
+
+
+def absolute_humidity(Tf, RH):
+    """
+    Absolute humidity, g/m3.
+    """
+    Tk = f2c(Tf) + 273.15
+    return vapor_pressure(Tf, RH) * 100. / (_RV * Tk) * 1000.
+
+
+def vapor_pressure_deficit(Tf, RH):
+    """
+    Vapor pressure deficit, kPa.
+    """
+    RH = np.asarray(RH, dtype=np.float64)
+    es = vapor_pressure_saturation(f2c(Tf))
+
+    return es * (1. - RH / 100.) / 10.
+
+
+def heat_index(Tf, RH):
+    """
+    Heat index, degrees F.
+    """
+    T = np.asarray(Tf, dtype=np.float64)
+    RH = np.asarray(RH, dtype=np.float64)
+
+    simple = 0.5 * (T + 61. + (T - 68.) * 1.2 + RH * 0.094)
+
+    full = (-42.379 + 2.04901523*T + 10.14333127*RH - 0.22475541*T*RH -
+            6.83783e-3*T*T - 5.481717e-2*RH*RH + 1.22874e-3*T*T*RH +
+            8.5282e-4*T*RH*RH - 1.99e-6*T*T*RH*RH)
+
+    # Adjustments at low and high humidity.
+    with np.errstate(invalid='ignore'):
+        dry = (RH < 13.) & (T >= 80.) & (T <= 112.)
+        full = full - np.where(dry, (13. - RH) / 4. *
+                               np.sqrt(np.clip(17. - np.abs(T - 95.), 0., None) / 17.), 0.)
+
+    humid = (RH > 85.) & (T >= 80.) & (T <= 87.)
+    full = full + np.where(humid, (RH - 85.) / 10. * (87. - T) / 5., 0.)
+
+    return np.where((simple + T) / 2. < 80., simple, full)
+
+
+_FUNCTIONS = {'Tdf': dew_point,
+              'AH': absolute_humidity,
+              'VPD': vapor_pressure_deficit,
+              'HIf': heat_index}
+
+#################################################
+
+
+def parse_names(value):
+    """
+    List of quantity names from config text "Tdf,AH", or a list.
+    """
+    if isinstance(value, basestring):
+        value = value.split(',')
+
+    names = [n.strip() for n in value if n.strip()]
+    for n in names:
+        if n not in QUANTITIES:
+            raise ValueError('Unknown derived quantity: {:s}.  Choose from {:s}'.format(
+                n, ', '.join(NAMES)))
+
+    return names
+
+
+def compute(Tf, RH, names=None):
+    """
+    Derived quantities for columns of temperature and humidity.
+
+    Parameters
+    ----------
+    Tf : temperature, degrees F.
+
+    RH : relative humidity, %.
+
+    names : quantities to compute, default all, see QUANTITIES.
+
+    Returns
+    -------
+    Dict of name -> float64 array.
+
+    """
+    if names is None:
+        names = NAMES
+
+    Tf = np.asarray(Tf, dtype=np.float64)
+    RH = np.asarray(RH, dtype=np.float64)
+
+    return collections.OrderedDict((n, _FUNCTIONS[n](Tf, RH)) for n in names)
+
+
+def add_columns(columns, names=None):
+    """
+    Add derived quantities to a dict of columns with Tf and RH, e.g. from codec.read.  Returns
+    the same dict.
+    """
+    columns.update(compute(columns['Tf'], columns['RH'], names))
+    return columns
+
+
+def add_to_frame(df, names=None):
+    """
+    Add derived quantities to a DataFrame with Temperature and Humidity columns, e.g. from
+    data_store.load.  Returns the same DataFrame.
+    """
+    values = compute(df['Temperature'].values, df['Humidity'].values, names)
+    for n, v in values.items():
+        df[QUANTITIES[n][0]] = v
+
+    return df
+
+
+def latest(pins, values):
+    """
+    Last value per pin of each quantity.
+
+    Parameters
+    ----------
+    pins : pin of every row.
+
+    values : dict of name -> array, one value per row.
+
+    Returns
+    -------
+    Dict of name -> dict of pin -> value.
+
+    """
+    pins = np.asarray(pins)
+
+    # First occurrence in reversed order is the last one.
+    pins_unique, index = np.unique(pins[::-1], return_index=True)
+    index = pins.size - 1 - index
+
+    result = {}
+    for n, v in values.items():
+        result[n] = dict(zip(pins_unique.tolist(), np.asarray(v)[index].tolist()))
+
+    return result
+
+#################################################
+
+
+class Sample_Batch(list):
+    """
+    List of sample dicts that carries its columnar form, so later stages don't convert again.
+    See upload.samples_to_columns.
+    """
+    columns = None
+
+
+def stage(source, names=None, observer=None):
+    """
+    This is a generator.
+
+    Pipeline stage computing derived quantities for every batch from source, e.g.
+    sensors.data_collector.  Batches are passed on unchanged as Sample_Batch.  The columnar form
+    built here is reused by the uploaders, so the only extra work is the vectorized math.
+
+    observer : optional function(values) called with the latest value per pin of each
+               quantity, see latest.  E.g. metrics.Metrics.observe_derived.
+    """
+    for samples in source:
+        if samples:
+            with profiling.span('derive'):
+                batch = Sample_Batch(samples)
+                batch.columns = upload.samples_to_columns(samples)
+
+                values = compute(batch.columns['Tf'], batch.columns['RH'], names)
+
+                if observer:
+                    observer(latest(batch.columns['pin'], values))
+
+            samples = batch
+
+        yield samples
+
+#################################################
+
+
+if __name__ == '__main__':
+    """
+    Development and examples.
+    """
+    Tf = np.array([50., 70., 85., 95.])
+    RH = np.array([80., 50., 60., 40.])
+
+    for n, v in compute(Tf, RH).items():
+        print('{:4s} {:s}  {}'.format(n, QUANTITIES[n][1], np.round(v, 2)))
@@ -32,6 +32,16 @@ cdef extern from 'wiringPi/wiringPi.h':
     cdef void delayMicroseconds(unsigned int howLong) nogil
     cdef unsigned int millis() nogil
 
+from libc.stdint cimport uint32_t
+
+cdef extern from 'gpio_mmap.h':
+    cdef long gpio_map_address() nogil
+    cdef int gpio_map_open(const char *path, long offset) nogil
+    cdef void gpio_map_close() nogil
+    cdef int gpio_map_is_open() nogil
+    cdef uint32_t gpio_map_levels() nogil
+    cdef int gpio_map_read(int pin) nogil
+
 
 # Constants.
 cdef int LOW = 0
@@ -78,6 +88,86 @@ _PUD_UP = PUD_UP
 
 _GPIO_IS_SETUP = False
 
+#################################################
+# Register-mapped fast path.  When enabled, pin levels are read straight from the GPIO level
+# register instead of through wiringPi's digitalRead.  Only pins 0 - 31 are covered by the
+# level register, other pins always use digitalRead.
+
+cdef int use_fast = 0
+
+def enable_fast_path(path=None, offset=None):
+    """Map the GPIO register block and read pins directly from it.
+
+    Parameters
+    ----------
+    path : device or file to map.  Default tries /dev/gpiomem, then /dev/mem.  Any regular file
+           of at least 4096 bytes can stand in for the registers during testing.
+
+    offset : byte offset of the register block within path.  Default is 0 for /dev/gpiomem and
+             regular files, the GPIO base address for /dev/mem.
+
+    Returns
+    -------
+    True if the fast path is active.  False if mapping failed, in which case reads keep using
+    wiringPi's digitalRead.
+
+    """
+    global use_fast
+
+    if path:
+        candidates = [(path, offset or 0)]
+    else:
+        candidates = [('/dev/gpiomem', 0),
+                      ('/dev/mem', gpio_map_address())]
+
+    cdef int val
+    for p, o in candidates:
+        p = p.encode('utf-8') if isinstance(p, unicode) else p
+        val = gpio_map_open(p, o)
+        if val == 0:
+            use_fast = 1
+            return True
+
+    use_fast = 0
+    return False
+
+
+def disable_fast_path():
+    """Unmap the GPIO register block.  Reads go back to wiringPi's digitalRead.
+    """
+    global use_fast
+
+    use_fast = 0
+    gpio_map_close()
+
+
+def fast_path_enabled():
+    return bool(use_fast)
+
+
+cdef inline int read_pin(int pin) nogil:
+    """Read pin level through the fast path if enabled and possible.
+    """
+    if use_fast and pin < 32:
+        return gpio_map_read(pin)
+    else:
+        return digitalRead(pin)
+
+
+def _read_pin(int pin):
+    return read_pin(pin)
+
+
+def _read_levels():
+    """Level register, one bit per pin 0 - 31.  Fast path must be enabled.
+    """
+    if not use_fast:
+        raise ValueError('Fast path is not enabled.')
+
+    return gpio_map_levels()
+
+#################################################
+
 def _setup_gpio():
     """Do stuff to initialize.
     """
@@ -148,7 +238,7 @@ def read_raw(int pin_data, int num_data=4000, int delay=1):
         while count < num_data:
             delayMicroseconds(delay)
 
-            value_sensor = digitalRead(pin_data)
+            value_sensor = read_pin(pin_data)
 
             data_signal_view[count] = value_sensor
 
@@ -180,6 +270,161 @@ def read_raw(int pin_data, int num_data=4000, int delay=1):
 #################################################
 
 
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def read_raw_multi(pins_data, int num_data=4000, int delay=1):
+    """Read raw data streams from several sensors at once.
+
+    All sensors get their start signal together, then every sample records the level of all
+    pins.  With the fast path enabled each sample is a single register read.  Otherwise the
+    pins are read one at a time with digitalRead and packed into the same format.
+
+    Parameters
+    ----------
+    pins_data : sequence of GPIO data pins, all below 32.
+
+    num_data : int, number of samples.
+
+    Returns
+    -------
+    levels : Numpy uint32 array, one word per sample, bit N holds the level of pin N.
+
+    sample_time : average time between samples, microseconds.
+
+    """
+    pins = np.asarray(pins_data, dtype=np.intc)
+    if np.any(pins < 0) or np.any(pins >= 32):
+        raise ValueError('Pins must be in range 0 - 31: %s' % pins_data)
+
+    cdef int [:] pins_view = pins
+    cdef int num_pins = pins.size
+
+    levels = np.zeros(num_data, dtype=np.uint32)
+    cdef uint32_t [:] levels_view = levels
+
+    cdef int count = 0
+    cdef int k = 0
+    cdef uint32_t word = 0
+    cdef int fast = use_fast
+
+    cdef unsigned int time_start = 0
+    cdef unsigned int time_stop = 0
+
+    with nogil:
+        # Start signal on all pins together.
+        for k in range(num_pins):
+            pinMode(pins_view[k], OUTPUT)
+            digitalWrite(pins_view[k], LOW)
+
+        delayMicroseconds(10*1000)
+
+        for k in range(num_pins):
+            digitalWrite(pins_view[k], HIGH)
+            pinMode(pins_view[k], INPUT)
+
+        # Sample.
+        time_start = millis()
+        while count < num_data:
+            delayMicroseconds(delay)
+
+            if fast:
+                word = gpio_map_levels()
+            else:
+                word = 0
+                for k in range(num_pins):
+                    word |= (<uint32_t>digitalRead(pins_view[k])) << pins_view[k]
+
+            levels_view[count] = word
+            count += 1
+
+        time_stop = millis()
+
+    sample_time = float(time_stop - time_start) / float(count) * 1000.
+
+    return levels, sample_time
+
+
+def decode_signal(signal):
+    """Decode a raw DHT22 signal recorded by read_raw or read_raw_multi.
+
+    Each bit is a LOW pulse followed by a HIGH pulse.  A HIGH pulse longer than its LOW pulse
+    is a 1, otherwise a 0, the same rule used by read_single_bit.
+
+    Parameters
+    ----------
+    signal : sequence of 0/1 samples for a single pin.
+
+    Returns
+    -------
+    Same as read_bits: (first, bits), or (None, message) if nothing was decoded.
+
+    """
+    signal = np.asarray(signal, dtype=np.int8)
+    if signal.size < 2:
+        return None, 'Problem decoding signal.  Too few samples: %d' % signal.size
+
+    # Run lengths.
+    edges = np.flatnonzero(np.diff(signal)) + 1
+    starts = np.concatenate(([0], edges))
+    lengths = np.diff(np.concatenate((starts, [signal.size])))
+    values = signal[starts]
+
+    # Drop anything before the first LOW run, and a trailing run that may be cut short.
+    ix_low = np.flatnonzero(values == LOW)
+    if not ix_low.size:
+        return None, 'Problem decoding signal.  No LOW pulses.'
+
+    values = values[ix_low[0]:]
+    lengths = lengths[ix_low[0]:]
+
+    num_pairs = values.size // 2
+    if values.size % 2 == 0 and num_pairs:
+        # Last HIGH run is the line idling after the transmission.
+        num_pairs -= 1
+
+    if not num_pairs:
+        return None, 'Problem decoding signal.  No complete bits.'
+
+    count_low = lengths[0:2*num_pairs:2]
+    count_high = lengths[1:2*num_pairs:2]
+
+    data = (count_high >= count_low).astype(np.int)
+
+    return data[0], data[1:]
+
+
+def split_levels(levels, pin):
+    """Extract a single pin's 0/1 samples from read_raw_multi level words.
+    """
+    return ((np.asarray(levels, dtype=np.uint32) >> pin) & 1).astype(np.int8)
+
+
+def read_dht22_multi(pins_data, delay=1, num_data=None):
+    """Read one sample of temperature and humidity from several sensors in a single pass.
+
+    Returns
+    -------
+    Dict mapping pin to tuple (RH, Tf), or (None, message) on failure, like read_dht22_single.
+
+    """
+    if num_data is None:
+        # About 5 ms of signal, plus margin, at roughly one sample per microsecond.
+        num_data = 8000 if use_fast else 4000
+
+    time.sleep(0.01)
+
+    levels, sample_time = read_raw_multi(pins_data, num_data=num_data, delay=delay)
+
+    results = {}
+    for pin in pins_data:
+        first, bits = decode_signal(split_levels(levels, pin))
+        results[pin] = bits_to_values(first, bits)
+
+    return results
+
+#################################################
+
+
 cdef int read_single_bit(int pin_data, int delay) nogil:
     """Read a signle bit of data.
 
@@ -203,21 +448,21 @@ cdef int read_single_bit(int pin_data, int delay) nogil:
     delayMicroseconds(delay)
 
     # While not ready.
-    while digitalRead(pin_data) == HIGH:
+    while read_pin(pin_data) == HIGH:
         delayMicroseconds(delay)
         count_wait += 1
         if count_wait >= count_timeout:
             return -1
 
     # While LOW, indicates new signal bit.
-    while digitalRead(pin_data) == LOW:
+    while read_pin(pin_data) == LOW:
         delayMicroseconds(delay)
         count_low += 1
         if count_low >= count_timeout:
             return -2
 
     # While HIGH, duration of HIGH indicates bit value, 0 or 1.
-    while digitalRead(pin_data) == HIGH:
+    while read_pin(pin_data) == HIGH:
         delayMicroseconds(delay)
         count_high += 1
         if count_high >= count_timeout:
@@ -365,6 +610,17 @@ def read_dht22_single(pin_data, delay=1):
     # Read some bits.
     first, bits = read_bits(pin_data, delay=delay)
 
+    return bits_to_values(first, bits)
+
+
+def bits_to_values(first, bits):
+    """Convert (first, bits) from read_bits or decode_signal to (RH, Tf).
+
+    Returns
+    -------
+    Tuple (RH, Tf), or (None, message) if anything is wrong with the bits.
+
+    """
     if first is None:
         msg = bits
         return None, msg
@@ -1,35 +1,135 @@
 
 from __future__ import division, print_function, unicode_literals
 
-import matplotlib.pyplot as plt
+"""
+Plot stored sensor data.
+
+Each series is reduced to about screen resolution before plotting.  Long time spans read the
+coarsest rollup level that still gives about one bucket per pixel, and are drawn as a min/max
+envelope around the mean.  Short spans read raw samples from the daily
+files and downsample them by min/max per bin, so spikes are never hidden.
+"""
+
+import time
+
 import numpy as np
-# import pandas as pd
 
+import lazy
 import data_store
+import downsample
+import rollup
+import utility
+
+# Matplotlib is slow to import, load it when the first plot is made.
+plt = lazy.lazy_import('matplotlib.pyplot')
+md = lazy.lazy_import('matplotlib.dates')
 
 #################################################
-# Setup.
 
-# data_store.update()
-df = data_store.load()
 
-pins = np.unique(df.Pin.values)
+def load_level(name, seconds_start=None, seconds_end=None):
+    """
+    Rollup rows of one level within the time range.
+    """
+    table = rollup.query(data_store.folder_store(), name, seconds_start=seconds_start,
+                         seconds_end=seconds_end)
+    if table is None:
+        raise ValueError('Rollups not found, run data_store.build_rollups().')
+
+    return table
+
+
+def time_range():
+    """
+    Seconds of first and last data in storage, from the daily rollup.
+    """
+    name, resolution = rollup.LEVELS[-1]
+    table = load_level(name)
+
+    return table.Seconds.min(), table.Seconds.max() + resolution
+
+
+def series(seconds_start, seconds_end, num_pixels=1500, variables=None):
+    """
+    Data for all pins between seconds_start and seconds_end, reduced to about num_pixels
+    points per series.
+
+    Returns dict of (pin, variable) -> (seconds, low, high, mean).
+    """
+    if variables is None:
+        variables = rollup.VARIABLES
+
+    result = {}
 
+    name = downsample.choose_level(seconds_end - seconds_start, num_pixels)
+    if name:
+        table = load_level(name, seconds_start, seconds_end)
 
-fig = plt.figure(1)
-fig.clear()
+        for pin in np.unique(table.Pin.values):
+            t = table[table.Pin.values == pin]
+            for v in variables:
+                result[(pin, v)] = (t.Seconds.values,
+                                    t[v + '_min'].values,
+                                    t[v + '_max'].values,
+                                    t[v + '_mean'].values)
+    else:
+        df = data_store.load_between(seconds_start, seconds_end)
+        seconds = df.index.asi8 / 1.e9
 
-ax = fig.add_subplot(1, 1, 1)
+        for pin in np.unique(df.Pin.values):
+            mask = df.Pin.values == pin
+            for v in variables:
+                x, y = downsample.minmax(seconds[mask], df[v].values[mask], num_pixels)
+                result[(pin, v)] = (x, y, y, y)
+
+    return result
+
+
+def plot(seconds_start=None, seconds_end=None, num_pixels=1500, fig=None):
+    """
+    Plot humidity and temperature for every pin.  Default time range is all data in storage.
+    """
+    if seconds_start is None or seconds_end is None:
+        first, last = time_range()
+        if seconds_start is None:
+            seconds_start = first
+        if seconds_end is None:
+            seconds_end = last
+
+    data = series(seconds_start, seconds_end, num_pixels)
+
+    if fig is None:
+        fig = plt.figure(1)
+    fig.clear()
+
+    ax = fig.add_subplot(1, 1, 1)
+
+    for (pin, variable), (seconds, low, high, mean) in sorted(data.items()):
+        dates = md.epoch2num(seconds)
+        line, = ax.plot_date(dates, mean, '-', tz=utility.tz_LAX,
+                             label='{:s} {:02d}'.format(variable[0], int(pin)))
+        if np.any(low != high):
+            ax.fill_between(dates, low, high, color=line.get_color(), alpha=0.25, linewidth=0)
+
+    ax.set_xlabel('Date / Time')
+    ax.set_ylabel('Data')
+    ax.legend(loc=2)
+
+    plt.draw()
+
+    return fig
+
+#################################################
 
-for p in pins:
-    mask = df.Pin == p
-    ax.plot(df[mask].index, df[mask].Humidity, label='H {:02d}'.format(p))
-    ax.plot(df[mask].index, df[mask].Temperature, label='T {:02d}'.format(p))
 
-ax.set_xlabel('Date / Time')
-ax.set_ylabel('Data')
-ax.legend(loc=2)
+if __name__ == '__main__':
+    """
+    Development and examples.
+    """
+    # data_store.update()
 
-plt.draw()
+    time_zero = time.time()
+    plot()
+    print('Plot time: {:.2f} s'.format(time.time() - time_zero))
 
-plt.show()
+    plt.show()
@@ -1,45 +1,56 @@
 
 from __future__ import division, print_function, unicode_literals
 
-import os
-import argparse
+import time
+import threading
+import Queue
+import socket
+
+import numpy as np
 
 import who8mygoogle.fusion_tables as fusion_tables
 import master_table
+import session
 import utility
+import errors
 
-import oauth2client.tools
+import apiclient.errors
 import httplib
 
 
-def path_to_module():
-    p = os.path.dirname(os.path.abspath(__file__))
-    return p
+# Fusion Tables refuses SQL responses larger than 10 MB.  A row from the data table is well under
+# 100 bytes, so this many rows per window keeps each response comfortably below the limit.
+_rows_window_max = 50000
+
+# Nominal number of rows per second written to the data table, e.g. seven sensors every 5 s.
+_rows_per_second = 7/5.
 
+# The rate above is only an estimate.  A window whose response reaches this many rows, or that
+# the service refuses as too large, is split in half and fetched again.
+_rows_response_max = 2*_rows_window_max
+_message_too_large = 'Response size is larger than'
 
-_fname_client_secrets = 'client_secrets.json'
-_folder_credentials = 'credentials'
+# Columns with known numeric type.  Anything else is kept as returned by the service.
+_column_dtypes = {'Seconds': np.float64,
+                  'Pin': np.uint8,
+                  'Temperature': np.float32,
+                  'Humidity': np.float32}
 
 
-def fetch_data(my_query):
+def build_service():
     """
-    Fetch the data from Google Fusion Table.
-    The query string must contain the ID for the Fusion Table.
+    Return the shared Fusion Tables API service object.
     """
-    # Parser is here to play nice with Google's stuff using the flags variable.
-    parser = argparse.ArgumentParser(description="Data Downloader",
-                                     formatter_class=argparse.RawDescriptionHelpFormatter,
-                                     parents=[oauth2client.tools.argparser])
-    flags = parser.parse_args()
-
-    # Connect to Fusion Table using functions from package Who8MyGoogle.
-    api_name = 'fusiontables'
+    return session.get_session().service
 
-    path_credentials = os.path.join(path_to_module(), _folder_credentials)
-    f = os.path.join(path_credentials, _fname_client_secrets)
 
-    # Service object.
-    service = fusion_tables.authorize.get_api_service(f, api_name, flags)
+def fetch_data(my_query, service=None):
+    """
+    Fetch the data from Google Fusion Table.
+    The query string must contain the ID for the Fusion Table.
+    """
+    if not service:
+        service = build_service()
 
     # Get a query object, https://developers.google.com/fusiontables/docs/v1/sql-reference
     query_service = service.query()
@@ -48,7 +59,7 @@ def fetch_data(my_query):
     request = query_service.sql(sql=my_query)
 
     try:
-        sql_results = request.execute()
+        sql_results = session.get_session().execute(request)
     except httplib.IncompleteRead as e:
         print('error: {:s}'.format(e.message))
         raise e
@@ -59,6 +70,80 @@ def fetch_data(my_query):
     return data
 
 
+def is_transient(error):
+    """
+    Return True if the supplied exception is worth retrying.
+    """
+    if isinstance(error, (httplib.IncompleteRead, httplib.HTTPException, socket.error)):
+        return True
+
+    if isinstance(error, apiclient.errors.HttpError):
+        status = int(error.resp.status)
+        return status == 429 or status >= 500
+
+    return False
+
+
+def is_too_large(error):
+    """
+    Return True if the supplied exception is the service refusing a response over its size
+    limit.
+    """
+    if isinstance(error, apiclient.errors.HttpError):
+        return _message_too_large in str(error.content)
+
+    return False
+
+
+def fetch_columns(my_query, service=None, num_retry=4, time_backoff=1.):
+    """
+    Fetch data from Google Fusion Table and return it as columns.
+
+    Transient failures are retried with exponential backoff.
+
+    Returns
+    -------
+    Dict mapping column name to Numpy array.
+
+    """
+    if not service:
+        service = build_service()
+
+    query_service = service.query()
+
+    count = 0
+    while True:
+        try:
+            sql_results = session.get_session().execute(query_service.sql(sql=my_query))
+            break
+        except Exception as e:
+            count += 1
+            if not is_transient(e) or count > num_retry:
+                raise e
+
+            print('retry {:d} of {:d}: {:s}'.format(count, num_retry, str(e)))
+            time.sleep(time_backoff * 2**(count - 1))
+
+    # The service leaves out the rows entry when nothing matched the query.
+    names = sql_results['columns']
+    rows = sql_results.get('rows', [])
+
+    return columns_from_rows(names, rows)
+
+
+def columns_from_rows(names, rows):
+    """
+    Convert a list of rows into a dict of column arrays.
+    """
+    columns = {}
+    for k, name in enumerate(names):
+        values = [row[k] for row in rows]
+        dtype = _column_dtypes.get(name, object)
+        columns[name] = np.asarray(values, dtype=dtype)
+
+    return columns
+
+
 def data_recent(table_id, num_rows=10):
     """
     Download most recent data from a Google Fusion Table.
@@ -83,6 +168,192 @@ def data_between(table_id, seconds_start, seconds_end=None):
 
     return fetch_data(my_query)
 
+
+def window_seconds(rows_per_second=None, rows_window_max=None):
+    """
+    Length of a time window (seconds) that will fit within the service's response limit.
+    """
+    if not rows_per_second:
+        rows_per_second = _rows_per_second
+
+    if not rows_window_max:
+        rows_window_max = _rows_window_max
+
+    return rows_window_max / rows_per_second
+
+
+def split_windows(seconds_start, seconds_end, seconds_window):
+    """
+    Split a time range into consecutive windows [start, end).  stream_between includes the
+    end of the last window, the same as data_between.
+    """
+    windows = []
+    time_a = seconds_start
+    while time_a < seconds_end:
+        time_b = min(time_a + seconds_window, seconds_end)
+        windows.append((time_a, time_b))
+        time_a = time_b
+
+    return windows
+
+
+def window_query(table_id, time_a, time_b, last=False):
+    """
+    SQL for one window, Seconds in [time_a, time_b), or [time_a, time_b] for the last window.
+    """
+    op_end = '<=' if last else '<'
+    conditions = 'Seconds >= {:.2f} AND Seconds {:s} {:.2f}'.format(time_a, op_end, time_b)
+
+    return 'SELECT * FROM {:s} WHERE {:s} ORDER BY Seconds ASC'.format(table_id, conditions)
+
+
+def fetch_window(table_id, time_a, time_b, last=False, service=None, num_retry=4,
+                 seconds_min=1.):
+    """
+    Fetch one window as columns, see window_query.  A window whose response hits the row or
+    size limit is split in half and each half fetched the same way, down to seconds_min.
+    """
+    my_query = window_query(table_id, time_a, time_b, last=last)
+
+    error = None
+    try:
+        columns = fetch_columns(my_query, service=service, num_retry=num_retry)
+        num_rows = max(len(values) for values in columns.values()) if columns else 0
+        if num_rows < _rows_response_max:
+            return columns
+    except apiclient.errors.HttpError as e:
+        if not is_too_large(e):
+            raise e
+        error = e
+
+    if time_b - time_a <= seconds_min:
+        if error:
+            raise error
+        return columns
+
+    time_mid = (time_a + time_b)/2.
+    first = fetch_window(table_id, time_a, time_mid, service=service, num_retry=num_retry,
+                         seconds_min=seconds_min)
+    second = fetch_window(table_id, time_mid, time_b, last=last, service=service,
+                          num_retry=num_retry, seconds_min=seconds_min)
+
+    return dict((name, np.concatenate([first[name], second[name]])) for name in first)
+
+
+def stream_between(table_id, seconds_start, seconds_end=None, seconds_window=None,
+                   num_workers=4, num_retry=4, num_pending_max=None):
+    """
+    Download data spanning time range from a Google Fusion Table, one window at a time.
+
+    This is a generator.  The time range is split into windows small enough to fit within
+    the service's response limit.  Windows are fetched concurrently by a bounded pool of
+    worker threads and yielded in time order as they complete.  Each window is retried
+    independently on transient failures, and split if it turns out too large, see
+    fetch_window.
+
+    Parameters
+    ----------
+    seconds_end : end of time range.  Default is now.
+
+    seconds_window : length of each window in seconds.  Default from window_seconds().
+
+    num_workers : number of concurrent requests.
+
+    num_pending_max : most windows fetched but not yet yielded, e.g. while waiting for a slow
+                      earlier window.  Default is twice num_workers.
+
+    Returns
+    -------
+    Yield sequence of dicts mapping column name to Numpy array.
+
+    """
+    if not seconds_end:
+        seconds_end = time.time()
+
+    if not seconds_window:
+        seconds_window = window_seconds()
+
+    windows = split_windows(seconds_start, seconds_end, seconds_window)
+    if not windows:
+        return
+
+    # All workers share one service object.  Each request runs over its own pooled connection.
+    service = build_service()
+
+    # Work to do, results coming back.
+    queue_work = Queue.Queue()
+    queue_results = Queue.Queue()
+    event_stop = threading.Event()
+
+    for index, window in enumerate(windows):
+        queue_work.put((index, window))
+
+    num_workers = max(1, min(num_workers, len(windows)))
+    if not num_pending_max:
+        num_pending_max = 2*num_workers
+
+    # One slot per window taken but not yet yielded.  Windows are taken in time order, so the
+    # next window to yield always holds a slot and the bound can't deadlock.
+    slots = threading.Semaphore(max(num_pending_max, num_workers))
+
+    def worker():
+        """Fetch windows until the work queue runs dry.
+        """
+        while True:
+            # Released as windows are yielded, or all at once when the caller stops.
+            slots.acquire()
+            if event_stop.is_set():
+                return
+
+            try:
+                index, (time_a, time_b) = queue_work.get(block=False)
+            except Queue.Empty:
+                slots.release()
+                return
+
+            try:
+                columns = fetch_window(table_id, time_a, time_b,
+                                       last=index == len(windows) - 1, service=service,
+                                       num_retry=num_retry)
+                queue_results.put((index, columns, None))
+            except BaseException as e:
+                # Anything, even SystemExit, must reach the caller or it waits forever.
+                queue_results.put((index, None, e))
+
+    threads = [threading.Thread(target=worker) for k in range(num_workers)]
+    for t in threads:
+        t.daemon = True
+        t.start()
+
+    # Yield in time order.  Windows arriving early wait in pending.
+    pending = {}
+    index_next = 0
+    try:
+        while index_next < len(windows):
+            try:
+                index, columns, error = queue_results.get(timeout=1.)
+            except Queue.Empty:
+                if any(t.is_alive() for t in threads) or not queue_results.empty():
+                    continue
+                raise errors.Who8MyRPiError('Download workers exited with windows missing.')
+
+            if error:
+                time_a, time_b = windows[index]
+                msg = 'Failed to fetch window {:s} - {:s}: {:s}'.format(
+                    utility.pretty_timestamp(time_a), utility.pretty_timestamp(time_b), str(error))
+                raise errors.Who8MyRPiError(msg)
+
+            pending[index] = columns
+            while index_next in pending:
+                yield pending.pop(index_next)
+                index_next += 1
+                slots.release()
+    finally:
+        # Wake workers waiting for a slot so they see the stop.
+        event_stop.set()
+        for t in threads:
+            slots.release()
+
 #################################################
 
 
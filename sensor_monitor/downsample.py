@@ -0,0 +1,111 @@
+
+from __future__ import division, print_function, unicode_literals
+
+"""
+Downsampling for plots.
+
+Two tools:
+  - Point downsampling of a single series to about screen resolution: min/max per bin, which
+    keeps every spike, or LTTB (largest triangle three buckets), which keeps the visual shape.
+  - Choice of rollup level (see rollup.py): a plot of any time span reads the coarsest level
+    that still has about one bucket per pixel, so a year-long view touches a few thousand rows
+    instead of millions of raw samples.
+"""
+
+import numpy as np
+
+import rollup
+
+#################################################
+
+
+def minmax(x, y, num_bins):
+    """
+    Downsample series to the minimum and maximum of each of num_bins equal-count bins.
+    Return x, y with at most 2*num_bins points, in original order.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+
+    n = y.size
+    if n <= 2*num_bins:
+        return x, y
+
+    edges = np.linspace(0, n, num_bins + 1).astype(np.int64)
+    bins = np.repeat(np.arange(num_bins), np.diff(edges))
+
+    # Sort by bin, then value.  First of each bin is the minimum, last is the maximum.
+    order = np.lexsort((y, bins))
+    first = edges[:-1]
+    last = edges[1:] - 1
+
+    index = np.union1d(order[first], order[last])
+
+    return x[index], y[index]
+
+
+def lttb(x, y, num_out):
+    """
+    Largest triangle three buckets downsampling.  Return x, y with num_out points including the
+    first and last.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    n = y.size
+    if num_out >= n or num_out < 3:
+        return x, y
+
+    edges = np.linspace(1, n - 1, num_out - 1).astype(np.int64)
+
+    index = np.empty(num_out, dtype=np.int64)
+    index[0] = 0
+    index[-1] = n - 1
+
+    a = 0
+    for k in range(num_out - 2):
+        i0, i1 = edges[k], edges[k + 1]
+
+        # Average of next bucket, or the last point.
+        if k < num_out - 3:
+            j0, j1 = edges[k + 1], edges[k + 2]
+            x_next = x[j0:j1].mean()
+            y_next = y[j0:j1].mean()
+        else:
+            x_next = x[-1]
+            y_next = y[-1]
+
+        area = np.abs((x[a] - x_next) * (y[i0:i1] - y[a]) -
+                      (x[a] - x[i0:i1]) * (y_next - y[a]))
+
+        a = i0 + int(np.argmax(area))
+        index[k + 1] = a
+
+    return x[index], y[index]
+
+#################################################
+
+
+def choose_level(seconds_span, num_pixels):
+    """
+    Coarsest rollup level with at least num_pixels buckets across seconds_span.  None if even
+    the finest level is too coarse, meaning raw samples should be used.
+    """
+    for name, resolution in reversed(rollup.LEVELS):
+        if seconds_span / resolution >= num_pixels:
+            return name
+
+    return None
+
+#################################################
+
+
+if __name__ == '__main__':
+    """
+    Development and examples.
+    """
+    x = np.arange(100000.)
+    y = np.sin(x / 5000.) + np.random.normal(0, 0.1, x.size)
+
+    print(minmax(x, y, 500)[0].size)
+    print(lttb(x, y, 500)[0].size)
@@ -0,0 +1,591 @@
+
+from __future__ import division, print_function, unicode_literals
+
+"""
+Edge-triggered GPIO input.
+
+Instead of polling a pin, ask the kernel to report level changes.  A single Edge_Watcher
+thread sleeps in epoll until any watched pin changes, then hands timestamped events to
+per-pin callbacks and to a shared queue.  No CPU is used while inputs are idle.
+
+Two kernel interfaces are supported:
+  - GPIO character device (/dev/gpiochipN).  Events carry kernel timestamps taken in the
+    interrupt handler, precise enough to decode DHT22 pulse widths.
+  - sysfs (/sys/class/gpio).  Older kernels.  Timestamps are taken when the watcher wakes up.
+
+Example, count presses on a switch:
+
+    watcher = Edge_Watcher()
+    watcher.add(17, edge=RISING, callback=lambda event: print(event))
+    watcher.start()
+"""
+
+import os
+import time
+import errno
+import fcntl
+import struct
+import select
+import ctypes
+import ctypes.util
+import threading
+import Queue
+import collections
+
+#################################################
+
+RISING = 1
+FALLING = 2
+BOTH = RISING | FALLING
+
+_edge_names = {RISING: 'rising', FALLING: 'falling', BOTH: 'both'}
+
+_CHIP_DEFAULT = '/dev/gpiochip0'
+_PATH_SYSFS = '/sys/class/gpio'
+
+# Character device ABI v1, linux/gpio.h.
+_GPIOHANDLE_REQUEST_INPUT = 1 << 0
+_GPIOEVENT_EVENT_RISING_EDGE = 0x01
+
+_fmt_event_request = str('=III32si')
+_fmt_event_data = str('=QI4x')
+_size_event_data = struct.calcsize(_fmt_event_data)
+
+
+def _iowr(kind, number, size):
+    return (3 << 30) | (size << 16) | (kind << 8) | number
+
+
+_GPIO_GET_LINEEVENT_IOCTL = _iowr(0xB4, 0x04, struct.calcsize(_fmt_event_request))
+
+# Character device ABI v2.  A single line request can be switched from output to input with
+# edge detection, and its event buffer sized to hold a whole DHT22 transmission.
+_GPIO_V2_LINE_FLAG_INPUT = 1 << 2
+_GPIO_V2_LINE_FLAG_OUTPUT = 1 << 3
+_GPIO_V2_LINE_FLAG_EDGE_RISING = 1 << 4
+_GPIO_V2_LINE_FLAG_EDGE_FALLING = 1 << 5
+_GPIO_V2_LINE_EVENT_RISING_EDGE = 1
+
+_fmt_v2_config = str('=QI5I') + str('IIQQ')*10
+_fmt_v2_request = str('=64I32s') + _fmt_v2_config[1:] + str('II5Ii')
+_fmt_v2_event = str('=QIIII24x')
+_size_v2_event = struct.calcsize(_fmt_v2_event)
+
+_GPIO_V2_GET_LINE_IOCTL = _iowr(0xB4, 0x07, struct.calcsize(_fmt_v2_request))
+_GPIO_V2_LINE_SET_CONFIG_IOCTL = _iowr(0xB4, 0x0D, struct.calcsize(_fmt_v2_config))
+
+#################################################
+# Clocks.  Newer kernels stamp chardev events with CLOCK_MONOTONIC, older ones with
+# CLOCK_REALTIME.  Event times are converted to epoch seconds either way.
+
+_CLOCK_MONOTONIC = 1
+
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+_librt = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1', use_errno=True)
+
+
+def monotonic():
+    """
+    Seconds from CLOCK_MONOTONIC.
+    """
+    t = _timespec()
+    _librt.clock_gettime(_CLOCK_MONOTONIC, ctypes.byref(t))
+    return t.tv_sec + t.tv_nsec * 1.e-9
+
+
+def kernel_to_epoch(seconds_kernel):
+    """
+    Convert a chardev event timestamp to epoch seconds.
+    """
+    time_now = time.time()
+    if abs(time_now - seconds_kernel) < 24*60*60:
+        # Already realtime.
+        return seconds_kernel
+
+    return time_now - (monotonic() - seconds_kernel)
+
+#################################################
+
+
+class Edge_Event(collections.namedtuple('Edge_Event', ['pin', 'seconds', 'level'])):
+    """
+    A level change on a pin.
+
+    pin: GPIO pin number.
+    seconds: epoch seconds when the edge happened.
+    level: pin level after the edge, 1 for rising, 0 for falling.
+    """
+    pass
+
+
+class Chardev_Line(object):
+    kernel_timestamps = True
+
+    def __init__(self, pin, edge=BOTH, chip=None):
+        """
+        Edge events for one pin from the GPIO character device.
+        """
+        if not chip:
+            chip = _CHIP_DEFAULT
+
+        self.pin = pin
+
+        request = bytearray(struct.pack(_fmt_event_request, pin, _GPIOHANDLE_REQUEST_INPUT, edge,
+                                        b'who8myrpi', 0))
+
+        fd_chip = os.open(chip, os.O_RDONLY)
+        try:
+            fcntl.ioctl(fd_chip, _GPIO_GET_LINEEVENT_IOCTL, request, True)
+        finally:
+            os.close(fd_chip)
+
+        self.fd = struct.unpack(_fmt_event_request, bytes(request))[4]
+
+        flags = fcntl.fcntl(self.fd, fcntl.F_GETFL)
+        fcntl.fcntl(self.fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+    def fileno(self):
+        return self.fd
+
+    def read_events(self):
+        """
+        Return list of (seconds, level) for all pending events.  Does not block.
+        """
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, _size_event_data * 64)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    break
+                raise
+
+            if not data:
+                break
+
+            for k in range(0, len(data) - _size_event_data + 1, _size_event_data):
+                timestamp, kind = struct.unpack_from(_fmt_event_data, data, k)
+                level = 1 if kind == _GPIOEVENT_EVENT_RISING_EDGE else 0
+                events.append((kernel_to_epoch(timestamp * 1.e-9), level))
+
+        return events
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def _v2_config(flags):
+    return [flags, 0] + [0]*5 + [0]*4*10
+
+
+class Chardev_Request(object):
+    kernel_timestamps = True
+
+    def __init__(self, pin, chip=None, num_events=128):
+        """
+        One pin through the v2 GPIO character device, requested as an output driven low.
+
+        listen() turns the same request into an input with edge events, so no other owner
+        touches the line in between and edges right after the switch are not missed.
+
+        num_events : kernel event buffer size.
+        """
+        if not chip:
+            chip = _CHIP_DEFAULT
+
+        self.pin = pin
+
+        offsets = [pin] + [0]*63
+        values = (offsets + [b'who8myrpi'] + _v2_config(_GPIO_V2_LINE_FLAG_OUTPUT) +
+                  [1, num_events] + [0]*5 + [0])
+        request = bytearray(struct.pack(_fmt_v2_request, *values))
+
+        fd_chip = os.open(chip, os.O_RDONLY)
+        try:
+            fcntl.ioctl(fd_chip, _GPIO_V2_GET_LINE_IOCTL, request, True)
+        finally:
+            os.close(fd_chip)
+
+        self.fd = struct.unpack(_fmt_v2_request, bytes(request))[-1]
+
+        flags = fcntl.fcntl(self.fd, fcntl.F_GETFL)
+        fcntl.fcntl(self.fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+    def fileno(self):
+        return self.fd
+
+    def listen(self, edge=BOTH):
+        """
+        Release the line to its pull-up and report edges.
+        """
+        flags = _GPIO_V2_LINE_FLAG_INPUT
+        if edge & RISING:
+            flags |= _GPIO_V2_LINE_FLAG_EDGE_RISING
+        if edge & FALLING:
+            flags |= _GPIO_V2_LINE_FLAG_EDGE_FALLING
+
+        config = bytearray(struct.pack(_fmt_v2_config, *_v2_config(flags)))
+        fcntl.ioctl(self.fd, _GPIO_V2_LINE_SET_CONFIG_IOCTL, config, True)
+
+    def read_events(self):
+        """
+        Return list of (seconds, level) for all pending events.  Does not block.
+        """
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, _size_v2_event * 64)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    break
+                raise
+
+            if not data:
+                break
+
+            for k in range(0, len(data) - _size_v2_event + 1, _size_v2_event):
+                timestamp, kind = struct.unpack_from(_fmt_v2_event, data, k)[:2]
+                level = 1 if kind == _GPIO_V2_LINE_EVENT_RISING_EDGE else 0
+                events.append((kernel_to_epoch(timestamp * 1.e-9), level))
+
+        return events
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class Sysfs_Line(object):
+    kernel_timestamps = False
+
+    def __init__(self, pin, edge=BOTH):
+        """
+        Edge events for one pin from the sysfs GPIO interface.
+        """
+        self.pin = pin
+
+        path = os.path.join(_PATH_SYSFS, 'gpio{:d}'.format(pin))
+        if not os.path.isdir(path):
+            with open(os.path.join(_PATH_SYSFS, 'export'), 'w') as fo:
+                fo.write(str(pin))
+
+            # Give udev a moment to set permissions on the new files.
+            time.sleep(0.1)
+
+        with open(os.path.join(path, 'direction'), 'w') as fo:
+            fo.write('in')
+
+        with open(os.path.join(path, 'edge'), 'w') as fo:
+            fo.write(_edge_names[edge])
+
+        self.fo = open(os.path.join(path, 'value'), 'r')
+
+        # Clear the initial pending state.
+        self.fo.read()
+
+    def fileno(self):
+        return self.fo.fileno()
+
+    def read_events(self):
+        """
+        Return list with one (seconds, level) for the current level.
+        """
+        seconds = time.time()
+
+        self.fo.seek(0)
+        level = int(self.fo.read().strip() or 0)
+
+        return [(seconds, level)]
+
+    def close(self):
+        self.fo.close()
+
+
+def open_line(pin, edge=BOTH, backend=None):
+    """
+    Open a pin for edge events.
+
+    backend: 'chardev', 'sysfs', or None to use the character device when present.
+    """
+    if backend is None:
+        backend = 'chardev' if os.path.exists(_CHIP_DEFAULT) else 'sysfs'
+
+    if backend == 'chardev':
+        return Chardev_Line(pin, edge)
+    elif backend == 'sysfs':
+        return Sysfs_Line(pin, edge)
+    else:
+        raise ValueError('Unknown edge backend: {:s}'.format(backend))
+
+#################################################
+
+
+class Edge_Watcher(threading.Thread):
+    def __init__(self, maxsize=10000, backend=None, *args, **kwargs):
+        """
+        Watch many pins for edges from a single thread.
+
+        Events go to the pin's callback, if any, and to self.queue.  When the queue is full the
+        oldest events are dropped and counted in self.count_dropped.
+
+        Parameters
+        ----------
+        maxsize : capacity of the event queue.
+
+        backend : 'chardev', 'sysfs', or None for automatic choice.
+
+        """
+        threading.Thread.__init__(self, *args, **kwargs)
+        self.daemon = True
+
+        self.backend = backend
+        self.queue = Queue.Queue(maxsize=maxsize)
+
+        self.lock = threading.Lock()
+        self.lines = {}
+        self.callbacks = {}
+        self.counts = {}
+        self.count_dropped = 0
+
+        self.epoll = select.epoll()
+
+        # Pipe to wake the thread on stop.
+        self._fd_wake_read, self._fd_wake_write = os.pipe()
+        self.epoll.register(self._fd_wake_read, select.EPOLLIN)
+
+        self.keep_running = False
+
+    def add(self, pin, edge=BOTH, callback=None):
+        """
+        Start watching a pin.
+
+        callback: function called with an Edge_Event from the watcher thread.  Keep it short.
+        """
+        line = open_line(pin, edge, self.backend)
+        self.add_line(pin, line, callback)
+
+    def add_line(self, pin, line, callback=None):
+        """
+        Start watching an already opened line object.
+        """
+        with self.lock:
+            if pin in self.lines:
+                raise ValueError('Pin already watched: {:d}'.format(pin))
+
+            self.lines[pin] = line
+            self.callbacks[pin] = callback
+            self.counts[pin] = 0
+
+        self.epoll.register(line.fileno(), select.EPOLLIN | select.EPOLLPRI | select.EPOLLERR)
+
+    def remove(self, pin):
+        """
+        Stop watching a pin.
+        """
+        with self.lock:
+            line = self.lines.pop(pin)
+            self.callbacks.pop(pin)
+
+        self.epoll.unregister(line.fileno())
+        line.close()
+
+    def start(self):
+        self.keep_running = True
+        threading.Thread.start(self)
+
+    def stop(self):
+        """
+        Tell thread to stop running.
+        """
+        self.keep_running = False
+        os.write(self._fd_wake_write, b'x')
+
+    def run(self):
+        """
+        This is where the work happens.
+        """
+        self.keep_running = True
+
+        while self.keep_running:
+            try:
+                ready = self.epoll.poll()
+            except IOError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+
+            for fd, mask in ready:
+                if fd == self._fd_wake_read:
+                    continue
+
+                # Read under the lock, remove() may close the line from another thread.
+                with self.lock:
+                    lines = [(p, line) for p, line in self.lines.items() if line.fileno() == fd]
+                    if not lines:
+                        continue
+
+                    pin, line = lines[0]
+                    events = line.read_events()
+
+                self.dispatch(pin, events)
+
+        # Finish.
+        for pin in list(self.lines.keys()):
+            self.remove(pin)
+
+        self.epoll.close()
+        os.close(self._fd_wake_read)
+        os.close(self._fd_wake_write)
+
+    def dispatch(self, pin, events):
+        """
+        Deliver raw (seconds, level) events for a pin.
+        """
+        callback = self.callbacks.get(pin)
+
+        for seconds, level in events:
+            event = Edge_Event(pin, seconds, level)
+            self.counts[pin] += 1
+
+            try:
+                self.queue.put(event, block=False)
+            except Queue.Full:
+                try:
+                    self.queue.get(block=False)
+                except Queue.Empty:
+                    pass
+                self.queue.put(event, block=False)
+                self.count_dropped += 1
+
+            if callback:
+                callback(event)
+
+    def events(self, timeout=None):
+        """
+        Generator yielding events from the queue until stopped, or until nothing arrives for
+        timeout seconds.
+        """
+        while self.keep_running or not self.queue.empty():
+            try:
+                yield self.queue.get(timeout=timeout)
+            except Queue.Empty:
+                return
+
+#################################################
+# DHT22 edge capture.
+
+
+def decode_edges(events):
+    """
+    Decode DHT22 bits from edge times.
+
+    Each bit is a LOW pulse followed by a HIGH pulse.  A HIGH pulse longer than its LOW pulse
+    is a 1, otherwise a 0, the same rule used by dht22.read_single_bit.
+
+    Parameters
+    ----------
+    events : sequence of (seconds, level) starting after the host released the line.
+
+    Returns
+    -------
+    Same as dht22.read_bits: (first, bits), or (None, message) if nothing was decoded.
+
+    """
+    # Runs between consecutive edges.  The level of a run is the level after its first edge.
+    runs = [(events[k][1], events[k + 1][0] - events[k][0]) for k in range(len(events) - 1)]
+
+    # Skip to the sensor's first LOW pulse.
+    while runs and runs[0][0] != 0:
+        runs.pop(0)
+
+    num_pairs = len(runs) // 2
+    if not num_pairs:
+        return None, 'Problem decoding edges.  count: {:d}'.format(len(events))
+
+    data = []
+    for k in range(num_pairs):
+        time_low = runs[2*k][1]
+        time_high = runs[2*k + 1][1]
+        data.append(1 if time_high >= time_low else 0)
+
+    return data[0], data[1:]
+
+
+# Sensor response, 40 data bits and the final release, two edges each.
+_DHT22_EDGES = 2 + 2*40 + 2
+
+
+def drain_events(line, num_events, time_capture):
+    """
+    Read events from line as they arrive, until num_events were read or time_capture seconds
+    passed.
+
+    The kernel only buffers a limited number of events per line, older kernels 16, fewer than
+    one DHT22 transmission.  Reading only after the transmission would lose the rest.
+    """
+    events = []
+    time_end = time.time() + time_capture
+
+    while len(events) < num_events:
+        time_left = time_end - time.time()
+        if time_left <= 0:
+            break
+
+        ready, _, _ = select.select([line], [], [], time_left)
+        if ready:
+            events.extend(line.read_events())
+
+    return events
+
+
+def capture_dht22(pin, time_start=0.01, time_capture=0.02, chip=None):
+    """
+    Read one DHT22 sample by capturing kernel-timestamped edges instead of polling.
+
+    The start signal is driven through the same character device request that then listens
+    for the sensor's edges, see Chardev_Request.  wiringPi is not involved.
+
+    Returns
+    -------
+    Tuple (RH, Tf), or (None, message) on failure, like dht22.read_dht22_single.
+
+    """
+    import dht22
+
+    line = Chardev_Request(pin, chip)
+    try:
+        # Start signal: line held low, then released.
+        time.sleep(time_start)
+        line.listen(BOTH)
+
+        events = drain_events(line, _DHT22_EDGES, time_capture)
+    finally:
+        line.close()
+
+    first, bits = decode_edges(events)
+
+    return dht22.bits_to_values(first, bits)
+
+#################################################
+
+
+if __name__ == '__main__':
+    """
+    Print edges on a switch until ctrl-C.
+    """
+    watcher = Edge_Watcher()
+    watcher.add(17, edge=BOTH)
+    watcher.start()
+
+    try:
+        for event in watcher.events():
+            print(event)
+    except KeyboardInterrupt:
+        watcher.stop()
@@ -25,6 +25,9 @@ def blinking():
     if val < 0:
         raise Exception('Problem seting up WiringPI.')
 
+    # Single register operations for the multi-pin reads and writes, if available.
+    gpio.enable_fast_path()
+
     # Configure GPIO pins.
     for pin in pins_led:
         gpio.pinMode(pin, gpio.OUTPUT)
@@ -43,8 +46,7 @@ def blinking():
         time.sleep(time_delta)
         
         # Read switches.
-        val_a = gpio.digitalRead(pin_switch_a)
-        val_b = gpio.digitalRead(pin_switch_b)
+        val_a, val_b = gpio.read_many([pin_switch_a, pin_switch_b])
         
         if val_a:
             time_delta *= 1.1
@@ -55,9 +57,8 @@ def blinking():
             
             
         # Set LEDs.
-        for pin in pins_led:
-            value_rnd = np.random.random_integers(0, 1)
-            gpio.digitalWrite(pin, value_rnd)
+        values_rnd = np.random.random_integers(0, 1, len(pins_led))
+        gpio.write_many(pins_led, values_rnd)
 
             
             
@@ -2,6 +2,8 @@
 
 from __future__ import division, print_function, unicode_literals
 
+import numpy as np
+
 import _gpio
 
 ############################################
@@ -39,7 +41,11 @@ def wiringPiSetup():
 
     This function needs to be called with root privileges.
     """
-    return _gpio._wiringPiSetup()
+    val = _gpio._wiringPiSetup()
+    if val >= 0:
+        _set_mode(MODE_PINS)
+
+    return val
 
 
 def wiringPiSetupGpio():
@@ -47,13 +53,21 @@ def wiringPiSetupGpio():
     Identical to wiringPiSetup, except it allows the calling programs to use the
     Broadcom GPIO pin numbers directly with no re-mapping.
     """
-    return _gpio._wiringPiSetupGpio()
+    val = _gpio._wiringPiSetupGpio()
+    if val >= 0:
+        _set_mode(MODE_GPIO)
+
+    return val
 
 
 def wiringPiSetupSys():
     """
     """
-    return _gpio._wiringPiSetupSys()
+    val = _gpio._wiringPiSetupSys()
+    if val >= 0:
+        _set_mode(MODE_SYS)
+
+    return val
 
 
 def wiringPiSetupPiFace():
@@ -71,7 +85,11 @@ def wiringPiSetupPiFace():
     Also note that some functions (noted below) have no effect when using this
     mode as they're not currently possible to action unless called with root priveledges.
     """
-    return _gpio._wiringPiSetupPiFace()
+    val = _gpio._wiringPiSetupPiFace()
+    if val >= 0:
+        _set_mode(MODE_PIFACE)
+
+    return val
 
 
 def pinMode(pin, mode):
@@ -141,6 +159,14 @@ def millis():
     return _gpio.millis()
 
 
+def piHiPri(pri):
+    """
+    Move the calling process to a real-time round-robin scheduling class at priority pri
+    (0 - 99) and raise its priority.  Needs root.  Returns 0 on success, -1 on error.
+    """
+    return _gpio._piHiPri(pri)
+
+
 
 def pwmWrite(pin, value):
     """
@@ -163,3 +189,93 @@ def pwmSetRange(range):
     """
     _gpio._pwmSetRange(range)
 
+################################3333
+
+# Batched multi-pin access.
+
+# Pin numbering chosen by the last wiringPi setup call, None before any.  The register fast
+# path addresses pins by their Broadcom GPIO number.
+_setup_mode = None
+_MODES_BCM = (MODE_GPIO, MODE_SYS)
+
+
+def _set_mode(mode):
+    global _setup_mode
+
+    _setup_mode = mode
+    if mode not in _MODES_BCM and fast_path_enabled():
+        print('Fast path disabled, it needs Broadcom GPIO pin numbers.')
+        disable_fast_path()
+
+
+def enable_fast_path(path=None, offset=None):
+    """
+    Map the GPIO register block so that write_many, read_many and read_mask on pins 0 - 31
+    become single register operations.  Tries /dev/gpiomem, then /dev/mem, unless path is
+    given.  A regular file of at least 4096 bytes can stand in for the registers.
+
+    Returns True if the mapping succeeded.  Otherwise everything keeps working through the
+    regular wiringPi calls.
+
+    Pins are Broadcom GPIO numbers, as after wiringPiSetupGpio or wiringPiSetupSys.  Raises
+    ValueError after wiringPiSetup or wiringPiSetupPiFace, whose pin numbers would address
+    the wrong register bits.  A later switch to those modes disables the fast path.
+    """
+    if _setup_mode is not None and _setup_mode not in _MODES_BCM:
+        raise ValueError('Fast path needs Broadcom GPIO pin numbers, use wiringPiSetupGpio.')
+
+    if path:
+        candidates = [(path, offset or 0)]
+    else:
+        candidates = [('/dev/gpiomem', 0),
+                      ('/dev/mem', _gpio._gpio_map_address())]
+
+    for p, o in candidates:
+        if _gpio._gpio_map_open(p, o) == 0:
+            return True
+
+    return False
+
+
+def disable_fast_path():
+    """
+    Unmap the GPIO register block.
+    """
+    _gpio._gpio_map_close()
+
+
+def fast_path_enabled():
+    return _gpio._gpio_map_is_open()
+
+
+def write_many(pins, values):
+    """
+    Write values to pins in a single call.  Pins must already be set as outputs.
+
+    pins: sequence or Numpy array of pin numbers.
+    values: sequence or Numpy array of HIGH/LOW values, one per pin, or a single value
+            written to every pin.
+    """
+    pins = np.ascontiguousarray(pins, dtype=np.intc).ravel()
+    values = np.ascontiguousarray(values, dtype=np.intc).ravel()
+
+    if values.size == 1 and pins.size > 1:
+        values = np.repeat(values, pins.size)
+
+    _gpio._write_many(pins, values)
+
+
+def read_many(pins):
+    """
+    Read levels of pins in a single call.  Return Numpy int array, one value per pin.
+    """
+    pins = np.ascontiguousarray(pins, dtype=np.intc).ravel()
+
+    return _gpio._read_many(pins)
+
+
+def read_mask():
+    """
+    Snapshot levels of pins 0 - 31 as one integer, bit N holds pin N.
+    """
+    return _gpio._read_mask()
@@ -0,0 +1,126 @@
+/*
+ * gpio_mmap.h
+ *
+ * Direct access to the BCM2835 GPIO register block through mmap.
+ *
+ * The block is mapped once from /dev/gpiomem (no root needed), /dev/mem at the GPIO base
+ * address, or any regular file of at least GPIO_BLOCK_SIZE bytes standing in for the
+ * registers during testing.  Reading the level register directly skips wiringPi's pin mode
+ * dispatch and returns the state of pins 0 - 31 in a single load.
+ */
+
+#ifndef GPIO_MMAP_H
+#define GPIO_MMAP_H
+
+#include <stdio.h>
+#include <string.h>
+#include <stdint.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+
+#define GPIO_BLOCK_SIZE  4096
+
+/* Register block offset from the peripheral base, and the Pi 1 peripheral base. */
+#define GPIO_OFFSET               0x200000
+#define GPIO_PERIPHERAL_BASE_PI1  0x20000000
+
+/* Word offsets into the register block. */
+#define GPIO_GPSET0      7
+#define GPIO_GPCLR0      10
+#define GPIO_GPLEV0      13
+
+static volatile uint32_t *gpio_map_base = 0;
+
+
+/* Physical address of the register block, for mapping /dev/mem.  Peripheral base from the
+ * device tree (Pi 2/3, or Pi 4 with its 64-bit child address), else the Pi 1 default. */
+static long gpio_map_address(void)
+{
+    unsigned char r[12];
+    unsigned long base;
+    FILE *fp;
+
+    memset(r, 0, sizeof(r));
+
+    fp = fopen("/proc/device-tree/soc/ranges", "rb");
+    if (!fp)
+        return GPIO_PERIPHERAL_BASE_PI1 + GPIO_OFFSET;
+
+    fread(r, 1, sizeof(r), fp);
+    fclose(fp);
+
+    base = ((unsigned long)r[4] << 24) | (r[5] << 16) | (r[6] << 8) | r[7];
+    if (base == 0)
+        base = ((unsigned long)r[8] << 24) | (r[9] << 16) | (r[10] << 8) | r[11];
+
+    return (long)(base + GPIO_OFFSET);
+}
+
+
+/* Map register block.  Return 0 on success, negative errno on failure. */
+static int gpio_map_open(const char *path, long offset)
+{
+    int fd;
+    void *p;
+
+    if (gpio_map_base)
+        return 0;
+
+    fd = open(path, O_RDWR | O_SYNC);
+    if (fd < 0)
+        return -errno;
+
+    p = mmap(0, GPIO_BLOCK_SIZE, PROT_READ | PROT_WRITE, MAP_SHARED, fd, offset);
+    close(fd);
+
+    if (p == MAP_FAILED)
+        return -errno;
+
+    gpio_map_base = (volatile uint32_t *)p;
+
+    return 0;
+}
+
+
+static void gpio_map_close(void)
+{
+    if (gpio_map_base) {
+        munmap((void *)gpio_map_base, GPIO_BLOCK_SIZE);
+        gpio_map_base = 0;
+    }
+}
+
+
+static inline int gpio_map_is_open(void)
+{
+    return gpio_map_base != 0;
+}
+
+
+/* Levels of pins 0 - 31, one bit per pin. */
+static inline uint32_t gpio_map_levels(void)
+{
+    return gpio_map_base[GPIO_GPLEV0];
+}
+
+
+static inline int gpio_map_read(int pin)
+{
+    return (gpio_map_base[GPIO_GPLEV0] >> pin) & 1;
+}
+
+
+/* Set pins in mask_set high and pins in mask_clear low, two register writes in total. */
+static inline void gpio_map_write_mask(uint32_t mask_set, uint32_t mask_clear)
+{
+    if (mask_set)
+        gpio_map_base[GPIO_GPSET0] = mask_set;
+
+    if (mask_clear)
+        gpio_map_base[GPIO_GPCLR0] = mask_clear;
+}
+
+
+#endif
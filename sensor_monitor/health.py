@@ -0,0 +1,311 @@
+
+from __future__ import division, print_function, unicode_literals
+
+"""
+Sensor channel health and readiness.
+
+Every read attempt on a channel, good or bad, is reported to a Health_Monitor.  The monitor
+keeps a short history per pin and classifies each channel:
+
+    powering : power applied recently, sensor not expected to answer yet.
+    warming  : powered, no good read yet.
+    healthy  : recent reads mostly good.
+    degraded : good reads are rare or stale.
+    dead     : no good read for a long time.
+
+Collection can begin as soon as one channel is healthy.  Channels keep running in the
+background, so a sensor that comes up late simply starts contributing samples.
+"""
+
+import time
+import threading
+import collections
+
+POWERING = 'powering'
+WARMING = 'warming'
+HEALTHY = 'healthy'
+DEGRADED = 'degraded'
+DEAD = 'dead'
+
+STATES = [POWERING, WARMING, HEALTHY, DEGRADED, DEAD]
+
+#################################################
+
+
+class Channel_Health(object):
+    def __init__(self, pin, time_powering=2., time_stale=60., time_dead=180., num_window=10,
+                 rate_degraded=0.5):
+        """
+        Health state of a single sensor channel.
+
+        Parameters
+        ----------
+        pin : GPIO data pin.
+
+        time_powering : seconds after power-on before the sensor is expected to answer.
+
+        time_stale : degraded when the last good read is older than this many seconds.
+
+        time_dead : dead when no good read for this many seconds.
+
+        num_window : number of recent read attempts used to compute the good-read rate.
+
+        rate_degraded : degraded when the good-read rate falls below this value.
+
+        """
+        self.pin = pin
+        self.time_powering = time_powering
+        self.time_stale = time_stale
+        self.time_dead = time_dead
+        self.rate_degraded = rate_degraded
+
+        self.recent = collections.deque(maxlen=num_window)
+
+        self.count_good = 0
+        self.count_bad = 0
+        self.msg_last = None
+
+        self.time_power = None
+        self.time_first_good = None
+        self.time_last_good = None
+
+        self.power_on()
+
+    def power_on(self, time_power=None):
+        """
+        Sensor power was just applied.  Start over as far as readiness is concerned.
+        """
+        if time_power is None:
+            time_power = time.time()
+
+        self.time_power = time_power
+        self.time_first_good = None
+        self.time_last_good = None
+        self.recent.clear()
+
+    def record(self, time_read, ok, msg=None):
+        """
+        Record outcome of one read attempt.
+        """
+        self.recent.append(bool(ok))
+
+        if ok:
+            self.count_good += 1
+            self.time_last_good = time_read
+            if self.time_first_good is None:
+                self.time_first_good = time_read
+        else:
+            self.count_bad += 1
+            self.msg_last = msg
+
+    @property
+    def rate_good(self):
+        """
+        Fraction of recent read attempts that were good.  None if no attempts yet.
+        """
+        if not self.recent:
+            return None
+
+        return sum(self.recent) / len(self.recent)
+
+    @property
+    def time_to_first_good(self):
+        """
+        Seconds from power-on to first good read.  None if no good read yet.
+        """
+        if self.time_first_good is None:
+            return None
+
+        return self.time_first_good - self.time_power
+
+    def state(self, time_now=None):
+        """
+        Current health state.
+        """
+        if time_now is None:
+            time_now = time.time()
+
+        if self.time_last_good is None:
+            time_powered = time_now - self.time_power
+            if time_powered < self.time_powering:
+                return POWERING
+            elif time_powered < self.time_dead:
+                return WARMING
+            else:
+                return DEAD
+
+        time_since_good = time_now - self.time_last_good
+        if time_since_good > self.time_dead:
+            return DEAD
+
+        rate = self.rate_good
+        if time_since_good > self.time_stale or (rate is not None and rate < self.rate_degraded):
+            return DEGRADED
+
+        return HEALTHY
+
+#################################################
+
+
+class Health_Monitor(object):
+    def __init__(self, pins=None, verbose=False, **kwargs):
+        """
+        Track health of many sensor channels.
+
+        Parameters
+        ----------
+        pins : initial list of pins.  Other pins are added as they report.
+
+        verbose : print state changes.
+
+        kwargs : passed on to Channel_Health.
+
+        """
+        self.verbose = verbose
+        self.kwargs = kwargs
+
+        self.condition = threading.Condition()
+        self.channels = collections.OrderedDict()
+        self.states_last = {}
+
+        if pins:
+            for p in pins:
+                self.add(p)
+
+    def add(self, pin):
+        """
+        Start tracking a pin.  No effect if already tracked.
+        """
+        with self.condition:
+            if pin not in self.channels:
+                self.channels[pin] = Channel_Health(pin, **self.kwargs)
+                self.states_last[pin] = None
+
+            return self.channels[pin]
+
+    def remove(self, pin):
+        """
+        Stop tracking a pin, e.g. when its sensor is taken out of the configuration.
+        """
+        with self.condition:
+            self.channels.pop(pin, None)
+            self.states_last.pop(pin, None)
+            self.condition.notify_all()
+
+    def __getitem__(self, pin):
+        return self.channels[pin]
+
+    def power_on(self, pins=None, time_power=None):
+        """
+        Power was applied to the given pins, or to all tracked pins.
+        """
+        with self.condition:
+            if pins is None:
+                pins = list(self.channels.keys())
+
+            for p in pins:
+                self.add(p).power_on(time_power)
+
+    def report(self, pin, time_read, ok, msg=None, duration=None):
+        """
+        Record the outcome of a read attempt.  Suitable as a channel observer.
+        """
+        with self.condition:
+            self.add(pin).record(time_read, ok, msg)
+            self._check_transition(pin, time_read)
+            self.condition.notify_all()
+
+    def _check_transition(self, pin, time_now):
+        state = self.channels[pin].state(time_now)
+        state_last = self.states_last[pin]
+
+        if state != state_last:
+            self.states_last[pin] = state
+            if self.verbose:
+                msg = 'Channel %d: %s -> %s' % (pin, state_last, state)
+                first = self.channels[pin].time_to_first_good
+                if state == HEALTHY and first is not None:
+                    msg += '  (first good read after %.1f s)' % first
+                print(msg)
+
+    def states(self, time_now=None):
+        """
+        Return dict of pin -> state.
+        """
+        if time_now is None:
+            time_now = time.time()
+
+        with self.condition:
+            result = collections.OrderedDict()
+            for p, c in self.channels.items():
+                result[p] = c.state(time_now)
+                self._check_transition(p, time_now)
+
+        return result
+
+    def pins_in(self, *states):
+        """
+        Return list of pins currently in any of the given states.
+        """
+        return [p for p, s in self.states().items() if s in states]
+
+    def time_to_first_good(self):
+        """
+        Return dict of pin -> seconds from power-on to first good read, None if not yet.
+        """
+        with self.condition:
+            return collections.OrderedDict((p, c.time_to_first_good)
+                                           for p, c in self.channels.items())
+
+    def wait_ready(self, time_wait_max=90., num_min=1):
+        """
+        Block until at least num_min channels are healthy, or timeout.  Return list of healthy
+        pins.
+        """
+        time_end = time.time() + time_wait_max
+
+        with self.condition:
+            while True:
+                pins_ok = [p for p, s in self.states().items() if s == HEALTHY]
+
+                time_remain = time_end - time.time()
+                if len(pins_ok) >= num_min or time_remain <= 0:
+                    return pins_ok
+
+                # Wake on every report, and at least once a second so state timeouts are seen.
+                self.condition.wait(min(time_remain, 1.))
+
+    def pretty_status(self):
+        """
+        Return multi-line string summarizing every channel.
+        """
+        lines = []
+        for p, s in self.states().items():
+            c = self.channels[p]
+            rate = c.rate_good
+            first = c.time_to_first_good
+
+            line = 'pin: %2d  %-8s  good: %5d  bad: %5d' % (p, s, c.count_good, c.count_bad)
+            if rate is not None:
+                line += '  rate: %.2f' % rate
+            if first is not None:
+                line += '  first good: %.1f s' % first
+
+            lines.append(line)
+
+        return '\n'.join(lines)
+
+#################################################
+
+
+if __name__ == '__main__':
+    """
+    Development and examples.
+    """
+    monitor = Health_Monitor([4, 17], verbose=True, time_powering=0.1)
+
+    time.sleep(0.2)
+    monitor.report(4, time.time(), True)
+    monitor.report(17, time.time(), False, 'Fail checksum')
+
+    print(monitor.pretty_status())
@@ -0,0 +1,225 @@
+
+from __future__ import division, print_function, unicode_literals
+
+"""
+Deferred imports and import timing.
+
+On a Pi 1 importing NumPy, pandas, matplotlib and the Google API client takes many seconds.
+Modules bind heavy dependencies to a stand-in instead:
+
+    plt = lazy.lazy_import('matplotlib.pyplot')
+
+The real module is imported on first attribute access, e.g. plt.figure(), so nothing is paid
+until the feature that needs it is actually used.  Names resolve the same way as an import
+statement in the calling module, including implicit relative imports, when given its globals().
+
+Lazy_Package does the same for the submodules of a package, so `import sensor_monitor` stays
+cheap while `sensor_monitor.sensors` still works.
+
+Import_Profiler wraps __import__ and records the time spent loading each module, inclusive and
+excluding nested imports.  Python 2 has no -X importtime, this fills the gap for
+`who8myrpi --profile-startup`, started by startup.py before who8myrpi is imported.
+"""
+
+import sys
+import time
+import types
+import threading
+import importlib
+
+import __builtin__
+
+# Reference time for startup reports: when this module was first imported.
+time_zero = time.time()
+
+#################################################
+
+
+class Lazy_Module(types.ModuleType):
+    def __init__(self, name, namespace=None, top=False):
+        """
+        Stand-in for a module, imported on first attribute access.
+
+        namespace : globals() of the importing module, for implicit relative imports.
+
+        top : stand in for the top-level package of a dotted name, as `import a.b` binds a.
+              Default is the named module itself, as `import a.b as x` binds a.b.
+        """
+        types.ModuleType.__init__(self, str(name))
+        self.__dict__['_lazy_namespace'] = namespace
+        self.__dict__['_lazy_top'] = top
+        self.__dict__['_lazy_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            fromlist = None if self._lazy_top else [str('__name__')]
+            module = __import__(self.__name__, self._lazy_namespace, None, fromlist)
+            self.__dict__['_lazy_module'] = module
+
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_lazy_module'] else 'not loaded'
+        return '<lazy module {:s} ({:s})>'.format(self.__name__, state)
+
+
+def lazy_import(name, namespace=None, top=False):
+    """
+    Return a stand-in for module name that imports it on first use.  See Lazy_Module.
+    """
+    return Lazy_Module(name, namespace, top)
+
+
+def is_loaded(module):
+    """
+    False for a stand-in whose module has not been imported yet.
+    """
+    if isinstance(module, Lazy_Module):
+        return module.__dict__['_lazy_module'] is not None
+
+    return True
+
+
+class Lazy_Package(types.ModuleType):
+    def __init__(self, package, submodules):
+        """
+        Replacement for a package module that imports the listed submodules on first
+        attribute access.  A submodule not found in the package is imported as a top-level
+        module, as a Python 2 implicit relative import would.  Use from the package's __init__:
+
+            sys.modules[__name__] = lazy.Lazy_Package(sys.modules[__name__], [...])
+        """
+        types.ModuleType.__init__(self, package.__name__)
+        self.__dict__.update(package.__dict__)
+        self.__dict__['_lazy_package'] = package
+        self.__dict__['_lazy_submodules'] = frozenset(submodules)
+
+    def __getattr__(self, attr):
+        if attr not in self._lazy_submodules:
+            raise AttributeError(attr)
+
+        try:
+            return importlib.import_module(self.__name__ + '.' + attr)
+        except ImportError as e:
+            error = e
+
+        # Extensions built in place by setup.py, e.g. dht22, are top-level modules.
+        try:
+            return importlib.import_module(attr)
+        except ImportError:
+            raise error
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | self._lazy_submodules)
+
+#################################################
+
+
+class Import_Profiler(object):
+    def __init__(self):
+        """
+        Time every import that loads new modules.
+        """
+        self.records = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.import_previous = None
+
+    @property
+    def running(self):
+        return self.import_previous is not None
+
+    def start(self):
+        if self.running:
+            return
+
+        self.import_previous = __builtin__.__import__
+        __builtin__.__import__ = self._import
+
+    def stop(self):
+        if not self.running:
+            return
+
+        __builtin__.__import__ = self.import_previous
+        self.import_previous = None
+
+    def _import(self, name, *args, **kwargs):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+
+        num_modules = len(sys.modules)
+        frame = [0.]
+        stack.append(frame)
+
+        time_start = time.time()
+        try:
+            return self.import_previous(name, *args, **kwargs)
+        finally:
+            inclusive = time.time() - time_start
+            stack.pop()
+
+            if stack:
+                stack[-1][0] += inclusive
+
+            num_new = len(sys.modules) - num_modules
+            if num_new > 0:
+                with self.lock:
+                    self.records.append((name, inclusive - frame[0], inclusive, num_new,
+                                         len(stack)))
+
+    def summary(self, num=None):
+        """
+        Return list of (module, seconds excluding nested imports, seconds inclusive, modules
+        loaded, nesting depth), slowest first.
+        """
+        with self.lock:
+            records = sorted(self.records, key=lambda r: r[1], reverse=True)
+
+        return records[:num] if num else records
+
+    def total(self):
+        """
+        Seconds spent importing, outermost imports only.
+        """
+        with self.lock:
+            return sum(r[2] for r in self.records if r[4] == 0)
+
+    def report(self, num=25):
+        lines = ['{:40s} {:>9s} {:>9s} {:>7s}'.format('module', 'self ms', 'total ms',
+                                                      'modules')]
+        for name, seconds_self, seconds, num_new, depth in self.summary(num):
+            lines.append('{:40s} {:9.1f} {:9.1f} {:7d}'.format(name[:40], seconds_self*1.e3,
+                                                               seconds*1.e3, num_new))
+
+        lines.append('Total import time: {:.1f} ms'.format(self.total()*1.e3))
+
+        return '\n'.join(lines)
+
+    def reset(self):
+        with self.lock:
+            del self.records[:]
+
+
+# Process-wide instance.
+import_profiler = Import_Profiler()
+
+#################################################
+
+
+if __name__ == '__main__':
+    """
+    Development and examples.
+    """
+    import_profiler.start()
+    np = lazy_import('numpy')
+    print(np)
+    print(np.arange(3))
+    print(np)
+    import_profiler.stop()
+
+    print(import_profiler.report())
@@ -2,21 +2,18 @@
 from __future__ import division, print_function, unicode_literals
 
 import os
-
-import simplejson as json
-
-import who8mygoogle.fusion_tables as fusion_tables
-
-import apiclient.errors
-import apiclient.http
+import time
+import hashlib
+import threading
 
 import data_io
 import errors
+import lazy
+import session
 
-import argparse
-# import oauth2client.client
-# import oauth2client.file
-import oauth2client.tools
+# Loaded on first use.  A cached config is read without touching the API client.
+json = lazy.lazy_import('simplejson')
+apiclient = lazy.lazy_import('apiclient.errors', top=True)
 
 #################################################
 
@@ -25,10 +22,11 @@ def path_to_module():
     p = os.path.dirname(os.path.abspath(__file__))
     return p
 
-#################################################
 
-_FNAME_CLIENT_SECRETS = 'client_secrets.json'
-_FOLDER_CREDENTIALS = 'credentials'
+_FOLDER_CACHE = 'cache'
+_FNAME_CACHE = 'master_table.json'
+
+#################################################
 
 
 def build_config():
@@ -37,31 +35,28 @@ def build_config():
     """
     fname = 'config_data.yml'
 
-    # parser is here to play nice with Google's stuff using the flags variable.
-    parser = argparse.ArgumentParser(description="authorize",
-                                     formatter_class=argparse.RawDescriptionHelpFormatter,
-                                     parents=[oauth2client.tools.argparser])
-    flags = parser.parse_args()
-
     info, meta = data_io.read(fname)
 
+    # Command line flags for Google's stuff are parsed once by the shared session.
+    flags = session.configure(info).flags
+
     return info, flags
 
 
-def get(info_config, flags=None):
-    """
-    Retrieve current data from master config table.
+def fetch_row(info_config):
     """
+    Query the master config table for the row of config data.
 
-    api_name = 'fusiontables'
+    Returns
+    -------
+    names : column names.
 
-    path_credentials = os.path.join(path_to_module(), _FOLDER_CREDENTIALS)
-    if not os.path.isdir(path_credentials):
-        os.makedirs(path_credentials)
+    row : list of values.
 
+    """
     # Fetch main service object.
-    f = os.path.join(path_credentials, _FNAME_CLIENT_SECRETS)
-    service = fusion_tables.authorize.get_api_service(f, api_name, flags)
+    s = session.get_session()
+    service = s.service
 
     # Get a query object.
     query_service = service.query()
@@ -71,7 +66,7 @@ def get(info_config, flags=None):
     request = query_service.sql(sql=my_query)
 
     try:
-        sql_results = request.execute()
+        sql_results = s.execute(request)
     except apiclient.errors.HttpError as e:
         content = json.loads(e.content)
         domain = content['error']['errors'][0]['domain']
@@ -79,27 +74,256 @@ def get(info_config, flags=None):
 
         raise errors.Who8MyRPiError(domain + ': ' + message)
 
-    # Extract most recent row.
     names = sql_results['columns']
     row = sql_results['rows'][0]
 
+    return names, row
+
+
+def parse_row(names, row):
+    """
+    Config data dict from a master table row.  Column names are lower case, words joined by
+    underscores.
+    """
     info_data = {}
     for k, v in zip(names, row):
         k = k.lower()
         k = '_'.join(k.split())
         info_data[k] = v
 
-    # Done.
     return info_data
 
 
+def fingerprint_row(names, row):
+    """
+    Hash of the content of a master table row.
+    """
+    text = json.dumps([names, row])
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def get(info_config, flags=None):
+    """
+    Retrieve current data from master config table.
+
+    Authorization is handled by the shared session.  Keyword flags is accepted for
+    backwards compatibility and is ignored.
+    """
+    names, row = fetch_row(info_config)
+
+    # Done.
+    return parse_row(names, row)
+
+
+def fingerprint(info_config):
+    """
+    Check for changes to the master config table.  Hash of the same row get reads, so any edit
+    to the config data changes it, not only added rows.
+    """
+    names, row = fetch_row(info_config)
+
+    return fingerprint_row(names, row)
+
+#################################################
+
+
+class Config_Cache(object):
+    def __init__(self, info_config, fname=None, time_ttl=60*60, time_refresh=None, verbose=False):
+        """
+        Master table config data persisted on local disk.
+
+        Cached data is returned without touching the network.  Stale data is refreshed in the
+        background, and the cached config is only replaced when the content of the config row
+        has changed.  If the service can't be reached the last known good config is used.
+
+        Parameters
+        ----------
+        info_config : local config data, must contain master_table_id.
+
+        fname : cache file name.  Default is cache/master_table.json next to this module.
+
+        time_ttl : seconds before cached data is considered stale.
+
+        time_refresh : seconds between background refreshes.  Default is time_ttl.
+
+        """
+        if not fname:
+            fname = os.path.join(path_to_module(), _FOLDER_CACHE, _FNAME_CACHE)
+
+        if not time_refresh:
+            time_refresh = time_ttl
+
+        self.info_config = info_config
+        self.fname = fname
+        self.time_ttl = time_ttl
+        self.time_refresh = time_refresh
+        self.verbose = verbose
+
+        self.lock = threading.Lock()
+        self.entry = self.load()
+
+        self._thread = None
+        self._event_stop = threading.Event()
+
+    def load(self):
+        """
+        Read cache entry from disk.  Return None if missing or unreadable.
+        """
+        try:
+            with open(self.fname, 'r') as fi:
+                entry = json.load(fi)
+        except (IOError, ValueError):
+            return None
+
+        # Cache belongs to a different master table?
+        if entry.get('master_table_id') != self.info_config['master_table_id']:
+            return None
+
+        return entry
+
+    def save(self, entry):
+        """
+        Write cache entry to disk.  Replace the old file atomically.
+        """
+        path = os.path.dirname(self.fname)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        fname_temp = self.fname + '.tmp'
+        with open(fname_temp, 'w') as fo:
+            json.dump(entry, fo, indent=2)
+
+        os.rename(fname_temp, self.fname)
+
+    @property
+    def age(self):
+        """
+        Seconds since cached data was last confirmed against the master table.
+        """
+        if not self.entry:
+            return None
+
+        return time.time() - self.entry['time_checked']
+
+    @property
+    def is_stale(self):
+        return not self.entry or self.age > self.time_ttl
+
+    def refresh(self):
+        """
+        Check the master table for changes, replace the cached config only if it changed.
+
+        Returns
+        -------
+        True if the config data changed.
+
+        """
+        # One query serves both the change check and the config data.
+        names, row = fetch_row(self.info_config)
+        value = fingerprint_row(names, row)
+
+        with self.lock:
+            entry = self.entry
+
+        if entry and entry['fingerprint'] == value:
+            changed = False
+            entry = dict(entry)
+        else:
+            changed = True
+            entry = {'master_table_id': self.info_config['master_table_id'],
+                     'fingerprint': value,
+                     'data': parse_row(names, row)}
+
+        entry['time_checked'] = time.time()
+        self.save(entry)
+
+        with self.lock:
+            self.entry = entry
+
+        if self.verbose:
+            print('Master table config: {:s}'.format('changed' if changed else 'unchanged'))
+
+        return changed
+
+    def get(self):
+        """
+        Return master table config data.
+
+        Only blocks on the network when nothing has been cached yet.  Stale data is returned
+        immediately while a background refresh is started.
+        """
+        if not self.entry:
+            self.refresh()
+        elif self.is_stale:
+            self.start()
+
+        with self.lock:
+            return dict(self.entry['data'])
+
+    def start(self):
+        """
+        Start the background refresh thread.
+        """
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._event_stop.clear()
+        self._thread = threading.Thread(target=self.run, name='master_table_refresh')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background refresh thread.
+        """
+        self._event_stop.set()
+
+    def run(self):
+        """
+        Keep the cache fresh.  Failures leave the last known good config in place.
+        """
+        time_wait = 0
+        while not self._event_stop.wait(time_wait):
+            try:
+                self.refresh()
+            except Exception as e:
+                print('Master table refresh failed, using cached config: {:s}'.format(str(e)))
+
+            time_wait = self.time_refresh
+
+#################################################
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(info_config):
+    """
+    Return the process-wide cache for the master table named in info_config.
+    """
+    key = info_config['master_table_id']
+
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = Config_Cache(info_config)
+
+    return _caches[key]
+
+
+def get_cached(info_config):
+    """
+    Retrieve master table config data through the local cache.
+    """
+    return get_cache(info_config).get()
+
+
 def get_current_table_id():
     """
     Get from master table the ID for current working table.
     """
 
     info, flags = build_config()
-    val = get(info, flags)
+    val = get_cached(info)
 
     table_id = val['data_table_id']
 
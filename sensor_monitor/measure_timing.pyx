@@ -10,6 +10,8 @@ np.import_array()
 
 import time
 
+from posix.time cimport clock_gettime, timespec, CLOCK_MONOTONIC
+
 ############################
 
 cdef extern from 'wiringPi/wiringPi.h':
@@ -102,12 +104,162 @@ def timing(int pin=21, int time_poll=10):
     # Done.
     return time_sample
 
+##########################################
+# Measurement kernels for the benchmark suite.  Each returns a Numpy array of raw per-event
+# durations in nanoseconds so that the caller can compute whatever statistics it likes.
+
+
+cdef inline long long now_ns() nogil:
+    """Monotonic clock, nanoseconds.
+    """
+    cdef timespec ts
+    clock_gettime(CLOCK_MONOTONIC, &ts)
+    return <long long>ts.tv_sec * 1000000000 + ts.tv_nsec
+
+
+def _setup():
+    val = wiringPiSetupGpio()
+    if val < 0:
+        raise Exception('Problem seting up WiringPI.')
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def timer_overhead(int num_samples=10000):
+    """
+    Duration of back-to-back clock reads, nanoseconds.  Subtract from the other measurements.
+    """
+    data = np.zeros(num_samples, dtype=np.int64)
+    cdef long long [:] data_view = data
+
+    cdef int k
+    cdef long long t0
+
+    with nogil:
+        for k in range(num_samples):
+            t0 = now_ns()
+            data_view[k] = now_ns() - t0
+
+    return data
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def read_latency(int pin, int num_samples=10000):
+    """
+    Duration of individual digitalRead calls on specified pin, nanoseconds.
+    """
+    _setup()
+
+    pinMode(pin, INPUT)
+    pullUpDnControl(pin, PUD_DOWN)
+
+    data = np.zeros(num_samples, dtype=np.int64)
+    cdef long long [:] data_view = data
+
+    cdef int k
+    cdef int value = 0
+    cdef long long t0
+
+    with nogil:
+        for k in range(num_samples):
+            t0 = now_ns()
+            value = digitalRead(pin)
+            data_view[k] = now_ns() - t0
+
+    return data
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def write_latency(int pin, int num_samples=10000):
+    """
+    Duration of individual digitalWrite calls on specified pin, nanoseconds.  Pin is toggled.
+    """
+    _setup()
+
+    pinMode(pin, OUTPUT)
+
+    data = np.zeros(num_samples, dtype=np.int64)
+    cdef long long [:] data_view = data
+
+    cdef int k
+    cdef long long t0
+
+    with nogil:
+        for k in range(num_samples):
+            t0 = now_ns()
+            digitalWrite(pin, k & 1)
+            data_view[k] = now_ns() - t0
+
+        digitalWrite(pin, LOW)
+
+    return data
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def delay_accuracy(unsigned int delay, int num_samples=1000):
+    """
+    Actual duration of delayMicroseconds(delay), nanoseconds.
+    """
+    _setup()
+
+    data = np.zeros(num_samples, dtype=np.int64)
+    cdef long long [:] data_view = data
+
+    cdef int k
+    cdef long long t0
+
+    with nogil:
+        for k in range(num_samples):
+            t0 = now_ns()
+            delayMicroseconds(delay)
+            data_view[k] = now_ns() - t0
+
+    return data
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def loop_jitter(unsigned int period, int num_samples=1000):
+    """
+    Actual duration of each iteration of a loop paced at period microseconds, nanoseconds.
+
+    The loop spins on the clock against an absolute schedule, so late iterations show up as
+    jitter instead of accumulating drift.
+    """
+    data = np.zeros(num_samples, dtype=np.int64)
+    cdef long long [:] data_view = data
+
+    cdef int k
+    cdef long long period_ns = <long long>period * 1000
+    cdef long long t_next
+    cdef long long t_prior
+    cdef long long t_now
+
+    with nogil:
+        t_prior = now_ns()
+        t_next = t_prior + period_ns
+        for k in range(num_samples):
+            t_now = now_ns()
+            while t_now < t_next:
+                t_now = now_ns()
+
+            data_view[k] = t_now - t_prior
+            t_prior = t_now
+            t_next += period_ns
+
+    return data
+
 
 
 def timing_example(int time_run, unsigned int delay):
     """
     time_run in seconds.
 
+    Return number of loop cycles and average sample time in microseconds.
+
     cython array view: http://docs.cython.org/src/userguide/memoryviews.html
     """
 
@@ -166,11 +318,8 @@ def timing_example(int time_run, unsigned int delay):
     dt = float(time_elapsed) / float(num_cycles) *1.e3
     # dt_py = time_elapsed_py / float(num_cycles) * 1.e6
 
-    print('sample time:      %f microseconds' % dt)
-    # print('sample time (py): %f microseconds' % dt_py)
-
     # Done
-    return num_cycles
+    return num_cycles, dt
 
 
 
@@ -0,0 +1,404 @@
+
+from __future__ import division, print_function, unicode_literals
+
+"""
+Sensor read-quality telemetry.
+
+Every read attempt on every channel is counted: good reads, failures by reason, and read
+duration.  Alongside that the registry reports good-read rate, sample age, queue depths, and
+channel health when a Health_Monitor is attached.
+
+Metrics are exposed in Prometheus text format over a small local HTTP server, and can be
+printed as a periodic summary:
+
+    m = get_metrics()
+    channel.add_observer(m.observe_read)
+    serve(m, port=9108, background=True)
+    Summary_Logger(m, time_interval=600).start()
+"""
+
+import re
+import time
+import threading
+import collections
+import BaseHTTPServer
+import SocketServer
+
+_PREFIX = 'who8myrpi'
+
+# Failure reason keys.
+REASONS = ['checksum', 'length', 'first_bit', 'timeout_1', 'timeout_2', 'timeout_3', 'other']
+
+# Upper bucket bounds for DHT22 read duration, seconds.  A read holds the line low for 10 ms
+# as the start signal, then receives for about 5 ms.
+_BOUNDS_READ = [0.02, 0.025, 0.03, 0.04, 0.05, 0.075, 0.1, 0.2, 0.5]
+
+#################################################
+
+
+def failure_reason(msg):
+    """
+    Reduce a read_dht22_single failure message to a short reason key.  Keys pass through
+    unchanged.
+    """
+    msg = str(msg)
+    if msg in REASONS:
+        return msg
+
+    m = re.search(r'bit: (-?\d+)', msg)
+    if m:
+        return 'timeout_{:s}'.format(m.group(1).lstrip('-'))
+
+    if 'checksum' in msg:
+        return 'checksum'
+
+    if 'len(bits)' in msg:
+        return 'length'
+
+    if 'first' in msg:
+        return 'first_bit'
+
+    return 'other'
+
+
+class Histogram(object):
+    def __init__(self, bounds):
+        """
+        Cumulative histogram with fixed upper bucket bounds, as used by Prometheus.
+        """
+        self.bounds = list(bounds)
+        self.counts = [0]*(len(self.bounds) + 1)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value):
+        k = 0
+        while k < len(self.bounds) and value > self.bounds[k]:
+            k += 1
+
+        self.counts[k] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Return list of (upper bound, cumulative count), last bound is '+Inf'.
+        """
+        result = []
+        total = 0
+        for bound, c in zip(self.bounds + ['+Inf'], self.counts):
+            total += c
+            result.append((bound, total))
+
+        return result
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding quantile q.  None if empty.
+        """
+        if not self.count:
+            return None
+
+        target = q*self.count
+        for bound, total in self.cumulative():
+            if total >= target:
+                return bound
+
+#################################################
+
+
+class Pin_Metrics(object):
+    def __init__(self, pin, num_window=20):
+        """
+        Read statistics for one sensor pin.
+        """
+        self.pin = pin
+        self.count_good = 0
+        self.failures = collections.Counter()
+        self.duration = Histogram(_BOUNDS_READ)
+        self.recent = collections.deque(maxlen=num_window)
+        self.time_last_good = None
+
+    @property
+    def count_bad(self):
+        return sum(self.failures.values())
+
+    @property
+    def rate_good(self):
+        if not self.recent:
+            return None
+
+        return sum(self.recent) / len(self.recent)
+
+
+class Metrics(object):
+    def __init__(self, monitor=None):
+        """
+        Registry of sensor read metrics.
+
+        monitor : optional health.Health_Monitor, adds channel state and time to first good
+                  read to the output.
+        """
+        self.monitor = monitor
+        self.lock = threading.Lock()
+        self.pins = collections.OrderedDict()
+        self.queues = collections.OrderedDict()
+        self.derived = collections.OrderedDict()
+        self.time_start = time.time()
+
+    def pin(self, pin):
+        with self.lock:
+            if pin not in self.pins:
+                self.pins[pin] = Pin_Metrics(pin)
+
+            return self.pins[pin]
+
+    def observe_read(self, pin, time_read, ok, msg=None, duration=None):
+        """
+        Record one read attempt.  Suitable as a channel observer.
+
+        duration : seconds spent in the read call, if known.
+        """
+        m = self.pin(pin)
+
+        with self.lock:
+            m.recent.append(bool(ok))
+            if ok:
+                m.count_good += 1
+                m.time_last_good = time_read
+            else:
+                m.failures[failure_reason(msg)] += 1
+
+            if duration is not None:
+                m.duration.observe(duration)
+
+    def observe_derived(self, values):
+        """
+        Record latest derived quantities, dict of name -> dict of pin -> value.  Suitable as
+        observer for derived.stage.
+        """
+        with self.lock:
+            for name, by_pin in values.items():
+                self.derived.setdefault(name, {}).update(by_pin)
+
+    def watch_queue(self, name, queue):
+        """
+        Report depth of queue under the given name.
+        """
+        self.queues[name] = queue
+
+    def render(self, time_now=None):
+        """
+        Return all metrics in Prometheus text exposition format.
+        """
+        if time_now is None:
+            time_now = time.time()
+
+        lines = []
+
+        def family(name, kind, doc):
+            lines.append('# HELP {:s}_{:s} {:s}'.format(_PREFIX, name, doc))
+            lines.append('# TYPE {:s}_{:s} {:s}'.format(_PREFIX, name, kind))
+
+        def sample(name, labels, value):
+            text = ','.join('{:s}="{}"'.format(k, v) for k, v in labels)
+            lines.append('{:s}_{:s}{{{:s}}} {}'.format(_PREFIX, name, text, value))
+
+        with self.lock:
+            pins = list(self.pins.values())
+
+            family('reads_total', 'counter', 'Sensor read attempts by result.')
+            for m in pins:
+                sample('reads_total', [('pin', m.pin), ('result', 'good')], m.count_good)
+                sample('reads_total', [('pin', m.pin), ('result', 'bad')], m.count_bad)
+
+            family('read_failures_total', 'counter', 'Failed sensor reads by reason.')
+            for m in pins:
+                for reason, count in sorted(m.failures.items()):
+                    sample('read_failures_total', [('pin', m.pin), ('reason', reason)], count)
+
+            family('read_duration_seconds', 'histogram', 'Time spent in a sensor read.')
+            for m in pins:
+                for bound, total in m.duration.cumulative():
+                    sample('read_duration_seconds_bucket', [('pin', m.pin), ('le', bound)],
+                           total)
+                sample('read_duration_seconds_sum', [('pin', m.pin)], m.duration.sum)
+                sample('read_duration_seconds_count', [('pin', m.pin)], m.duration.count)
+
+            family('good_read_rate', 'gauge', 'Fraction of recent reads that were good.')
+            for m in pins:
+                if m.rate_good is not None:
+                    sample('good_read_rate', [('pin', m.pin)], m.rate_good)
+
+            family('sample_age_seconds', 'gauge', 'Seconds since last good read.')
+            for m in pins:
+                if m.time_last_good is not None:
+                    sample('sample_age_seconds', [('pin', m.pin)], time_now - m.time_last_good)
+
+            if self.derived:
+                family('derived', 'gauge', 'Latest derived quantity, see derived.py.')
+                for name, by_pin in self.derived.items():
+                    for pin, value in sorted(by_pin.items()):
+                        sample('derived', [('pin', pin), ('quantity', name)], value)
+
+        family('queue_depth', 'gauge', 'Items waiting in a queue.')
+        for name, queue in self.queues.items():
+            sample('queue_depth', [('queue', name)], queue.qsize())
+
+        if self.monitor:
+            family('channel_state', 'gauge', 'Channel health state, 1 for the current state.')
+            for pin, state in self.monitor.states(time_now).items():
+                sample('channel_state', [('pin', pin), ('state', state)], 1)
+
+            family('time_to_first_good_seconds', 'gauge',
+                   'Seconds from sensor power-on to first good read.')
+            for pin, value in self.monitor.time_to_first_good().items():
+                if value is not None:
+                    sample('time_to_first_good_seconds', [('pin', pin)], value)
+
+        family('uptime_seconds', 'gauge', 'Seconds since metrics started.')
+        lines.append('{:s}_uptime_seconds {}'.format(_PREFIX, time_now - self.time_start))
+
+        return '\n'.join(lines) + '\n'
+
+    def pretty_summary(self, time_now=None):
+        """
+        Return multi-line human readable summary, one line per pin.
+        """
+        if time_now is None:
+            time_now = time.time()
+
+        lines = []
+        with self.lock:
+            for m in self.pins.values():
+                line = 'pin: %2d  good: %5d  bad: %5d' % (m.pin, m.count_good, m.count_bad)
+
+                if m.rate_good is not None:
+                    line += '  rate: %.2f' % m.rate_good
+
+                p50 = m.duration.quantile(0.5)
+                if p50 is not None:
+                    line += '  p50: %s s' % p50
+
+                if m.time_last_good is not None:
+                    line += '  age: %.0f s' % (time_now - m.time_last_good)
+
+                if m.failures:
+                    line += '  ' + ' '.join('%s:%d' % (k, v)
+                                            for k, v in m.failures.most_common(3))
+
+                lines.append(line)
+
+        for name, queue in self.queues.items():
+            lines.append('queue %s: %d' % (name, queue.qsize()))
+
+        return '\n'.join(lines)
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """
+    Return the process-wide metrics registry, creating it on first call.
+    """
+    global _metrics
+
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+
+    return _metrics
+
+#################################################
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Serve metrics text at /metrics.
+    """
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ['/', '/metrics']:
+            self.send_error(404)
+            return
+
+        content = self.server.metrics.render().encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, metrics):
+        BaseHTTPServer.HTTPServer.__init__(self, address, Handler)
+        self.metrics = metrics
+
+
+def serve(metrics=None, port=9108, host='', background=True):
+    """
+    Run the metrics HTTP server.  Default is the process-wide registry in a daemon thread.
+    """
+    if not metrics:
+        metrics = get_metrics()
+
+    server = Server((host, port), metrics)
+
+    if background:
+        t = threading.Thread(target=server.serve_forever, name='metrics')
+        t.daemon = True
+        t.start()
+    else:
+        server.serve_forever()
+
+    return server
+
+
+class Summary_Logger(threading.Thread):
+    def __init__(self, metrics=None, time_interval=600., *args, **kwargs):
+        """
+        Print a metrics summary every time_interval seconds.
+        """
+        threading.Thread.__init__(self, *args, **kwargs)
+        self.daemon = True
+
+        if not metrics:
+            metrics = get_metrics()
+
+        self.metrics = metrics
+        self.time_interval = time_interval
+        self.event_stop = threading.Event()
+
+    def run(self):
+        while not self.event_stop.wait(self.time_interval):
+            print()
+            print(self.metrics.pretty_summary())
+
+    def stop(self):
+        """
+        Tell thread to stop running.
+        """
+        self.event_stop.set()
+
+#################################################
+
+
+if __name__ == '__main__':
+    """
+    Development and examples.
+    """
+    m = get_metrics()
+    m.observe_read(4, time.time(), True, duration=0.0051)
+    m.observe_read(4, time.time(), False, 'Fail checksum', duration=0.0049)
+
+    print(m.render())
+    print(m.pretty_summary())
@@ -0,0 +1,327 @@
+
+from __future__ import division, print_function, unicode_literals
+
+"""
+Streaming outlier rejection.
+
+Each new value is compared with the median of the values seen within a trailing time window.
+The spread is the median absolute deviation (MAD) over the same window.  A value further than
+threshold * 1.4826 * MAD from the median is an outlier.
+
+Window values are kept in an indexable skiplist, so adding a value, expiring an old one and
+looking up the median are all O(log n).  The MAD is found by selecting the k-th smallest
+deviation from two sorted runs (values below and above the median) in O(log^2 n), without
+copying the window.  Nothing is rebuilt per sample.
+"""
+
+import math
+import random
+import collections
+
+# Scale MAD to standard deviation for normally distributed data.
+_MAD_TO_SIGMA = 1.4826
+
+POLICIES = ['replace', 'flag', 'drop', 'pass']
+
+#################################################
+
+
+class _Node(object):
+    __slots__ = ('value', 'next', 'width')
+
+    def __init__(self, value, levels):
+        self.value = value
+        self.next = [None]*levels
+        self.width = [1]*levels
+
+
+class Indexable_Skiplist(object):
+    def __init__(self, size_expected=1000):
+        """
+        Sorted collection with O(log n) insert, remove and access by rank.
+        """
+        self.max_levels = int(1 + math.log(max(size_expected, 2), 2))
+        self.head = _Node(None, self.max_levels)
+        self.head.width = [1]*self.max_levels
+        self.size = 0
+
+        # Sentinel at the end, larger than anything.
+        self.tail = _Node(float('inf'), self.max_levels)
+        self.head.next = [self.tail]*self.max_levels
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.size
+
+        if not 0 <= index < self.size:
+            raise IndexError('Skiplist index out of range.')
+
+        node = self.head
+        index += 1
+        for level in reversed(range(self.max_levels)):
+            while node.width[level] <= index:
+                index -= node.width[level]
+                node = node.next[level]
+
+        return node.value
+
+    def insert(self, value):
+        # Find the last node before value on each level, and its rank.
+        chain = [None]*self.max_levels
+        steps = [0]*self.max_levels
+
+        node = self.head
+        for level in reversed(range(self.max_levels)):
+            while node.next[level].value <= value:
+                steps[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        # Random number of levels, geometric distribution.
+        levels = min(self.max_levels, 1 - int(math.log(random.random() or 0.5, 2.)))
+        node_new = _Node(value, levels)
+
+        steps_total = 0
+        for level in range(levels):
+            prev = chain[level]
+            node_new.next[level] = prev.next[level]
+            prev.next[level] = node_new
+            node_new.width[level] = prev.width[level] - steps_total
+            prev.width[level] = steps_total + 1
+            steps_total += steps[level]
+
+        for level in range(levels, self.max_levels):
+            chain[level].width[level] += 1
+
+        self.size += 1
+
+    def remove(self, value):
+        chain = [None]*self.max_levels
+
+        node = self.head
+        for level in reversed(range(self.max_levels)):
+            while node.next[level].value < value:
+                node = node.next[level]
+            chain[level] = node
+
+        if chain[0].next[0].value != value:
+            raise KeyError('Value not found in skiplist: {}'.format(value))
+
+        levels = len(chain[0].next[0].next)
+        for level in range(levels):
+            prev = chain[level]
+            prev.width[level] += prev.next[level].width[level] - 1
+            prev.next[level] = prev.next[level].next[level]
+
+        for level in range(levels, self.max_levels):
+            chain[level].width[level] -= 1
+
+        self.size -= 1
+
+    def __iter__(self):
+        node = self.head.next[0]
+        while node is not self.tail:
+            yield node.value
+            node = node.next[0]
+
+#################################################
+
+
+def kth_smallest_deviation(values, median, k):
+    """
+    Return k-th smallest (zero based) |x - median| over sorted random-access values, in
+    O(log^2 n) lookups.
+
+    Deviations below the median, read outward from the middle, form one ascending run and
+    deviations above form another.  Select the k-th element of their merge by binary search.
+    """
+    n = len(values)
+
+    # Split point: values[:split] < median <= values[split:].
+    lo, hi = 0, n
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if values[mid] < median:
+            lo = mid + 1
+        else:
+            hi = mid
+    split = lo
+
+    num_left = split
+    num_right = n - split
+
+    def left(i):
+        return median - values[split - 1 - i]
+
+    def right(i):
+        return values[split + i] - median
+
+    # Choose how many come from the left run, a in [max(0, k+1-num_right), min(k+1, num_left)].
+    a_lo = max(0, k + 1 - num_right)
+    a_hi = min(k + 1, num_left)
+    while a_lo < a_hi:
+        a = (a_lo + a_hi) // 2
+        b = k + 1 - a
+        # Too few from the left if the next left element is smaller than the last right one.
+        if a < num_left and b > 0 and left(a) < right(b - 1):
+            a_lo = a + 1
+        else:
+            a_hi = a
+
+    a = a_lo
+    b = k + 1 - a
+
+    candidates = []
+    if a > 0:
+        candidates.append(left(a - 1))
+    if b > 0:
+        candidates.append(right(b - 1))
+
+    return max(candidates)
+
+
+class Rolling_Stats(object):
+    def __init__(self, time_window=600.):
+        """
+        Median and MAD of values within a trailing time window.
+        """
+        self.time_window = time_window
+        self.history = collections.deque()
+        self.values = Indexable_Skiplist()
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, time_value, value):
+        """
+        Add a value and expire values older than time_value - time_window.
+        """
+        time_limit = time_value - self.time_window
+        while self.history and self.history[0][0] < time_limit:
+            t, v = self.history.popleft()
+            self.values.remove(v)
+
+        self.history.append((time_value, value))
+        self.values.insert(value)
+
+    def median(self):
+        n = len(self.values)
+        if n == 0:
+            return None
+
+        if n % 2:
+            return self.values[n // 2]
+
+        return (self.values[n // 2 - 1] + self.values[n // 2]) / 2.
+
+    def mad(self, median=None):
+        """
+        Median absolute deviation from the median.
+        """
+        n = len(self.values)
+        if n == 0:
+            return None
+
+        if median is None:
+            median = self.median()
+
+        if n % 2:
+            return kth_smallest_deviation(self.values, median, n // 2)
+
+        a = kth_smallest_deviation(self.values, median, n // 2 - 1)
+        b = kth_smallest_deviation(self.values, median, n // 2)
+
+        return (a + b) / 2.
+
+#################################################
+
+
+class Outlier_Filter(object):
+    def __init__(self, time_window=600., threshold=5., num_min=10, mad_min=0.1,
+                 policy='replace'):
+        """
+        Streaming outlier test for one variable.
+
+        Parameters
+        ----------
+        time_window : seconds of history used for median and MAD.
+
+        threshold : outlier when further than this many scaled MADs from the median.
+
+        num_min : pass values through untested until the window holds this many.
+
+        mad_min : lower limit on MAD, so flat data does not make every change an outlier.
+
+        policy : what check() returns for an outlier.
+                 'replace' : the window median.
+                 'flag', 'pass' : the original value.
+                 'drop' : None.
+
+        """
+        if policy not in POLICIES:
+            raise ValueError('Unknown outlier policy: {:s}'.format(policy))
+
+        self.threshold = threshold
+        self.num_min = num_min
+        self.mad_min = mad_min
+        self.policy = policy
+
+        self.stats = Rolling_Stats(time_window)
+        self.count = 0
+        self.count_outliers = 0
+
+    def check(self, time_value, value):
+        """
+        Test value against recent history, then add it to the history.
+
+        Returns
+        -------
+        value_out : value after applying the policy.
+        is_outlier : True if value was judged an outlier.
+
+        """
+        is_outlier = False
+        value_out = value
+
+        if value != value:
+            # NaN can't be ordered, never let it into the history.
+            self.count_outliers += 1
+            return (None if self.policy == 'drop' else
+                    self.stats.median() if self.policy == 'replace' else value), True
+
+        if len(self.stats) >= self.num_min:
+            median = self.stats.median()
+            mad = max(self.stats.mad(median), self.mad_min)
+
+            if abs(value - median) > self.threshold * _MAD_TO_SIGMA * mad:
+                is_outlier = True
+                self.count_outliers += 1
+
+                if self.policy == 'replace':
+                    value_out = median
+                elif self.policy == 'drop':
+                    value_out = None
+
+        # Outliers go into the history too, so a genuine step change is accepted once it
+        # persists for half the window.
+        self.stats.add(time_value, value)
+        self.count += 1
+
+        return value_out, is_outlier
+
+#################################################
+
+
+if __name__ == '__main__':
+    """
+    Development and examples.
+    """
+    f = Outlier_Filter(time_window=60., num_min=5)
+    for k in range(30):
+        v = 20. + 0.1*random.gauss(0, 1)
+        if k == 20:
+            v = 80.
+        print(k, f.check(k*5., v))
@@ -0,0 +1,285 @@
+
+from __future__ import division, print_function, unicode_literals
+
+"""
+Sensor power supervision.
+
+Sensors are wired in power groups, each switched by its own GPIO power pin.  A Power_Supervisor
+thread watches channel health and power cycles a group only when one of its sensors has
+degraded or died.  Only that group's channels are paused while its power is off; every other
+channel keeps recording.
+
+Power groups are configured as a string, one group per power pin:
+
+    power_groups: "22:4,17,18;27:23,24"
+
+meaning power pin 22 feeds sensors on data pins 4, 17 and 18, and power pin 27 feeds 23 and 24.
+Without power_groups a single group is built from pin_power and pins_data.
+"""
+
+import time
+import threading
+
+import dht22
+import health
+
+
+class Power_Group(object):
+    def __init__(self, pin_power, pins_data, write=None):
+        """
+        Sensors sharing one power pin.
+
+        Parameters
+        ----------
+        pin_power : GPIO pin switching power to the group.
+
+        pins_data : list of data pins of sensors in this group.
+
+        write : function(pin, value) setting the power pin.  Default is dht22._digitalWrite.
+
+        """
+        if write is None:
+            write = dht22._digitalWrite
+
+        self.pin_power = pin_power
+        self.pins_data = list(pins_data)
+        self.write = write
+
+        self.count_cycles = 0
+        self.time_cycle_last = None
+
+        # Sensors are powered on at startup.
+        self.is_on = True
+
+    def setup(self):
+        dht22._pinMode(self.pin_power, dht22._OUTPUT)
+
+    def on(self):
+        self.write(self.pin_power, True)
+        self.is_on = True
+
+    def off(self):
+        self.write(self.pin_power, False)
+        self.is_on = False
+
+    def __repr__(self):
+        return 'Power_Group(%d: %s)' % (self.pin_power, self.pins_data)
+
+
+def parse_groups(text):
+    """
+    Parse power group string "22:4,17,18;27:23,24".  Return list of (pin_power, pins_data).
+    """
+    groups = []
+    for part in text.split(';'):
+        part = part.strip()
+        if not part:
+            continue
+
+        pin_power, pins_data = part.split(':')
+        pins_data = [int(p) for p in pins_data.split(',') if p.strip()]
+
+        groups.append((int(pin_power), pins_data))
+
+    return groups
+
+
+def groups_from_config(info_config, write=None):
+    """
+    Build list of Power_Group from config data.  Recognized keys: power_groups, or pin_power
+    and pins_data.  Data pins not listed in any group are not power supervised.
+    """
+    text = info_config.get('power_groups')
+    if text:
+        specs = parse_groups(text)
+    elif info_config.get('pin_power'):
+        specs = [(int(info_config['pin_power']), info_config['pins_data'])]
+    else:
+        specs = []
+
+    return [Power_Group(pin_power, pins_data, write=write) for pin_power, pins_data in specs]
+
+#################################################
+
+
+class Power_Supervisor(threading.Thread):
+    def __init__(self, groups, channels, monitor, time_check=30., time_off=30.,
+                 time_cycle_min=15*60, time_cycle_max=4*60*60, *args, **kwargs):
+        """
+        Power cycle sensor groups when their health degrades.
+
+        Parameters
+        ----------
+        groups : list of Power_Group.
+
+        channels : list of channel runners, see sensors.Channel_Runner.
+
+        monitor : health.Health_Monitor watching the channels.
+
+        Hold self.lock while changing the channel list or the power groups, e.g. from
+        config_service.Config_Service, so that no channel is started or unpaused while its
+        group is powered off.
+
+        time_check : seconds between health checks.
+
+        time_off : seconds power stays off during a cycle.
+
+        time_cycle_min : minimum seconds between cycles of the same group.
+
+        time_cycle_max : the wait between cycles doubles each time a cycle fails to bring the
+                         group back to health, up to this many seconds.
+
+        """
+        threading.Thread.__init__(self, *args, **kwargs)
+        self.daemon = True
+
+        self.groups = groups
+        self.channels = channels
+        self.monitor = monitor
+
+        self.time_check = time_check
+        self.time_off = time_off
+        self.time_cycle_min = time_cycle_min
+        self.time_cycle_max = time_cycle_max
+
+        self.time_cycle_wait = dict((g.pin_power, time_cycle_min) for g in groups)
+        self.recovered = dict((g.pin_power, True) for g in groups)
+
+        self.lock = threading.RLock()
+        self.event_stop = threading.Event()
+
+    def channels_in(self, group):
+        with self.lock:
+            return [c for c in self.channels if c.pin in group.pins_data]
+
+    def is_powered(self, pin):
+        """
+        False if the pin's group is powered off, e.g. part way through a cycle.  Pins not in
+        any group are always powered.
+        """
+        with self.lock:
+            for group in self.groups:
+                if pin in group.pins_data:
+                    return group.is_on
+
+        return True
+
+    def needs_cycle(self, group, time_now=None):
+        """
+        True if a sensor in the group is degraded or dead and the group has not been cycled
+        too recently.
+        """
+        if time_now is None:
+            time_now = time.time()
+
+        states = self.monitor.states(time_now)
+        bad = [p for p in group.pins_data if states.get(p) in (health.DEGRADED, health.DEAD)]
+        if not bad:
+            if all(states.get(p) == health.HEALTHY for p in group.pins_data):
+                self.recovered[group.pin_power] = True
+            return False
+
+        if group.time_cycle_last is None:
+            return True
+
+        return time_now - group.time_cycle_last >= self.time_cycle_wait[group.pin_power]
+
+    def cycle(self, group):
+        """
+        Power cycle one group.  Other groups keep recording.
+        """
+        print('Power cycle: %s' % group)
+
+        with self.lock:
+            channels = self.channels_in(group)
+            for c in channels:
+                c.pause()
+
+            time.sleep(0.01)
+            group.off()
+
+        # Lock is released while power is off, channels may be started or stopped meanwhile.
+        self.event_stop.wait(self.time_off)
+
+        with self.lock:
+            group.on()
+            self.monitor.power_on(group.pins_data)
+
+            # Channels started paused while power was off, and those that moved to another
+            # group since.
+            for c in set(channels) | set(self.channels_in(group)):
+                c.unpause()
+
+        if self.recovered[group.pin_power]:
+            self.time_cycle_wait[group.pin_power] = self.time_cycle_min
+        else:
+            # Previous cycle didn't fix things, back off.
+            wait = self.time_cycle_wait[group.pin_power]
+            self.time_cycle_wait[group.pin_power] = min(2*wait, self.time_cycle_max)
+
+        self.recovered[group.pin_power] = False
+
+        group.time_cycle_last = time.time()
+        group.count_cycles += 1
+
+    def update_groups(self, groups):
+        """
+        Switch to a new list of power groups while running.  Groups with a known power pin
+        keep their state and take the new data pins.  New groups are powered on.  Groups no
+        longer listed are left as they are but no longer supervised.
+        """
+        with self.lock:
+            groups_old = dict((g.pin_power, g) for g in self.groups)
+
+            result = []
+            for g in groups:
+                if g.pin_power in groups_old:
+                    g_old = groups_old[g.pin_power]
+                    g_old.pins_data = list(g.pins_data)
+                    result.append(g_old)
+                else:
+                    g.setup()
+                    g.on()
+                    self.monitor.power_on(g.pins_data)
+
+                    self.time_cycle_wait[g.pin_power] = self.time_cycle_min
+                    self.recovered[g.pin_power] = True
+                    result.append(g)
+
+            # Rebind rather than modify in place, check() may be iterating the old list.
+            self.groups = result
+
+    def check(self):
+        """
+        Cycle each group that needs it.
+        """
+        for group in self.groups:
+            if self.event_stop.is_set():
+                break
+
+            if self.needs_cycle(group):
+                self.cycle(group)
+
+    def run(self):
+        """
+        This is where the work happens.
+        """
+        while not self.event_stop.wait(self.time_check):
+            self.check()
+
+    def stop(self):
+        """
+        Tell thread to stop running.
+        """
+        self.event_stop.set()
+
+#################################################
+
+
+if __name__ == '__main__':
+    """
+    Development and examples.
+    """
+    info = {'power_groups': '22:4,17,18;27:23,24'}
+    for g in groups_from_config(info, write=lambda pin, value: None):
+        print(g)
@@ -0,0 +1,287 @@
+
+from __future__ import division, print_function, unicode_literals
+
+"""
+Low-overhead profiling hooks.
+
+Spans time named pipeline stages.  Each stage is switched on or off on its own; a disabled
+span costs one set lookup.  Enabled spans feed a duration histogram per stage:
+
+    with span('upload'):
+        sink.send(samples)
+
+The sampling profiler records the call stack of every thread at a fixed CPU-time interval
+using SIGPROF.  Stacks are aggregated in collapsed form ("file:func;file:func count"), ready
+for flame graph tools.
+
+Both can be switched at runtime by signal once install_signal_handlers has been called:
+
+    kill -USR1 <pid>    toggle spans for all stages and the sampling profiler
+    kill -USR2 <pid>    dump results to files in the profile folder
+"""
+
+import os
+import sys
+import time
+import json
+import signal
+import threading
+import contextlib
+import collections
+
+import metrics
+
+
+def path_to_module():
+    p = os.path.dirname(os.path.abspath(__file__))
+    return p
+
+
+_FOLDER_PROFILE = 'profile'
+
+# Upper bucket bounds for stage durations, seconds.
+_BOUNDS_STAGE = [1.e-5, 1.e-4, 1.e-3, 0.01, 0.1, 1., 10., 100.]
+
+#################################################
+
+
+class Spans(object):
+    def __init__(self):
+        """
+        Duration histograms for named pipeline stages.
+        """
+        self.enabled = set()
+        self.all_enabled = False
+        self.lock = threading.Lock()
+        self.histograms = collections.OrderedDict()
+
+    def enable(self, *stages):
+        """
+        Switch on timing for the given stages, or for every stage if none given.
+        """
+        if stages:
+            self.enabled.update(stages)
+        else:
+            self.all_enabled = True
+
+    def disable(self, *stages):
+        """
+        Switch off timing for the given stages, or for every stage if none given.
+        """
+        if stages:
+            self.enabled.difference_update(stages)
+        else:
+            self.all_enabled = False
+            self.enabled.clear()
+
+    def is_enabled(self, stage):
+        return self.all_enabled or stage in self.enabled
+
+    def observe(self, stage, duration):
+        with self.lock:
+            if stage not in self.histograms:
+                self.histograms[stage] = metrics.Histogram(_BOUNDS_STAGE)
+
+            self.histograms[stage].observe(duration)
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        """
+        Time the body of the with statement as one occurrence of stage.
+        """
+        if not (self.all_enabled or stage in self.enabled):
+            yield
+            return
+
+        time_zero = time.time()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.time() - time_zero)
+
+    def summary(self):
+        """
+        Return dict of stage -> dict(count, total, mean, p50, p90, p99).
+        """
+        result = collections.OrderedDict()
+        with self.lock:
+            for stage, h in self.histograms.items():
+                info = {'count': h.count,
+                        'total': h.sum,
+                        'mean': h.sum / h.count if h.count else None,
+                        'p50': h.quantile(0.5),
+                        'p90': h.quantile(0.9),
+                        'p99': h.quantile(0.99)}
+                result[stage] = info
+
+        return result
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+
+#################################################
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return '%s:%s' % (os.path.basename(code.co_filename), code.co_name)
+
+
+class Sampling_Profiler(object):
+    def __init__(self, interval=0.005, max_depth=64):
+        """
+        Statistical profiler sampling stacks of all threads on SIGPROF.  Must be started from
+        the main thread.  Interrupted system calls are restarted where the kernel allows it, but
+        a time.sleep in the main thread may return early while sampling.
+
+        interval : seconds of process CPU time between samples.
+        """
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = collections.Counter()
+        self.count_samples = 0
+        self.running = False
+        self.handler_previous = None
+
+    def _handler(self, signum, frame):
+        names = dict((t.ident, t.name) for t in threading.enumerate())
+
+        for ident, f in sys._current_frames().items():
+            stack = []
+            while f is not None and len(stack) < self.max_depth:
+                stack.append(_frame_name(f))
+                f = f.f_back
+
+            stack.append(names.get(ident, str(ident)))
+            self.stacks[';'.join(reversed(stack))] += 1
+
+        self.count_samples += 1
+
+    def start(self):
+        if self.running:
+            return
+
+        self.handler_previous = signal.signal(signal.SIGPROF, self._handler)
+        signal.siginterrupt(signal.SIGPROF, False)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        self.running = True
+
+    def stop(self):
+        if not self.running:
+            return
+
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self.handler_previous or signal.SIG_DFL)
+        self.running = False
+
+    def toggle(self):
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def collapsed(self):
+        """
+        Return stacks in collapsed text format, one "frame;frame;frame count" line per stack.
+        """
+        lines = ['%s %d' % (stack, count) for stack, count in self.stacks.most_common()]
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        self.stacks.clear()
+        self.count_samples = 0
+
+#################################################
+# Process-wide instances.
+
+spans = Spans()
+profiler = Sampling_Profiler()
+
+span = spans.span
+
+
+def enable(*stages):
+    spans.enable(*stages)
+
+
+def disable(*stages):
+    spans.disable(*stages)
+
+
+def dump(path=None):
+    """
+    Write span summary (JSON) and sampled stacks (collapsed text) to files named with the
+    current time.  Return list of file names.
+    """
+    if not path:
+        path = os.path.join(path_to_module(), _FOLDER_PROFILE)
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    stamp = time.strftime('%Y%m%d_%H%M%S')
+
+    fname_spans = os.path.join(path, 'spans_%s.json' % stamp)
+    with open(fname_spans, 'w') as fo:
+        json.dump(spans.summary(), fo, indent=2)
+
+    fnames = [fname_spans]
+
+    if profiler.count_samples:
+        fname_stacks = os.path.join(path, 'stacks_%s.txt' % stamp)
+        with open(fname_stacks, 'w') as fo:
+            fo.write(profiler.collapsed())
+
+        fnames.append(fname_stacks)
+
+    return fnames
+
+
+def _toggle(signum, frame):
+    if profiler.running:
+        profiler.stop()
+        spans.disable()
+        print('Profiling off')
+    else:
+        spans.enable()
+        profiler.start()
+        print('Profiling on')
+
+
+def _dump(signum, frame):
+    for f in dump():
+        print('Profile written: %s' % f)
+
+
+def install_signal_handlers():
+    """
+    SIGUSR1 toggles profiling, SIGUSR2 dumps results.  Call from the main thread.
+    """
+    signal.signal(signal.SIGUSR1, _toggle)
+    signal.signal(signal.SIGUSR2, _dump)
+
+    signal.siginterrupt(signal.SIGUSR1, False)
+    signal.siginterrupt(signal.SIGUSR2, False)
+
+#################################################
+
+
+if __name__ == '__main__':
+    """
+    Development and examples.
+    """
+    enable()
+    profiler.start()
+
+    for k in range(20):
+        with span('work'):
+            sum(i*i for i in range(100000))
+
+        with span('sleep'):
+            time.sleep(0.01)
+
+    profiler.stop()
+
+    print(json.dumps(spans.summary(), indent=2))
+    print(profiler.collapsed()[:1000])
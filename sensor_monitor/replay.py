@@ -0,0 +1,395 @@
+
+from __future__ import division, print_function, unicode_literals
+
+"""
+Accelerated replay of archived sensor data through the full recording pipeline.
+
+Archived samples for many pins are fed through Channel_DHT22_Data_File channels, optional
+outlier filtering, the queue and data_collector, record_data and the bulk uploader with its disk
+spool, to a local Fusion Table stand-in.  Rows received by the stand-in are then written to a
+codec file, the same as data_store does for a day of data.
+
+Replay runs at a chosen multiple of real time, e.g. 1x, 100x, or as fast as the pipeline goes.
+Samples keep their original timestamps.  Channels share one time origin so pins stay in step,
+and no sample is dropped: channels wait for room in a full queue instead.
+
+The report gives end-to-end throughput, per-stage latency from the profiling spans, and
+resident memory at start, peak and end.
+
+Example:
+
+    python replay.py --start 2014-03-01 --end 2014-03-08 --speedup 0
+    python replay.py --file 4:sample_data.txt --speedup 100 --outliers replace
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+
+import Queue
+
+import numpy as np
+
+import codec
+import metrics
+import profiling
+import sensors
+import session
+import standin
+import upload
+import utility
+import who8myrpi
+
+#################################################
+
+
+def rss_bytes():
+    """
+    Resident memory of this process, bytes.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as fi:
+            pages = int(fi.read().split()[1])
+        return pages * os.sysconf(str('SC_PAGE_SIZE'))
+    except (IOError, OSError, ValueError, IndexError):
+        # Peak rather than current, but the best available without /proc.
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Memory_Sampler(threading.Thread):
+    def __init__(self, time_interval=0.1, *args, **kwargs):
+        """
+        Track peak resident memory in the background.
+        """
+        threading.Thread.__init__(self, *args, **kwargs)
+        self.daemon = True
+
+        self.time_interval = time_interval
+        self.rss_start = rss_bytes()
+        self.rss_peak = self.rss_start
+        self.event_stop = threading.Event()
+
+    def stop(self):
+        """
+        Tell thread to stop running.
+        """
+        self.event_stop.set()
+
+    def run(self):
+        """
+        This is where the work happens.
+        """
+        while not self.event_stop.is_set():
+            self.rss_peak = max(self.rss_peak, rss_bytes())
+            self.event_stop.wait(self.time_interval)
+
+#################################################
+
+
+def load_text(fname):
+    """
+    Load a text data file as read by Channel_DHT22_Data_File: rows of seconds, RH, Tf.
+    """
+    return np.loadtxt(fname, delimiter=',', ndmin=2)
+
+
+def load_archive(seconds_start, seconds_end, pins=None):
+    """
+    Load stored samples from data_store.  Returns dict of pin -> array of rows
+    (seconds, RH, Tf), sorted by time.
+    """
+    import data_store
+
+    df = data_store.load_between(seconds_start, seconds_end)
+
+    seconds = df.index.asi8 / 1.e9
+    col_pin = df['Pin'].values.astype(int)
+
+    if pins is None:
+        pins = np.unique(col_pin)
+
+    data = {}
+    for pin in pins:
+        mask = col_pin == pin
+        rows = np.column_stack([seconds[mask],
+                                df['Humidity'].values[mask],
+                                df['Temperature'].values[mask]])
+        data[int(pin)] = rows[np.argsort(rows[:, 0], kind='mergesort')]
+
+    return data
+
+
+def table_to_columns(table):
+    """
+    Codec columns from the rows of a stand-in table.
+    """
+    names = table.names
+    rows = list(table.rows)
+
+    def column(name, dtype=np.float64):
+        k = names.index(name)
+        return np.asarray([r[k] for r in rows], dtype=dtype)
+
+    return {'seconds': column('Seconds'),
+            'pin': column('Pin').astype(np.int64),
+            'Tf': column('Temperature'),
+            'RH': column('Humidity')}
+
+#################################################
+
+
+class Replay(object):
+    def __init__(self, data, speedup=None, outliers=None, rows_bulk_min=100, use_gzip=False,
+                 latency=0., path=None, verbose=False):
+        """
+        Replay archived samples through record_data.
+
+        Parameters
+        ----------
+        data : dict of pin -> array of rows (seconds, RH, Tf).
+
+        speedup : multiple of real time, e.g. 1 or 100.  None or 0 for as fast as possible.
+
+        outliers : optional outlier policy ('replace', 'drop' or 'flag'), see
+                   sensors.Channel_Filter_Outlier.
+
+        rows_bulk_min, use_gzip : bulk uploader settings, as in the local config file.
+
+        latency : seconds the stand-in adds to every request.
+
+        path : folder for the spool and the stored result.  Default is a temporary folder,
+               removed afterwards.
+
+        """
+        self.data = data
+        self.speedup = speedup
+        self.outliers = outliers
+        self.rows_bulk_min = rows_bulk_min
+        self.use_gzip = use_gzip
+        self.latency = latency
+        self.path = path
+        self.verbose = verbose
+
+    def channels(self, queue):
+        """
+        Build and start one channel runner per pin.
+        """
+        time_zero = min(rows[0, 0] for rows in self.data.values() if len(rows))
+        registry = metrics.get_metrics()
+
+        runners = []
+        for pin, rows in sorted(self.data.items()):
+            if not len(rows):
+                continue
+
+            channel = sensors.Channel_DHT22_Data_File(pin=pin, data=rows, speedup=self.speedup,
+                                                      time_zero=time_zero, time_timeout=None)
+            if self.outliers:
+                channel = sensors.Channel_Filter_Outlier(channel, policy=self.outliers)
+
+            c = sensors.Channel_Runner(channel, queue=queue, observers=[registry.observe_read],
+                                       drop_oldest=False)
+            c.start()
+            runners.append(c)
+
+        return runners
+
+    def run(self):
+        """
+        Do the replay.  Return report dict.
+        """
+        path = self.path
+        if not path:
+            path = tempfile.mkdtemp(prefix='replay_')
+
+        path_spool = os.path.join(path, 'spool')
+        fname_store = os.path.join(path, 'replay.tsc')
+
+        # Upload target.
+        stand_in = standin.Stand_In(latency=self.latency)
+        server = standin.serve(port=0, stand_in=stand_in, background=True)
+        host, port = server.server_address[:2]
+        session.reset_session()
+        session.configure({'service_url': 'http://{:s}:{:d}'.format(host, port)})
+
+        service, tableId = upload.connect_table('replay')
+
+        if self.speedup:
+            time_collect = 60. / self.speedup
+        else:
+            time_collect = 0.1
+
+        info_config = {'upload_bulk': True,
+                       'rows_bulk_min': self.rows_bulk_min,
+                       'upload_gzip': self.use_gzip,
+                       'path_spool': path_spool}
+
+        num_rows = sum(len(rows) for rows in self.data.values())
+
+        profiling.spans.reset()
+        profiling.enable()
+
+        sampler = Memory_Sampler()
+        sampler.start()
+
+        time_zero = time.time()
+        try:
+            queue = Queue.Queue(maxsize=1000)
+            runners = self.channels(queue)
+
+            source = sensors.data_collector(queue, time_collect, channels=runners)
+            who8myrpi.record_data(runners, queue, service, tableId, info_config, source=source)
+
+            time_pipeline = time.time() - time_zero
+
+            table = stand_in.get_table(tableId)
+            with profiling.span('store'):
+                columns = table_to_columns(table)
+                if columns['seconds'].size:
+                    codec.write(fname_store, columns)
+
+            time_total = time.time() - time_zero
+
+        finally:
+            sampler.stop()
+            server.shutdown()
+            profiling.disable()
+
+        rss_end = rss_bytes()
+
+        spool = upload.Spool(path_spool)
+        seconds_data = [rows[:, 0] for rows in self.data.values() if len(rows)]
+        span_data = max(s.max() for s in seconds_data) - min(s.min() for s in seconds_data)
+
+        report = {'pins': sorted(self.data),
+                  'speedup': self.speedup,
+                  'rows_replayed': num_rows,
+                  'rows_received': int(columns['seconds'].size),
+                  'rows_spooled': spool.num_rows,
+                  'rows_dropped': sum(c.count_dropped for c in runners),
+                  'requests': stand_in.count_requests,
+                  'seconds_data': float(span_data),
+                  'seconds_pipeline': time_pipeline,
+                  'seconds_total': time_total,
+                  'rows_per_second': num_rows / time_total if time_total else None,
+                  'speedup_effective': span_data / time_pipeline if time_pipeline else None,
+                  'stages': profiling.spans.summary(),
+                  'rss_start': sampler.rss_start,
+                  'rss_peak': max(sampler.rss_peak, rss_end),
+                  'rss_end': rss_end}
+
+        if not self.path:
+            shutil.rmtree(path, ignore_errors=True)
+
+        return report
+
+
+def replay(data, **kwargs):
+    """
+    Replay samples through the recording pipeline.  Keyword arguments as for Replay.
+    """
+    return Replay(data, **kwargs).run()
+
+#################################################
+
+
+def pretty_report(report):
+    """
+    Format report as text.
+    """
+    mb = 1024.**2
+
+    lines = []
+    lines.append('pins:           {}'.format(report['pins']))
+    lines.append('rows replayed:  {:d}'.format(report['rows_replayed']))
+    lines.append('rows received:  {:d}'.format(report['rows_received']))
+    lines.append('rows spooled:   {:d}'.format(report['rows_spooled']))
+    lines.append('requests:       {:d}'.format(report['requests']))
+    lines.append('data span:      {:.1f} h'.format(report['seconds_data'] / 3600.))
+    lines.append('wall time:      {:.2f} s'.format(report['seconds_total']))
+    if report['rows_per_second']:
+        lines.append('throughput:     {:.0f} rows/s'.format(report['rows_per_second']))
+    if report['speedup_effective']:
+        lines.append('speedup:        {:.0f}x'.format(report['speedup_effective']))
+    lines.append('memory:         {:.1f} MB start, {:.1f} MB peak, {:+.1f} MB growth'.format(
+        report['rss_start'] / mb, report['rss_peak'] / mb,
+        (report['rss_peak'] - report['rss_start']) / mb))
+
+    lines.append('')
+    lines.append('{:10s} {:>8s} {:>10s} {:>10s} {:>10s} {:>10s}'.format(
+        'stage', 'count', 'mean ms', 'p50 ms', 'p90 ms', 'p99 ms'))
+
+    def ms(value):
+        return '{:10.3f}'.format(value * 1.e3) if value is not None else '{:>10s}'.format('-')
+
+    for stage, info in report['stages'].items():
+        lines.append('{:10s} {:8d} {:s} {:s} {:s} {:s}'.format(
+            stage, info['count'], ms(info['mean']), ms(info['p50']), ms(info['p90']),
+            ms(info['p99'])))
+
+    return '\n'.join(lines)
+
+
+def parse_date(text):
+    year, month, day = [int(v) for v in text.split('-')]
+    return utility.timestamp_seconds(year, month, day)
+
+
+def main():
+    """
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description='Replay archived data through the recording '
+                                                 'pipeline.')
+    parser.add_argument('--start', default=None, help='First day from data store, YYYY-MM-DD.')
+    parser.add_argument('--end', default=None, help='Day after the last, YYYY-MM-DD.')
+    parser.add_argument('--pins', default=None, type=int, nargs='*',
+                        help='Pins from data store, all if not given.')
+    parser.add_argument('--file', default=[], action='append', metavar='PIN:FNAME',
+                        help='Replay a text data file as the given pin.  May be repeated.')
+    parser.add_argument('--speedup', default=0., type=float,
+                        help='Multiple of real time, 0 for as fast as possible.')
+    parser.add_argument('--outliers', default=None, choices=['replace', 'drop', 'flag'],
+                        help='Filter outliers with this policy.')
+    parser.add_argument('--rows_bulk_min', default=100, type=int,
+                        help='Bulk upload batch size.')
+    parser.add_argument('--gzip', default=False, action='store_true',
+                        help='Compress uploads.')
+    parser.add_argument('--latency', default=0., type=float,
+                        help='Seconds added to every stand-in request.')
+    parser.add_argument('--path', default=None,
+                        help='Keep spool and stored result in this folder.')
+
+    args = parser.parse_args()
+
+    data = {}
+    if args.start:
+        seconds_start = parse_date(args.start)
+        if args.end:
+            seconds_end = parse_date(args.end)
+        else:
+            seconds_end = seconds_start + 24*60*60
+
+        data.update(load_archive(seconds_start, seconds_end, args.pins))
+
+    for text in args.file:
+        pin, fname = text.split(':', 1)
+        data[int(pin)] = load_text(fname)
+
+    if not data:
+        parser.error('Nothing to replay, give --start or --file.')
+
+    report = replay(data, speedup=args.speedup, outliers=args.outliers,
+                    rows_bulk_min=args.rows_bulk_min, use_gzip=args.gzip,
+                    latency=args.latency, path=args.path)
+
+    print()
+    print(pretty_report(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+
+from __future__ import division, print_function, unicode_literals
+
+"""
+Align irregular multi-pin samples onto a common regular time grid.
+
+Sensors are read every few seconds but reads fail unpredictably, so each pin has its own
+irregular timestamps.  resample() puts every pin on the same grid and returns a dense cube of
+shape (time, pin, variable), plus a gap mask of shape (time, pin) marking grid points not
+supported by observations within max_gap seconds.  Cross-sensor analysis then becomes plain array
+math, e.g. the spread between pins is cube.values.std(axis=1).
+
+Interpolation methods:
+  - 'hold' : last observation carried forward.
+  - 'linear' : straight line between the observations either side.
+  - 'kalman' : prediction from a local linear trend Kalman filter (level and slope), run over
+               each pin's observations with the actual time step between them.  Prediction to
+               grid points is one vectorized step from the latest filtered state.
+
+Grid lookups are vectorized with searchsorted; only the Kalman filter loops, once per
+observation.
+"""
+
+import numpy as np
+
+METHODS = ['hold', 'linear', 'kalman']
+
+# Kalman defaults: observation noise standard deviation per variable, and process noise
+# variance per second for level and slope.
+_NOISE_OBS = {'Humidity': 2.0, 'RH': 2.0, 'Temperature': 0.5, 'Tf': 0.5}
+_NOISE_LEVEL = 0.02**2 / 5.
+_NOISE_SLOPE = 1.e-4**2 / 5.
+
+#################################################
+
+
+class Cube(object):
+    def __init__(self, seconds, pins, variables, values, gap):
+        """
+        Samples on a regular grid.
+
+        seconds : grid times, shape (T,).
+
+        pins : pin numbers, shape (P,).
+
+        variables : variable names, length V.
+
+        values : data, shape (T, P, V).  NaN where no estimate is possible.
+
+        gap : True where the estimate is not supported by observations, shape (T, P).
+        """
+        self.seconds = seconds
+        self.pins = pins
+        self.variables = list(variables)
+        self.values = values
+        self.gap = gap
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def pin(self, pin):
+        """
+        Index of pin along the pin axis.
+        """
+        return int(np.flatnonzero(self.pins == pin)[0])
+
+    def variable(self, name):
+        """
+        Values of one variable, shape (T, P).
+        """
+        return self.values[:, :, self.variables.index(name)]
+
+    def masked(self):
+        """
+        Copy of values with gaps set to NaN.
+        """
+        values = self.values.copy()
+        values[self.gap] = np.nan
+        return values
+
+
+def grid(seconds_start, seconds_end, step=5.):
+    """
+    Regular grid times from seconds_start, aligned to a multiple of step, up to seconds_end.
+    """
+    first = np.ceil(seconds_start / step) * step
+    return np.arange(first, seconds_end + step*1.e-6, step)
+
+#################################################
+
+
+def kalman_filter(seconds, values, noise_obs=1., noise_level=_NOISE_LEVEL,
+                  noise_slope=_NOISE_SLOPE):
+    """
+    Local linear trend Kalman filter over irregularly spaced observations.
+
+    Returns filtered level and slope at each observation time.
+    """
+    num = seconds.size
+    level = np.empty(num)
+    slope = np.empty(num)
+
+    r = noise_obs**2
+
+    l = values[0]
+    s = 0.
+    p00, p01, p11 = r, 0., noise_obs**2 / 3600.
+    t_prev = seconds[0]
+
+    for k in range(num):
+        dt = seconds[k] - t_prev
+        t_prev = seconds[k]
+
+        # Predict.
+        l += s*dt
+        p00 += dt*(2.*p01 + dt*p11) + noise_level*dt
+        p01 += dt*p11
+        p11 += noise_slope*dt
+
+        # Update.
+        z = values[k]
+        if z == z:
+            S = p00 + r
+            k0 = p00 / S
+            k1 = p01 / S
+            y = z - l
+
+            l += k0*y
+            s += k1*y
+
+            p11 -= k1*p01
+            p01 -= k0*p01
+            p00 -= k0*p00
+
+        level[k] = l
+        slope[k] = s
+
+    return level, slope
+
+
+def _resample_pin(t_obs, v_obs, seconds, method, max_gap, noise_obs):
+    """
+    Resample one pin.  v_obs has shape (N, V).  Returns values (T, V) and gap (T,).
+    """
+    num_vars = v_obs.shape[1]
+    values = np.full((seconds.size, num_vars), np.nan)
+
+    if not t_obs.size:
+        return values, np.ones(seconds.size, dtype=bool)
+
+    # Latest observation at or before each grid point, and the next one after.
+    ix = np.searchsorted(t_obs, seconds, side='right') - 1
+    before = ix >= 0
+    ix_prev = np.clip(ix, 0, t_obs.size - 1)
+    ix_next = np.clip(ix + 1, 0, t_obs.size - 1)
+
+    age = np.where(before, seconds - t_obs[ix_prev], np.inf)
+    ahead = np.where(ix + 1 < t_obs.size, t_obs[ix_next] - seconds, np.inf)
+
+    if method == 'hold':
+        values[before] = v_obs[ix_prev[before]]
+        gap = age > max_gap
+
+    elif method == 'linear':
+        for j in range(num_vars):
+            values[:, j] = np.interp(seconds, t_obs, v_obs[:, j], left=np.nan, right=np.nan)
+        gap = (age > 0) & (age + ahead > max_gap)
+        gap |= np.isnan(values[:, 0])
+
+    elif method == 'kalman':
+        for j in range(num_vars):
+            level, slope = kalman_filter(t_obs, v_obs[:, j], noise_obs[j])
+            values[before, j] = level[ix_prev[before]] + slope[ix_prev[before]]*age[before]
+        gap = age > max_gap
+
+    else:
+        raise ValueError('Unknown resample method: {:s}'.format(method))
+
+    return values, gap
+
+
+def resample(seconds, pins, columns, step=5., seconds_start=None, seconds_end=None,
+             method='linear', max_gap=30., noise_obs=None):
+    """
+    Align samples from all pins onto one regular time grid.
+
+    Parameters
+    ----------
+    seconds : sample times, one per row.
+
+    pins : pin number, one per row.
+
+    columns : dict of variable name -> values, one per row.  Also accepts an ordered list of
+              (name, values) pairs to fix the variable order.
+
+    step : grid spacing, seconds.
+
+    seconds_start, seconds_end : grid range, default first and last sample.
+
+    method : 'hold', 'linear' or 'kalman'.
+
+    max_gap : seconds.  For 'hold' and 'kalman' a grid point is a gap when the latest
+              observation is older than this; for 'linear' when the observations either
+              side are further apart than this.
+
+    noise_obs : dict of variable name -> observation noise standard deviation, for 'kalman'.
+
+    Returns
+    -------
+    Cube
+
+    """
+    if method not in METHODS:
+        raise ValueError('Unknown resample method: {:s}'.format(method))
+
+    if isinstance(columns, dict):
+        columns = sorted(columns.items())
+
+    names = [name for name, values in columns]
+    data = np.column_stack([np.asarray(values, dtype=np.float64) for name, values in columns])
+
+    seconds_obs = np.asarray(seconds, dtype=np.float64)
+    pins = np.asarray(pins)
+
+    if seconds_start is None:
+        seconds_start = seconds_obs.min()
+    if seconds_end is None:
+        seconds_end = seconds_obs.max()
+
+    seconds_grid = grid(seconds_start, seconds_end, step)
+
+    noise = dict(_NOISE_OBS)
+    noise.update(noise_obs or {})
+    noise = [noise.get(n, 1.) for n in names]
+
+    pins_unique = np.unique(pins)
+
+    values = np.full((seconds_grid.size, pins_unique.size, len(names)), np.nan)
+    gap = np.ones((seconds_grid.size, pins_unique.size), dtype=bool)
+
+    for k, pin in enumerate(pins_unique):
+        mask = pins == pin
+        t_obs = seconds_obs[mask]
+        v_obs = data[mask]
+
+        order = np.argsort(t_obs, kind='mergesort')
+        t_obs = t_obs[order]
+        v_obs = v_obs[order]
+
+        # Drop repeated timestamps, keeping the last.
+        keep = np.append(np.diff(t_obs) > 0, True)
+        t_obs = t_obs[keep]
+        v_obs = v_obs[keep]
+
+        values[:, k], gap[:, k] = _resample_pin(t_obs, v_obs, seconds_grid, method, max_gap,
+                                                noise)
+
+    return Cube(seconds_grid, pins_unique, names, values, gap)
+
+
+def resample_frame(data_frame, variables=('Humidity', 'Temperature'), **kwargs):
+    """
+    Resample a DataFrame as returned by data_store.load.  Keyword arguments as for resample.
+    """
+    seconds = data_frame.index.asi8 / 1.e9
+    columns = [(n, data_frame[n].values) for n in variables]
+
+    return resample(seconds, data_frame['Pin'].values, columns, **kwargs)
+
+#################################################
+
+
+if __name__ == '__main__':
+    """
+    Development and examples.
+    """
+    np.random.seed(1)
+    num = 2000
+    seconds = np.cumsum(np.random.choice([5., 5., 10., 15.], num))
+    pins = np.random.choice([4, 17, 18], num)
+    RH = 50. + np.sin(seconds / 3000.)*5. + np.random.normal(0, 0.5, num)
+
+    for method in METHODS:
+        cube = resample(seconds, pins, {'RH': RH}, method=method)
+        print(method, cube.shape, cube.gap.mean())
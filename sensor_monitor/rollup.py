@@ -0,0 +1,292 @@
+
+from __future__ import division, print_function, unicode_literals
+
+"""
+Rollup tables of per-pin statistics, maintained as data is ingested.
+
+For every pin and every 1 minute, 15 minute, hourly and daily bucket a rollup row holds count,
+min, max, mean and variance of each variable.  Buckets combine with the parallel form of
+Welford's algorithm (Chan et al.): counts add, means are count weighted, and the sums of squared
+deviations add together with a correction for the spread of the group means.  Raw samples are
+combined into 1 minute rows and 1 minute rows into each coarser level, so every level gives the
+same result as working from raw samples.
+
+Each level is an HDF table with queryable Seconds and Pin columns.  Updates delete and rebuild
+only the buckets touched by newly ingested samples.  Queries read only the rows in the
+requested range, and stats() covers a range with as few rows as possible by taking whole days,
+then hours, and so on toward the range ends.
+"""
+
+import os
+
+import numpy as np
+
+import lazy
+
+# Loaded on first use.
+pd = lazy.lazy_import('pandas')
+
+# Rollup levels, finest first: (name, seconds per bucket).
+LEVELS = [('1min', 60),
+          ('15min', 15*60),
+          ('1h', 60*60),
+          ('1d', 24*60*60)]
+
+VARIABLES = ['Humidity', 'Temperature']
+
+_SUFFIXES = ['_min', '_max', '_mean', '_var']
+
+#################################################
+
+
+def _merge(bucket, pins, counts, mins, maxs, means, variances):
+    """
+    Group rows by (pin, bucket) and combine their statistics.
+
+    mins, maxs, means, variances : dicts of variable name -> values, one per row.
+    """
+    bucket = np.asarray(bucket).astype(np.int64)
+    pins = np.asarray(pins).astype(np.int64)
+    counts = np.asarray(counts).astype(np.int64)
+
+    order = np.lexsort((bucket, pins))
+    bucket = bucket[order]
+    pins = pins[order]
+    counts = counts[order]
+
+    change = np.ones(bucket.size, dtype=bool)
+    change[1:] = (bucket[1:] != bucket[:-1]) | (pins[1:] != pins[:-1])
+    starts = np.flatnonzero(change)
+
+    result = {'bucket': bucket[starts],
+              'Pin': pins[starts]}
+
+    if not starts.size:
+        result['Count'] = np.zeros(0, dtype=np.int64)
+        for name in means:
+            for suffix in _SUFFIXES:
+                result[name + suffix] = np.zeros(0)
+        return result
+
+    total = np.add.reduceat(counts, starts)
+    sizes = np.diff(np.append(starts, bucket.size))
+    result['Count'] = total
+
+    for name in means:
+        mean_k = np.asarray(means[name], dtype=np.float64)[order]
+        var_k = np.asarray(variances[name], dtype=np.float64)[order]
+
+        mean = np.add.reduceat(counts*mean_k, starts) / total
+
+        # Sum of squared deviations: within each row, plus row mean about group mean.
+        delta = mean_k - np.repeat(mean, sizes)
+        m2 = np.add.reduceat(counts*(var_k + delta*delta), starts)
+
+        result[name + '_min'] = np.minimum.reduceat(np.asarray(mins[name])[order], starts)
+        result[name + '_max'] = np.maximum.reduceat(np.asarray(maxs[name])[order], starts)
+        result[name + '_mean'] = mean
+        result[name + '_var'] = m2 / total
+
+    return result
+
+
+def _frame(result, resolution):
+    columns = ['Seconds', 'Pin', 'Count']
+    for name in sorted(set(k.rsplit('_', 1)[0] for k in result if k.endswith('_mean'))):
+        columns += [name + suffix for suffix in _SUFFIXES]
+
+    result = dict(result)
+    result['Seconds'] = (result.pop('bucket') * resolution).astype(np.float64)
+
+    return pd.DataFrame(result, columns=columns)
+
+
+def aggregate(seconds, pins, columns, resolution):
+    """
+    Roll up raw samples into buckets of resolution seconds, per pin.
+
+    columns : dict of variable name -> values, one per sample.
+
+    Returns DataFrame with Seconds (bucket start), Pin, Count and, per variable, <name>_min,
+    _max, _mean and _var.
+    """
+    bucket = np.floor(np.asarray(seconds) / resolution)
+    counts = np.ones(len(seconds), dtype=np.int64)
+    zeros = dict((n, np.zeros(len(seconds))) for n in columns)
+
+    result = _merge(bucket, pins, counts, columns, columns, columns, zeros)
+
+    return _frame(result, resolution)
+
+
+def _split(table):
+    names = [c[:-len('_mean')] for c in table.columns if c.endswith('_mean')]
+
+    mins = dict((n, table[n + '_min'].values) for n in names)
+    maxs = dict((n, table[n + '_max'].values) for n in names)
+    means = dict((n, table[n + '_mean'].values) for n in names)
+    variances = dict((n, table[n + '_var'].values) for n in names)
+
+    return mins, maxs, means, variances
+
+
+def coarsen(table, resolution):
+    """
+    Roll up a rollup table into larger buckets.
+    """
+    bucket = np.floor(table['Seconds'].values / resolution)
+    mins, maxs, means, variances = _split(table)
+
+    result = _merge(bucket, table['Pin'].values, table['Count'].values,
+                    mins, maxs, means, variances)
+
+    return _frame(result, resolution)
+
+
+def combine(table):
+    """
+    Combine all rows of a rollup table into one row per pin.
+    """
+    bucket = np.zeros(len(table))
+    mins, maxs, means, variances = _split(table)
+
+    result = _merge(bucket, table['Pin'].values, table['Count'].values,
+                    mins, maxs, means, variances)
+    del result['bucket']
+
+    return pd.DataFrame(result).set_index('Pin')
+
+#################################################
+
+
+def fname_level(path, name):
+    return os.path.join(path, 'rollup_{:s}.h5'.format(name))
+
+
+def _where(pins=None, seconds_start=None, seconds_end=None):
+    terms = []
+    if seconds_start is not None:
+        terms.append('Seconds >= {:f}'.format(seconds_start))
+    if seconds_end is not None:
+        terms.append('Seconds < {:f}'.format(seconds_end))
+    if pins is not None:
+        terms.append('Pin in {}'.format([int(p) for p in pins]))
+
+    if terms:
+        return ' & '.join(terms)
+
+
+def query(path, name, pins=None, seconds_start=None, seconds_end=None):
+    """
+    Rollup rows of one level for the given pins and seconds_start <= bucket < seconds_end.
+    Only matching rows are read from disk.  Returns None if the level has not been built.
+    """
+    f = fname_level(path, name)
+    if not os.path.isfile(f):
+        return None
+
+    table = pd.read_hdf(f, 'df', where=_where(pins, seconds_start, seconds_end))
+
+    return table.sort_values(['Pin', 'Seconds']).reset_index(drop=True)
+
+
+def update(path, seconds, pins, columns, seconds_start=None):
+    """
+    Fold newly ingested raw samples into the stored rollups.
+
+    Buckets at or after seconds_start (default: first new sample) are deleted and rebuilt, so a
+    partition that is ingested again is not counted twice.  Each coarser level is rebuilt for
+    the affected buckets from the level below.
+    """
+    if seconds_start is None:
+        seconds_start = np.min(seconds)
+
+    table = None
+    for name, resolution in LEVELS:
+        seconds_cut = np.floor(seconds_start / resolution) * resolution
+
+        if table is None:
+            table = aggregate(seconds, pins, columns, resolution)
+        else:
+            # Finer level rows for the affected buckets, including ones stored earlier.
+            name_fine = LEVELS[LEVELS.index((name, resolution)) - 1][0]
+            table = coarsen(query(path, name_fine, seconds_start=seconds_cut), resolution)
+
+        with pd.HDFStore(fname_level(path, name)) as store:
+            if 'df' in store:
+                store.remove('df', where='Seconds >= {:f}'.format(seconds_cut))
+            store.append('df', table[table['Seconds'] >= seconds_cut],
+                         data_columns=['Seconds', 'Pin'], index=False)
+
+
+def build(path, data_frame):
+    """
+    Build all rollups from an archive DataFrame as returned by data_store.load.
+    """
+    for name, resolution in LEVELS:
+        f = fname_level(path, name)
+        if os.path.isfile(f):
+            os.remove(f)
+
+    seconds = data_frame.index.asi8 / 1.e9
+    columns = dict((n, data_frame[n].values) for n in VARIABLES)
+
+    update(path, seconds, data_frame['Pin'].values, columns)
+
+
+def cover(seconds_start, seconds_end, levels=None):
+    """
+    Split a time range into (level name, start, end) pieces using the coarsest buckets that fit
+    inside it.  Range ends are rounded to the finest level.
+    """
+    if levels is None:
+        levels = LEVELS
+
+    name, resolution = levels[-1]
+
+    if len(levels) == 1:
+        a = np.floor(seconds_start / resolution) * resolution
+        b = np.ceil(seconds_end / resolution) * resolution
+        return [(name, a, b)] if a < b else []
+
+    a = np.ceil(seconds_start / resolution) * resolution
+    b = np.floor(seconds_end / resolution) * resolution
+
+    if a >= b:
+        return cover(seconds_start, seconds_end, levels[:-1])
+
+    pieces = [(name, a, b)]
+    if seconds_start < a:
+        pieces = cover(seconds_start, a, levels[:-1]) + pieces
+    if b < seconds_end:
+        pieces = pieces + cover(b, seconds_end, levels[:-1])
+
+    return pieces
+
+
+def stats(path, seconds_start, seconds_end, pins=None):
+    """
+    Count, min, max, mean and variance per pin between seconds_start and seconds_end, read from
+    the fewest rollup rows.  Returns DataFrame indexed by Pin.
+    """
+    tables = [query(path, name, pins, a, b) for name, a, b in cover(seconds_start, seconds_end)]
+    tables = [t for t in tables if t is not None and len(t)]
+
+    if not tables:
+        return None
+
+    return combine(pd.concat(tables, ignore_index=True))
+
+#################################################
+
+
+if __name__ == '__main__':
+    """
+    Development and examples.
+    """
+    seconds = np.sort(np.random.uniform(0, 2*86400, 10000))
+    pins = np.random.choice([4, 17], seconds.size)
+    columns = {'Humidity': np.random.normal(50, 5, seconds.size)}
+
+    print(aggregate(seconds, pins, columns, 3600).head())
+    print(cover(1000., 2*86400. - 1000.))
@@ -3,7 +3,7 @@ from __future__ import division, print_function, unicode_literals
 
 import os
 import time
-# import threading
+import threading
 import Queue
 import random
 import abc
@@ -13,6 +13,8 @@ import numpy as np
 # import pykalman.sqrt
 
 import dht22
+import profiling
+import outlier
 # import utility
 # import gen_multi
 
@@ -25,6 +27,8 @@ class Channel_Base(object):
         self._keep_running = False
         self._finished = False
         self.verbose = verbose
+        self.paused = False
+        self.observers = []
 
     def start(self):
         """Start the main event loop.  This function in turn calls subclass's run() method.
@@ -58,6 +62,19 @@ class Channel_Base(object):
         """
         pass
 
+    def add_observer(self, observer):
+        """Register function observer(pin, time_read, ok, msg, duration) to be called after
+        every read attempt, good or bad.
+        """
+        self.observers.append(observer)
+
+    def notify(self, time_read, ok, msg=None, duration=None):
+        """Tell observers about the outcome of a read attempt.  Duration is the time spent
+        reading, seconds.
+        """
+        for observer in self.observers:
+            observer(self.pin, time_read, ok, msg, duration)
+
     @property
     def is_running(self):
         return self._keep_running
@@ -80,7 +97,7 @@ class Channel_Base(object):
 
 class Channel_DHT22_Raw(Channel_Base):
 
-    def __init__(self, pin, time_wait=5.0, verbose=False):
+    def __init__(self, pin, time_wait=5.0, time_timeout=100, verbose=False):
         """Read data from specified DHT22 sensor on specified GPIO pin.
 
         Parameters
@@ -89,11 +106,15 @@ class Channel_DHT22_Raw(Channel_Base):
 
         time_wait : number of seconds between polling sensor for new data.
 
+        time_timeout : stop after this many seconds without a good reading.  None to keep
+                       trying forever, e.g. when a Health_Monitor is watching the channel.
+
         """
-        super(Channel_DHT22_Raw, self).__init__(verbose=vervose)
+        super(Channel_DHT22_Raw, self).__init__(verbose=verbose)
 
         self.pin = pin
         self.time_wait = time_wait
+        self.time_timeout = time_timeout
         self.delay = 1  # milliseconds
 
     def run(self):
@@ -104,22 +125,32 @@ class Channel_DHT22_Raw(Channel_Base):
         Yield sequence of tuples containing data (time_read, RH, Tf).
 
         """
-        time_timeout = 100  # seconds
         time_last_good = time.time()
 
         while self.is_running:
+            if self.paused:
+                # Sensor may be powered down.  Don't count failed reads against it.
+                self.sleep(self.time_wait)
+                time_last_good = time.time()
+                continue
+
             # Record some data.  Keyword delay specified in microseconds.
-            RH, Tf = dht22.read_dht22_single(self.pin, delay=self.delay)
+            time_zero = time.time()
+            with profiling.span('read'):
+                RH, Tf = dht22.read_dht22_single(self.pin, delay=self.delay)
             time_read = time.time()
+            duration = time_read - time_zero
 
             if RH:
                 # Reading is good.
                 time_last_good = time_read
+                self.notify(time_read, True, duration=duration)
                 yield time_read, RH, Tf
 
             else:
                 # Reading is not valid.
-                if time_read - time_last_good > time_timeout:
+                self.notify(time_read, False, Tf, duration=duration)
+                if self.time_timeout and time_read - time_last_good > self.time_timeout:
                     # Problem.  Stop looping.
                     self.stop()
 
@@ -131,7 +162,8 @@ class Channel_DHT22_Raw(Channel_Base):
 
 class Channel_DHT22_Data_File(Channel_Base):
 
-    def __init__(self, fname_data, time_wait=5.0, realtime=False, verbose=False):
+    def __init__(self, fname_data=None, time_wait=5.0, realtime=False, verbose=False, pin=0,
+                 data=None, speedup=None, time_zero=None, time_timeout=100):
         """Read raw DHT22 data from specified text file.
 
         Parameters
@@ -142,15 +174,34 @@ class Channel_DHT22_Data_File(Channel_Base):
 
         realtime : boolean, if True, then simulate reading data in realtime.  If False, then
                             yield data as fast as possible.
+
+        pin : pin number reported to observers and Channel_Runner.
+
+        data : array of rows (seconds, RH, Tf) used instead of reading fname_data.
+
+        speedup : pace replay at this many times real time, keeping the original timestamps.
+                  None or 0 for as fast as possible.  Ignored if realtime is True.
+
+        time_zero : data time at which paced replay starts, default first sample.  Give the
+                    same value to several channels to replay them in step.
+
+        time_timeout : stop after this many seconds of data without a good reading.  None to
+                       never stop.
+
         """
         super(Channel_DHT22_Data_File, self).__init__(verbose=verbose)
 
         self.fname = fname_data
         self.time_wait = time_wait
         self.realtime = realtime
+        self.pin = pin
+        self.speedup = speedup
+        self.time_zero = time_zero
+        self.time_timeout = time_timeout
 
-        self.data = None
-        self.load_data()
+        self.data = data
+        if data is None:
+            self.load_data()
 
     def load_data(self, fname=None):
         """Load data samples from file.  Data to be yielded to parent.
@@ -179,9 +230,11 @@ class Channel_DHT22_Data_File(Channel_Base):
         Yield sequence of tuples (time_read, RH, Tf).
 
         """
-        time_timeout = 100  # seconds
+        time_timeout = self.time_timeout
 
         time_data_zero = self.data[0][0]
+        if self.time_zero is not None:
+            time_data_zero = self.time_zero
         time_local_zero = time.time()
 
         if self.realtime:
@@ -199,14 +252,21 @@ class Channel_DHT22_Data_File(Channel_Base):
                 while time.time() - time_read < 0:
                     time.sleep(0.01)
 
+            elif self.speedup:
+                time_due = time_local_zero + (time_read - time_data_zero) / self.speedup
+                if time_due > time.time():
+                    self.sleep(time_due - time.time())
+
             if RH:
                 # Reading is good.
                 time_last_good = time_read
+                self.notify(time_read, True)
                 yield time_read, RH, Tf
 
             else:
                 # Reading is not valid.
-                if time_read - time_last_good > time_timeout:
+                self.notify(time_read, False)
+                if time_timeout and time_read - time_last_good > time_timeout:
                     # Problem.  Stop looping.
                     self.stop()
 
@@ -276,6 +336,209 @@ class Channel_Filter_Kalman(object):
 #################################################
 
 
+class Channel_Filter_Outlier(Channel_Base):
+
+    def __init__(self, channel, time_window=600., threshold=5., policy='replace', verbose=False):
+        """Reject outliers in RH and Tf from another channel, using a rolling median and MAD.
+
+        Parameters
+        ----------
+        channel : Channel instance, not yet started.
+
+        time_window : seconds of history used for median and MAD.
+
+        threshold : outlier when further than this many scaled MADs from the median.
+
+        policy : 'replace' outliers with the window median, 'drop' the sample, or 'flag' it.
+                 Flagged samples are passed on unchanged with kind 'outlier' instead of
+                 'sample'.
+
+        """
+        super(Channel_Filter_Outlier, self).__init__(verbose=verbose)
+
+        self.channel = channel
+        self.pin = channel.pin
+        self.policy = policy
+
+        policy_value = 'pass' if policy == 'flag' else policy
+        self.filter_RH = outlier.Outlier_Filter(time_window, threshold, policy=policy_value)
+        self.filter_Tf = outlier.Outlier_Filter(time_window, threshold, policy=policy_value)
+
+    def stop(self):
+        super(Channel_Filter_Outlier, self).stop()
+        self.channel.stop()
+
+    @property
+    def paused(self):
+        return self.channel.paused
+
+    @paused.setter
+    def paused(self, value):
+        # Channel_Base.__init__ sets this before self.channel exists.
+        if hasattr(self, 'channel'):
+            self.channel.paused = value
+
+    @property
+    def time_wait(self):
+        return self.channel.time_wait
+
+    @time_wait.setter
+    def time_wait(self, value):
+        self.channel.time_wait = value
+
+    def add_observer(self, observer):
+        self.channel.add_observer(observer)
+
+    @property
+    def count_outliers(self):
+        return self.filter_RH.count_outliers + self.filter_Tf.count_outliers
+
+    def run(self):
+        """Operate the generator main loop.
+
+        Returns
+        -------
+        Yield sequence of tuples (time_read, RH, Tf), or (time_read, RH, Tf, kind) with
+        policy 'flag'.
+
+        """
+        for time_read, RH, Tf in self.channel.start():
+            RH_out, RH_bad = self.filter_RH.check(time_read, RH)
+            Tf_out, Tf_bad = self.filter_Tf.check(time_read, Tf)
+
+            if self.verbose and (RH_bad or Tf_bad):
+                print('Outlier pin %d: RH %.1f -> %s, Tf %.1f -> %s' %
+                      (self.pin, RH, RH_out, Tf, Tf_out))
+
+            if self.policy == 'flag':
+                kind = 'outlier' if RH_bad or Tf_bad else 'sample'
+                yield time_read, RH_out, Tf_out, kind
+
+            elif RH_out is not None and Tf_out is not None:
+                yield time_read, RH_out, Tf_out
+
+            if not self.is_running:
+                return
+
+#################################################
+
+
+class Channel_Runner(threading.Thread):
+    def __init__(self, channel, queue, monitor=None, observers=None, drop_oldest=True, *args,
+                 **kwargs):
+        """Run a channel in a background thread.  Push each sample to a queue as an info dict
+        with keys kind, pin, RH, Tf and seconds.  Kind is 'sample' unless the channel yields
+        its own as a fourth item.
+
+        Parameters
+        ----------
+        channel : Channel instance, not yet started.
+
+        queue : Queue.Queue receiving data samples.  When full the oldest sample is dropped.
+
+        drop_oldest : if False, wait for room in a full queue instead of dropping samples,
+                      e.g. when replaying recorded data.
+
+        monitor : optional Health_Monitor told about every read attempt.
+
+        observers : optional list of further functions called after every read attempt, see
+                    Channel_Base.add_observer.
+
+        """
+        threading.Thread.__init__(self, *args, **kwargs)
+        self.daemon = True
+
+        self.channel = channel
+        self.pin = channel.pin
+        self.queue = queue
+        self.monitor = monitor
+        self.data_latest = None
+        self.count_dropped = 0
+        self.drop_oldest = drop_oldest
+
+        if monitor:
+            monitor.add(self.pin)
+            channel.add_observer(monitor.report)
+
+        if observers:
+            for observer in observers:
+                channel.add_observer(observer)
+
+    def run(self):
+        """
+        This is where the work happens.
+        """
+        for item in self.channel.start():
+            time_read, RH, Tf = item[:3]
+            kind = item[3] if len(item) > 3 else 'sample'
+
+            info = {'kind': kind,
+                    'pin': self.pin,
+                    'RH': float(np.round(RH, decimals=2)),
+                    'Tf': float(np.round(Tf, decimals=2)),
+                    'seconds': float(np.round(time_read, decimals=2))}
+
+            self.data_latest = info
+            with profiling.span('queue'):
+                self.put(info)
+
+        if self.channel.verbose:
+            print('Channel exit: %d' % self.pin)
+
+    def put(self, info):
+        if not self.drop_oldest:
+            while self.channel.is_running:
+                try:
+                    self.queue.put(info, timeout=0.5)
+                    return
+                except Queue.Full:
+                    pass
+            return
+
+        while True:
+            try:
+                self.queue.put(info, block=False)
+                return
+            except Queue.Full:
+                try:
+                    self.queue.get(block=False)
+                    self.count_dropped += 1
+                except Queue.Empty:
+                    pass
+
+    def stop(self):
+        """
+        Tell thread to stop running.
+        """
+        self.channel.stop()
+
+    def pause(self):
+        """
+        Stop reading the sensor until unpause is called.
+        """
+        self.channel.paused = True
+
+    def unpause(self):
+        self.channel.paused = False
+
+    @property
+    def is_paused(self):
+        return self.channel.paused
+
+    @property
+    def time_wait(self):
+        """
+        Seconds between sensor reads.  May be changed while running.
+        """
+        return self.channel.time_wait
+
+    @time_wait.setter
+    def time_wait(self, value):
+        self.channel.time_wait = value
+
+#################################################
+
+
 # _time_wait_default = 8.
 # _time_history_default = 10*60
 # class Channel(threading.Thread):
@@ -448,12 +711,19 @@ class Channel_Filter_Kalman(object):
     #     print(' freshness: %.1f seconds' % self.freshness)
     #     print()
 #################################################
-# def pause_channels(channels):
-#     for c in channels:
-#         c.record_data = False
-# def unpause_channels(channels):
-#     for c in channels:
-#         c.record_data = True
+
+
+def pause_channels(channels):
+    """
+    Stop reading sensors on these channels, e.g. while their power is off.
+    """
+    for c in channels:
+        c.pause()
+
+
+def unpause_channels(channels):
+    for c in channels:
+        c.unpause()
 
 
 def stop_channels(channels):
@@ -472,10 +742,25 @@ def stop_channels(channels):
     # Done.
 
 
-def start_channels(pins_data):
+def make_channel(pin, time_wait=5.0, outliers=None):
+    """
+    Build a sensor channel for one pin, not yet started.  Keeps trying until stopped.
+    outliers: optional outlier policy, see Channel_Filter_Outlier.
+    """
+    channel = Channel_DHT22_Raw(pin, time_wait=time_wait, time_timeout=None)
+    if outliers:
+        channel = Channel_Filter_Outlier(channel, policy=outliers)
+
+    return channel
+
+
+def start_channels(pins_data, monitor=None, time_wait=5.0, observers=None, outliers=None):
     """
     Turn on all recording channels.
-    Verify all are recording valid data.
+    Channels keep trying until stopped, reporting every read attempt to monitor and observers
+    if given.
+    outliers: optional outlier policy ('replace', 'drop' or 'flag') applied to each channel,
+              see Channel_Filter_Outlier.
     """
     # Build queue for collecting all data samples.
     queue = Queue.Queue(maxsize=1000)
@@ -483,7 +768,9 @@ def start_channels(pins_data):
     # Build and start the channel recorders.
     channels = []
     for p in pins_data:
-        c = Channel(p, queue=queue)
+        channel = make_channel(p, time_wait=time_wait, outliers=outliers)
+
+        c = Channel_Runner(channel, queue=queue, monitor=monitor, observers=observers)
         c.start()
         channels.append(c)
 
@@ -495,56 +782,53 @@ def start_channels(pins_data):
     return channels, queue
 
 
-def check_channels_ok(channels, time_wait_max=None, verbose=False):
+def check_channels_ok(channels, time_wait_max=None, num_min=1, verbose=False):
     """
-    Ensure all channels are recording ok.
-    time_wait_max: maximum number of seconds to wait for all sensors to be ready.
+    Wait until at least num_min channels are healthy.  Return True as soon as that happens,
+    False on timeout.  Remaining channels keep running and join in when their sensors come up.
+    time_wait_max: maximum number of seconds to wait.
     """
     if not time_wait_max:
         time_wait_max = 90  # seconds
 
-    count_ready = 0
-    time_elapsed = 0
-    time_zero = time.time()
-
-    num_channels = len(channels)
+    monitors = [c.monitor for c in channels if getattr(c, 'monitor', None)]
+    if monitors:
+        monitor = monitors[0]
+        pins_ok = monitor.wait_ready(time_wait_max, num_min=num_min)
 
-    # Main loop.
-    while not (time_elapsed > time_wait_max or count_ready == num_channels):
-        # Keep looping until all channels pass, or until timeout.
-        time.sleep(.2)
+        if verbose:
+            print('Channels ok: %d of %d  %s' % (len(pins_ok), len(channels), pins_ok))
+            print(monitor.pretty_status())
 
-        # Count number of channels with collected data.
-        count_ready_test = 0
-        pins_ready = []
-        for c in channels:
-            if c.data_latest:
-                pins_ready.append(c.pin)
-                count_ready_test += 1
+        return len(pins_ok) >= num_min
 
-        if count_ready_test > count_ready:
-            count_ready = count_ready_test
+    # No health monitor, fall back to looking for any data at all.
+    time_zero = time.time()
+    while time.time() - time_zero < time_wait_max:
+        pins_ready = [c.pin for c in channels if c.data_latest]
+        if len(pins_ready) >= num_min:
             if verbose:
-                print('Channels ok: %d of %d  %s' % (count_ready, num_channels, pins_ready))
+                print('Channels ok: %d of %d  %s' % (len(pins_ready), len(channels),
+                                                     pins_ready))
+            return True
 
-        time_elapsed = time.time() - time_zero
+        time.sleep(.2)
 
-    # Finish.
-    if count_ready == num_channels:
-        return True
-    else:
-        return False
+    return False
 
 #######################################################
 
 
-def data_collector(queue, time_interval=60):
+def data_collector(queue, time_interval=60, channels=None):
     """
     This is a generator.
 
     Record data for an experiment from multiple sensors.
     Keep recording for specified time interval (seconds).
     Return all accumulated data at end of interval.
+
+    channels: optional list of Channel_Runner.  Stop once all have finished and the queue is
+              empty, e.g. at the end of a replay.
     """
 
     # Main loop.
@@ -553,15 +837,21 @@ def data_collector(queue, time_interval=60):
             # Wait a bit for some data to accumulate in the queue.
             time.sleep(time_interval)
 
-            samples = []
-            while not queue.empty():
-                info = queue.get()
-                samples.append(info)
+            finished = channels and not any(c.is_alive() for c in channels)
+
+            with profiling.span('collect'):
+                samples = []
+                while not queue.empty():
+                    info = queue.get()
+                    samples.append(info)
 
             if samples:
                 # Yield data to the caller.
                 yield samples
 
+            if finished and queue.empty():
+                break
+
         except GeneratorExit:
             print('\nData collector: GeneratorExit')
             break
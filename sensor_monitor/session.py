@@ -0,0 +1,275 @@
+
+from __future__ import division, print_function, unicode_literals
+
+"""
+Process-wide Google API session.
+
+Credentials and the discovery-based service object are built once and shared by every module
+that talks to Fusion Tables.  A background thread refreshes the access token before it expires.
+Requests are executed over a pool of authorized HTTP connections which are kept alive between
+calls.  The underlying httplib2 connections are not thread safe, so each one is handed out to a
+single caller at a time.
+"""
+
+import os
+import argparse
+import datetime
+import threading
+import Queue
+
+import lazy
+import errors
+
+# The API client stack is slow to import, load it when the service is first needed.
+httplib2 = lazy.lazy_import('httplib2')
+oauth2client = lazy.lazy_import('oauth2client.tools', top=True)
+fusion_tables = lazy.lazy_import('who8mygoogle.fusion_tables')
+
+standin = lazy.lazy_import('standin', globals())
+
+
+def path_to_module():
+    p = os.path.dirname(os.path.abspath(__file__))
+    return p
+
+
+_FNAME_CLIENT_SECRETS = 'client_secrets.json'
+_FOLDER_CREDENTIALS = 'credentials'
+
+
+class Session(object):
+    def __init__(self, api_name='fusiontables', fname_secrets=None, service_url=None,
+                 num_http_max=8, time_check=60., time_margin=300.):
+        """
+        Shared credentials, service object and HTTP connection pool.
+
+        Parameters
+        ----------
+        api_name : Google API name.
+
+        fname_secrets : client secrets file.  Default is credentials/client_secrets.json.
+
+        service_url : URL of a local stand-in server (see standin.py).  If given, requests go
+                      there instead of to Google and no credentials are needed.
+
+        num_http_max : maximum number of pooled HTTP connections.
+
+        time_check : seconds between checks on the access token.
+
+        time_margin : refresh the access token when it expires within this many seconds.
+
+        """
+        if not fname_secrets:
+            path_credentials = os.path.join(path_to_module(), _FOLDER_CREDENTIALS)
+            if not os.path.isdir(path_credentials):
+                os.makedirs(path_credentials)
+
+            fname_secrets = os.path.join(path_credentials, _FNAME_CLIENT_SECRETS)
+
+        self.api_name = api_name
+        self.fname_secrets = fname_secrets
+        self.service_url = service_url
+        self.time_check = time_check
+        self.time_margin = time_margin
+
+        self.lock = threading.Lock()
+        self._flags = None
+        self._credentials = None
+        self._service = None
+
+        self._pool = Queue.Queue(maxsize=num_http_max)
+        self._num_http = 0
+        self._num_http_max = num_http_max
+
+        self._thread_refresh = None
+        self._event_stop = threading.Event()
+
+    @property
+    def flags(self):
+        """
+        Command line flags for Google's oauth2client, parsed once.
+        """
+        with self.lock:
+            if self._flags is None:
+                # Parser is here to play nice with Google's stuff using the flags variable.
+                parser = argparse.ArgumentParser(description='authorize',
+                                                 formatter_class=argparse.RawDescriptionHelpFormatter,
+                                                 parents=[oauth2client.tools.argparser])
+                self._flags, remainder = parser.parse_known_args()
+
+        return self._flags
+
+    @property
+    def credentials(self):
+        """
+        Authorized credentials.  Built on first use.  None when using a stand-in server.
+        """
+        if self.service_url:
+            return None
+
+        # Parsed before taking the lock, the flags property takes it too.
+        flags = self.flags
+
+        with self.lock:
+            if self._credentials is None:
+                self._credentials = fusion_tables.authorize.build_credentials(self.fname_secrets,
+                                                                              self.api_name,
+                                                                              flags)
+                self._start_refresh()
+
+        return self._credentials
+
+    @property
+    def service(self):
+        """
+        API service object.  Built on first use.
+        """
+        credentials = self.credentials
+
+        with self.lock:
+            if self._service is None:
+                if self.service_url:
+                    self._service = standin.Service(self.service_url)
+                else:
+                    self._service = fusion_tables.authorize.build_service(self.api_name,
+                                                                          credentials)
+
+        return self._service
+
+    def _start_refresh(self):
+        """
+        Start the background token refresh thread.  Caller must hold the lock.
+        """
+        if self._thread_refresh:
+            return
+
+        self._thread_refresh = threading.Thread(target=self._run_refresh, name='session_refresh')
+        self._thread_refresh.daemon = True
+        self._thread_refresh.start()
+
+    def _run_refresh(self):
+        """
+        Refresh access token shortly before it expires.
+        """
+        while not self._event_stop.wait(self.time_check):
+            credentials = self._credentials
+            expiry = getattr(credentials, 'token_expiry', None)
+            if not expiry:
+                continue
+
+            time_left = (expiry - datetime.datetime.utcnow()).total_seconds()
+            if time_left > self.time_margin:
+                continue
+
+            try:
+                with self.lock:
+                    credentials.refresh(httplib2.Http())
+            except Exception as e:
+                # Not fatal.  The authorized HTTP objects also refresh on a 401 response.
+                print('session: token refresh failed: {:s}'.format(str(e)))
+
+    def borrow_http(self):
+        """
+        Take an authorized HTTP connection from the pool.  Block if all are in use.
+        """
+        try:
+            return self._pool.get(block=False)
+        except Queue.Empty:
+            pass
+
+        with self.lock:
+            make_new = self._num_http < self._num_http_max
+            if make_new:
+                self._num_http += 1
+
+        if make_new:
+            if self.service_url:
+                return httplib2.Http()
+            else:
+                return self.credentials.authorize(httplib2.Http())
+        else:
+            return self._pool.get()
+
+    def return_http(self, http):
+        """
+        Put an HTTP connection back in the pool.
+        """
+        self._pool.put(http)
+
+    def execute(self, request):
+        """
+        Execute an API request over a pooled connection.
+        """
+        http = self.borrow_http()
+        try:
+            return request.execute(http=http)
+        finally:
+            self.return_http(http)
+
+    def stop(self):
+        """
+        Stop the background refresh thread.
+        """
+        self._event_stop.set()
+
+#################################################
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session(fname_secrets=None, service_url=None):
+    """
+    Return the process-wide session, creating it on first call.
+
+    fname_secrets, service_url: passed to Session when the session is created.  Later calls
+    may leave them out, but raise Who8MyRPiError if they ask for a different session than
+    the one that exists.  Client secrets don't matter for a stand-in session.
+    """
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            _session = Session(fname_secrets=fname_secrets, service_url=service_url)
+        else:
+            if fname_secrets and not _session.service_url and (
+                    os.path.abspath(fname_secrets) != os.path.abspath(_session.fname_secrets)):
+                raise errors.Who8MyRPiError('Session already uses client secrets {:s}, not '
+                                            '{:s}'.format(_session.fname_secrets, fname_secrets))
+
+            if service_url and service_url != _session.service_url:
+                raise errors.Who8MyRPiError('Session already uses service {}, not {:s}'.format(
+                    _session.service_url, service_url))
+
+        return _session
+
+
+def reset_session():
+    """
+    Stop and forget the process-wide session, e.g. before configuring a different one.
+    """
+    global _session
+
+    with _session_lock:
+        if _session is not None:
+            _session.stop()
+        _session = None
+
+
+def configure(info_config):
+    """
+    Create the process-wide session from local config data.
+
+    Recognized keys: service_url.
+    """
+    return get_session(service_url=info_config.get('service_url'))
+
+#################################################
+
+
+if __name__ == '__main__':
+    """
+    Development and examples.
+    """
+    s = get_session()
+    print(s.service)
@@ -0,0 +1,673 @@
+
+from __future__ import division, print_function, unicode_literals
+
+"""
+Local stand-in for the Google Fusion Tables API.
+
+Implements the subset of the API used by this package so that uploads and downloads can be
+exercised and benchmarked without a network connection:
+
+  - SQL queries: SELECT with WHERE conditions on numeric columns, ORDER BY and LIMIT,
+    SELECT COUNT(), and one or more INSERT statements.
+  - Table list, get and insert.
+  - Bulk row import from CSV, optionally gzip-compressed.
+
+The server has configurable latency, error injection and a request rate limit.  Tables live
+in memory only.
+
+Point the rest of the package at a running stand-in by adding its URL to config_data.yml:
+
+    service_url: http://localhost:8080
+
+Start a server from the command line:
+
+    python standin.py --port 8080 --latency 0.1 --error_rate 0.05 --rate_limit 10
+"""
+
+import re
+import csv
+import gzip
+import time
+import random
+import argparse
+import threading
+import StringIO
+import urllib
+import urlparse
+import BaseHTTPServer
+import SocketServer
+
+import simplejson as json
+import httplib2
+
+import apiclient.errors
+
+#################################################
+
+_PATH_API = '/fusiontables/v1'
+_PATH_UPLOAD = '/upload/fusiontables/v1'
+
+_TYPE_NUMBER = 'NUMBER'
+
+_re_select = re.compile(r"^\s*SELECT\s+(?P<what>.+?)\s+FROM\s+(?P<table>[\w-]+)"
+                        r"(?:\s+WHERE\s+(?P<where>.+?))?"
+                        r"(?:\s+ORDER\s+BY\s+(?P<order>'?\w+'?)(?:\s+(?P<direction>ASC|DESC))?)?"
+                        r"(?:\s+LIMIT\s+(?P<limit>\d+))?\s*$", re.IGNORECASE | re.DOTALL)
+
+_re_insert = re.compile(r"^\s*INSERT\s+INTO\s+(?P<table>[\w-]+)\s*\((?P<columns>[^)]*)\)\s*"
+                        r"VALUES\s*\((?P<values>.*)\)\s*$", re.IGNORECASE | re.DOTALL)
+
+_re_condition = re.compile(r"^\s*'?(?P<column>\w+)'?\s*(?P<op>>=|<=|=|<|>)\s*"
+                           r"(?P<value>'[^']*'|[-+\d.eE]+)\s*$")
+
+_re_and = re.compile(r"\s+AND\s+", re.IGNORECASE)
+
+_operators = {'>=': lambda a, b: a >= b,
+              '<=': lambda a, b: a <= b,
+              '=': lambda a, b: a == b,
+              '<': lambda a, b: a < b,
+              '>': lambda a, b: a > b}
+
+
+class Stand_In_Error(Exception):
+    """
+    Error to be returned to the client as an HTTP error response.
+    """
+    def __init__(self, status, reason, message):
+        super(Stand_In_Error, self).__init__(message)
+        self.status = status
+        self.reason = reason
+        self.message = message
+
+    def content(self):
+        info = {'error': {'errors': [{'domain': 'global',
+                                      'reason': self.reason,
+                                      'message': self.message}],
+                          'code': self.status,
+                          'message': self.message}}
+        return json.dumps(info)
+
+#################################################
+
+
+def split_statements(sql):
+    """
+    Split SQL text on semicolons that are not inside quoted strings.
+    """
+    statements = []
+    current = []
+    in_quote = False
+    previous = ''
+    for c in sql:
+        if c == "'" and previous != '\\':
+            in_quote = not in_quote
+
+        if c == ';' and not in_quote:
+            statements.append(''.join(current))
+            current = []
+        else:
+            current.append(c)
+
+        previous = c
+
+    statements.append(''.join(current))
+
+    return [s for s in statements if s.strip()]
+
+
+def split_values(text):
+    """
+    Split comma-separated SQL values, respecting quoted strings.
+    """
+    values = []
+    current = []
+    in_quote = False
+    previous = ''
+    for c in text:
+        if c == "'" and previous != '\\':
+            in_quote = not in_quote
+
+        if c == ',' and not in_quote:
+            values.append(''.join(current).strip())
+            current = []
+        else:
+            current.append(c)
+
+        previous = c
+
+    values.append(''.join(current).strip())
+
+    return [parse_literal(v) for v in values]
+
+
+def parse_literal(text):
+    """
+    Convert SQL literal to a Python value.
+    """
+    if len(text) >= 2 and text[0] == "'" and text[-1] == "'":
+        return text[1:-1].replace("\\'", "'")
+
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+#################################################
+
+
+class Table(object):
+    def __init__(self, table_id, name, columns):
+        """
+        In-memory table.
+
+        Parameters
+        ----------
+        columns : list of dicts with keys 'name' and 'type'.
+
+        """
+        self.table_id = table_id
+        self.name = name
+        self.columns = [dict(c) for c in columns]
+        self.names = [c['name'] for c in columns]
+        self.rows = []
+        self.lock = threading.Lock()
+
+    def resource(self):
+        return {'kind': 'fusiontables#table',
+                'tableId': self.table_id,
+                'name': self.name,
+                'columns': self.columns}
+
+    def convert(self, name, value):
+        """
+        Coerce value to the column's type.
+        """
+        k = self.names.index(name)
+        if self.columns[k].get('type') == _TYPE_NUMBER:
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return value
+
+        return value
+
+    def insert(self, names, values):
+        """
+        Append one row.  Columns not named are left empty.
+        """
+        for n in names:
+            if n not in self.names:
+                raise Stand_In_Error(400, 'badRequest', 'Unknown column: {:s}'.format(n))
+
+        row = [''] * len(self.names)
+        for n, v in zip(names, values):
+            row[self.names.index(n)] = self.convert(n, v)
+
+        with self.lock:
+            self.rows.append(row)
+            rowid = len(self.rows)
+
+        return rowid
+
+    def select(self, what, conditions, order=None, descending=False, limit=None):
+        """
+        Evaluate a SELECT statement.
+
+        Parameters
+        ----------
+        what : '*', 'COUNT()' or list of column names.
+
+        conditions : list of tuples (column, operator, value).
+
+        """
+        for column, op, value in conditions:
+            if column not in self.names:
+                raise Stand_In_Error(400, 'badQuery', 'Unknown column: {:s}'.format(column))
+
+        with self.lock:
+            rows = list(self.rows)
+
+        for column, op, value in conditions:
+            k = self.names.index(column)
+            func = _operators[op]
+            rows = [r for r in rows if func(r[k], value)]
+
+        if what == 'COUNT()':
+            return ['count()'], [[len(rows)]]
+
+        if order:
+            if order not in self.names:
+                raise Stand_In_Error(400, 'badQuery', 'Unknown column: {:s}'.format(order))
+
+            k = self.names.index(order)
+            rows.sort(key=lambda r: r[k], reverse=descending)
+
+        if limit is not None:
+            rows = rows[:limit]
+
+        if what == '*':
+            return list(self.names), rows
+
+        indices = [self.names.index(n) for n in what]
+        rows = [[r[k] for k in indices] for r in rows]
+
+        return list(what), rows
+
+#################################################
+
+
+class Stand_In(object):
+    def __init__(self, latency=0., jitter=0., error_rate=0., rate_limit=None):
+        """
+        Tables and behavior settings shared by all request handlers.
+
+        Parameters
+        ----------
+        latency : seconds added to every request.
+
+        jitter : maximum random extra seconds added to every request.
+
+        error_rate : fraction of requests failed with a 503 backend error.
+
+        rate_limit : maximum sustained requests per second.  Excess requests fail with 429.
+
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+
+        self.tables = {}
+        self.lock = threading.Lock()
+
+        self._tokens = rate_limit or 0
+        self._time_tokens = time.time()
+
+        self.count_requests = 0
+        self.count_errors = 0
+
+    def create_table(self, name, columns, table_id=None):
+        with self.lock:
+            if not table_id:
+                table_id = 'standin{:06d}'.format(len(self.tables) + 1)
+
+            table = Table(table_id, name, columns)
+            self.tables[table_id] = table
+
+        return table
+
+    def get_table(self, table_id):
+        try:
+            return self.tables[table_id]
+        except KeyError:
+            raise Stand_In_Error(404, 'notFound', 'Table not found: {:s}'.format(table_id))
+
+    def admit(self):
+        """
+        Apply latency, rate limit and error injection to a new request.
+        """
+        with self.lock:
+            self.count_requests += 1
+
+            if self.rate_limit:
+                time_now = time.time()
+                self._tokens = min(self.rate_limit,
+                                   self._tokens + (time_now - self._time_tokens) * self.rate_limit)
+                self._time_tokens = time_now
+
+                if self._tokens < 1:
+                    self.count_errors += 1
+                    raise Stand_In_Error(429, 'rateLimitExceeded', 'Rate limit exceeded.')
+
+                self._tokens -= 1
+
+        time_sleep = self.latency + random.uniform(0, self.jitter)
+        if time_sleep > 0:
+            time.sleep(time_sleep)
+
+        if self.error_rate and random.random() < self.error_rate:
+            with self.lock:
+                self.count_errors += 1
+            raise Stand_In_Error(503, 'backendError', 'Injected backend error.')
+
+    def sql(self, sql):
+        """
+        Evaluate one or more SQL statements.  Return a sqlresponse dict.
+        """
+        statements = split_statements(sql)
+        if not statements:
+            raise Stand_In_Error(400, 'badQuery', 'Empty query.')
+
+        # Batch of inserts.
+        if _re_insert.match(statements[0]):
+            rowids = []
+            for statement in statements:
+                m = _re_insert.match(statement)
+                if not m:
+                    raise Stand_In_Error(400, 'badQuery', 'Mixed statement types.')
+
+                table = self.get_table(m.group('table'))
+                names = [n.strip().strip("'") for n in m.group('columns').split(',')]
+                values = split_values(m.group('values'))
+                if len(names) != len(values):
+                    raise Stand_In_Error(400, 'badQuery', 'Column and value counts differ.')
+
+                rowids.append([table.insert(names, values)])
+
+            return {'kind': 'fusiontables#sqlresponse', 'columns': ['rowid'], 'rows': rowids}
+
+        # Single select.
+        if len(statements) != 1:
+            raise Stand_In_Error(400, 'badQuery', 'Only one SELECT per request.')
+
+        m = _re_select.match(statements[0])
+        if not m:
+            raise Stand_In_Error(400, 'badQuery', 'Unsupported query: {:s}'.format(sql))
+
+        table = self.get_table(m.group('table'))
+
+        what = m.group('what').strip()
+        if what.upper() == 'COUNT()':
+            what = 'COUNT()'
+        elif what != '*':
+            what = [n.strip().strip("'") for n in what.split(',')]
+
+        conditions = []
+        if m.group('where'):
+            for text in _re_and.split(m.group('where')):
+                c = _re_condition.match(text)
+                if not c:
+                    raise Stand_In_Error(400, 'badQuery', 'Unsupported condition: {:s}'.format(text))
+
+                conditions.append((c.group('column'), c.group('op'),
+                                   parse_literal(c.group('value'))))
+
+        order = m.group('order')
+        if order:
+            order = order.strip("'")
+
+        descending = (m.group('direction') or '').upper() == 'DESC'
+
+        limit = m.group('limit')
+        if limit is not None:
+            limit = int(limit)
+
+        names, rows = table.select(what, conditions, order, descending, limit)
+
+        result = {'kind': 'fusiontables#sqlresponse', 'columns': names}
+        if rows:
+            # Real service leaves out the rows entry when nothing matched.
+            result['rows'] = rows
+
+        return result
+
+    def import_rows(self, table_id, content, delimiter=','):
+        """
+        Append CSV rows to a table.  Column order is the table's column order.
+        """
+        table = self.get_table(table_id)
+
+        reader = csv.reader(StringIO.StringIO(content), delimiter=str(delimiter))
+        count = 0
+        for values in reader:
+            if not values:
+                continue
+
+            if len(values) != len(table.names):
+                raise Stand_In_Error(400, 'badImportInputContent',
+                                     'Row {:d} has {:d} values, expected {:d}.'.format(
+                                         count + 1, len(values), len(table.names)))
+
+            table.insert(table.names, values)
+            count += 1
+
+        return {'kind': 'fusiontables#import', 'numRowsReceived': str(count)}
+
+#################################################
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Route HTTP requests to the stand-in.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b''
+
+        if self.headers.get('Content-Encoding', '') == 'gzip':
+            body = gzip.GzipFile(fileobj=StringIO.StringIO(body)).read()
+
+        return body
+
+    def reply(self, status, content):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def dispatch(self, method):
+        stand_in = self.server.stand_in
+
+        try:
+            body = self.read_body()
+            parts = urlparse.urlparse(self.path)
+            params = dict(urlparse.parse_qsl(parts.query))
+
+            stand_in.admit()
+
+            path = parts.path.rstrip('/')
+
+            if path == _PATH_API + '/query':
+                if method == 'POST' and body and 'sql' not in params:
+                    params.update(urlparse.parse_qsl(body))
+                result = stand_in.sql(params.get('sql', ''))
+
+            elif path == _PATH_API + '/tables' and method == 'GET':
+                items = [t.resource() for t in stand_in.tables.values()]
+                result = {'kind': 'fusiontables#tableList', 'items': items}
+
+            elif path == _PATH_API + '/tables' and method == 'POST':
+                info = json.loads(body)
+                result = stand_in.create_table(info['name'], info.get('columns', [])).resource()
+
+            elif path.startswith(_PATH_UPLOAD + '/tables/') and path.endswith('/import'):
+                table_id = path.split('/')[-2]
+                result = stand_in.import_rows(table_id, body, params.get('delimiter', ','))
+
+            elif path.startswith(_PATH_API + '/tables/') and method == 'GET':
+                table_id = path.split('/')[-1]
+                result = stand_in.get_table(table_id).resource()
+
+            else:
+                raise Stand_In_Error(404, 'notFound', 'No such endpoint: {:s}'.format(path))
+
+            self.reply(200, json.dumps(result))
+
+        except Stand_In_Error as e:
+            self.reply(e.status, e.content())
+
+        except Exception as e:
+            error = Stand_In_Error(500, 'internalError', str(e))
+            self.reply(error.status, error.content())
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, stand_in, verbose=False):
+        BaseHTTPServer.HTTPServer.__init__(self, address, Handler)
+        self.stand_in = stand_in
+        self.verbose = verbose
+
+
+def serve(port=8080, host='localhost', stand_in=None, background=False, verbose=False):
+    """
+    Run a stand-in server.
+
+    Parameters
+    ----------
+    stand_in : Stand_In instance holding tables and settings.  Default is a fresh instance.
+
+    background : if True, run in a daemon thread and return the server immediately.
+
+    """
+    if not stand_in:
+        stand_in = Stand_In()
+
+    server = Server((host, port), stand_in, verbose=verbose)
+
+    if background:
+        t = threading.Thread(target=server.serve_forever, name='standin')
+        t.daemon = True
+        t.start()
+    else:
+        server.serve_forever()
+
+    return server
+
+#################################################
+# Client side.  Mimics the parts of the googleapiclient service object used by this package.
+
+
+class Request(object):
+    def __init__(self, service, method, path, params=None, body=None, headers=None):
+        self.service = service
+        self.method = method
+        self.path = path
+        self.params = params or {}
+        self.body = body
+        self.headers = headers or {}
+
+    @property
+    def uri(self):
+        uri = self.service.url + self.path
+        if self.params:
+            uri += '?' + urllib.urlencode(self.params)
+        return uri
+
+    def execute(self, http=None):
+        if not http:
+            http = httplib2.Http()
+
+        resp, content = http.request(self.uri, self.method, body=self.body, headers=self.headers)
+
+        if resp.status >= 300:
+            raise apiclient.errors.HttpError(resp, content, uri=self.uri)
+
+        return json.loads(content)
+
+
+class _Query_Resource(object):
+    def __init__(self, service):
+        self.service = service
+
+    def sql(self, sql, **kwargs):
+        # Send statement in the body so that large INSERT batches don't overflow the URL.
+        body = urllib.urlencode({'sql': sql.encode('utf-8')})
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        return Request(self.service, 'POST', _PATH_API + '/query', body=body, headers=headers)
+
+    def sqlGet(self, sql, **kwargs):
+        params = {'sql': sql.encode('utf-8')}
+        return Request(self.service, 'GET', _PATH_API + '/query', params=params)
+
+
+class _Table_Resource(object):
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, **kwargs):
+        return Request(self.service, 'GET', _PATH_API + '/tables')
+
+    def get(self, tableId, **kwargs):
+        return Request(self.service, 'GET', _PATH_API + '/tables/' + tableId)
+
+    def insert(self, body, **kwargs):
+        headers = {'Content-Type': 'application/json'}
+        return Request(self.service, 'POST', _PATH_API + '/tables', body=json.dumps(body),
+                       headers=headers)
+
+    def importRows(self, tableId, media_body=None, delimiter=',', headers=None, **kwargs):
+        """
+        media_body may be a string or an apiclient.http.MediaUpload instance.
+        """
+        if hasattr(media_body, 'getbytes'):
+            content = media_body.getbytes(0, media_body.size())
+        else:
+            content = media_body
+
+        params = {'delimiter': delimiter}
+        path = _PATH_UPLOAD + '/tables/' + tableId + '/import'
+        return Request(self.service, 'POST', path, params=params, body=content,
+                       headers=headers or {'Content-Type': 'application/octet-stream'})
+
+
+class Service(object):
+    def __init__(self, url):
+        """
+        Client for a stand-in server, used in place of the Google API service object.
+        """
+        self.url = url.rstrip('/')
+
+    def query(self):
+        return _Query_Resource(self)
+
+    def table(self):
+        return _Table_Resource(self)
+
+#################################################
+
+
+def main():
+    """
+    Run a stand-in server from the command line.
+    """
+    parser = argparse.ArgumentParser(description='Local Fusion Tables stand-in.')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', default=8080, type=int)
+    parser.add_argument('--latency', default=0., type=float,
+                        help='Seconds added to every request.')
+    parser.add_argument('--jitter', default=0., type=float,
+                        help='Maximum random extra seconds added to every request.')
+    parser.add_argument('--error_rate', default=0., type=float,
+                        help='Fraction of requests failed with a 503 error.')
+    parser.add_argument('--rate_limit', default=None, type=float,
+                        help='Maximum requests per second.')
+    parser.add_argument('--seed', default=None,
+                        help='JSON file of tables to preload: {table_id: {name, columns, rows}}.')
+    parser.add_argument('-v', '--verbose', default=False, action='store_true')
+
+    args = parser.parse_args()
+
+    stand_in = Stand_In(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                        rate_limit=args.rate_limit)
+
+    if args.seed:
+        with open(args.seed, 'r') as fi:
+            info = json.load(fi)
+
+        for table_id, t in info.items():
+            table = stand_in.create_table(t['name'], t['columns'], table_id=table_id)
+            for row in t.get('rows', []):
+                table.insert(table.names, row)
+
+    print('Fusion Tables stand-in on http://{:s}:{:d}'.format(args.host, args.port))
+    serve(args.port, args.host, stand_in, verbose=args.verbose)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+
+from __future__ import division, print_function, unicode_literals
+
+"""
+Console entry point for who8myrpi.
+
+With --profile-startup the import timer has to be running before who8myrpi is imported, since
+who8myrpi loads NumPy, the sensor channels and most of the pipeline at import time.  This
+module only imports lazy, then who8myrpi.  Run it rather than who8myrpi.py directly when
+profiling startup:
+
+    python startup.py --profile-startup
+"""
+
+import sys
+
+import lazy
+
+
+def load(profile=False):
+    """
+    Import and return who8myrpi, timing each module it loads if profile is True.  See
+    lazy.Import_Profiler.
+    """
+    if profile:
+        lazy.import_profiler.start()
+
+    import who8myrpi
+
+    return who8myrpi
+
+
+def main():
+    """
+    This is the entry point for the application, see who8myrpi.main.
+    """
+    who8myrpi = load('--profile-startup' in sys.argv[1:])
+    who8myrpi.main()
+
+#################################################
+
+
+if __name__ == '__main__':
+    main()
@@ -7,12 +7,24 @@ import glob
 import datetime
 import time
 
+import csv
+import json
+import gzip
+import StringIO
+
 import numpy as np
 import data_io as io
 
+import apiclient.http
+import apiclient.errors
+
 import who8mygoogle.fusion_tables as fusion_tables
+import errors
 import utility
+import codec
 import blinker
+import profiling
+import session
 
 from coroutine import coroutine
 
@@ -27,24 +39,69 @@ column_types = [['DateTime',    fusion_tables.fusion_table.TYPE_DATETIME],
 fname_client = 'client_secrets.json'
 api_name = 'fusiontables'
 
+_folder_spool = 'spool'
+_fname_spool = 'pending.tsc'
+_fname_spool_csv = 'pending.csv'
+
+# Upper limit on the size of a single bulk import request.
+_bytes_import_max = 8*1024*1024
+
 #################################################
 
 
-def connect_table(table_name, path_credentials):
+def path_to_module():
+    p = os.path.dirname(os.path.abspath(__file__))
+    return p
+
+
+
+def connect_service(path_credentials=None):
     """
     Establish credentials and retrieve API service object.
+
+    The service object is shared through the session module.  Client secrets in
+    path_credentials are used if this call creates the session.
     """
+    f = None
+    if path_credentials:
+        f = os.path.join(path_credentials, fname_client)
 
-    f = os.path.join(path_credentials, fname_client)
-    credentials = fusion_tables.authorize.build_credentials(f, api_name)
-    service = fusion_tables.authorize.build_service(api_name, credentials)
+    return session.get_session(f).service
 
-    tableId = fusion_tables.fusion_table.fetch_table(service, table_name, column_types)
+
+def connect_table(table_name, path_credentials=None):
+    """
+    Establish credentials and retrieve API service object and the ID of the named table,
+    created if needed.  See connect_service.
+    """
+    service = connect_service(path_credentials)
+
+    tableId = fetch_table(service, table_name, column_types)
 
     # Done.
     return service, tableId
 
 
+def fetch_table(service, table_name, column_types):
+    """
+    Return ID of the named table, creating it with the given columns if it doesn't exist.
+    Requests go over the session's connection pool.
+    """
+    s = session.get_session()
+
+    response = s.execute(service.table().list())
+    for item in response.get('items', []):
+        if item['name'] == table_name:
+            return item['tableId']
+
+    body = {'name': table_name,
+            'isExportable': True,
+            'columns': [{'name': name, 'type': kind} for name, kind in column_types]}
+    response = s.execute(service.table().insert(body=body))
+
+    return response['tableId']
+
+
 
 def process_samples(samples):
     """
@@ -76,6 +133,262 @@ def process_samples(samples):
 
 
 
+def samples_to_columns(samples):
+    """
+    Convert sensor-generated samples to columnar Numpy buffers.
+    """
+    if getattr(samples, 'columns', None) is not None:
+        # Converted by an earlier pipeline stage, see derived.Sample_Batch.
+        return samples.columns
+
+    num_samples = len(samples)
+
+    columns = {'seconds': np.empty(num_samples, dtype=np.float64),
+               'pin': np.empty(num_samples, dtype=np.int32),
+               'Tf': np.empty(num_samples, dtype=np.float64),
+               'RH': np.empty(num_samples, dtype=np.float64)}
+
+    for k, info in enumerate(samples):
+        columns['seconds'][k] = info['seconds']
+        columns['pin'][k] = info['pin']
+        columns['Tf'][k] = info['Tf']
+        columns['RH'][k] = info['RH']
+
+    columns['kind'] = [info['kind'] for info in samples]
+
+    return columns
+
+
+def columns_to_csv(columns):
+    """
+    Serialize columnar sample buffers to CSV text in Fusion Table column order.
+
+    Returns
+    -------
+    CSV bytes, one line per sample.
+
+    """
+    if not len(columns['seconds']):
+        return b''
+
+    time_stamps = [utility.pretty_timestamp(t) for t in columns['seconds']]
+
+    # Numeric columns formatted in one pass each.
+    seconds = np.char.mod(b'%.2f', columns['seconds'])
+    pins = np.char.mod(b'%d', columns['pin'])
+    Tf = np.char.mod(b'%.2f', columns['Tf'])
+    RH = np.char.mod(b'%.2f', columns['RH'])
+
+    lines = [b','.join((str(a), b, str(c), d, e, f))
+             for a, b, c, d, e, f in zip(time_stamps, seconds, columns['kind'], pins, Tf, RH)]
+
+    return b'\n'.join(lines) + b'\n'
+
+
+def compress(content):
+    """
+    Gzip-compress bytes.
+    """
+    buf = StringIO.StringIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as fo:
+        fo.write(content)
+
+    return buf.getvalue()
+
+
+def import_rows(service, tableId, content, use_gzip=False):
+    """
+    Append CSV rows to a Fusion Table in a single bulk import request.
+
+    Parameters
+    ----------
+    content : CSV bytes in table column order.
+
+    use_gzip : send the request body gzip-compressed.
+
+    Returns
+    -------
+    Number of rows received by the service.
+
+    """
+    if use_gzip:
+        content = compress(content)
+
+    media = apiclient.http.MediaInMemoryUpload(content, mimetype='application/octet-stream')
+    request = service.table().importRows(tableId=tableId, media_body=media,
+                                         delimiter=',', encoding='UTF-8')
+
+    if use_gzip:
+        request.headers['Content-Encoding'] = 'gzip'
+
+    response = session.get_session().execute(request)
+
+    return int(response['numRowsReceived'])
+
+
+def add_rows(service, tableId, data_rows):
+    """
+    Append rows to a Fusion Table, as fusion_tables.fusion_table.add_rows but over the
+    session's connection pool.  Return the service response.
+    """
+    fo = StringIO.StringIO()
+    writer = csv.writer(fo, lineterminator=str('\n'))
+    writer.writerows(data_rows)
+
+    media = apiclient.http.MediaInMemoryUpload(fo.getvalue(),
+                                               mimetype='application/octet-stream')
+    request = service.table().importRows(tableId=tableId, media_body=media,
+                                         delimiter=',', encoding='UTF-8')
+
+    try:
+        return session.get_session().execute(request)
+    except apiclient.errors.HttpError as e:
+        content = json.loads(e.content)
+        domain = content['error']['errors'][0]['domain']
+        message = content['error']['errors'][0]['message']
+
+        raise errors.Who8MyRPiError(domain + ': ' + message)
+
+
+def csv_to_columns(content):
+    """
+    Parse CSV bytes written by columns_to_csv back to columnar buffers.
+    """
+    lines = [line.split(b',') for line in content.splitlines() if line]
+
+    columns = {'seconds': np.array([float(p[1]) for p in lines], dtype=np.float64),
+               'kind': [p[2].decode('utf-8') for p in lines],
+               'pin': np.array([int(p[3]) for p in lines], dtype=np.int32),
+               'Tf': np.array([float(p[4]) for p in lines], dtype=np.float64),
+               'RH': np.array([float(p[5]) for p in lines], dtype=np.float64)}
+
+    return columns
+
+
+class Spool(object):
+    def __init__(self, path=None):
+        """
+        Local on-disk spool of samples waiting to be uploaded.  Survives restarts.
+
+        Samples are stored as codec blocks, about a tenth the size of the CSV rows they
+        become, which saves SD card space and writes while offline.  A block cut short by a
+        crash is dropped.
+        """
+        if not path:
+            path = os.path.join(path_to_module(), _folder_spool)
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        self.fname = os.path.join(path, _fname_spool)
+
+        self.num_rows = 0
+        if os.path.isfile(self.fname):
+            reader = codec.Reader(self.fname)
+            self.num_rows = reader.num_rows
+
+            if reader.size_valid < os.path.getsize(self.fname):
+                with open(self.fname, 'r+b') as fo:
+                    fo.truncate(reader.size_valid)
+
+        # Carry over rows from an older CSV spool.
+        fname_csv = os.path.join(path, _fname_spool_csv)
+        if os.path.isfile(fname_csv):
+            with open(fname_csv, 'rb') as fi:
+                columns = csv_to_columns(fi.read())
+
+            if len(columns['seconds']):
+                self.append(columns)
+            os.remove(fname_csv)
+
+    def append(self, columns):
+        """
+        Add columnar samples to the end of the spool.
+        """
+        num_rows = len(columns['seconds'])
+        if not num_rows:
+            return
+
+        codec.append(self.fname, columns)
+
+        self.num_rows += num_rows
+
+    def read(self, bytes_max=None):
+        """
+        Read whole blocks from the front of the spool as CSV rows, up to about bytes_max bytes
+        of CSV.
+
+        Returns
+        -------
+        content : CSV bytes in table column order.
+
+        size : spool bytes holding those rows, to pass to consume().
+
+        """
+        if not os.path.isfile(self.fname):
+            return b'', 0
+
+        if not bytes_max:
+            bytes_max = _bytes_import_max
+
+        reader = codec.Reader(self.fname)
+
+        parts = []
+        num_bytes = 0
+        size = 0
+        for k, info in enumerate(reader.index):
+            content = columns_to_csv(reader.read_block(k))
+            if parts and num_bytes + len(content) > bytes_max:
+                break
+
+            parts.append(content)
+            num_bytes += len(content)
+            size += info.size
+
+        return b''.join(parts), size
+
+    def consume(self, size, head=b''):
+        """
+        Remove bytes from the front of the spool after they have been uploaded.  Optional head
+        bytes, e.g. a block holding the rest of a partly uploaded block, take their place.
+        """
+        with open(self.fname, 'rb') as fi:
+            fi.seek(size)
+            remainder = fi.read()
+
+        fname_temp = self.fname + '.tmp'
+        with open(fname_temp, 'wb') as fo:
+            fo.write(head)
+            fo.write(remainder)
+
+        os.rename(fname_temp, self.fname)
+
+        self.num_rows = codec.Reader(self.fname).num_rows
+
+    def consume_rows(self, num_rows):
+        """
+        Remove the first num_rows rows from the spool, e.g. the part of an import the service
+        accepted when it fell short.  Rows are in the same order as the CSV from read().
+        """
+        reader = codec.Reader(self.fname)
+
+        size = 0
+        head = b''
+        for k, info in enumerate(reader.index):
+            if num_rows <= 0:
+                break
+
+            if num_rows < info.num_rows:
+                # Block only partly uploaded, keep the rest of it.
+                columns = reader.read_block(k)
+                head = codec.encode_block(dict((n, v[num_rows:]) for n, v in columns.items()))
+
+            num_rows -= info.num_rows
+            size += info.size
+
+        self.consume(size, head)
+
+
 @coroutine
 def data_uploader(service, tableId, pin_status):
     """
@@ -92,16 +405,18 @@ def data_uploader(service, tableId, pin_status):
 
             # Receive new data samples.
             samples = (yield)
-            data_rows, column_names = process_samples(samples)
+            with profiling.span('process_samples'):
+                data_rows, column_names = process_samples(samples)
 
-            # Upload the new data.
+            # Upload the new data, over the session's connection pool.
             num_rows = len(data_rows)
             if num_rows > 0:
                 blink_status.frequency = 30
                 try:
-                    response = fusion_tables.fusion_table.add_rows(service, tableId, data_rows)
+                    with profiling.span('add_rows'):
+                        response = add_rows(service, tableId, data_rows)
                     samples = None
-                except fusion_tables.errors.Who8MyGoogleError as e:
+                except errors.Who8MyRPiError as e:
                     print('upload.data_uploader caught error: %s' % e.message)
                     print('was trying to upload following samples:')
                     print(samples)
@@ -149,5 +464,80 @@ def data_uploader(service, tableId, pin_status):
     # Done.
 
 
+@coroutine
+def bulk_uploader(service, tableId, pin_status, rows_bulk_min=1, use_gzip=False, path_spool=None):
+    """
+    Coroutine to receive new data and upload to a Google Fusion Table in bulk.
+
+    Samples are appended to a local spool and serialized to CSV for upload.  Once the spool
+    holds at least rows_bulk_min rows it is sent with as few bulk import requests as possible.  Rows
+    stay in the spool until the service confirms them, so a backlog built up while offline
+    is uploaded in a handful of requests.
+    """
+    blink_status = blinker.Blinker(pin_status)
+    spool = Spool(path_spool)
+
+    if spool.num_rows:
+        print('Spooled rows waiting for upload: {:d}'.format(spool.num_rows))
+
+    keep_looping = True
+    while keep_looping:
+        try:
+            # Receive new data samples.
+            samples = (yield)
+            with profiling.span('spool'):
+                spool.append(samples_to_columns(samples))
+
+            if spool.num_rows < rows_bulk_min:
+                continue
+
+            # Upload the spool.
+            blink_status.frequency = 30
+            while spool.num_rows:
+                content, size = spool.read()
+                num_rows = content.count(b'\n')
+
+                try:
+                    with profiling.span('import_rows'):
+                        num_uploaded = import_rows(service, tableId, content, use_gzip)
+                except Exception as e:
+                    print('upload.bulk_uploader caught error: {:s}'.format(str(e)))
+                    print('{:d} rows kept in spool for next attempt.'.format(spool.num_rows))
+                    blink_status.frequency = 2
+                    break
+
+                if num_uploaded != num_rows:
+                    print('Error: Problem uploading data: num_uploaded != num_rows: %s, %s' %
+                          (num_uploaded, num_rows))
+                    blink_status.frequency = 2
+
+                    # Rows the service took are not sent again.
+                    if 0 < num_uploaded < num_rows:
+                        spool.consume_rows(num_uploaded)
+                    break
+
+                spool.consume(size)
+                blink_status.frequency = 0
+
+        except GeneratorExit:
+            print('Bulk uploader: GeneratorExit')
+            keep_looping = False
+
+        except Exception as e:
+            print('upload.bulk_uploader: Unknown problem uploading data')
+            print(type(e))
+            print(e)
+
+            blink_status.stop()
+
+            raise e
+
+    # Stop the blinker.
+    blink_status.frequency = 0
+    blink_status.stop()
+
+    # Done.
+
+
 if __name__ == '__main__':
     pass
@@ -4,18 +4,31 @@ from __future__ import division, print_function, unicode_literals
 import os
 import argparse
 import time
+import threading
 
-# import numpy as np
 import data_io as io
 
+import lazy
+import profiling
 import dht22
 import sensors
+import health
+import power
+import metrics
+import acquisition
 import utility
 import blinker
-import upload
-import master_table
+import derived
+import config_service
 
-import who8mygoogle.fusion_tables as fusion_tables
+# The Google API client stack loads on first use, so sensors start reading before it has been
+# imported.  See lazy.py and --profile-startup.
+upload = lazy.lazy_import('upload', globals())
+collector = lazy.lazy_import('collector', globals())
+master_table = lazy.lazy_import('master_table', globals())
+session = lazy.lazy_import('session', globals())
+
+fusion_tables = lazy.lazy_import('who8mygoogle.fusion_tables', globals())
 
 #################################################
 
@@ -25,27 +38,52 @@ def path_to_module():
     return p
 
 
-def initialize_sensors(info_config):
+def initialize_sensors(info_config, multiprocess=False, observers=None):
     """Do all setup operations necesary to get ready prior to recording data.
+
+    multiprocess: read sensors in a separate high-priority process, see acquisition.py.
+    observers: optional list of further functions called after every read attempt.
     """
 
     # Config data.
     pins_data = info_config['pins_data']
 
-    pin_power = int(info_config['pin_power'])
+    groups = power.groups_from_config(info_config)
+    outliers = info_config.get('outliers')
+    time_wait = info_config.get('time_wait', config_service.TIME_WAIT)
 
     # Initialize GPIO.
     # dht22.SetupGpio()
 
+    # Track readiness of each sensor.
+    monitor = health.Health_Monitor(pins_data, verbose=True)
+
     # Power up the sensors.
-    if pin_power:
-        dht22._pinMode(pin_power, dht22._OUTPUT)
-        dht22._digitalWrite(pin_power, True)
-        time.sleep(5)
+    for g in groups:
+        g.setup()
+        g.on()
+        monitor.power_on(g.pins_data)
+
+    # Read-quality telemetry.
+    registry = metrics.get_metrics()
+    registry.monitor = monitor
+
+    observers = [registry.observe_read] + list(observers or [])
 
     # Create data recording channels.
-    channels, queue = sensors.start_channels(pins_data)
+    if multiprocess:
+        acq = acquisition.Acquisition(pins_data, time_wait=time_wait, monitor=monitor,
+                                      observers=observers, outliers=outliers,
+                                      verbose=True)
+        acq.start()
+        channels, queue = acq.channels, acq.samples
+    else:
+        channels, queue = sensors.start_channels(pins_data, monitor=monitor,
+                                                 time_wait=time_wait, observers=observers,
+                                                 outliers=outliers)
+    registry.watch_queue('samples', queue)
 
+    # Begin as soon as one sensor is healthy.  The others join when ready.
     ok = sensors.check_channels_ok(channels, verbose=True)
 
     if not ok:
@@ -70,32 +108,69 @@ def initialize_upload(info_config):
     return service, tableId
 
 
-def record_data(channels, queue, service, tableId, info_config, power_cycle_interval=None):
+def record_data(channels, queue, service, tableId, info_config, power_cycle_interval=None,
+                source=None, reconfigure=None):
     """
     Do the work to record data from sensors.
+
+    source: generator of sample lists, default sensors.data_collector(queue).
+    reconfigure: optional config_service.Config_Service, run while recording.
     """
 
     if not power_cycle_interval:
         power_cycle_interval = 30*60  # seconds
 
+    # Power cycle sensor groups only when their health degrades.
+    monitor = channels[0].monitor
+    groups = power.groups_from_config(info_config)
+    supervisor = power.Power_Supervisor(groups, channels, monitor,
+                                        time_cycle_min=power_cycle_interval)
+    supervisor.start()
+
+    # Apply config changes while running.
+    if reconfigure:
+        reconfigure.supervisor = supervisor
+        reconfigure.start()
+
     # Status LED.
-    pin_ok = int(info_config['pin_ok'])
-    pin_upload = int(info_config['pin_err'])
+    pin_ok = info_config.get('pin_ok')
+    pin_upload = info_config.get('pin_err')
+    if pin_ok is not None:
+        pin_ok = int(pin_ok)
+    if pin_upload is not None:
+        pin_upload = int(pin_upload)
 
     blink_sensors = blinker.Blinker(pin_ok)
 
     # Setup.
-    source = sensors.data_collector(queue)                     # data producer / generator
-    sink = upload.data_uploader(service, tableId, pin_upload)  # consumer coroutine
+    if source is None:
+        source = sensors.data_collector(queue)                 # data producer / generator
+    if info_config.get('derived'):
+        names = info_config['derived']
+        names = None if names is True else derived.parse_names(names)
+        source = derived.stage(source, names, observer=metrics.get_metrics().observe_derived)
+    if info_config.get('collector'):
+        rows_bulk_min = int(info_config.get('rows_bulk_min', 1))
+        sink = collector.collector_uploader(info_config['collector'], pin_upload,
+                                            station=info_config.get('station'),
+                                            rows_bulk_min=rows_bulk_min,
+                                            path_spool=info_config.get('path_spool'))
+    elif info_config.get('upload_bulk'):
+        rows_bulk_min = int(info_config.get('rows_bulk_min', 1))
+        sink = upload.bulk_uploader(service, tableId, pin_upload, rows_bulk_min,
+                                    use_gzip=bool(info_config.get('upload_gzip')),
+                                    path_spool=info_config.get('path_spool'))
+    else:
+        sink = upload.data_uploader(service, tableId, pin_upload)  # consumer coroutine
 
     # Main processing loop.
-    time_power_zero = time.time()
     for samples in source:
         try:
             # Pass the data along to the uploader.
             blink_sensors.frequency = 0
 
-            sink.send(samples)
+            with profiling.span('upload'):
+                sink.send(samples)
 
             blink_sensors.frequency = len(samples)
 
@@ -105,16 +180,6 @@ def record_data(channels, queue, service, tableId, info_config, power_cycle_inte
             time_stamp = utility.pretty_timestamp(t, fmt)
             print('samples:%3d [%s]' % (len(samples), time_stamp))
 
-            # Do a power cycle?
-            if time.time() - time_power_zero > power_cycle_interval:
-                print('Power cycle')
-                blink_sensors.frequency = 0.2
-
-                power_cycle(channels, info_config)
-                time_power_zero = time.time()
-
-                blink_sensors.frequency = 0
-
         except fusion_tables.errors.Who8MyGoogleError as e:
             print()
             print('Error: %s' % e.message)
@@ -128,12 +193,18 @@ def record_data(channels, queue, service, tableId, info_config, power_cycle_inte
         except Exception as e:
             # More gentle end for unknown exception.
             print(e)
+            if reconfigure:
+                reconfigure.stop()
+            supervisor.stop()
             blink_sensors.stop()
             sink.close()
 
             raise e
 
     # Finish.
+    if reconfigure:
+        reconfigure.stop()
+    supervisor.stop()
     blink_sensors.stop()
     sink.close()
 
@@ -151,42 +222,41 @@ def finalize(channels, info_config):
 
     # Turn off the sensors.
     if info_config:
-        if info_config['pin_power']:
-            print('pin_power off')
-            dht22._digitalWrite(info_config['pin_power'], False)
+        for g in power.groups_from_config(info_config):
+            print('pin_power off: %d' % g.pin_power)
+            g.off()
 
     # Done.
 
 ##################################################
 
 
-def power_cycle(channels, info_config, time_off=30):
+def startup_reporter():
     """
-    Power cycle all conected sensors.
-
-    time_off: sleep time in seconds.
+    Return a channel observer that prints the import profile and the time from startup to the
+    first good sensor read, once.
     """
+    lock = threading.Lock()
+    done = []
 
-    if not info_config['pin_power']:
-        # Nothing to do.
-        pass
-    else:
-        # Do it.
-        sensors.pause_channels(channels)
-
-        time.sleep(0.01)
-        dht22._digitalWrite(info_config['pin_power'], False)
+    def observer(pin, time_read, ok, msg=None, duration=None):
+        if not ok or done:
+            return
 
-        time.sleep(time_off)
+        with lock:
+            if done:
+                return
+            done.append(pin)
 
-        dht22._digitalWrite(info_config['pin_power'], True)
-        time.sleep(0.01)
+        time_first = time.time() - lazy.time_zero
+        lazy.import_profiler.stop()
 
-        sensors.unpause_channels(channels)
+        print()
+        print(lazy.import_profiler.report())
+        print('First good read: pin %d, %.2f s after startup' % (pin, time_first))
+        print()
 
-    # Done.
-
-##################################################
+    return observer
 
 
 def main():
@@ -204,10 +274,29 @@ def main():
                         # help='Record data from DHT22 sensors.')
     parser.add_argument('-C', '--config_file', default=None,
                         help='Config file name.')
+    parser.add_argument('-P', '--profile', default=None, nargs='*', metavar='STAGE',
+                        help='Time pipeline stages (read, queue, collect, upload, ...), all if '
+                             'none listed.  SIGUSR1 toggles profiling, SIGUSR2 writes results.')
+    parser.add_argument('-M', '--multiprocess', default=False, action='store_true',
+                        help='Read sensors in a separate high-priority process.')
+    parser.add_argument('--profile-startup', default=False, action='store_true',
+                        help='Report import time per module and time to first good sensor '
+                             'read.')
 
     # Parse command line input, do the work.
     args = parser.parse_args()
 
+    observers = []
+    if args.profile_startup:
+        # Already running when started through startup.py, which covers the imports above.
+        lazy.import_profiler.start()
+        observers.append(startup_reporter())
+
+    # Profiling can be switched on later by signal, even if not requested now.
+    profiling.install_signal_handlers()
+    if args.profile is not None:
+        profiling.enable(*args.profile)
+
     # Config file.
     if not args.config_file:
         args.config_file = 'config_data.yml'
@@ -215,6 +304,9 @@ def main():
     f = os.path.join(path_to_module(), args.config_file)
     info_master, meta = io.read(f)
 
+    # Talk to Google, or to a local stand-in if the config says so.
+    session.configure(info_master)
+
     power_cycle_interval = 15*60  # seconds
 
     #############################################
@@ -224,29 +316,45 @@ def main():
     try:
         # Get config data from master table.
         print('Fetch master table config data')
-        info_config = master_table.get(info_master)
+        info_table = master_table.get_cached(info_master)
 
-        # Convert some string values to integers.
-        pins_data = info_config['pins_data']
-        pins_data = pins_data.split(',')
-        pins_data = [int(pin) for pin in pins_data]
+        # Master table config with local options applied.
+        info_config = config_service.station_config(info_master, info_table)
 
-        info_config['pins_data'] = pins_data
+        # Metrics endpoint and periodic summary.
+        if info_master.get('metrics_port'):
+            print('Serve metrics on port %d' % int(info_master['metrics_port']))
+            metrics.serve(port=int(info_master['metrics_port']))
 
-        info_config['pin_ok'] = int(info_config['pin_ok'])
-        info_config['pin_err'] = int(info_config['pin_error'])
-        info_config['pin_power'] = int(info_config['pin_power'])
+        if info_master.get('metrics_log_interval'):
+            time_interval = float(info_master['metrics_log_interval'])
+            metrics.Summary_Logger(time_interval=time_interval).start()
 
         # Initialize stuff.
         print('Initialize sensors')
-        channels, queue = initialize_sensors(info_config)
+        channels, queue = initialize_sensors(info_config, multiprocess=args.multiprocess,
+                                             observers=observers)
 
         print('Initialize upload data API')
         service, tableId = initialize_upload(info_config)
 
+        # Watch local file and master table for config changes.  Channels running in the
+        # acquisition process can't be changed from here.
+        reconfigure = None
+        time_check = float(info_master.get('config_check_interval', 10.))
+        if time_check and not args.multiprocess:
+            source = config_service.Config_Source(f, info_master)
+            observers_all = [metrics.get_metrics().observe_read] + observers
+            reconfigure = config_service.Config_Service(channels, queue, dict(info_config),
+                                                        source.load,
+                                                        monitor=channels[0].monitor,
+                                                        observers=observers_all,
+                                                        time_check=time_check, verbose=True)
+
         # Start recording data.
         print('Begin recording: %s' % info_config['pins_data'])
-        record_data(channels, queue, service, tableId, info_config, power_cycle_interval)
+        record_data(channels, queue, service, tableId, info_config, power_cycle_interval,
+                    reconfigure=reconfigure)
 
     except KeyboardInterrupt:
         # Stop it all when user hits ctrl-C.
@@ -262,6 +370,10 @@ def main():
     print('Stop recording')
     finalize(channels, info_config)
 
+    if args.profile is not None:
+        for fname in profiling.dump():
+            print('Profile written: %s' % fname)
+
     # Done.
     print('Done.')
 
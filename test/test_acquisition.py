@@ -0,0 +1,90 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import multiprocessing
+import unittest
+
+from context import sensor_monitor
+import sensor_monitor.acquisition
+
+acquisition = sensor_monitor.acquisition
+
+
+def produce(ring, num):
+    for k in range(num):
+        kind = 'outlier' if k == 5 else 'sample'
+        ring.put_sample({'kind': kind, 'seconds': 1000. + k, 'pin': 4, 'RH': 50., 'Tf': 70. + k})
+
+
+class Test_Ring_Buffer(unittest.TestCase):
+
+    def setUp(self):
+        self.ring = acquisition.Ring_Buffer(capacity=4, width=2)
+
+    def tearDown(self):
+        pass
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(acquisition, 'Acquisition'))
+        self.assertTrue(hasattr(acquisition, 'Sample_Ring'))
+
+    def test_put_get(self):
+        for k in range(3):
+            self.assertTrue(self.ring.put([k, 10*k]))
+
+        self.assertTrue(self.ring.qsize() == 3)
+
+        rows = self.ring.get_rows(2)
+        self.assertTrue(rows.tolist() == [[0., 0.], [1., 10.]])
+
+        rows = self.ring.get_rows()
+        self.assertTrue(rows.tolist() == [[2., 20.]])
+        self.assertTrue(self.ring.empty())
+
+    def test_wrap_and_drop(self):
+        for k in range(6):
+            self.ring.put([k, k])
+
+        self.assertTrue(self.ring.count_dropped == 2)
+        self.assertTrue(self.ring.get_rows()[:, 0].tolist() == [0., 1., 2., 3.])
+
+        for k in range(3):
+            self.ring.put([10 + k, 0])
+        self.assertTrue(self.ring.get_rows()[:, 0].tolist() == [10., 11., 12.])
+
+
+class Test_Sample_Ring(unittest.TestCase):
+
+    def test_across_process(self):
+        ring = acquisition.Sample_Ring(capacity=100)
+
+        p = multiprocessing.Process(target=produce, args=(ring, 10))
+        p.start()
+        p.join()
+
+        samples = []
+        while not ring.empty():
+            samples.append(ring.get())
+
+        self.assertTrue(len(samples) == 10)
+        self.assertTrue(samples[3] == {'kind': 'sample', 'pin': 4, 'RH': 50., 'Tf': 73.,
+                                       'seconds': 1003.})
+
+        # Flagged samples keep their kind.
+        self.assertTrue(samples[5]['kind'] == 'outlier')
+        self.assertTrue(sum(s['kind'] == 'outlier' for s in samples) == 1)
+
+    def test_unknown_kind(self):
+        ring = acquisition.Sample_Ring(capacity=4)
+
+        with self.assertRaises(ValueError):
+            ring.put_sample({'kind': 'bogus', 'seconds': 1000., 'pin': 4, 'RH': 50., 'Tf': 70.})
+
+    def test_reason_code(self):
+        code = acquisition._reason_code('Fail checksum')
+        self.assertTrue(acquisition._REASONS[code] == 'checksum')
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,59 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import unittest
+
+from context import sensor_monitor
+import sensor_monitor.benchmark
+
+
+class Test_Benchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = sensor_monitor.benchmark.Simulated_Backend(rate_success=0.5, seed=1)
+
+    def tearDown(self):
+        pass
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(sensor_monitor.benchmark, 'run'))
+        self.assertTrue(hasattr(sensor_monitor.benchmark, 'compare'))
+        self.assertTrue(hasattr(sensor_monitor.benchmark, 'Hardware_Backend'))
+
+    def test_dht22_simulated(self):
+        results = sensor_monitor.benchmark.case_dht22(self.backend, [4, 17], num_reads=10,
+                                                      time_wait=0.)
+        info = results['4']
+        self.assertTrue(0. <= info['success_rate'] <= 1.)
+        self.assertTrue(info['duration']['count'] == 10)
+        self.assertTrue(sum(info['failures'].values()) == 10 - info['success_rate']*10)
+
+    def test_summarize(self):
+        info = sensor_monitor.benchmark.summarize(range(101))
+        self.assertTrue(info['count'] == 101)
+        self.assertTrue(info['p50'] == 50.)
+        self.assertTrue(info['max'] == 100.)
+
+    def test_failure_reason(self):
+        failure_reason = sensor_monitor.benchmark.failure_reason
+        self.assertTrue(failure_reason('Fail checksum') == 'checksum')
+        self.assertTrue(failure_reason('Fail len(bits) != 40 [12]') == 'length')
+        self.assertTrue(failure_reason('Problem reading data from sensor.  count: 0, pin: 4, '
+                                       'bit: -2') == 'timeout_2')
+
+    def test_run_simulated(self):
+        results = sensor_monitor.benchmark.run(self.backend, num_samples=100, with_load=False)
+
+        cases = results['cases']
+        self.assertTrue(results['meta']['backend'] == 'simulated')
+        self.assertTrue(cases['read_latency']['count'] == 100)
+        self.assertTrue('idle' in cases['loop_jitter'])
+
+        changes = sensor_monitor.benchmark.compare(results, results)
+        self.assertTrue(len(changes) > 0)
+        self.assertTrue(all(delta == 0. for name, a, b, delta in changes))
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
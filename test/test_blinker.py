@@ -0,0 +1,101 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import time
+import unittest
+
+from context import sensor_monitor
+import sensor_monitor.blinker
+
+
+class Recorder(object):
+    def __init__(self):
+        self.writes = []
+        self.pins = []
+
+    def write_many(self, pins, values):
+        self.writes.append((time.time(), list(pins), list(values)))
+
+    def pin_mode(self, pin):
+        self.pins.append(pin)
+
+    def levels(self, pin):
+        return [v for t, pins, values in self.writes for p, v in zip(pins, values) if p == pin]
+
+
+class Test_Blinker(unittest.TestCase):
+
+    def setUp(self):
+        self.recorder = Recorder()
+        self.wheel = sensor_monitor.blinker.Timer_Wheel(write_many=self.recorder.write_many,
+                                                        pin_mode=self.recorder.pin_mode)
+        self.wheel.start()
+
+    def tearDown(self):
+        self.wheel.stop()
+        self.wheel.join()
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(sensor_monitor.blinker, 'Blinker'))
+        self.assertTrue(hasattr(sensor_monitor.blinker, 'Timer_Wheel'))
+
+    def test_make_segments(self):
+        make_segments = sensor_monitor.blinker.make_segments
+
+        self.assertTrue(make_segments(0) == [(0, None)])
+        self.assertTrue(make_segments(2, duty=1.) == [(1, None)])
+        self.assertTrue(make_segments(4, duty=0.25) == [(1, 0.125), (0, 0.375)])
+
+        segments = make_segments(10, burst=3, pause=1.)
+        self.assertTrue(len(segments) == 6)
+        self.assertTrue(segments[-1] == (0, 0.1 + 1.))
+
+    def test_blink(self):
+        led = sensor_monitor.blinker.Blinker(18, freq=40, wheel=self.wheel)
+        time.sleep(0.22)
+        led.stop()
+        time.sleep(0.05)
+
+        levels = self.recorder.levels(18)
+        self.assertTrue(self.recorder.pins == [18])
+        self.assertTrue(7 <= len(levels) <= 11)
+        self.assertTrue(levels[:4] == [1, 0, 1, 0])
+        self.assertTrue(levels[-1] == 0)
+
+    def test_steady(self):
+        led = sensor_monitor.blinker.Blinker(23, freq=0, wheel=self.wheel)
+        time.sleep(0.05)
+        self.assertTrue(self.recorder.levels(23) == [0])
+
+        led.frequency = 0
+        time.sleep(0.05)
+        self.assertTrue(self.recorder.levels(23) == [0])
+
+    def test_shared_write(self):
+        wheel = sensor_monitor.blinker.Timer_Wheel(tolerance=0.01,
+                                                   write_many=self.recorder.write_many,
+                                                   pin_mode=self.recorder.pin_mode)
+        leds = [sensor_monitor.blinker.Blinker(pin, freq=5, wheel=wheel) for pin in [4, 17, 27]]
+
+        wheel.start()
+        time.sleep(0.05)
+        wheel.stop()
+        wheel.join()
+
+        t, pins, values = self.recorder.writes[0]
+        self.assertTrue(len(self.recorder.writes) == 1)
+        self.assertTrue(sorted(pins) == [4, 17, 27])
+        self.assertTrue(values == [1, 1, 1])
+
+    def test_no_pin(self):
+        led = sensor_monitor.blinker.Blinker(None)
+        led.frequency = 10
+        led.stop()
+
+        self.assertTrue(led.wheel is None)
+        self.assertTrue(led.frequency == 10)
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,135 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from context import sensor_monitor
+import sensor_monitor.codec
+
+codec = sensor_monitor.codec
+
+
+def make_columns(num, pins=(4, 17, 18), seed=1):
+    np.random.seed(seed)
+
+    seconds = 1.38e9 + np.cumsum(np.random.choice([5., 5., 5., 5.01, 4.99, 7.5], num))
+    pins = np.random.choice(pins, num).astype(np.int32)
+
+    # Slowly varying values at the sensor resolution.
+    RH = np.round(50. + np.cumsum(np.random.choice([-0.1, 0., 0., 0.1], num)), 1)
+    Tf = np.round((20. + np.cumsum(np.random.choice([-0.1, 0., 0.1], num)))*1.8 + 32., 2)
+
+    kind = [str('sample') if k % 50 else str('outlier') for k in range(num)]
+
+    return {'seconds': seconds, 'pin': pins, 'RH': RH, 'Tf': Tf, 'kind': kind}
+
+
+class Test_Codec(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def check_equal(self, a, b):
+        self.assertTrue(np.allclose(a['seconds'], b['seconds'], rtol=0, atol=1.e-6))
+        self.assertTrue(np.all(a['pin'] == b['pin']))
+        self.assertTrue(np.allclose(a['RH'], b['RH'], rtol=0, atol=1.e-9))
+        self.assertTrue(np.allclose(a['Tf'], b['Tf'], rtol=0, atol=1.e-9))
+        if 'kind' in a:
+            self.assertTrue(list(a['kind']) == list(b['kind']))
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(codec, 'encode_block'))
+        self.assertTrue(hasattr(codec, 'Reader'))
+
+    def test_zigzag_pack(self):
+        values = np.array([0, -1, 1, -2, 2, 1000, -70000, 2**40], dtype=np.int64)
+        u = codec.zigzag(values)
+        self.assertTrue(np.all(codec.unzigzag(u) == values))
+
+        data = b'xx' + codec.pack(u)
+        result, offset = codec.unpack(data, 2, values.size)
+        self.assertTrue(np.all(result == u))
+        self.assertTrue(offset == len(data))
+
+    def test_round_trip(self):
+        columns = make_columns(5000)
+        result = codec.decode_block(codec.encode_block(columns))
+        self.check_equal(columns, result)
+
+    def test_round_trip_small(self):
+        for num in [1, 2, 3]:
+            columns = make_columns(num)
+            result = codec.decode_block(codec.encode_block(columns))
+            self.check_equal(columns, result)
+
+        columns = make_columns(100)
+        del columns['kind']
+        result = codec.decode_block(codec.encode_block(columns))
+        self.assertTrue('kind' not in result)
+        self.check_equal(columns, result)
+
+    def test_size(self):
+        columns = make_columns(5000)
+        del columns['kind']
+
+        # Same rows as written to the upload spool.
+        text = ''.join('2013-10-11 00:00:00,%.2f,sample,%d,%.2f,%.2f\n' % row for row in
+                       zip(columns['seconds'], columns['pin'], columns['Tf'], columns['RH']))
+        block = codec.encode_block(columns)
+
+        self.assertTrue(len(block)*10 < len(text))
+
+    def test_reject_nan(self):
+        columns = make_columns(10)
+        columns['RH'][3] = np.nan
+        self.assertRaises(ValueError, codec.encode_block, columns)
+
+    def test_file_random_access(self):
+        fname = os.path.join(self.path, 'data.tsc')
+        columns = make_columns(10000)
+
+        codec.write(fname, columns, rows_block=1000)
+        more = make_columns(500, seed=2)
+        more['seconds'] += columns['seconds'][-1] - more['seconds'][0] + 5.
+        codec.append(fname, more, rows_block=1000)
+
+        reader = codec.Reader(fname)
+        self.assertTrue(len(reader) == 11)
+        self.assertTrue(reader.num_rows == 10500)
+
+        block = reader.read_block(3)
+        self.assertTrue(np.all(block['seconds'] == columns['seconds'][3000:4000]))
+
+        t0 = columns['seconds'][2500]
+        t1 = columns['seconds'][4500]
+        self.assertTrue(reader.blocks_between(t0, t1) == [2, 3, 4])
+
+        part = reader.read(t0, t1)
+        self.assertTrue(part['seconds'].size == 2000)
+        self.assertTrue(part['kind'] == columns['kind'][2500:4500])
+
+    def test_truncated_block_ignored(self):
+        fname = os.path.join(self.path, 'data.tsc')
+        codec.write(fname, make_columns(3000), rows_block=1000)
+
+        with open(fname, 'rb') as fi:
+            data = fi.read()
+        with open(fname, 'wb') as fo:
+            fo.write(data[:-10])
+
+        reader = codec.Reader(fname)
+        self.assertTrue(len(reader) == 2)
+        self.assertTrue(reader.read()['seconds'].size == 2000)
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
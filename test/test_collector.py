@@ -0,0 +1,189 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from context import sensor_monitor
+import sensor_monitor.collector
+import sensor_monitor.session
+import sensor_monitor.standin
+import sensor_monitor.upload
+
+collector = sensor_monitor.collector
+session = sensor_monitor.session
+standin = sensor_monitor.standin
+upload = sensor_monitor.upload
+
+
+def make_columns(seconds_start, num, pins=(4, 17)):
+    seconds = seconds_start + np.arange(num) * 5.
+    return {'seconds': seconds,
+            'pin': np.array([pins[k % len(pins)] for k in range(num)], dtype=np.int32),
+            'RH': np.round(50. + np.sin(seconds / 600.), 2),
+            'Tf': np.round(70. + np.cos(seconds / 600.), 2),
+            'kind': ['sample'] * num}
+
+
+class Test_Collector(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.collector = collector.Collector(self.path)
+        self.server = collector.serve(self.collector, port=0, host='localhost', background=True)
+        self.port = self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.path)
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(collector, 'Collector'))
+        self.assertTrue(hasattr(collector, 'Station_Client'))
+        self.assertTrue(hasattr(collector, 'collector_uploader'))
+
+    def test_dedupe(self):
+        dedupe = collector.Dedupe()
+        mask = dedupe.check('a', [4, 4, 17, 4], [10., 15., 10., 10.])
+        self.assertTrue(list(mask) == [True, True, True, False])
+
+        mask = dedupe.check('a', [4, 17], [15., 20.])
+        self.assertTrue(list(mask) == [False, True])
+
+        mask = dedupe.check('b', [4], [10.])
+        self.assertTrue(list(mask) == [True])
+
+    def test_send_and_query(self):
+        # Batch spans a day boundary, US/Pacific.
+        seconds_start = 1393660800. - 300.
+        columns = make_columns(seconds_start, 200)
+
+        client = collector.Station_Client('localhost', self.port, 'attic')
+        num_new, num_dup = client.send(columns)
+        self.assertTrue(num_new == 200 and num_dup == 0)
+
+        # Resend overlapping batch, as after a lost acknowledgement.
+        more = make_columns(seconds_start + 500., 200)
+        num_new, num_dup = client.send(more)
+        self.assertTrue(num_new == 100 and num_dup == 100)
+
+        client.close()
+
+        other = collector.Station_Client('localhost', self.port, 'basement')
+        other.send(columns)
+        other.close()
+
+        result = self.collector.query()
+        self.assertTrue(sorted(result) == ['attic', 'basement'])
+        self.assertTrue(len(result['attic']['seconds']) == 300)
+        self.assertTrue(np.allclose(np.sort(result['attic']['seconds'])[:200],
+                                    columns['seconds']))
+
+        files = self.collector.files_between('attic')
+        self.assertTrue(len(files) == 2)
+
+        part = self.collector.query(seconds_start, seconds_start + 100., ['attic'])
+        self.assertTrue(len(part['attic']['seconds']) == 20)
+
+    def test_restart_dedupe(self):
+        columns = make_columns(1393660800., 50)
+
+        client = collector.Station_Client('localhost', self.port, 'attic')
+        client.send(columns)
+        client.close()
+
+        # Fresh collector over the same archive recognizes the resent batch.
+        again = collector.Collector(self.path)
+        num_new, num_dup = again.accept('attic', columns)
+        self.assertTrue(num_new == 0 and num_dup == 50)
+
+    def test_store_failure(self):
+        path = tempfile.mkdtemp()
+        columns = make_columns(1393660800., 50)
+
+        def archive_fails(station, columns):
+            raise IOError('disk full')
+
+        site = collector.Collector(path, service=object(), table_name='site')
+        site.archive = archive_fails
+
+        with self.assertRaises(IOError):
+            site.accept('attic', columns)
+
+        # Spooled before archiving, nothing is lost.
+        self.assertTrue(site.spool_station('attic').num_rows == 50)
+
+        # Resend after a restart is new, gets archived.
+        again = collector.Collector(path, service=object(), table_name='site')
+        num_new, num_dup = again.accept('attic', columns)
+        self.assertTrue(num_new == 50 and num_dup == 0)
+        self.assertTrue(len(again.query()['attic']['seconds']) == 50)
+
+        # Resend without a restart is new as well.
+        site = collector.Collector(tempfile.mkdtemp(dir=path), service=object(), table_name='site')
+        site.archive = archive_fails
+        with self.assertRaises(IOError):
+            site.accept('attic', columns)
+
+        del site.archive
+        num_new, num_dup = site.accept('attic', columns)
+        self.assertTrue(num_new == 50)
+
+        shutil.rmtree(path)
+
+    def test_forward(self):
+        stand_in = standin.Stand_In()
+        server = standin.serve(port=0, stand_in=stand_in, background=True)
+        host, port = server.server_address[:2]
+
+        session.reset_session()
+        session.configure({'service_url': 'http://{:s}:{:d}'.format(host, port)})
+
+        try:
+            path = tempfile.mkdtemp()
+            service = upload.connect_service()
+            site = collector.Collector(path, service, 'site', rows_bulk_min=1)
+
+            site.accept('attic', make_columns(1393660800., 30))
+            site.accept('basement', make_columns(1393660800., 20))
+            self.assertTrue(site.num_spooled == 50)
+
+            self.assertTrue(site.forward() == 50)
+            self.assertTrue(site.num_spooled == 0)
+
+            # One table per station.
+            names = dict((t.name, len(t.rows)) for t in stand_in.tables.values())
+            self.assertTrue(names == {'site_attic': 30, 'site_basement': 20})
+
+            # Spools found again after a restart.
+            site.accept('attic', make_columns(1393670000., 10))
+            again = collector.Collector(path, service, 'site', rows_bulk_min=1)
+            self.assertTrue(again.num_spooled == 10)
+            self.assertTrue(again.forward() == 10)
+            self.assertTrue(len(stand_in.tables) == 2)
+
+            shutil.rmtree(path)
+
+        finally:
+            session.reset_session()
+            server.shutdown()
+            server.server_close()
+
+    def test_bad_block(self):
+        client = collector.Station_Client('localhost', self.port, 'attic')
+        with self.assertRaises(collector.Collector_Error):
+            client.send_block(b'garbage')
+
+        # Connection still usable.
+        num_new, num_dup = client.send(make_columns(1393660800., 10))
+        self.assertTrue(num_new == 10)
+        client.close()
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
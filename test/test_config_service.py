@@ -0,0 +1,221 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import time
+import Queue
+import threading
+import unittest
+
+from context import sensor_monitor
+import sensor_monitor.config_service
+import sensor_monitor.health
+import sensor_monitor.power
+import sensor_monitor.sensors
+
+config_service = sensor_monitor.config_service
+health = sensor_monitor.health
+power = sensor_monitor.power
+sensors = sensor_monitor.sensors
+
+
+class Fake_Channel(sensors.Channel_Base):
+    def __init__(self, pin, time_wait=0.01):
+        """
+        Good reading every time_wait seconds, no sensor required.
+        """
+        super(Fake_Channel, self).__init__()
+        self.pin = pin
+        self.time_wait = time_wait
+
+    def run(self):
+        while self.is_running:
+            time_read = time.time()
+            self.notify(time_read, True)
+            yield time_read, 50., 70.
+
+            self.sleep(self.time_wait)
+
+
+def make_fake(pin, time_wait, outliers):
+    channel = Fake_Channel(pin, time_wait)
+    if outliers:
+        channel = sensors.Channel_Filter_Outlier(channel, policy=outliers)
+
+    return channel
+
+
+def drain(queue):
+    samples = []
+    while not queue.empty():
+        samples.append(queue.get())
+
+    return samples
+
+
+class Test_Config_Service(unittest.TestCase):
+
+    def setUp(self):
+        self.info = {'pins_data': [4, 17], 'pin_power': 22, 'time_wait': 0.01,
+                     'experiment_name': 'test'}
+
+        self.queue = Queue.Queue()
+        self.monitor = health.Health_Monitor(time_powering=0.)
+        self.channels = []
+        for pin in self.info['pins_data']:
+            c = sensors.Channel_Runner(make_fake(pin, 0.01, None), self.queue,
+                                       monitor=self.monitor)
+            c.start()
+            self.channels.append(c)
+
+        self.service = config_service.Config_Service(self.channels, self.queue, dict(self.info),
+                                                     load=lambda: self.info_new,
+                                                     monitor=self.monitor,
+                                                     make_channel=make_fake)
+
+    def tearDown(self):
+        sensors.stop_channels(self.channels)
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(config_service, 'Config_Service'))
+        self.assertTrue(hasattr(config_service, 'station_config'))
+
+    def test_station_config(self):
+        info_table = {'pins_data': '4,17, 18', 'pin_ok': '5', 'pin_error': '6',
+                      'pin_power': '22', 'experiment_name': 'test'}
+        info_master = {'master_table_id': 'abc', 'outliers': 'drop', 'time_wait': 2}
+
+        info = config_service.station_config(info_master, info_table)
+        self.assertTrue(info['pins_data'] == [4, 17, 18])
+        self.assertTrue(info['pin_err'] == 6)
+        self.assertTrue(info['outliers'] == 'drop')
+        self.assertTrue(info['time_wait'] == 2.)
+        self.assertTrue('master_table_id' not in info)
+
+    def test_diff(self):
+        info_new = dict(self.info, pins_data=[17, 18], time_wait=2., experiment_name='other')
+        changes = config_service.diff(self.info, info_new)
+
+        self.assertTrue(changes['pins_added'] == [18])
+        self.assertTrue(changes['pins_removed'] == [4])
+        self.assertTrue(changes['time_wait'] == 2.)
+        self.assertFalse(changes['outliers'])
+        self.assertTrue(changes['power'])
+        self.assertTrue(changes['restart'] == ['experiment_name'])
+
+        changes = config_service.diff(self.info, dict(self.info))
+        self.assertFalse(config_service.has_changes(changes))
+
+    def test_unchanged(self):
+        self.info_new = dict(self.info)
+        self.assertTrue(self.service.check() is None)
+        self.assertTrue(self.service.count_changes == 0)
+
+    def test_add_remove(self):
+        time.sleep(0.1)
+        channel_17 = self.service.find(17)
+
+        self.info_new = dict(self.info, pins_data=[17, 18])
+        changes = self.service.check()
+        self.assertTrue(changes['pins_added'] == [18])
+        self.assertTrue(changes['pins_removed'] == [4])
+
+        # Unaffected channel kept running.
+        self.assertTrue(self.service.find(17) is channel_17)
+        self.assertTrue(channel_17.is_alive())
+
+        self.assertTrue(sorted(c.pin for c in self.channels) == [17, 18])
+        self.assertTrue(sorted(self.monitor.channels) == [17, 18])
+
+        time.sleep(0.1)
+        pins = set(s['pin'] for s in drain(self.queue))
+        self.assertTrue(pins == set([4, 17, 18]))
+
+        # Removed channel sends nothing more.
+        time.sleep(0.1)
+        pins = set(s['pin'] for s in drain(self.queue))
+        self.assertTrue(pins == set([17, 18]))
+
+    def test_time_wait(self):
+        self.info_new = dict(self.info, time_wait=0.5)
+        changes = self.service.check()
+        self.assertTrue(changes['time_wait'] == 0.5)
+
+        channels = list(self.channels)
+        self.assertTrue(all(c.time_wait == 0.5 for c in channels))
+        self.assertTrue(all(c.is_alive() for c in channels))
+
+        # Slower polling.
+        time.sleep(0.1)
+        drain(self.queue)
+        time.sleep(0.3)
+        self.assertTrue(len(drain(self.queue)) <= 2)
+
+    def test_outliers(self):
+        self.info_new = dict(self.info, outliers='flag')
+        changes = self.service.check()
+        self.assertTrue(changes['outliers'])
+
+        self.assertTrue(len(self.channels) == 2)
+        self.assertTrue(all(isinstance(c.channel, sensors.Channel_Filter_Outlier)
+                            for c in self.channels))
+
+    def test_power_groups(self):
+        writes = []
+        write = lambda pin, value: writes.append((pin, value))
+
+        groups = power.groups_from_config({'power_groups': '22:4,17'}, write=write)
+        supervisor = power.Power_Supervisor(groups, self.channels, self.monitor)
+
+        groups_new = power.groups_from_config({'power_groups': '22:4;27:17,23'}, write=write)
+        groups_new[1].setup = lambda: None
+        supervisor.update_groups(groups_new)
+
+        self.assertTrue(supervisor.groups[0] is groups[0])
+        self.assertTrue(supervisor.groups[0].pins_data == [4])
+        self.assertTrue(supervisor.groups[1].pins_data == [17, 23])
+        self.assertTrue(writes == [(27, True)])
+        self.assertTrue(27 in supervisor.time_cycle_wait)
+
+    def test_power_cycle(self):
+        writes = []
+        write = lambda pin, value: writes.append((pin, value))
+
+        info = dict(self.info, power_groups='22:4,17,18')
+        groups = power.groups_from_config(info, write=write)
+        supervisor = power.Power_Supervisor(groups, self.channels, self.monitor, time_off=0.3)
+        self.service.supervisor = supervisor
+        self.service.info_config = info
+
+        cycle = threading.Thread(target=supervisor.cycle, args=(groups[0],))
+        cycle.start()
+        time.sleep(0.1)
+
+        # Channel added while its group is off starts paused.
+        self.info_new = dict(info, pins_data=[4, 17, 18])
+        self.service.check()
+        self.assertTrue(self.service.find(18).is_paused)
+
+        cycle.join()
+        self.assertTrue(writes == [(22, False), (22, True)])
+        self.assertTrue(not any(c.is_paused for c in self.channels))
+
+    def test_shared_lock(self):
+        groups = power.groups_from_config(self.info, write=lambda pin, value: None)
+        supervisor = power.Power_Supervisor(groups, self.channels, self.monitor)
+        self.service.supervisor = supervisor
+
+        self.info_new = dict(self.info, pins_data=[4, 17, 18])
+        reload = threading.Thread(target=self.service.check)
+
+        with supervisor.lock:
+            reload.start()
+            time.sleep(0.1)
+            self.assertTrue(self.service.find(18) is None)
+
+        reload.join()
+        self.assertTrue(self.service.find(18) is not None)
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,93 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import unittest
+
+import numpy as np
+
+from context import sensor_monitor
+import sensor_monitor.derived
+import sensor_monitor.upload
+
+derived = sensor_monitor.derived
+upload = sensor_monitor.upload
+
+
+def make_samples(num, pins=(4, 17)):
+    return [{'kind': 'sample', 'pin': pins[k % len(pins)], 'seconds': 1393660800. + k,
+             'Tf': 60. + k, 'RH': 40. + k % 7} for k in range(num)]
+
+
+class Test_Derived(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(derived, 'compute'))
+        self.assertTrue(hasattr(derived, 'stage'))
+
+    def test_reference_values(self):
+        # 70 F, 50 %: dew point 50.5 F, 9.2 g/m3, 1.25 kPa.
+        self.assertTrue(abs(derived.dew_point(70., 50.) - 50.5) < 0.2)
+        self.assertTrue(abs(derived.absolute_humidity(70., 50.) - 9.2) < 0.1)
+        self.assertTrue(abs(derived.vapor_pressure_deficit(70., 50.) - 1.25) < 0.02)
+
+        # Saturated air: dew point equals temperature, no deficit.
+        self.assertTrue(abs(derived.dew_point(60., 100.) - 60.) < 1.e-6)
+        self.assertTrue(abs(derived.vapor_pressure_deficit(60., 100.)) < 1.e-9)
+
+        # NWS heat index table.
+        self.assertTrue(abs(derived.heat_index(90., 60.) - 100.) < 1.)
+        self.assertTrue(abs(derived.heat_index(100., 40.) - 109.) < 1.)
+        self.assertTrue(abs(derived.heat_index(70., 50.) - 69.1) < 0.5)
+
+        self.assertTrue(np.isnan(derived.dew_point(70., 0.)))
+
+    def test_vectorized(self):
+        Tf = np.linspace(30., 110., 50)
+        RH = np.linspace(5., 100., 50)
+
+        values = derived.compute(Tf, RH)
+        self.assertTrue(list(values) == derived.NAMES)
+
+        for n, v in values.items():
+            self.assertTrue(v.shape == Tf.shape)
+            for k in [0, 17, 49]:
+                self.assertTrue(np.allclose(v[k], derived.compute(Tf[k], RH[k], [n])[n]))
+
+    def test_parse_names(self):
+        self.assertTrue(derived.parse_names('Tdf, AH') == ['Tdf', 'AH'])
+        self.assertTrue(derived.parse_names(['VPD']) == ['VPD'])
+
+        with self.assertRaises(ValueError):
+            derived.parse_names('dew')
+
+    def test_latest(self):
+        result = derived.latest([4, 17, 4, 17, 4], {'x': [1., 2., 3., 4., 5.]})
+        self.assertTrue(result == {'x': {4: 5., 17: 4.}})
+
+    def test_stage(self):
+        batches = [make_samples(10), [], make_samples(3, pins=(18,))]
+        seen = []
+
+        result = list(derived.stage(iter(batches), ['Tdf'], observer=seen.append))
+
+        self.assertTrue(len(result) == 3)
+        self.assertTrue(result[0] == batches[0])
+        self.assertTrue(result[1] == [])
+        self.assertTrue(len(seen) == 2)
+        self.assertTrue(sorted(seen[0]['Tdf']) == [4, 17])
+
+        # Uploader reuses the columns built by the stage.
+        columns = upload.samples_to_columns(result[0])
+        self.assertTrue(columns is result[0].columns)
+        self.assertTrue(np.allclose(columns['Tf'], [s['Tf'] for s in batches[0]]))
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
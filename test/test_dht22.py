@@ -1,11 +1,14 @@
 
 from __future__ import division, print_function, unicode_literals
 
-# import os
+import os
 import time
+import mmap
+import struct
+import tempfile
 import unittest
 
-# import numpy as np
+import numpy as np
 
 from context import sensor_monitor
 
@@ -55,6 +58,70 @@ class Test_Basic_Read_Some_Data(unittest.TestCase):
 
         self.assertTrue(flag)
 
+class Test_Fast_Path(unittest.TestCase):
+    """
+    Register-mapped reads against a regular file standing in for the GPIO register block.
+    """
+    offset_level = 13*4
+
+    def setUp(self):
+        fd, self.fname = tempfile.mkstemp()
+        os.write(fd, b'\x00'*4096)
+        os.close(fd)
+
+        self.fo = open(self.fname, 'r+b')
+        self.registers = mmap.mmap(self.fo.fileno(), 4096)
+
+    def tearDown(self):
+        sensor_monitor.dht22.disable_fast_path()
+
+        self.registers.close()
+        self.fo.close()
+        os.remove(self.fname)
+
+    def set_levels(self, word):
+        self.registers[self.offset_level:self.offset_level + 4] = struct.pack(str('<I'), word)
+
+    def test_enable(self):
+        self.assertTrue(sensor_monitor.dht22.enable_fast_path(self.fname))
+        self.assertTrue(sensor_monitor.dht22.fast_path_enabled())
+
+        sensor_monitor.dht22.disable_fast_path()
+        self.assertFalse(sensor_monitor.dht22.fast_path_enabled())
+
+    def test_enable_fail(self):
+        self.assertFalse(sensor_monitor.dht22.enable_fast_path('/does/not/exist'))
+        self.assertFalse(sensor_monitor.dht22.fast_path_enabled())
+
+    def test_read_levels(self):
+        sensor_monitor.dht22.enable_fast_path(self.fname)
+
+        self.set_levels((1 << 4) | (1 << 25))
+        self.assertTrue(sensor_monitor.dht22._read_levels() == (1 << 4) | (1 << 25))
+        self.assertTrue(sensor_monitor.dht22._read_pin(4) == 1)
+        self.assertTrue(sensor_monitor.dht22._read_pin(17) == 0)
+        self.assertTrue(sensor_monitor.dht22._read_pin(25) == 1)
+
+        self.set_levels(0)
+        self.assertTrue(sensor_monitor.dht22._read_pin(4) == 0)
+
+    def test_decode_signal(self):
+        # Response pulse, then 40 bits: 0 is short HIGH, 1 is long HIGH.
+        bits = [0, 1]*20
+        signal = [1]*30 + [0]*80 + [1]*80
+        for b in bits:
+            signal += [0]*50 + ([1]*70 if b else [1]*26)
+        signal += [0]*50 + [1]*100
+
+        first, bits_decoded = sensor_monitor.dht22.decode_signal(signal)
+        self.assertTrue(first == 1)
+        self.assertTrue(list(bits_decoded) == bits)
+
+        # Same signal packed into level words for pin 17.
+        levels = np.asarray(signal, dtype=np.uint32) << 17
+        signal_17 = sensor_monitor.dht22.split_levels(levels, 17)
+        self.assertTrue(list(signal_17) == signal)
+
 # Standalone.
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -0,0 +1,162 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import time
+import threading
+import unittest
+
+import numpy as np
+import httplib2
+import apiclient.errors
+
+from context import sensor_monitor
+import sensor_monitor.download
+import sensor_monitor.errors
+
+download = sensor_monitor.download
+
+
+def query_range(query):
+    """
+    Time range of a window query, see download.window_query.
+    """
+    time_a = float(query.split('Seconds >= ')[1].split()[0])
+    time_b = float(query.split('AND Seconds ')[1].split()[1])
+
+    return time_a, time_b
+
+
+class Test_Download(unittest.TestCase):
+
+    def setUp(self):
+        self.fetch_columns = download.fetch_columns
+        self.build_service = download.build_service
+        self.rows_response_max = download._rows_response_max
+        download.build_service = lambda: None
+
+    def tearDown(self):
+        download.fetch_columns = self.fetch_columns
+        download.build_service = self.build_service
+        download._rows_response_max = self.rows_response_max
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(download, 'stream_between'))
+        self.assertTrue(hasattr(download, 'split_windows'))
+
+    def test_split_windows(self):
+        windows = download.split_windows(0., 25., 10.)
+        self.assertTrue(windows == [(0., 10.), (10., 20.), (20., 25.)])
+
+        self.assertTrue(download.split_windows(0., 20., 10.) == [(0., 10.), (10., 20.)])
+        self.assertTrue(download.split_windows(5., 5., 10.) == [])
+
+    def test_window_query(self):
+        query = download.window_query('abc', 0., 10.)
+        self.assertTrue('Seconds >= 0.00 AND Seconds < 10.00' in query)
+
+        query = download.window_query('abc', 10., 20., last=True)
+        self.assertTrue('Seconds >= 10.00 AND Seconds <= 20.00' in query)
+
+    def test_columns_from_rows(self):
+        names = ['Seconds', 'Pin', 'Kind']
+        rows = [[1.5, 4, 'sample'], [2.5, 17, 'outlier']]
+
+        columns = download.columns_from_rows(names, rows)
+        self.assertTrue(columns['Seconds'].dtype == np.float64)
+        self.assertTrue(columns['Pin'].dtype == np.uint8)
+        self.assertTrue(list(columns['Pin']) == [4, 17])
+        self.assertTrue(list(columns['Kind']) == ['sample', 'outlier'])
+
+        columns = download.columns_from_rows(names, [])
+        self.assertTrue(columns['Seconds'].size == 0)
+
+    def test_stream_order(self):
+        queries = []
+
+        def fetch(query, service=None, num_retry=None):
+            queries.append(query)
+            time_a = float(query.split('Seconds >= ')[1].split()[0])
+            return {'Seconds': np.array([time_a])}
+
+        download.fetch_columns = fetch
+
+        result = list(download.stream_between('abc', 0., 100., seconds_window=10.,
+                                              num_workers=3, num_pending_max=2))
+        self.assertTrue([c['Seconds'][0] for c in result] == list(np.arange(0., 100., 10.)))
+        self.assertTrue(sum('<= 100.00' in q for q in queries) == 1)
+
+    def test_worker_exit(self):
+        def fetch(query, service=None, num_retry=None):
+            raise SystemExit(2)
+
+        download.fetch_columns = fetch
+
+        with self.assertRaises(sensor_monitor.errors.Who8MyRPiError):
+            list(download.stream_between('abc', 0., 100., seconds_window=10.))
+
+    def test_close_early(self):
+        def fetch(query, service=None, num_retry=None):
+            time_a, time_b = query_range(query)
+            return {'Seconds': np.array([time_a])}
+
+        download.fetch_columns = fetch
+
+        count = threading.active_count()
+        stream = download.stream_between('abc', 0., 1000., seconds_window=10., num_workers=3,
+                                         num_pending_max=3)
+        next(stream)
+        time.sleep(0.05)
+        stream.close()
+
+        # Workers waiting for a slot are woken and exit.
+        time.sleep(0.05)
+        self.assertTrue(threading.active_count() == count)
+
+    def test_split_too_large(self):
+        content = b'{"error": {"message": "Response size is larger than 10 MB."}}'
+        queries = []
+
+        def fetch(query, service=None, num_retry=None):
+            queries.append(query)
+            time_a, time_b = query_range(query)
+            if time_b - time_a > 3.:
+                raise apiclient.errors.HttpError(httplib2.Response({'status': 400}), content)
+
+            return {'Seconds': np.arange(np.ceil(time_a), time_b)}
+
+        download.fetch_columns = fetch
+
+        result = list(download.stream_between('abc', 0., 20., seconds_window=10.))
+        seconds = np.concatenate([c['Seconds'] for c in result])
+
+        self.assertTrue(len(result) == 2)
+        self.assertTrue(list(seconds) == list(np.arange(0., 20.)))
+        self.assertTrue(len(queries) == 2 + 2*(2 + 4))
+
+    def test_split_row_limit(self):
+        download._rows_response_max = 5
+
+        def fetch(query, service=None, num_retry=None):
+            time_a, time_b = query_range(query)
+            last = '<=' in query
+            seconds = np.arange(np.ceil(time_a), np.floor(time_b) + 1)
+            return {'Seconds': seconds if last else seconds[seconds < time_b]}
+
+        download.fetch_columns = fetch
+
+        columns = download.fetch_window('abc', 0., 16., last=True)
+        self.assertTrue(list(columns['Seconds']) == list(np.arange(0., 17.)))
+
+    def test_split_other_error(self):
+        def fetch(query, service=None, num_retry=None):
+            raise apiclient.errors.HttpError(httplib2.Response({'status': 403}), b'{}')
+
+        download.fetch_columns = fetch
+
+        with self.assertRaises(apiclient.errors.HttpError):
+            download.fetch_window('abc', 0., 16.)
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
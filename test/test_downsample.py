@@ -0,0 +1,69 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import unittest
+
+import numpy as np
+
+from context import sensor_monitor
+import sensor_monitor.downsample
+
+downsample = sensor_monitor.downsample
+
+
+class Test_Points(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(1)
+
+    def tearDown(self):
+        pass
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(downsample, 'minmax'))
+        self.assertTrue(hasattr(downsample, 'lttb'))
+
+    def test_minmax_keeps_extremes(self):
+        x = np.arange(10000.)
+        y = np.random.normal(0, 1, x.size)
+        y[1234] = 50.
+        y[8765] = -50.
+
+        xd, yd = downsample.minmax(x, y, 100)
+
+        self.assertTrue(xd.size <= 200)
+        self.assertTrue(np.all(np.diff(xd) > 0))
+        self.assertTrue(yd.max() == 50. and yd.min() == -50.)
+
+        # Every bin contributes its own minimum and maximum.
+        for k in range(100):
+            chunk = y[k*100:(k + 1)*100]
+            self.assertTrue(chunk.min() in yd and chunk.max() in yd)
+
+    def test_minmax_short(self):
+        x = np.arange(10.)
+        xd, yd = downsample.minmax(x, x, 100)
+        self.assertTrue(np.all(xd == x))
+
+    def test_lttb(self):
+        x = np.arange(5000.)
+        y = np.sin(x / 500.)
+        y[2500] = 10.
+
+        xd, yd = downsample.lttb(x, y, 200)
+
+        self.assertTrue(xd.size == 200)
+        self.assertTrue(xd[0] == x[0] and xd[-1] == x[-1])
+        self.assertTrue(np.all(np.diff(xd) > 0))
+        self.assertTrue(10. in yd)
+
+    def test_choose_level(self):
+        self.assertTrue(downsample.choose_level(365*86400, 300) == '1d')
+        self.assertTrue(downsample.choose_level(365*86400, 1500) == '1h')
+        self.assertTrue(downsample.choose_level(7*86400, 500) == '15min')
+        self.assertTrue(downsample.choose_level(3600, 1500) is None)
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,233 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import os
+import time
+import struct
+import threading
+import collections
+import unittest
+
+from context import sensor_monitor
+import sensor_monitor.edge
+
+
+class Fake_Line(object):
+    """
+    Line object backed by a pipe.  Each byte written is one event at the current level.
+    """
+    def __init__(self):
+        self.fd_read, self.fd_write = os.pipe()
+
+    def fileno(self):
+        return self.fd_read
+
+    def read_events(self):
+        data = os.read(self.fd_read, 1024)
+        return [(time.time(), int(c)) for c in data.decode('ascii')]
+
+    def trigger(self, levels):
+        os.write(self.fd_write, ''.join(str(v) for v in levels).encode('ascii'))
+
+    def close(self):
+        os.close(self.fd_read)
+        os.close(self.fd_write)
+
+
+class Fifo_Line(object):
+    """
+    Line object with a kernel-like event buffer of limited depth.  Events pushed while the
+    buffer is full are dropped.
+    """
+    def __init__(self, depth=16):
+        self.depth = depth
+        self.buffer = collections.deque()
+        self.lock = threading.Lock()
+        self.count_dropped = 0
+
+        self.fd_read, self.fd_write = os.pipe()
+
+    def fileno(self):
+        return self.fd_read
+
+    def push(self, event):
+        with self.lock:
+            if len(self.buffer) >= self.depth:
+                self.count_dropped += 1
+                return
+
+            self.buffer.append(event)
+
+        os.write(self.fd_write, b'x')
+
+    def read_events(self):
+        os.read(self.fd_read, 1024)
+
+        with self.lock:
+            events = list(self.buffer)
+            self.buffer.clear()
+
+        return events
+
+    def close(self):
+        os.close(self.fd_read)
+        os.close(self.fd_write)
+
+
+class Remove_After_Release(object):
+    """
+    Lock that removes a pin from another thread right after the watcher thread first releases
+    it, e.g. between finding the ready line and reading from it.
+    """
+    def __init__(self, watcher, pin):
+        self.lock = threading.Lock()
+        self.watcher = watcher
+        self.pin = pin
+        self.done = False
+
+    def __enter__(self):
+        self.lock.acquire()
+
+    def __exit__(self, *args):
+        self.lock.release()
+
+        if not self.done and threading.current_thread() is self.watcher:
+            self.done = True
+            remover = threading.Thread(target=self.watcher.remove, args=(self.pin,))
+            remover.start()
+            remover.join()
+
+
+def dht22_edges(bits, time_zero=100.):
+    """
+    Edge times for a DHT22 transmission of the supplied bits, microsecond pulse widths.
+    """
+    events = []
+    t = time_zero
+
+    def pulse(level, width):
+        events.append((t, level))
+        return t + width*1.e-6
+
+    t = pulse(0, 80)
+    t = pulse(1, 80)
+    for b in bits:
+        t = pulse(0, 50)
+        t = pulse(1, 70 if b else 26)
+    t = pulse(0, 50)
+    t = pulse(1, 0)
+
+    return events
+
+
+class Test_Edge(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(sensor_monitor.edge, 'Edge_Watcher'))
+        self.assertTrue(hasattr(sensor_monitor.edge, 'decode_edges'))
+        self.assertTrue(hasattr(sensor_monitor.edge, 'capture_dht22'))
+
+    def test_decode_edges(self):
+        bits = [1, 0, 0, 1]*10
+        first, bits_decoded = sensor_monitor.edge.decode_edges(dht22_edges(bits))
+
+        self.assertTrue(first == 1)
+        self.assertTrue(bits_decoded == bits)
+
+    def test_decode_edges_empty(self):
+        first, msg = sensor_monitor.edge.decode_edges([])
+        self.assertTrue(first is None)
+
+    def test_v2_layout(self):
+        # Struct sizes from linux/gpio.h.
+        self.assertTrue(struct.calcsize(sensor_monitor.edge._fmt_v2_request) == 592)
+        self.assertTrue(struct.calcsize(sensor_monitor.edge._fmt_v2_config) == 272)
+        self.assertTrue(sensor_monitor.edge._size_v2_event == 48)
+
+    def test_drain_events(self):
+        bits = [1, 0, 1, 1]*10
+        edges = dht22_edges(bits)
+        self.assertTrue(len(edges) == 84)
+
+        line = Fifo_Line(depth=16)
+
+        def feed():
+            # Faster than the buffer can hold, slower than the reader.
+            for k, event in enumerate(edges):
+                line.push(event)
+                if k % 4 == 3:
+                    time.sleep(0.002)
+
+        feeder = threading.Thread(target=feed)
+        feeder.start()
+
+        events = sensor_monitor.edge.drain_events(line, 84, time_capture=5.)
+        feeder.join()
+        line.close()
+
+        self.assertTrue(line.count_dropped == 0)
+        self.assertTrue(events == edges)
+
+        first, bits_decoded = sensor_monitor.edge.decode_edges(events)
+        self.assertTrue(bits_decoded == bits)
+
+    def test_drain_events_timeout(self):
+        line = Fifo_Line()
+        line.push((100., 0))
+
+        time_start = time.time()
+        events = sensor_monitor.edge.drain_events(line, 84, time_capture=0.05)
+        line.close()
+
+        self.assertTrue(events == [(100., 0)])
+        self.assertTrue(time.time() - time_start < 1.)
+
+    def test_watcher(self):
+        received = []
+
+        line = Fake_Line()
+        watcher = sensor_monitor.edge.Edge_Watcher()
+        watcher.add_line(17, line, callback=received.append)
+        watcher.start()
+
+        line.trigger([1, 0, 1])
+        time.sleep(0.1)
+
+        watcher.stop()
+        watcher.join()
+
+        events = list(watcher.events(timeout=0.1))
+        self.assertTrue(len(events) == 3)
+        self.assertTrue([e.level for e in events] == [1, 0, 1])
+        self.assertTrue(all(e.pin == 17 for e in events))
+        self.assertTrue(len(received) == 3)
+        self.assertTrue(watcher.counts[17] == 3)
+
+    def test_remove_while_running(self):
+        line = Fake_Line()
+        watcher = sensor_monitor.edge.Edge_Watcher()
+        watcher.add_line(17, line)
+
+        watcher.lock = Remove_After_Release(watcher, 17)
+        watcher.start()
+
+        line.trigger([1, 0])
+        time.sleep(0.1)
+
+        self.assertTrue(watcher.lock.done)
+        self.assertTrue(watcher.is_alive())
+        self.assertTrue(watcher.counts[17] == 2)
+
+        watcher.stop()
+        watcher.join()
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
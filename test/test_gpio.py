@@ -0,0 +1,103 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import os
+import mmap
+import struct
+import tempfile
+import unittest
+
+import numpy as np
+
+from context import sensor_monitor
+import sensor_monitor.gpio
+
+
+class Test_Many_Fast_Path(unittest.TestCase):
+    """
+    Batched reads and writes against a regular file standing in for the GPIO register block.
+    """
+    offset_set = 7*4
+    offset_clear = 10*4
+    offset_level = 13*4
+
+    def setUp(self):
+        fd, self.fname = tempfile.mkstemp()
+        os.write(fd, b'\x00'*4096)
+        os.close(fd)
+
+        self.fo = open(self.fname, 'r+b')
+        self.registers = mmap.mmap(self.fo.fileno(), 4096)
+
+        self.assertTrue(sensor_monitor.gpio.enable_fast_path(self.fname))
+
+    def tearDown(self):
+        sensor_monitor.gpio.disable_fast_path()
+
+        self.registers.close()
+        self.fo.close()
+        os.remove(self.fname)
+
+    def register(self, offset):
+        return struct.unpack(str('<I'), self.registers[offset:offset + 4])[0]
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(sensor_monitor.gpio, 'write_many'))
+        self.assertTrue(hasattr(sensor_monitor.gpio, 'read_many'))
+        self.assertTrue(hasattr(sensor_monitor.gpio, 'read_mask'))
+
+    def test_write_many(self):
+        sensor_monitor.gpio.write_many([18, 23, 24, 25], [1, 0, 1, 0])
+
+        self.assertTrue(self.register(self.offset_set) == (1 << 18) | (1 << 24))
+        self.assertTrue(self.register(self.offset_clear) == (1 << 23) | (1 << 25))
+
+    def test_write_many_broadcast(self):
+        sensor_monitor.gpio.write_many(np.asarray([4, 17]), 1)
+
+        self.assertTrue(self.register(self.offset_set) == (1 << 4) | (1 << 17))
+
+    def test_read_many(self):
+        word = (1 << 4) | (1 << 21)
+        self.registers[self.offset_level:self.offset_level + 4] = struct.pack(str('<I'), word)
+
+        values = sensor_monitor.gpio.read_many([4, 17, 21])
+        self.assertTrue(list(values) == [1, 0, 1])
+        self.assertTrue(sensor_monitor.gpio.read_mask() == word)
+
+
+class Test_Fast_Path_Numbering(unittest.TestCase):
+    """
+    Fast path only with Broadcom GPIO pin numbers.
+    """
+    def setUp(self):
+        fd, self.fname = tempfile.mkstemp()
+        os.write(fd, b'\x00'*4096)
+        os.close(fd)
+
+        self.mode = sensor_monitor.gpio._setup_mode
+
+    def tearDown(self):
+        sensor_monitor.gpio.disable_fast_path()
+        sensor_monitor.gpio._setup_mode = self.mode
+
+        os.remove(self.fname)
+
+    def test_wiringpi_numbers(self):
+        sensor_monitor.gpio._set_mode(sensor_monitor.gpio.MODE_PINS)
+
+        with self.assertRaises(ValueError):
+            sensor_monitor.gpio.enable_fast_path(self.fname)
+        self.assertFalse(sensor_monitor.gpio.fast_path_enabled())
+
+    def test_switch_disables(self):
+        sensor_monitor.gpio._set_mode(sensor_monitor.gpio.MODE_GPIO)
+        self.assertTrue(sensor_monitor.gpio.enable_fast_path(self.fname))
+
+        sensor_monitor.gpio._set_mode(sensor_monitor.gpio.MODE_PINS)
+        self.assertFalse(sensor_monitor.gpio.fast_path_enabled())
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
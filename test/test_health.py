@@ -0,0 +1,93 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import threading
+import unittest
+
+from context import sensor_monitor
+import sensor_monitor.health
+
+health = sensor_monitor.health
+
+
+class Test_Channel_Health(unittest.TestCase):
+
+    def setUp(self):
+        self.channel = health.Channel_Health(4, time_powering=2., time_stale=60., time_dead=180.,
+                                             num_window=4)
+        self.channel.power_on(time_power=1000.)
+
+    def tearDown(self):
+        pass
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(health, 'Health_Monitor'))
+        self.assertTrue(hasattr(health, 'Channel_Health'))
+
+    def test_warm_up(self):
+        self.assertTrue(self.channel.state(1001.) == health.POWERING)
+        self.assertTrue(self.channel.state(1010.) == health.WARMING)
+        self.assertTrue(self.channel.state(1200.) == health.DEAD)
+
+    def test_healthy(self):
+        self.channel.record(1003., False, 'Fail checksum')
+        self.channel.record(1008., True)
+
+        self.assertTrue(self.channel.state(1009.) == health.HEALTHY)
+        self.assertTrue(self.channel.time_to_first_good == 8.)
+
+    def test_degraded_rate(self):
+        self.channel.record(1005., True)
+        for t in [1010., 1015., 1020.]:
+            self.channel.record(t, False, 'Fail checksum')
+
+        self.assertTrue(self.channel.rate_good == 0.25)
+        self.assertTrue(self.channel.state(1021.) == health.DEGRADED)
+
+    def test_degraded_stale_then_dead(self):
+        self.channel.record(1005., True)
+
+        self.assertTrue(self.channel.state(1100.) == health.DEGRADED)
+        self.assertTrue(self.channel.state(1300.) == health.DEAD)
+
+
+class Test_Health_Monitor(unittest.TestCase):
+
+    def setUp(self):
+        self.monitor = health.Health_Monitor([4, 17], time_powering=0.)
+
+    def tearDown(self):
+        pass
+
+    def test_report(self):
+        self.monitor.report(4, 1.e10, True)
+        self.monitor.report(22, 1.e10, False, 'Fail checksum')
+
+        self.assertTrue(list(self.monitor.channels.keys()) == [4, 17, 22])
+        self.assertTrue(self.monitor[22].msg_last == 'Fail checksum')
+
+    def test_wait_ready_any(self):
+        import time
+
+        def late():
+            time.sleep(0.1)
+            self.monitor.report(17, time.time(), True)
+
+        thread = threading.Thread(target=late)
+        thread.start()
+
+        pins_ok = self.monitor.wait_ready(time_wait_max=5., num_min=1)
+        thread.join()
+
+        self.assertTrue(pins_ok == [17])
+        self.assertTrue(self.monitor.states()[4] == health.WARMING)
+        self.assertTrue(self.monitor.time_to_first_good()[4] is None)
+
+    def test_wait_ready_timeout(self):
+        pins_ok = self.monitor.wait_ready(time_wait_max=0.05)
+        self.assertTrue(pins_ok == [])
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,92 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import os
+import sys
+import types
+import subprocess
+import unittest
+
+from context import sensor_monitor
+import sensor_monitor.lazy
+
+lazy = sensor_monitor.lazy
+
+
+class Test_Lazy(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        lazy.import_profiler.stop()
+        lazy.import_profiler.reset()
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(lazy, 'lazy_import'))
+        self.assertTrue(hasattr(lazy, 'import_profiler'))
+
+    def test_deferred(self):
+        sys.modules.pop('colorsys', None)
+
+        colorsys = lazy.lazy_import('colorsys')
+        self.assertFalse(lazy.is_loaded(colorsys))
+        self.assertTrue('colorsys' not in sys.modules)
+
+        self.assertTrue(colorsys.rgb_to_hsv(1., 0., 0.) == (0., 1., 1.))
+        self.assertTrue(lazy.is_loaded(colorsys))
+        self.assertTrue('colorsys' in sys.modules)
+
+    def test_top(self):
+        leaf = lazy.lazy_import('xml.dom.minidom')
+        top = lazy.lazy_import('xml.dom.minidom', top=True)
+
+        self.assertTrue(hasattr(leaf, 'parseString'))
+        self.assertTrue(hasattr(top.dom.minidom, 'parseString'))
+
+    def test_package(self):
+        self.assertTrue(isinstance(sensor_monitor, lazy.Lazy_Package))
+        self.assertTrue('sensors' in dir(sensor_monitor))
+
+        with self.assertRaises(AttributeError):
+            sensor_monitor.no_such_module
+
+    def test_package_top_level(self):
+        package = lazy.Lazy_Package(types.ModuleType(str('no_such_package')), ['colorsys'])
+        self.assertTrue(package.colorsys is sys.modules['colorsys'])
+
+    def test_package_extension(self):
+        # Built as top-level modules, see setup.py.
+        self.assertTrue(sensor_monitor.dht22.__name__ == 'dht22')
+        self.assertTrue(hasattr(sensor_monitor.dht22, 'read_bits'))
+
+    def test_profile_startup(self):
+        # Fresh interpreter, nothing imported yet.
+        code = ('from context import sensor_monitor\n'
+                'import sensor_monitor.startup as startup\n'
+                'startup.load(profile=True)\n'
+                'print(startup.lazy.import_profiler.report(num=None))\n')
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         cwd=os.path.dirname(os.path.abspath(__file__)))
+
+        names = [line.split()[0] for line in output.decode('utf-8').splitlines()]
+        self.assertTrue('who8myrpi' in names)
+        self.assertTrue('sensors' in names)
+        self.assertTrue('numpy' in names)
+
+    def test_import_profiler(self):
+        sys.modules.pop('colorsys', None)
+
+        lazy.import_profiler.start()
+        import colorsys
+        lazy.import_profiler.stop()
+
+        names = [r[0] for r in lazy.import_profiler.summary()]
+        self.assertTrue('colorsys' in names)
+        self.assertTrue(lazy.import_profiler.total() > 0.)
+        self.assertTrue('Total import time' in lazy.import_profiler.report())
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,106 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from context import sensor_monitor
+import sensor_monitor.master_table
+import sensor_monitor.session
+
+master_table = sensor_monitor.master_table
+session = sensor_monitor.session
+
+
+class Fake_Query(object):
+    def __init__(self, owner):
+        self.owner = owner
+
+    def sql(self, sql=None):
+        self.owner.queries.append(sql)
+        return sql
+
+
+class Fake_Service(object):
+    def __init__(self, owner):
+        self.owner = owner
+
+    def query(self):
+        return Fake_Query(self.owner)
+
+
+class Fake_Session(object):
+    def __init__(self, names, row):
+        """
+        Answers every query with one row of config data, no network.
+        """
+        self.names = names
+        self.row = row
+        self.queries = []
+        self.service = Fake_Service(self)
+
+    def execute(self, request):
+        return {'columns': list(self.names), 'rows': [list(self.row)]}
+
+
+class Test_Master_Table(unittest.TestCase):
+
+    def setUp(self):
+        self.names = ['Experiment Name', 'Data Table ID', 'Pins Data']
+        self.fake = Fake_Session(self.names, ['test', 'abc', '4,17'])
+
+        self.get_session = session.get_session
+        master_table.session.get_session = lambda *args, **kwargs: self.fake
+
+        self.path = tempfile.mkdtemp()
+        self.fname = os.path.join(self.path, 'master_table.json')
+        self.info = {'master_table_id': 'xyz'}
+
+    def tearDown(self):
+        master_table.session.get_session = self.get_session
+        shutil.rmtree(self.path)
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(master_table, 'Config_Cache'))
+        self.assertTrue(hasattr(master_table, 'fingerprint'))
+
+    def test_get(self):
+        info = master_table.get(self.info)
+        self.assertTrue(info == {'experiment_name': 'test', 'data_table_id': 'abc',
+                                 'pins_data': '4,17'})
+
+    def test_fingerprint(self):
+        value = master_table.fingerprint(self.info)
+        self.assertTrue(master_table.fingerprint(self.info) == value)
+
+        # Row edited in place, no row added.
+        self.fake.row = ['test', 'abc', '4,18']
+        self.assertTrue(master_table.fingerprint(self.info) != value)
+
+        self.assertTrue(all('SELECT * FROM xyz LIMIT 1' == q for q in self.fake.queries))
+
+    def test_refresh(self):
+        cache = master_table.Config_Cache(self.info, fname=self.fname)
+
+        self.assertTrue(cache.refresh())
+        self.assertTrue(cache.get()['pins_data'] == '4,17')
+        self.assertTrue(len(self.fake.queries) == 1)
+
+        self.assertFalse(cache.refresh())
+        self.assertTrue(len(self.fake.queries) == 2)
+
+        self.fake.row = ['test', 'abc', '4,18']
+        self.assertTrue(cache.refresh())
+        self.assertTrue(cache.get()['pins_data'] == '4,18')
+
+        # Persisted on disk.
+        cache = master_table.Config_Cache(self.info, fname=self.fname)
+        self.assertTrue(cache.get()['pins_data'] == '4,18')
+        self.assertTrue(len(self.fake.queries) == 3)
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
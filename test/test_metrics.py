@@ -0,0 +1,91 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import Queue
+import urllib2
+import unittest
+
+from context import sensor_monitor
+import sensor_monitor.metrics
+import sensor_monitor.health
+
+metrics = sensor_monitor.metrics
+
+
+class Test_Metrics(unittest.TestCase):
+
+    def setUp(self):
+        self.monitor = sensor_monitor.health.Health_Monitor([4], time_powering=0.)
+        self.metrics = metrics.Metrics(monitor=self.monitor)
+
+        self.queue = Queue.Queue()
+        self.queue.put({'pin': 4})
+        self.metrics.watch_queue('samples', self.queue)
+
+        self.metrics.observe_read(4, 1000., True, duration=0.005)
+        self.metrics.observe_read(4, 1005., False, 'Fail checksum', duration=0.003)
+        self.metrics.observe_read(4, 1010., False, 'Problem reading data from sensor.  '
+                                  'count: 0, pin: 4, bit: -2', duration=0.2)
+
+    def tearDown(self):
+        pass
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(metrics, 'Metrics'))
+        self.assertTrue(hasattr(metrics, 'serve'))
+
+    def test_failure_reason(self):
+        self.assertTrue(metrics.failure_reason('Fail first != 1') == 'first_bit')
+        self.assertTrue(metrics.failure_reason(None) == 'other')
+
+    def test_histogram(self):
+        h = metrics.Histogram([1., 2., 3.])
+        for v in [0.5, 1.5, 1.5, 2.5, 10.]:
+            h.observe(v)
+
+        self.assertTrue(h.cumulative() == [(1., 1), (2., 3), (3., 4), ('+Inf', 5)])
+        self.assertTrue(h.quantile(0.5) == 2.)
+
+    def test_pin_counts(self):
+        m = self.metrics.pins[4]
+        self.assertTrue(m.count_good == 1)
+        self.assertTrue(m.count_bad == 2)
+        self.assertTrue(m.failures['checksum'] == 1)
+        self.assertTrue(m.failures['timeout_2'] == 1)
+        self.assertTrue(abs(m.rate_good - 1/3) < 1.e-6)
+
+    def test_render(self):
+        text = self.metrics.render(time_now=1020.)
+
+        self.assertTrue('who8myrpi_reads_total{pin="4",result="good"} 1\n' in text)
+        self.assertTrue('who8myrpi_read_failures_total{pin="4",reason="checksum"} 1\n' in text)
+        self.assertTrue('who8myrpi_read_duration_seconds_bucket{pin="4",le="+Inf"} 3\n' in text)
+        self.assertTrue('who8myrpi_sample_age_seconds{pin="4"} 20.0\n' in text)
+        self.assertTrue('who8myrpi_queue_depth{queue="samples"} 1\n' in text)
+        self.assertTrue('who8myrpi_channel_state{pin="4",state=' in text)
+
+    def test_derived(self):
+        self.assertTrue('derived' not in self.metrics.render(time_now=1020.))
+
+        self.metrics.observe_derived({'Tdf': {4: 50.5}})
+        self.metrics.observe_derived({'Tdf': {4: 51.}, 'AH': {4: 9.2}})
+
+        text = self.metrics.render(time_now=1020.)
+        self.assertTrue('who8myrpi_derived{pin="4",quantity="Tdf"} 51.0' in text)
+        self.assertTrue('who8myrpi_derived{pin="4",quantity="AH"} 9.2' in text)
+
+    def test_serve(self):
+        server = metrics.serve(self.metrics, port=0, host='localhost')
+        try:
+            url = 'http://localhost:{:d}/metrics'.format(server.server_address[1])
+            text = urllib2.urlopen(url).read().decode('utf-8')
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertTrue('who8myrpi_reads_total' in text)
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,99 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import random
+import unittest
+
+import numpy as np
+
+from context import sensor_monitor
+import sensor_monitor.outlier
+
+outlier = sensor_monitor.outlier
+
+
+class Test_Skiplist(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+
+    def tearDown(self):
+        pass
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(outlier, 'Outlier_Filter'))
+        self.assertTrue(hasattr(outlier, 'Indexable_Skiplist'))
+
+    def test_insert_remove(self):
+        s = outlier.Indexable_Skiplist(100)
+        values = [random.randint(0, 20) for k in range(200)]
+
+        for v in values:
+            s.insert(v)
+        self.assertTrue(list(s) == sorted(values))
+        self.assertTrue(s[0] == min(values) and s[-1] == max(values))
+
+        for v in values[::2]:
+            s.remove(v)
+        remain = sorted(values[1::2])
+        self.assertTrue(len(s) == len(remain))
+        self.assertTrue([s[k] for k in range(len(s))] == remain)
+
+        self.assertRaises(KeyError, s.remove, 1000)
+
+
+class Test_Rolling_Stats(unittest.TestCase):
+
+    def test_matches_numpy(self):
+        random.seed(2)
+        stats = outlier.Rolling_Stats(time_window=30.)
+
+        history = []
+        for t in range(200):
+            v = round(random.gauss(20., 2.), 1)
+            stats.add(t, v)
+            history.append((t, v))
+
+            window = np.asarray([x for s, x in history if s >= t - 30.])
+            median = np.median(window)
+
+            self.assertTrue(len(stats) == len(window))
+            self.assertTrue(abs(stats.median() - median) < 1.e-9)
+            self.assertTrue(abs(stats.mad() - np.median(np.abs(window - median))) < 1.e-9)
+
+
+class Test_Outlier_Filter(unittest.TestCase):
+
+    def series(self, policy):
+        f = outlier.Outlier_Filter(time_window=100., threshold=5., num_min=5, policy=policy)
+
+        results = []
+        for k in range(20):
+            v = 70. + 0.5*(k % 3)
+            if k == 12:
+                v = 150.
+            results.append(f.check(k*5., v))
+
+        return f, results
+
+    def test_replace(self):
+        f, results = self.series('replace')
+        self.assertTrue(f.count_outliers == 1)
+        self.assertTrue(results[12][1])
+        self.assertTrue(results[12][0] == 70.5)
+        self.assertTrue(not any(bad for v, bad in results[:12] + results[13:]))
+
+    def test_flag_and_drop(self):
+        f, results = self.series('flag')
+        self.assertTrue(results[12] == (150., True))
+
+        f, results = self.series('drop')
+        self.assertTrue(results[12] == (None, True))
+
+    def test_bad_policy(self):
+        self.assertRaises(ValueError, outlier.Outlier_Filter, policy='ignore')
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,124 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import time
+import threading
+import unittest
+
+from context import sensor_monitor
+import sensor_monitor.health
+import sensor_monitor.power
+
+health = sensor_monitor.health
+power = sensor_monitor.power
+
+
+class Fake_Channel(object):
+    def __init__(self, pin):
+        self.pin = pin
+        self.paused = False
+        self.count_paused = 0
+
+    def pause(self):
+        self.paused = True
+        self.count_paused += 1
+
+    def unpause(self):
+        self.paused = False
+
+
+class Test_Power(unittest.TestCase):
+
+    def setUp(self):
+        self.writes = []
+        write = lambda pin, value: self.writes.append((pin, value))
+
+        info = {'power_groups': '22:4,17;27:23'}
+        self.groups = power.groups_from_config(info, write=write)
+
+        self.channels = [Fake_Channel(p) for p in [4, 17, 23]]
+        self.monitor = health.Health_Monitor([4, 17, 23], time_powering=0., time_dead=10.)
+        self.supervisor = power.Power_Supervisor(self.groups, self.channels, self.monitor,
+                                                 time_off=0., time_cycle_min=100.)
+
+    def tearDown(self):
+        pass
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(power, 'Power_Supervisor'))
+        self.assertTrue(hasattr(power, 'groups_from_config'))
+
+    def test_parse_groups(self):
+        groups = power.parse_groups('22:4,17,18; 27:23,24;')
+        self.assertTrue(groups == [(22, [4, 17, 18]), (27, [23, 24])])
+
+        groups = power.groups_from_config({'pin_power': 22, 'pins_data': [4, 17]},
+                                          write=lambda pin, value: None)
+        self.assertTrue(groups[0].pin_power == 22)
+        self.assertTrue(groups[0].pins_data == [4, 17])
+
+    def test_healthy_no_cycle(self):
+        time_now = time.time()
+        for p in [4, 17, 23]:
+            self.monitor.report(p, time_now, True)
+
+        self.supervisor.check()
+        self.assertTrue(self.writes == [])
+
+    def test_cycle_only_bad_group(self):
+        time_now = time.time()
+        self.monitor.report(4, time_now, True)
+        self.monitor.report(17, time_now, True)
+        self.monitor.report(23, time_now - 20., True)
+
+        self.supervisor.check()
+
+        self.assertTrue(self.writes == [(27, False), (27, True)])
+        self.assertTrue([c.count_paused for c in self.channels] == [0, 0, 1])
+        self.assertTrue(not any(c.paused for c in self.channels))
+        self.assertTrue(self.monitor[23].time_last_good is None)
+
+        # Too soon for another cycle.
+        self.monitor.report(23, time.time() - 20., True)
+        self.supervisor.check()
+        self.assertTrue(len(self.writes) == 2)
+
+    def test_backoff(self):
+        group = self.groups[1]
+
+        self.supervisor.cycle(group)
+        self.assertTrue(self.supervisor.time_cycle_wait[27] == 100.)
+
+        # Cycle did not help.
+        self.supervisor.cycle(group)
+        self.assertTrue(self.supervisor.time_cycle_wait[27] == 200.)
+        self.assertTrue(group.count_cycles == 2)
+
+    def test_added_while_off(self):
+        group = self.groups[1]
+        self.supervisor.time_off = 0.2
+
+        cycle = threading.Thread(target=self.supervisor.cycle, args=(group,))
+        cycle.start()
+        time.sleep(0.1)
+
+        self.assertFalse(group.is_on)
+        self.assertFalse(self.supervisor.is_powered(23))
+        self.assertTrue(self.supervisor.is_powered(4))
+
+        # Channel started part way through the cycle, paused by the caller.
+        with self.supervisor.lock:
+            channel = Fake_Channel(23)
+            channel.pause()
+            self.channels.append(channel)
+
+        cycle.join()
+
+        self.assertTrue(group.is_on)
+        self.assertFalse(channel.paused)
+        self.assertTrue(not any(c.paused for c in self.channels))
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
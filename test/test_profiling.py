@@ -0,0 +1,84 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+
+from context import sensor_monitor
+import sensor_monitor.profiling
+
+profiling = sensor_monitor.profiling
+
+
+class Test_Profiling(unittest.TestCase):
+
+    def setUp(self):
+        self.spans = profiling.Spans()
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(profiling, 'span'))
+        self.assertTrue(hasattr(profiling, 'Sampling_Profiler'))
+
+    def test_span_disabled(self):
+        with self.spans.span('read'):
+            pass
+
+        self.assertTrue(len(self.spans.summary()) == 0)
+
+    def test_span_per_stage(self):
+        self.spans.enable('read')
+
+        for k in range(3):
+            with self.spans.span('read'):
+                time.sleep(0.001)
+            with self.spans.span('upload'):
+                pass
+
+        summary = self.spans.summary()
+        self.assertTrue(list(summary.keys()) == ['read'])
+        self.assertTrue(summary['read']['count'] == 3)
+        self.assertTrue(summary['read']['total'] >= 0.003)
+
+        self.spans.disable()
+        self.spans.enable()
+        with self.spans.span('upload'):
+            pass
+        self.assertTrue('upload' in self.spans.summary())
+
+    def test_sampling_profiler(self):
+        profiler = profiling.Sampling_Profiler(interval=0.001)
+        profiler.start()
+
+        time_zero = time.time()
+        while time.time() - time_zero < 0.2:
+            sum(k*k for k in range(1000))
+
+        profiler.stop()
+
+        self.assertTrue(profiler.count_samples > 0)
+        self.assertTrue('test_sampling_profiler' in profiler.collapsed())
+
+    def test_dump(self):
+        profiling.spans.enable('dump_test')
+        with profiling.span('dump_test'):
+            pass
+        profiling.spans.disable('dump_test')
+
+        fnames = profiling.dump(self.path)
+        with open(fnames[0]) as fi:
+            info = json.load(fi)
+
+        self.assertTrue(info['dump_test']['count'] == 1)
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,57 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import unittest
+
+import numpy as np
+
+from context import sensor_monitor
+import sensor_monitor.replay
+import sensor_monitor.session
+
+replay = sensor_monitor.replay
+session = sensor_monitor.session
+
+
+def make_rows(num, seconds_start=1393660800., seed=0):
+    """
+    Rows of (seconds, RH, Tf), one every two seconds.
+    """
+    rng = np.random.RandomState(seed)
+    seconds = seconds_start + 2.*np.arange(num)
+
+    return np.column_stack([seconds,
+                            50. + rng.uniform(-5., 5., num),
+                            70. + rng.uniform(-5., 5., num)])
+
+
+class Test_Replay(unittest.TestCase):
+
+    def setUp(self):
+        session.reset_session()
+
+    def tearDown(self):
+        session.reset_session()
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(replay, 'Replay'))
+        self.assertTrue(hasattr(replay, 'pretty_report'))
+
+    def test_run(self):
+        data = {4: make_rows(300), 17: make_rows(250, seed=1)}
+
+        report = replay.Replay(data, speedup=None, rows_bulk_min=50).run()
+
+        self.assertTrue(report['pins'] == [4, 17])
+        self.assertTrue(report['rows_replayed'] == 550)
+        self.assertTrue(report['rows_dropped'] == 0)
+        self.assertTrue(report['rows_received'] + report['rows_spooled'] ==
+                        report['rows_replayed'])
+        self.assertTrue(report['rows_received'] > 0)
+
+        self.assertTrue(replay.pretty_report(report))
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,94 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import unittest
+
+import numpy as np
+
+from context import sensor_monitor
+import sensor_monitor.resample
+
+resample = sensor_monitor.resample
+
+
+class Test_Resample(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(1)
+
+        # Two pins with their own irregular times, and a long dropout on pin 17.
+        t4 = np.array([0., 4., 11., 14., 21., 26.])
+        t17 = np.array([1., 6., 9., 60., 66.])
+
+        self.seconds = np.concatenate([t4, t17])
+        self.pins = np.array([4]*t4.size + [17]*t17.size)
+        self.RH = np.concatenate([10.*t4, 100. - t17])
+        self.Tf = np.concatenate([70. + 0.*t4, 60. + 0.*t17])
+
+    def tearDown(self):
+        pass
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(resample, 'resample'))
+        self.assertTrue(hasattr(resample, 'Cube'))
+
+    def test_cube_shape(self):
+        cube = resample.resample(self.seconds, self.pins, [('RH', self.RH), ('Tf', self.Tf)],
+                                 step=5., method='hold')
+
+        self.assertTrue(cube.shape == (14, 2, 2))
+        self.assertTrue(list(cube.pins) == [4, 17])
+        self.assertTrue(cube.variables == ['RH', 'Tf'])
+        self.assertTrue(np.all(cube.seconds == np.arange(0., 66., 5.)))
+        self.assertTrue(np.all(cube.variable('Tf')[:, cube.pin(17)][1:] == 60.))
+
+    def test_hold(self):
+        cube = resample.resample(self.seconds, self.pins, {'RH': self.RH}, step=5.,
+                                 method='hold', max_gap=10.)
+        rh = cube.variable('RH')
+
+        # Pin 4 at t = 0, 5, 10, 15: last values from t = 0, 4, 4, 14.
+        self.assertTrue(list(rh[:4, 0]) == [0., 40., 40., 140.])
+
+        # Pin 17 has nothing before t = 1, then a dropout from 9 to 60.
+        self.assertTrue(np.isnan(rh[0, 1]) and cube.gap[0, 1])
+        self.assertTrue(not cube.gap[2, 1] and cube.gap[4, 1] and not cube.gap[12, 1])
+
+    def test_linear(self):
+        cube = resample.resample(self.seconds, self.pins, {'RH': self.RH}, step=5.,
+                                 method='linear', max_gap=10.)
+        rh = cube.variable('RH')
+
+        # Pin 4 values are 10*t, so linear interpolation is exact inside its range.
+        self.assertTrue(np.allclose(rh[:6, 0], 10.*cube.seconds[:6]))
+        self.assertTrue(np.all(np.isnan(rh[6:, 0])) and np.all(cube.gap[6:, 0]))
+
+        # Pin 17 interpolates across the dropout but flags it.
+        self.assertTrue(np.allclose(rh[4:12, 1], 100. - cube.seconds[4:12]))
+        self.assertTrue(np.all(cube.gap[2:12, 1]) and not cube.gap[1, 1])
+
+        masked = cube.masked()
+        self.assertTrue(np.all(np.isnan(masked[cube.gap])))
+
+    def test_kalman_tracks_trend(self):
+        seconds = np.cumsum(np.random.choice([5., 5., 10., 15.], 3000))
+        truth = 50. + seconds*0.001
+        RH = truth + np.random.normal(0, 0.5, seconds.size)
+
+        cube = resample.resample(seconds, np.full(seconds.size, 4), {'RH': RH}, step=5.,
+                                 method='kalman', noise_obs={'RH': 0.5})
+
+        estimate = cube.variable('RH')[:, 0]
+        error = estimate[1000:] - (50. + cube.seconds[1000:]*0.001)
+
+        self.assertTrue(np.abs(error).mean() < 0.2)
+        self.assertTrue(not cube.gap.any())
+
+    def test_bad_method(self):
+        self.assertRaises(ValueError, resample.resample, self.seconds, self.pins,
+                          {'RH': self.RH}, method='spline')
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,125 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from context import sensor_monitor
+import sensor_monitor.rollup
+
+rollup = sensor_monitor.rollup
+
+
+class Test_Rollup(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(2)
+        self.path = tempfile.mkdtemp()
+
+        num = 5000
+        self.seconds = np.sort(np.random.uniform(0, 3*86400, num))
+        self.pins = np.random.choice([4, 17], num)
+        self.columns = {'Humidity': np.random.uniform(20, 80, num),
+                        'Temperature': np.random.uniform(50, 90, num)}
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def check_table(self, table, resolution):
+        for pin in [4, 17]:
+            for bucket in [0, 1, 7]:
+                mask = ((self.pins == pin) &
+                        (np.floor(self.seconds / resolution) == bucket))
+                row = table[(table.Pin == pin) & (table.Seconds == bucket*resolution)]
+                if not mask.any():
+                    self.assertTrue(len(row) == 0)
+                    continue
+
+                values = self.columns['Humidity'][mask]
+                self.assertTrue(int(row.Count.iloc[0]) == mask.sum())
+                self.assertTrue(np.isclose(row.Humidity_min.iloc[0], values.min()))
+                self.assertTrue(np.isclose(row.Humidity_max.iloc[0], values.max()))
+                self.assertTrue(np.isclose(row.Humidity_mean.iloc[0], values.mean()))
+                self.assertTrue(np.isclose(row.Humidity_var.iloc[0], values.var()))
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(rollup, 'update'))
+        self.assertTrue(hasattr(rollup, 'stats'))
+
+    def test_aggregate(self):
+        table = rollup.aggregate(self.seconds, self.pins, self.columns, 3600)
+        self.check_table(table, 3600)
+        self.assertTrue(table.Count.sum() == self.seconds.size)
+
+    def test_coarsen_matches_direct(self):
+        fine = rollup.aggregate(self.seconds, self.pins, self.columns, 60)
+        table = rollup.coarsen(fine, 3600)
+        self.check_table(table, 3600)
+
+    def test_combine_large_offset(self):
+        # Merged variance stays accurate when the mean is large compared with the spread.
+        values = 1.e6 + np.random.normal(0, 0.01, self.seconds.size)
+        fine = rollup.aggregate(self.seconds, self.pins, {'Humidity': values}, 60)
+        total = rollup.combine(fine)
+
+        for pin in [4, 17]:
+            v = values[self.pins == pin]
+            self.assertTrue(np.isclose(total.loc[pin, 'Humidity_var'], v.var(), rtol=1.e-6))
+
+    def test_update_incremental(self):
+        # Second update repeats the tail of the first, as when the latest day is downloaded
+        # again from its start.
+        seconds_start = 86400.
+        first = self.seconds < 2*86400.
+        second = self.seconds >= seconds_start
+
+        rollup.update(self.path, self.seconds[first], self.pins[first],
+                      dict((k, v[first]) for k, v in self.columns.items()))
+        rollup.update(self.path, self.seconds[second], self.pins[second],
+                      dict((k, v[second]) for k, v in self.columns.items()),
+                      seconds_start=seconds_start)
+
+        for name, resolution in rollup.LEVELS:
+            table = rollup.query(self.path, name)
+            self.assertTrue(table.Count.sum() == self.seconds.size)
+
+        self.check_table(rollup.query(self.path, '1h'), 3600)
+
+        table = rollup.query(self.path, '15min', pins=[17], seconds_start=3600.,
+                             seconds_end=7200.)
+        self.assertTrue(len(table) == 4)
+        self.assertTrue(np.all(table.Pin == 17))
+
+    def test_cover(self):
+        pieces = rollup.cover(1800., 2*86400. + 120.)
+        self.assertTrue(pieces == [('15min', 1800., 3600.),
+                                   ('1h', 3600., 86400.),
+                                   ('1d', 86400., 2*86400.),
+                                   ('1min', 2*86400., 2*86400. + 120.)])
+
+        self.assertTrue(rollup.cover(100., 110.) == [('1min', 60., 120.)])
+
+    def test_stats(self):
+        rollup.update(self.path, self.seconds, self.pins, self.columns)
+
+        seconds_start = 1234.
+        seconds_end = 2.5*86400.
+        result = rollup.stats(self.path, seconds_start, seconds_end, pins=[4])
+
+        # Range ends are rounded out to whole minutes.
+        mask = ((self.pins == 4) & (self.seconds >= 1200.) & (self.seconds < seconds_end))
+        values = self.columns['Temperature'][mask]
+
+        self.assertTrue(list(result.index) == [4])
+        self.assertTrue(result.loc[4, 'Count'] == mask.sum())
+        self.assertTrue(np.isclose(result.loc[4, 'Temperature_mean'], values.mean()))
+        self.assertTrue(np.isclose(result.loc[4, 'Temperature_var'], values.var()))
+        self.assertTrue(np.isclose(result.loc[4, 'Temperature_max'], values.max()))
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -2,7 +2,12 @@
 from __future__ import division, print_function, unicode_literals
 
 import os
+import time
 import unittest
+import Queue
+
+import numpy as np
+
 from context import sensor_monitor
 
 path_module = os.path.normpath(os.path.dirname(__file__))
@@ -71,6 +76,41 @@ class Test_Channel(unittest.TestCase):
         self.assertTrue(C.is_finished)
         self.assertFalse(C.is_running)
 
+    def test_channel_file_data_speedup(self):
+        data = np.array([[1000., 50., 70.],
+                         [1010., 0., 0.],
+                         [1020., 51., 71.]])
+        C = sensor_monitor.sensors.Channel_DHT22_Data_File(pin=4, data=data, speedup=100.)
+
+        reports = []
+        C.add_observer(lambda pin, t, ok, msg, duration: reports.append((pin, t, ok)))
+
+        time_zero = time.time()
+        result = list(C.start())
+        time_elapsed = time.time() - time_zero
+
+        self.assertTrue([t for t, RH, Tf in result] == [1000., 1020.])
+        self.assertTrue(reports == [(4, 1000., True), (4, 1010., False), (4, 1020., True)])
+        self.assertTrue(0.15 < time_elapsed < 1.)
+
+    def test_data_collector_finishes(self):
+        data = np.column_stack([np.arange(500.), np.full(500, 50.), np.full(500, 70.)])
+        queue = Queue.Queue(maxsize=10)
+
+        runners = []
+        for pin in [4, 17]:
+            C = sensor_monitor.sensors.Channel_DHT22_Data_File(pin=pin, data=data)
+            R = sensor_monitor.sensors.Channel_Runner(C, queue, drop_oldest=False)
+            R.start()
+            runners.append(R)
+
+        samples = []
+        for batch in sensor_monitor.sensors.data_collector(queue, 0.01, channels=runners):
+            samples.extend(batch)
+
+        self.assertTrue(len(samples) == 1000)
+        self.assertTrue(sum(R.count_dropped for R in runners) == 0)
+
 
 # Standalone.
 if __name__ == '__main__':
@@ -0,0 +1,72 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import unittest
+
+from context import sensor_monitor
+import sensor_monitor.session
+import sensor_monitor.standin
+import sensor_monitor.upload
+import sensor_monitor.errors
+
+session = sensor_monitor.session
+standin = sensor_monitor.standin
+upload = sensor_monitor.upload
+
+
+class Test_Session(unittest.TestCase):
+
+    def setUp(self):
+        self.stand_in = standin.Stand_In()
+        self.server = standin.serve(port=0, stand_in=self.stand_in, background=True)
+        host, port = self.server.server_address[:2]
+        self.url = 'http://{:s}:{:d}'.format(host, port)
+
+        session.reset_session()
+
+    def tearDown(self):
+        session.reset_session()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(session, 'Session'))
+        self.assertTrue(hasattr(session, 'get_session'))
+
+    def test_shared(self):
+        s = session.configure({'service_url': self.url})
+        self.assertTrue(session.get_session() is s)
+        self.assertTrue(session.get_session(service_url=self.url) is s)
+        self.assertTrue(s.credentials is None)
+
+    def test_mismatch(self):
+        session.get_session(fname_secrets='/tmp/a/client_secrets.json')
+
+        self.assertTrue(session.get_session('/tmp/a/client_secrets.json') is not None)
+        with self.assertRaises(sensor_monitor.errors.Who8MyRPiError):
+            session.get_session('/tmp/b/client_secrets.json')
+
+        with self.assertRaises(sensor_monitor.errors.Who8MyRPiError):
+            session.configure({'service_url': self.url})
+
+    def test_pool(self):
+        s = session.configure({'service_url': self.url})
+
+        http = s.borrow_http()
+        s.return_http(http)
+        self.assertTrue(s.borrow_http() is http)
+        s.return_http(http)
+
+        # Table lookup and creation go over the pool.
+        service, tableId = upload.connect_table('test')
+        self.assertTrue(s._num_http == 1)
+        self.assertTrue(self.stand_in.get_table(tableId).name == 'test')
+
+        service, tableId_again = upload.connect_table('test')
+        self.assertTrue(tableId_again == tableId)
+        self.assertTrue(len(self.stand_in.tables) == 1)
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
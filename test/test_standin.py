@@ -0,0 +1,73 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import unittest
+
+from context import sensor_monitor
+import sensor_monitor.standin
+
+
+columns = [{'name': 'Seconds', 'type': 'NUMBER'},
+           {'name': 'Pin', 'type': 'NUMBER'},
+           {'name': 'Kind', 'type': 'STRING'}]
+
+
+class Test_Stand_In(unittest.TestCase):
+
+    def setUp(self):
+        self.stand_in = sensor_monitor.standin.Stand_In()
+        self.table = self.stand_in.create_table('test', columns, table_id='abc')
+
+        sql = ';'.join("INSERT INTO abc (Seconds, Pin, Kind) VALUES ({:d}, 4, 'sample')".format(k)
+                       for k in range(10))
+        self.stand_in.sql(sql)
+
+    def tearDown(self):
+        pass
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(sensor_monitor.standin, 'Stand_In'))
+        self.assertTrue(hasattr(sensor_monitor.standin, 'Service'))
+        self.assertTrue(hasattr(sensor_monitor.standin, 'serve'))
+
+    def test_insert(self):
+        self.assertTrue(len(self.table.rows) == 10)
+        self.assertTrue(self.table.rows[3][0] == 3.)
+
+    def test_select_where(self):
+        result = self.stand_in.sql('SELECT * FROM abc WHERE Seconds >= 2.00 AND Seconds < 5.00 '
+                                   'ORDER BY Seconds ASC')
+        seconds = [row[0] for row in result['rows']]
+        self.assertTrue(seconds == [2., 3., 4.])
+
+    def test_select_order_limit(self):
+        result = self.stand_in.sql('SELECT * FROM abc ORDER BY Seconds DESC LIMIT 2')
+        seconds = [row[0] for row in result['rows']]
+        self.assertTrue(seconds == [9., 8.])
+
+    def test_select_empty(self):
+        result = self.stand_in.sql('SELECT * FROM abc WHERE Seconds > 100')
+        self.assertFalse('rows' in result)
+
+    def test_count(self):
+        result = self.stand_in.sql('SELECT COUNT() FROM abc')
+        self.assertTrue(result['rows'][0][0] == 10)
+
+    def test_import_rows(self):
+        result = self.stand_in.import_rows('abc', '20,5,sample\n21,5,sample\n')
+        self.assertTrue(result['numRowsReceived'] == '2')
+        self.assertTrue(len(self.table.rows) == 12)
+
+    def test_quoted_semicolon(self):
+        self.stand_in.sql("INSERT INTO abc (Seconds, Kind) VALUES (50, 'a;b')")
+        result = self.stand_in.sql('SELECT Kind FROM abc WHERE Seconds = 50')
+        self.assertTrue(result['rows'][0][0] == 'a;b')
+
+    def test_error_injection(self):
+        stand_in = sensor_monitor.standin.Stand_In(error_rate=1.)
+        self.assertRaises(sensor_monitor.standin.Stand_In_Error, stand_in.admit)
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
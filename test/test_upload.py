@@ -0,0 +1,238 @@
+
+from __future__ import division, print_function, unicode_literals
+
+import json
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import httplib2
+import apiclient.errors
+
+from context import sensor_monitor
+import sensor_monitor.upload
+import sensor_monitor.utility
+import sensor_monitor.session
+import sensor_monitor.errors
+
+upload = sensor_monitor.upload
+utility = sensor_monitor.utility
+session = sensor_monitor.session
+
+
+class Fake_Table(object):
+    def importRows(self, **kwargs):
+        return kwargs
+
+
+class Fake_Service(object):
+    def table(self):
+        return Fake_Table()
+
+
+class Fake_Session(object):
+    def __init__(self):
+        """
+        Accepts every import request, no network.
+        """
+        self.requests = []
+        self.error = None
+
+    def execute(self, request):
+        if self.error:
+            raise self.error
+
+        self.requests.append(request)
+        rows = request['media_body'].getbytes(0, request['media_body'].size()).splitlines()
+
+        return {'numRowsReceived': str(len(rows))}
+
+
+def make_columns(num, seconds_start=1393660800.):
+    seconds = seconds_start + np.arange(num) * 2.5
+    return {'seconds': seconds,
+            'pin': np.array([4, 17] * (num // 2) + [4] * (num % 2), dtype=np.int32),
+            'Tf': 60. + np.arange(num) * 0.25,
+            'RH': 40. + np.arange(num) * 0.5,
+            'kind': ['sample'] * num}
+
+
+class Test_CSV(unittest.TestCase):
+
+    def test_does_it_import(self):
+        self.assertTrue(hasattr(upload, 'columns_to_csv'))
+        self.assertTrue(hasattr(upload, 'Spool'))
+
+    def test_columns_to_csv(self):
+        columns = {'seconds': np.array([1393660800., 1393660802.5]),
+                   'pin': np.array([4, 17], dtype=np.int32),
+                   'Tf': np.array([70.254, 71.]),
+                   'RH': np.array([40.5, 41.]),
+                   'kind': ['sample', 'outlier']}
+
+        content = upload.columns_to_csv(columns)
+        lines = content.splitlines()
+
+        self.assertTrue(content.endswith(b'\n'))
+        self.assertTrue(len(lines) == 2)
+
+        time_stamp = utility.pretty_timestamp(1393660800.).encode('utf-8')
+        self.assertTrue(lines[0] == time_stamp + b',1393660800.00,sample,4,70.25,40.50')
+        self.assertTrue(lines[1].endswith(b',1393660802.50,outlier,17,71.00,41.00'))
+
+    def test_empty(self):
+        self.assertTrue(upload.columns_to_csv(make_columns(0)) == b'')
+
+    def test_round_trip(self):
+        columns = make_columns(11)
+        result = upload.csv_to_columns(upload.columns_to_csv(columns))
+
+        self.assertTrue(np.allclose(result['seconds'], columns['seconds']))
+        self.assertTrue(list(result['pin']) == list(columns['pin']))
+        self.assertTrue(np.allclose(result['Tf'], columns['Tf']))
+        self.assertTrue(result['kind'] == columns['kind'])
+
+
+class Test_Spool(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+        self.import_rows = upload.import_rows
+
+    def tearDown(self):
+        upload.import_rows = self.import_rows
+
+        shutil.rmtree(self.path)
+
+    def test_append_read_consume(self):
+        spool = upload.Spool(self.path)
+        self.assertTrue(spool.read() == (b'', 0))
+
+        spool.append(make_columns(10))
+        spool.append(make_columns(10, seconds_start=1393670000.))
+        self.assertTrue(spool.num_rows == 20)
+
+        content, size = spool.read()
+        self.assertTrue(content.count(b'\n') == 20)
+
+        # Whole blocks only.
+        content_one, size_one = spool.read(bytes_max=10)
+        self.assertTrue(content_one.count(b'\n') == 10)
+        self.assertTrue(content.startswith(content_one))
+
+        # Survives a restart.
+        spool = upload.Spool(self.path)
+        self.assertTrue(spool.num_rows == 20)
+
+        spool.consume(size_one)
+        self.assertTrue(spool.num_rows == 10)
+        self.assertTrue(spool.read()[0] == content[len(content_one):])
+
+        spool.consume(spool.read()[1])
+        self.assertTrue(spool.num_rows == 0)
+
+    def test_consume_rows(self):
+        spool = upload.Spool(self.path)
+        for k in range(3):
+            spool.append(make_columns(10, seconds_start=1393660800. + k*100.))
+
+        content, size = spool.read()
+        lines = content.splitlines(True)
+
+        # Part way into the second block.
+        spool.consume_rows(15)
+        self.assertTrue(spool.num_rows == 15)
+        self.assertTrue(spool.read()[0] == b''.join(lines[15:]))
+
+        spool.consume_rows(15)
+        self.assertTrue(spool.num_rows == 0)
+
+    def test_bulk_partial(self):
+        calls = []
+
+        def accept_half(service, tableId, content, use_gzip=False):
+            num_rows = content.count(b'\n')
+            calls.append(content)
+            return num_rows // 2 if len(calls) == 1 else num_rows
+
+        upload.import_rows = accept_half
+
+        sink = upload.bulk_uploader(None, 'abc', None, rows_bulk_min=1, path_spool=self.path)
+
+        columns = make_columns(20)
+        samples = [{'seconds': t, 'pin': p, 'Tf': f, 'RH': h, 'kind': k} for t, p, f, h, k in
+                   zip(columns['seconds'], columns['pin'], columns['Tf'], columns['RH'],
+                       columns['kind'])]
+
+        # First import falls short, only the rows it took leave the spool.
+        sink.send(samples)
+        self.assertTrue(len(calls) == 1)
+        self.assertTrue(upload.Spool(self.path).num_rows == 10)
+
+        # Next attempt sends only the rest.
+        sink.send(samples[:0])
+        self.assertTrue(len(calls) == 2)
+        self.assertTrue(calls[1].splitlines() == calls[0].splitlines()[10:])
+        self.assertTrue(upload.Spool(self.path).num_rows == 0)
+
+        sink.close()
+
+
+class Test_Data_Uploader(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = Fake_Session()
+
+        self.get_session = session.get_session
+        upload.session.get_session = lambda *args, **kwargs: self.fake
+
+    def tearDown(self):
+        upload.session.get_session = self.get_session
+
+    def samples(self, num):
+        columns = make_columns(num)
+        return [{'seconds': t, 'pin': p, 'Tf': f, 'RH': h, 'kind': k} for t, p, f, h, k in
+                zip(columns['seconds'], columns['pin'], columns['Tf'], columns['RH'],
+                    columns['kind'])]
+
+    def test_add_rows(self):
+        sink = upload.data_uploader(Fake_Service(), 'abc', None)
+        sink.send(self.samples(4))
+        sink.close()
+
+        self.assertTrue(len(self.fake.requests) == 1)
+
+        request = self.fake.requests[0]
+        media = request['media_body']
+        lines = media.getbytes(0, media.size()).splitlines()
+
+        self.assertTrue(request['tableId'] == 'abc')
+        self.assertTrue(len(lines) == 4)
+        self.assertTrue(lines[0].split(b',')[1:] == [b'1393660800.0', b'sample', b'4', b'60.0',
+                                                     b'40.0'])
+
+    def test_service_error(self):
+        content = json.dumps({'error': {'errors': [{'domain': 'usageLimits',
+                                                    'message': 'Rate Limit Exceeded'}]}})
+        self.fake.error = apiclient.errors.HttpError(httplib2.Response({'status': 403}),
+                                                     content.encode('utf-8'))
+
+        with self.assertRaises(sensor_monitor.errors.Who8MyRPiError):
+            upload.add_rows(Fake_Service(), 'abc', [[1, 2]])
+
+        # Uploader keeps running.
+        sink = upload.data_uploader(Fake_Service(), 'abc', None)
+        sink.send(self.samples(2))
+
+        self.fake.error = None
+        sink.send(self.samples(2))
+        sink.close()
+
+        self.assertTrue(len(self.fake.requests) == 1)
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)